@@ -1,13 +1,53 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
-from fastapi.responses import JSONResponse
-from typing import List
-import os
-import uuid
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import BinaryIO, Callable, Iterator, List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from app.services.butterfly_classifier import butterfly_classifier
+from itertools import islice
+import asyncio
+import io
+import json
+import os
+import time
+import zipfile
+
+import numpy as np
+
+from app.services.imaging import to_model_input
+from app.services.model_loader import ModelNotReady, butterfly_model
+from app.services.prediction_cache import content_hash, get_prediction_cache
 
 router = APIRouter()
 
+_cache = get_prediction_cache("butterfly")
+
+# Seconds clients are told to wait while the model is still loading
+RETRY_AFTER_SECONDS = 5
+
+# Bulk classification: images per forward pass, and threads decoding the next
+# batch while the model runs the current one
+BULK_BATCH_SIZE = int(os.getenv("BUTTERFLY_BULK_BATCH_SIZE", "32"))
+DECODE_WORKERS = int(os.getenv("BUTTERFLY_DECODE_WORKERS", str(min(8, 2 * (os.cpu_count() or 1)))))
+_decode_pool = ThreadPoolExecutor(max_workers=DECODE_WORKERS, thread_name_prefix="butterfly-decode")
+
+_IMG_EXTS = {".jpg", ".jpeg", ".png", ".webp", ".bmp", ".gif", ".tif", ".tiff"}
+
+
+def _cacheable(predictions) -> bool:
+    return bool(predictions) and not any("error" in p for p in predictions)
+
+
+def _classifier():
+    """The loaded classifier, or an immediate 503 while it is still warming up."""
+    try:
+        return butterfly_model.get()
+    except ModelNotReady as e:
+        raise HTTPException(
+            status_code=503,
+            detail={"message": "Butterfly model is not ready yet", **butterfly_model.status()},
+            headers={"Retry-After": str(RETRY_AFTER_SECONDS)},
+        ) from e
+
 @router.post("/classify")
 async def classify_butterfly(
     file: UploadFile = File(...),
@@ -24,66 +64,62 @@ async def classify_butterfly(
     # Validate file type
     if not file.content_type or not file.content_type.startswith('image/'):
         raise HTTPException(status_code=400, detail=f"Invalid file type: {file.content_type}. Must be an image.")
-    
-    # Create temp directory if it doesn't exist
-    temp_dir = os.path.join("temp", "uploads")
-    os.makedirs(temp_dir, exist_ok=True)
-    
-    # Save uploaded file
-    file_extension = os.path.splitext(file.filename or 'image.jpg')[1] or '.jpg'
-    temp_filename = f"{uuid.uuid4()}{file_extension}"
-    temp_path = os.path.join(temp_dir, temp_filename)
-    
+
+    butterfly_classifier = _classifier()
+
     try:
-        # Read file content
+        # Read file content; it is decoded straight from memory
         contents = await file.read()
         if not contents:
             raise HTTPException(status_code=400, detail="Empty file provided")
-            
-        # Save to temp file
-        with open(temp_path, "wb") as buffer:
-            buffer.write(contents)
-        
-        print(f"Saved uploaded file to: {temp_path} ({len(contents)} bytes)")
-        
-        # Get predictions
-        print(f"Calling classifier.predict() with top_k={top_k}")
-        predictions = butterfly_classifier.predict(temp_path, top_k=top_k)
-        
+
+        print(f"Read uploaded file ({len(contents)} bytes)")
+
+        # Re-submitted images are answered from the cache; otherwise batched with
+        # concurrent requests, with the model running off the event loop
+        key = _cache.key(content_hash(contents), butterfly_classifier.model_version, top_k=top_k)
+        predictions, cached = await _cache.get_or_compute(
+            key, lambda: butterfly_classifier.predict_async(contents, top_k=top_k), _cacheable
+        )
+
         if not predictions:
             raise HTTPException(status_code=500, detail="No predictions returned from classifier")
-        
+
         # Format response
         response = {
             "success": True,
             "predictions": predictions,
             "timestamp": datetime.utcnow().isoformat(),
-            "filename": file.filename
+            "filename": file.filename,
+            "cached": cached
         }
         print(f"Classification successful. Found {len(predictions)} predictions.")
-        
+
         return JSONResponse(content=response)
-        
+
     except HTTPException:
         raise
     except Exception as e:
         error_msg = f"Error during classification: {str(e)}"
         print(error_msg)
         raise HTTPException(status_code=500, detail=error_msg)
-        
-    finally:
-        # Clean up temp file
-        try:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
-        except Exception as e:
-            print(f"Warning: Failed to remove temp file {temp_path}: {str(e)}")
+
+@router.get("/status")
+async def model_status():
+    """Readiness of the classification model"""
+    return {"success": True, "model": butterfly_model.status(), "timestamp": datetime.utcnow().isoformat()}
+
+@router.get("/cache-stats")
+async def cache_stats():
+    """Hit/miss counters of the classification cache"""
+    return {"success": True, "cache": _cache.stats(), "timestamp": datetime.utcnow().isoformat()}
 
 @router.get("/species")
 async def list_species():
     """List all available butterfly/moth species"""
+    butterfly_classifier = _classifier()
     try:
-        species = list(butterfly_classifier.class_indices.values())
+        species = list(butterfly_classifier.class_names)
         return {
             "success": True,
             "count": len(species),
@@ -92,3 +128,173 @@ async def list_species():
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error retrieving species list: {str(e)}")
+
+
+def _is_zip(filename: Optional[str], content_type: Optional[str]) -> bool:
+    return (content_type or "") in ("application/zip", "application/x-zip-compressed") or (filename or "").lower().endswith(".zip")
+
+
+def _iter_sources(uploads: List[Tuple[str, Optional[str], BinaryIO]]) -> Iterator[Tuple[str, Callable[[], bytes]]]:
+    """(name, read) per image; zips are expanded member by member, never fully in memory."""
+    for filename, content_type, fh in uploads:
+        if _is_zip(filename, content_type):
+            try:
+                zf = zipfile.ZipFile(fh)
+            except zipfile.BadZipFile as e:
+                yield filename, _raiser(ValueError(f"Invalid zip archive: {e}"))
+                continue
+            for info in zf.infolist():
+                name = info.filename
+                if info.is_dir() or name.startswith("__MACOSX/") or os.path.splitext(name)[1].lower() not in _IMG_EXTS:
+                    continue
+                yield f"{filename}/{name}", (lambda zf=zf, info=info: zf.read(info))
+        else:
+            yield filename, fh.read
+
+
+def _raiser(exc: Exception) -> Callable[[], bytes]:
+    def read() -> bytes:
+        raise exc
+    return read
+
+
+def _decode(index: int, name: str, read: Callable[[], bytes], model_version: str, top_k: int) -> dict:
+    """Runs in the decode pool: read, hash, cache lookup, then preprocess on a miss."""
+    item = {"index": index, "filename": name}
+    try:
+        data = read()
+        if not data:
+            raise ValueError("Empty file")
+        item["key"] = _cache.key(content_hash(data), model_version, top_k=top_k)
+        cached = _cache.get(item["key"])
+        if cached is not None:
+            item["predictions"], item["cached"] = cached, True
+        else:
+            item["x"] = to_model_input(data)
+    except Exception as e:
+        item["error"] = f"Error processing image: {e}"
+    return item
+
+
+async def _classify_stream(classifier, sources: Iterator[Tuple[str, Callable[[], bytes]]], top_k: int, closers: List[BinaryIO]):
+    loop = asyncio.get_running_loop()
+    numbered = enumerate(sources)
+    t0 = time.perf_counter()
+    count = errors = hits = 0
+
+    def submit_next():
+        chunk = list(islice(numbered, BULK_BATCH_SIZE))
+        return [
+            loop.run_in_executor(_decode_pool, _decode, i, name, read, classifier.model_version, top_k)
+            for i, (name, read) in chunk
+        ]
+
+    try:
+        pending = submit_next()
+        while pending:
+            items = await asyncio.gather(*pending)
+            # Decode the next batch while this one runs through the model
+            pending = submit_next()
+            todo = [it for it in items if "x" in it]
+            if todo:
+                try:
+                    results = await asyncio.to_thread(classifier.predict_batch, np.stack([it.pop("x") for it in todo]), top_k)
+                    for it, predictions in zip(todo, results):
+                        it["predictions"], it["cached"] = predictions, False
+                        if _cacheable(predictions):
+                            await _cache.aput(it["key"], predictions)
+                except Exception as e:
+                    for it in todo:
+                        it["error"] = f"Prediction failed: {e}"
+            for it in items:
+                it.pop("key", None)
+                it.pop("x", None)
+                it["success"] = "error" not in it
+                count += 1
+                errors += 0 if it["success"] else 1
+                hits += 1 if it.get("cached") else 0
+                yield json.dumps(it) + "\n"
+        yield json.dumps({
+            "done": True,
+            "count": count,
+            "errors": errors,
+            "cached": hits,
+            "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+            "timestamp": datetime.utcnow().isoformat(),
+        }) + "\n"
+    finally:
+        for fh in closers:
+            fh.close()
+
+
+@router.post("/classify-batch")
+async def classify_batch(
+    files: List[UploadFile] = File(...),
+    top_k: int = 5
+):
+    """
+    Classify many butterfly/moth images, streaming results as NDJSON
+
+    - **files**: Image files and/or zip archives of images
+    - **top_k**: Number of top predictions per image (default: 5)
+
+    Each line is one image ({"index", "filename", "success", "predictions" | "error", "cached"})
+    in upload order, emitted as soon as its batch finishes; the last line is a
+    summary with "done": true.
+    """
+    butterfly_classifier = _classifier()
+    uploads = []
+    for f in files:
+        # Take ownership of the spooled upload: the framework may close form
+        # files as soon as this handler returns, before the stream is consumed
+        fh, f.file = f.file, io.BytesIO()
+        uploads.append((f.filename or "image", f.content_type, fh))
+    return StreamingResponse(
+        _classify_stream(butterfly_classifier, _iter_sources(uploads), top_k, [fh for _n, _c, fh in uploads]),
+        media_type="application/x-ndjson",
+    )
+
+
+@router.post("/classify-async")
+async def classify_async(
+    files: List[UploadFile] = File(...),
+    top_k: int = 5
+):
+    """
+    Queue images for classification by the Celery workers
+
+    - **files**: Image files
+    - **top_k**: Number of top predictions per image (default: 5)
+
+    Images are written to the shared blob store and only their references
+    travel through the broker. Poll /jobs/{job_id} for the results.
+    """
+    from app.tasks.ml_tasks import enqueue_images
+
+    images = [await f.read() for f in files]
+
+    def enqueue():
+        # blob writes, the group dispatch and saving it are all blocking broker / backend calls
+        job = enqueue_images(images, top_k)
+        job.save()
+        return job
+
+    job = await asyncio.to_thread(enqueue)
+    return {"job_id": job.id, "images": len(images)}
+
+
+@router.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """Progress and, once finished, the per-image results of a classify-async job"""
+    # Plain def: every call below is a blocking result-backend round-trip, so
+    # this runs in the threadpool rather than on the event loop
+    from app.tasks.ml_tasks import celery_app
+
+    job = celery_app.GroupResult.restore(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    done = job.ready()
+    body = {"job_id": job_id, "ready": done, "completed": job.completed_count(), "total": len(job.results)}
+    if done:
+        body["results"] = [r for batch in job.get(propagate=False) if isinstance(batch, list) for r in batch]
+    return body
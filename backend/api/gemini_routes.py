@@ -1,7 +1,8 @@
 from fastapi import APIRouter, UploadFile, File, HTTPException
 from fastapi.responses import JSONResponse
-from app.services.gemini_classifier import get_gemini_classifier
-import google.generativeai as genai
+from app.services.prediction_cache import content_hash, get_prediction_cache
+from services.catalog import get_catalog
+import asyncio
 import logging
 from typing import List, Dict, Any
 import os
@@ -12,6 +13,23 @@ import re
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
+_cache = get_prediction_cache("gemini")
+
+
+def _cacheable(predictions) -> bool:
+    # Fallback answers (Gemini errors, unparsable replies) carry zero confidence
+    return isinstance(predictions, list) and bool(predictions) and float(predictions[0].get("confidence", 0) or 0) > 0
+
+
+async def _classify_cached(image_bytes: bytes):
+    """Gemini predictions for the image, reusing earlier answers for identical bytes."""
+    # Imported on first use: the Gemini SDK is slow to import and not needed to start serving
+    from app.services.gemini_classifier import get_gemini_classifier
+    classifier = get_gemini_classifier()
+    key = _cache.key(content_hash(image_bytes), classifier.model_name or "default")
+    return await _cache.get_or_compute(key, lambda: classifier.classify_image(image_bytes), _cacheable)
+
+
 @router.post("/classify")
 async def classify_image_with_gemini(
     file: UploadFile = File(...)
@@ -43,8 +61,7 @@ async def classify_image_with_gemini(
         
         # Get predictions
         try:
-            classifier = get_gemini_classifier()
-            predictions = await classifier.classify_image(image_bytes)
+            predictions, cached = await _classify_cached(image_bytes)
             
             # Ensure we have valid predictions
             if not predictions or not isinstance(predictions, list):
@@ -54,7 +71,8 @@ async def classify_image_with_gemini(
             response = {
                 "success": True,
                 "predictions": predictions,
-                "model": "gemini-pro-vision"
+                "model": "gemini-pro-vision",
+                "cached": cached
             }
             
             logger.info(f"Classification successful. Found {len(predictions)} predictions.")
@@ -76,10 +94,16 @@ async def classify_image_with_gemini(
             detail=f"An unexpected error occurred: {str(e)}"
         )
 
+@router.get("/cache-stats")
+async def cache_stats():
+    from app.services import gemini_classifier
+    client = gemini_classifier.gemini_classifier
+    return JSONResponse(content={"success": True, "cache": _cache.stats(), "client": client.stats() if client else None})
+
 @router.get("/species")
 async def list_species():
     try:
-        items = _known_species()
+        items = await asyncio.to_thread(_known_species)
         return JSONResponse(content={"success": True, "species": items})
     except Exception as e:
         logger.error(f"Failed to list species: {e}")
@@ -88,6 +112,7 @@ async def list_species():
 @router.get("/models")
 async def list_models():
     try:
+        import google.generativeai as genai
         models = genai.list_models()
         out = []
         for m in models:
@@ -138,20 +163,7 @@ def _normalize_name(s: str) -> str:
 
 
 def _known_species() -> List[str]:
-    roots = [
-        Path("/app/data/butterflies/train"),
-        Path("/app/data/temp_extract/train"),
-    ]
-    seen = set()
-    names: List[str] = []
-    for root in roots:
-        if not root.exists() or not root.is_dir():
-            continue
-        for d in root.iterdir():
-            if d.is_dir() and d.name not in seen:
-                seen.add(d.name)
-                names.append(d.name)
-    return sorted(names)
+    return get_catalog().species_names()
 
 
 @router.post("/classify-upsert")
@@ -176,8 +188,7 @@ async def classify_upsert(
             # Try Gemini classification
             predictions = None
             try:
-                classifier = get_gemini_classifier()
-                predictions = await classifier.classify_image(image_bytes)
+                predictions, _cached = await _classify_cached(image_bytes)
             except Exception as ge:
                 logger.error(f"Gemini classification failed: {ge}")
                 predictions = []
@@ -186,7 +197,7 @@ async def classify_upsert(
             top_species = _normalize_name(str(predictions[0].get("species", "Unknown")))
 
         # Determine target species based on known folders
-        known = _known_species()
+        known = await asyncio.to_thread(_known_species)
         known_norm = {k.lower(): k for k in known}
         top_norm = top_species.lower()
 
@@ -229,13 +240,12 @@ async def classify_upsert(
         with open(save_path, "wb") as f:
             f.write(image_bytes)
 
-        # Invalidate species clusters cache so Species Discovery refreshes
+        # Index the new image right away; the catalog pushes the delta into the
+        # species clusters and time-series caches (no full rebuild)
         try:
-            from . import species_routes
-            species_routes._CLUSTERS_CACHE = []
-            species_routes._CACHE_BUILT_AT = None
+            await asyncio.to_thread(lambda: get_catalog().reconcile(force_dirs=[str(species_dir)]))
         except Exception as e:
-            logger.warning(f"Failed to invalidate clusters cache: {e}")
+            logger.warning(f"Failed to update dataset catalog: {e}")
 
         return JSONResponse(content={
             "success": True,
@@ -1,7 +1,17 @@
 from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.services.model_loader import MODELS
 
 router = APIRouter()
 
 @router.get("/health")
 async def health_check():
     return {"status": "ok"}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """200 once every model has loaded, 503 while any is still warming up"""
+    models = [m.status() for m in MODELS]
+    ready = all(m.ready for m in MODELS)
+    return JSONResponse(status_code=200 if ready else 503, content={"status": "ready" if ready else "loading", "models": models})
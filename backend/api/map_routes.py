@@ -1,9 +1,11 @@
 from fastapi import APIRouter, Query, Request
 from typing import List, Dict, Any
-from pathlib import Path
+import asyncio
 import random
 from datetime import datetime, timedelta
 
+from services.catalog import get_catalog
+
 router = APIRouter()
 
 # This endpoint synthesizes detection points from the local butterflies dataset
@@ -20,27 +22,18 @@ async def detections(
     limit: int = Query(200, ge=1, le=1000, description="Max detections to return"),
     hours: int = Query(24, ge=1, le=720, description="Lookback window in hours for timestamps"),
 ) -> Dict[str, Any]:
-    base = Path(__file__).resolve().parents[2]
-    # Prefer the temp_extract path if present (as used elsewhere), else butterflies/train
-    candidates = [
-        base / "data" / "temp_extract" / "train",
-        base / "data" / "butterflies" / "train",
-    ]
-    train_dir = None
-    for p in candidates:
-        if p.exists():
-            train_dir = p
-            break
-
-    species_dirs: List[Path] = []
-    if train_dir:
+    # Species names from the shared dataset catalog (uploads + base dataset);
+    # the catalog is SQLite and the roots are stat()ed, so not on the loop
+    def read_catalog():
+        catalog = get_catalog()
+        roots = catalog.existing_roots()
         try:
-            species_dirs = [d for d in train_dir.iterdir() if d.is_dir()]
+            names = [sp.replace("_", " ") for sp in catalog.species_names()][:100]
         except Exception:
-            species_dirs = []
+            names = []
+        return roots, names
 
-    # Build species names from directories, fallback to generic
-    names: List[str] = [d.name.replace("_", " ") for d in species_dirs][:100]
+    roots, names = await asyncio.to_thread(read_catalog)
     if not names:
         names = ["Monarch", "Blue Morpho", "Swallowtail", "Heliconian"]
 
@@ -69,7 +62,7 @@ async def detections(
         "success": True,
         "data": data,
         "source": "local_dataset",
-        "dataset_path": str(train_dir) if train_dir else None,
+        "dataset_path": str(roots[0][0]) if roots else None,
         "message": "OK",
         "timestamp": datetime.utcnow().isoformat(),
     }
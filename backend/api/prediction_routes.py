@@ -1,46 +1,222 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, BackgroundTasks, Query
 from datetime import datetime
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import threading
+import zlib
+
+import numpy as np
+
+from services import ews, timeseries
 
 router = APIRouter()
 
-MOCK_WARNINGS = [
-    {
-        "id": 101,
-        "ecosystem_id": "reef_a",
-        "severity": "high",
-        "message": "Critical slowing down detected (autocorrelation rising)",
-        "created_at": datetime.utcnow().isoformat(),
-    },
-    {
-        "id": 102,
-        "ecosystem_id": "forest_madagascar",
-        "severity": "medium",
-        "message": "Variance increasing in keystone species population",
-        "created_at": datetime.utcnow().isoformat(),
-    },
-]
-
-MOCK_TIPPING = {
-    "risk_level": "high",
-    "risk_percent": 78,
-    "estimated_time_months": 6,
-    "confidence": 0.82,
-}
+# Aggregate row appended to the species matrix: all detections summed per day
+ALL_SPECIES = "__all__"
+
+# Memoized EWS snapshots keyed on (dataset_version, window, baseline). The
+# newest snapshot per (window, baseline) is also kept so a stale dataset can be
+# served immediately while a background task rebuilds it.
+_EWS_CACHE: "OrderedDict[Tuple[str, int, int], dict]" = OrderedDict()
+_EWS_CACHE_MAX = 16
+_LATEST: Dict[Tuple[int, int], dict] = {}
+_LOCK = threading.Lock()
+
+
+def _norm(name: str) -> str:
+    return name.strip().replace("_", " ").lower()
+
+
+def _compute_snapshot(version: str, window: int, baseline: int) -> dict:
+    species, dates, counts = timeseries.build_counts_matrix()
+    if species:
+        counts = np.vstack([counts, counts.sum(axis=0, keepdims=True)])
+    metrics = ews.compute_metrics_batch(counts, trend_window=window, metric_window=window, baseline=baseline)
+    rows = species + [ALL_SPECIES] if species else []
+    return {
+        "version": version,
+        "window": window,
+        "baseline": baseline,
+        "species": rows,
+        "index": {_norm(sp): i for i, sp in enumerate(rows)},
+        "dates": [d.date().isoformat() for d in dates],
+        "metrics": metrics,
+        "built_at": datetime.utcnow().isoformat(),
+    }
+
+
+def _snapshot(window: int, baseline: int) -> dict:
+    with _LOCK:
+        version = timeseries.dataset_version()
+        key = (version, window, baseline)
+        snap = _EWS_CACHE.get(key)
+        if snap is None:
+            snap = _compute_snapshot(version, window, baseline)
+            _EWS_CACHE[key] = snap
+            while len(_EWS_CACHE) > _EWS_CACHE_MAX:
+                _EWS_CACHE.popitem(last=False)
+        else:
+            _EWS_CACHE.move_to_end(key)
+        _LATEST[(window, baseline)] = snap
+        return snap
+
+
+def _refresh_snapshot(window: int, baseline: int):
+    try:
+        _snapshot(window, baseline)
+    except Exception as e:
+        print(f"Error refreshing EWS snapshot: {e}")
+
+
+async def _get_snapshot(background_tasks: BackgroundTasks, window: int, baseline: int) -> dict:
+    # Served inline only when nothing needs to be read or computed
+    version = timeseries.cached_version()
+    if version is not None:
+        snap = _EWS_CACHE.get((version, window, baseline))
+        if snap is not None:
+            return snap
+    stale = _LATEST.get((window, baseline))
+    if stale is not None and not timeseries.is_fresh():
+        # The catalog is due for a reconcile: serve the newest snapshot and rebuild in the background
+        background_tasks.add_task(_refresh_snapshot, window, baseline)
+        return stale
+    # Reconciles, rebuilds the matrix or computes new metrics: keep it off the event loop
+    return await asyncio.to_thread(_snapshot, window, baseline)
+
+
+def _row(snap: dict, species: Optional[str]) -> Optional[int]:
+    if not snap["species"]:
+        return None
+    return snap["index"].get(_norm(species or ALL_SPECIES))
+
+
+def _severity(risk: float) -> str:
+    if risk >= 85:
+        return "critical"
+    if risk >= 70:
+        return "high"
+    if risk >= 40:
+        return "medium"
+    return "low"
+
+
+def _tipping_for(snap: dict, i: int, window: int) -> dict:
+    m = snap["metrics"]
+    risk = m["risk"][i]
+    current = float(risk[-1])
+    # Days until risk would reach 100 at the recent rate of increase
+    recent = risk[-max(2, window):]
+    rate = float(recent[-1] - recent[0]) / max(1, len(recent) - 1)
+    eta_months = None
+    if rate > 0:
+        eta_months = round(min(24.0, (100.0 - current) / rate / 30.0), 1)
+    # Confidence grows with history beyond the baseline and metric window
+    n_days = len(snap["dates"])
+    confidence = round(min(1.0, n_days / float(snap["baseline"] + 2 * window)), 2)
+    sp = snap["species"][i]
+    return {
+        "species": None if sp == ALL_SPECIES else sp,
+        "name": "All species" if sp == ALL_SPECIES else sp.replace("_", " "),
+        "risk_level": _severity(current),
+        "severity": _severity(current),
+        "risk_percent": int(round(current)),
+        "estimated_time_months": eta_months,
+        "confidence": confidence,
+        "autocorrelation": round(float(m["autocorrelation"][i][-1]), 3),
+        "variance": round(float(m["variance"][i][-1]), 3),
+        "as_of": snap["dates"][-1],
+    }
+
+
+def _not_found(species: str) -> dict:
+    return {
+        "success": False,
+        "error": {"code": "SPECIES_NOT_FOUND", "message": f"No time series for species '{species}'"},
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+
 
 @router.get("/warnings")
-async def warnings():
-    return {"success": True, "data": MOCK_WARNINGS, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
+async def warnings(
+    background_tasks: BackgroundTasks,
+    window: int = Query(14, ge=2, le=365),
+    baseline: int = Query(30, ge=1, le=3650),
+    min_risk: float = Query(40.0, ge=0.0, le=100.0),
+    limit: int = Query(20, ge=1, le=200),
+):
+    snap = await _get_snapshot(background_tasks, window, baseline)
+    data: List[dict] = []
+    if snap["species"]:
+        m = snap["metrics"]
+        latest = m["risk"][:-1, -1]  # exclude the aggregate row
+        order = np.argsort(-latest, kind="stable")
+        for i in order[:limit]:
+            risk = float(latest[i])
+            if risk < min_risk:
+                break
+            sp = snap["species"][i]
+            ac = float(m["autocorrelation"][i, -1])
+            var = float(m["variance"][i, -1])
+            signal = "Critical slowing down (autocorrelation rising)" if ac >= 0.5 else "Variance increasing"
+            data.append({
+                "id": zlib.crc32(sp.encode("utf-8")),
+                "ecosystem_id": sp,
+                "species": sp.replace("_", " "),
+                "severity": _severity(risk),
+                "risk_percent": int(round(risk)),
+                "message": f"{signal} for {sp.replace('_', ' ')} (risk {risk:.0f}%, ac {ac:.2f}, var {var:.2f})",
+                "created_at": snap["dates"][-1],
+            })
+    return {"success": True, "data": data, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
+
 
 @router.get("/tipping-points")
-async def tipping_points():
-    return {"success": True, "data": MOCK_TIPPING, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
+async def tipping_points(
+    background_tasks: BackgroundTasks,
+    species: Optional[str] = Query(None, description="Species name; defaults to all species combined"),
+    window: int = Query(14, ge=2, le=365),
+    baseline: int = Query(30, ge=1, le=3650),
+):
+    snap = await _get_snapshot(background_tasks, window, baseline)
+    if not snap["species"]:
+        return {"success": True, "data": None, "message": "No dataset available", "timestamp": datetime.utcnow().isoformat()}
+    i = _row(snap, species)
+    if i is None:
+        return _not_found(species or "")
+    data = _tipping_for(snap, i, window)
+    if species is None:
+        # Per-species entries above the medium band, most at risk first
+        latest = snap["metrics"]["risk"][:-1, -1]
+        order = np.argsort(-latest, kind="stable")
+        data["tipping_points"] = [_tipping_for(snap, int(j), window) for j in order[:10] if latest[j] >= 70]
+    return {"success": True, "data": data, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
+
 
 @router.get("/signals")
-async def signals():
-    # Mocked small timeseries for sparkline visuals
+async def signals(
+    background_tasks: BackgroundTasks,
+    species: Optional[str] = Query(None, description="Species name; defaults to all species combined"),
+    window: int = Query(14, ge=2, le=365),
+    baseline: int = Query(30, ge=1, le=3650),
+    points: int = Query(30, ge=2, le=3650, description="Trailing points returned for sparklines"),
+):
+    snap = await _get_snapshot(background_tasks, window, baseline)
+    if not snap["species"]:
+        empty = {"autocorrelation": [], "variance": [], "detections": [], "trend": [], "risk": [], "dates": []}
+        return {"success": True, "data": empty, "message": "No dataset available", "timestamp": datetime.utcnow().isoformat()}
+    i = _row(snap, species)
+    if i is None:
+        return _not_found(species or "")
+    m = snap["metrics"]
     data = {
-        "autocorrelation": [0.12,0.18,0.22,0.25,0.29,0.34,0.38,0.41,0.43,0.47,0.5,0.54],
-        "variance": [0.15,0.16,0.2,0.22,0.19,0.24,0.28,0.31,0.36,0.33,0.37,0.4],
-        "detections": [8,9,7,10,11,14,12,15,17,16,18,20],
+        "species": None if snap["species"][i] == ALL_SPECIES else snap["species"][i],
+        "dates": snap["dates"][-points:],
+        "autocorrelation": np.round(m["autocorrelation"][i, -points:], 4).tolist(),
+        "variance": np.round(m["variance"][i, -points:], 4).tolist(),
+        "trend": np.round(m["trend"][i, -points:], 4).tolist(),
+        "risk": np.round(m["risk"][i, -points:], 2).tolist(),
+        "detections": m["detections"][i, -points:].astype(int).tolist(),
+        "dataset_version": snap["version"],
     }
     return {"success": True, "data": data, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
@@ -1,226 +1,181 @@
-from fastapi import APIRouter, BackgroundTasks, Body, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Body, HTTPException, Query
 from datetime import datetime
-from pathlib import Path
 import random
+import secrets
 import time
 import asyncio
 from websocket.handlers import emit_sim_progress, emit_sim_completed
+from services.catalog import get_catalog
+from app.services.population import ACTIONS, simulate_population
+from app.services.simulation_store import DEFAULT_PAGE, MAX_PAGE, get_simulation_store
 
 router = APIRouter()
 
-_SIM_STATE = {
-    "last_id": 1,
-    "store": {
-        1: {
-            "id": 1,
-            "name": "Demo Ecosystem",
-            "status": "idle",
-            "ecosystem_config": {"species": 12, "areas": 5},
-            "intervention_config": {},
-            "results": None,
-            "progress": 0,
-            "phase": "idle",
-            "created_at": datetime.utcnow().isoformat(),
-        }
-    }
-}
+# Simulations and saved scenarios live in the database (see
+# app.services.simulation_store), so every API worker sees the same state
+_store = get_simulation_store()
+
+
+def _error(code: str, message: str) -> dict:
+    return {"success": False, "error": {"code": code, "message": message}, "timestamp": datetime.utcnow().isoformat()}
 
-# In-memory scenario storage for prototype
-_SCENARIOS: list[dict] = []
 
 @router.post("/create")
 async def create_simulation():
-    _SIM_STATE["last_id"] += 1
-    sim_id = _SIM_STATE["last_id"]
-    _SIM_STATE["store"][sim_id] = {
-        "id": sim_id,
-        "name": f"Simulation {sim_id}",
-        "status": "idle",
-        "ecosystem_config": {"species": 10, "areas": 4},
-        "intervention_config": {},
-        "results": None,
-        "progress": 0,
-        "phase": "idle",
-        "created_at": datetime.utcnow().isoformat(),
-    }
+    sim = await _store.create_simulation({"species": 10, "areas": 4})
     return {
         "success": True,
-        "data": {"simulation_id": sim_id},
+        "data": {"simulation_id": sim["id"]},
         "message": "Created",
         "timestamp": datetime.utcnow().isoformat(),
     }
 
-async def run_phases(sim_id: int, intervention: dict | None = None):
-    """Simulate a long-running simulation with progress updates."""
-    sim = _SIM_STATE["store"][sim_id]
-    phases = [
-        ("loading data", 20),
-        ("simulating dynamics", 60),
-        ("applying intervention", 85),
-        ("finalizing", 100),
-    ]
 
-    for phase, target_progress in phases:
-        sim["phase"] = phase
-        steps = random.randint(3, 7)  # Random steps per phase
-        
-        for i in range(steps):
-            if sim["status"] == "cancelled":
-                return
-                
-            # Simulate work
-            await asyncio.sleep(0.5)
-            
-            # Update progress within phase
-            phase_progress = int((i + 1) * (target_progress - sim["progress"]) / steps)
-            sim["progress"] = min(sim["progress"] + phase_progress, target_progress)
-            
-            # Broadcast progress
-            try:
-                await emit_sim_progress(sim_id, phase, sim["progress"])
-            except Exception as e:
-                print(f"Error emitting progress: {e}")
-    
-    # Finalize
-    sim["progress"] = 100
-    sim["status"] = "completed"
-    sim["phase"] = "completed"
-    sim["completed_at"] = datetime.utcnow().isoformat()
-    
-    # Generate mock results based on real dataset where possible
-    species_counts: list[tuple[str, int]] = []
+@router.get("")
+async def list_simulations(status: str | None = None, limit: int = Query(DEFAULT_PAGE, ge=1, le=MAX_PAGE), cursor: str | None = None):
+    # Newest first; pass next_cursor back as cursor for the following page
+    try:
+        items, next_cursor = await _store.list_simulations(status, limit, cursor)
+    except ValueError as e:
+        return _error("INVALID_CURSOR", str(e))
+    return {"success": True, "data": items, "next_cursor": next_cursor, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
 
-    # Prefer the same dataset locations used by species_routes: temp_extract/train, then butterflies/train
-    dataset_candidates = [
-        Path("/app/data/temp_extract/train"),
-        Path("/app/data/butterflies/train"),
-    ]
+DEFAULT_SPECIES = [("Monarch", 1000), ("Blue Morpho", 800), ("Swallowtail", 600), ("Heliconian", 550)]
 
-    for train_dir in dataset_candidates:
-        if not train_dir.exists() or not train_dir.is_dir():
-            continue
 
-        try:
-            for species_dir in [p for p in train_dir.iterdir() if p.is_dir()]:
-                count = 0
-                try:
-                    for f in species_dir.iterdir():
-                        if f.is_file() and f.suffix.lower() in {'.jpg', '.jpeg', '.png'}:
-                            count += 1
-                        elif f.is_dir():
-                            # Bounded deeper scan per subdirectory
-                            c = 0
-                            for sf in f.iterdir():
-                                if sf.is_file() and sf.suffix.lower() in {'.jpg', '.jpeg', '.png'}:
-                                    count += 1
-                                    c += 1
-                                    if c >= 500:
-                                        break
-                except Exception:
-                    # Ignore per-species errors and continue
-                    pass
-                if count > 0:
-                    species_counts.append((species_dir.name.replace('_', ' '), count))
-        except Exception:
-            # Ignore dataset-level errors for this path and continue with others
-            continue
+def _engine_options(config: dict) -> dict:
+    """Engine inputs from an intervention config; raises ValueError on bad values."""
+    action = config.get("action", "habitat-restoration")
+    if action not in ACTIONS:
+        raise ValueError(f"Unknown action {action!r}; expected one of {', '.join(ACTIONS)}")
+    seed = config.get("seed")
+    return {
+        "action": action,
+        "intensity": max(0.0, min(1.0, float(config.get("intensity", 0.5)))),
+        "species_limit": max(1, min(100, int(config.get("species_limit", 8)))),
+        "sampling": config.get("sampling", "random"),
+        "years": max(1.0, min(100.0, float(config.get("years", 10.0)))),
+        "replicas": max(1, min(512, int(config.get("replicas", 64)))),
+        "seed": int(seed) if seed is not None else secrets.randbits(32),
+    }
 
-    # Fallback if no real dataset present anywhere
-    if not species_counts:
-        species_counts = [("Monarch", 1000), ("Blue Morpho", 800), ("Swallowtail", 600), ("Heliconian", 550)]
 
-    species_limit = 8
-    sampling = 'random'
-    intensity = 0.5
-    action = 'habitat-restoration'
-    
-    if isinstance(sim.get("intervention_config"), dict):
-        species_limit = int(sim["intervention_config"].get("species_limit", species_limit))
-        sampling = sim["intervention_config"].get("sampling", sampling)
-        intensity = float(sim["intervention_config"].get("intensity", intensity))
-        action = sim["intervention_config"].get("action", action)
+def _species_counts() -> list[tuple[str, int]]:
+    # Per-species image counts across both dataset roots, from the shared catalog
+    try:
+        return [(sp.replace('_', ' '), n) for sp, n in get_catalog().species_counts()]
+    except Exception as e:
+        print(f"Error reading dataset catalog: {e}")
+        return []
 
+
+def _pick_species(species_counts: list[tuple[str, int]], config: dict, limit: int, sampling: str, rnd: random.Random) -> list[tuple[str, int]]:
     # Sampling strategy (optionally honor a custom species list)
     selected_species = []
-    if isinstance(sim.get("intervention_config"), dict):
-        raw_sel = sim["intervention_config"].get("selected_species")
-        if isinstance(raw_sel, list):
-            selected_species = [str(s).strip() for s in raw_sel if str(s).strip()]
-        elif isinstance(raw_sel, str):
-            # Allow comma-separated string fallback
-            selected_species = [s.strip() for s in raw_sel.split(',') if s.strip()]
-
-    picked: list[tuple[str, int]] = []
+    raw_sel = config.get("selected_species")
+    if isinstance(raw_sel, list):
+        selected_species = [str(s).strip() for s in raw_sel if str(s).strip()]
+    elif isinstance(raw_sel, str):
+        # Allow comma-separated string fallback
+        selected_species = [s.strip() for s in raw_sel.split(',') if s.strip()]
 
     if selected_species:
         # Case-insensitive match of requested names against available species
         wanted = {s.lower() for s in selected_species}
         pool = [sc for sc in species_counts if sc[0].lower() in wanted]
-        # If we found any matches, use them (respecting species_limit)
         if pool:
-            picked = pool[:species_limit]
-
-    # If no custom selection or no matches, fall back to existing sampling
-    if not picked:
-        if sampling == 'top-by-images':
-            species_counts.sort(key=lambda x: x[1], reverse=True)
-            picked = species_counts[:species_limit]
-        else:
-            rnd = species_counts[:]
-            random.shuffle(rnd)
-            picked = rnd[:species_limit]
-
-    # Effect factor based on action
-    base_effect = 0.2
-    if action == 'anti-poaching':
-        base_effect = 0.25
-    elif action == 'invasive-control':
-        base_effect = 0.18
-    
-    # Clamp intensity 0..1
-    intensity = max(0.0, min(1.0, intensity))
-    pop_change = round(100 * (base_effect * intensity), 1)  # percentage points
-    risk_change = round(-1 * (10 + 20 * intensity), 1)
-    
-    trajectories = []
-    for name, before in picked:
-        after = int(before * (1 + (pop_change/100)))
-        trajectories.append({"species": name, "before": before, "after": after})
-    
-    biodiversity_index = round(0.5 + 0.5 * min(1.0, len(picked)/20) * (0.7 + 0.3*intensity), 2)
-    
-    sim["results"] = {
-        "population_change_percent": pop_change,
-        "risk_change_percent": risk_change,
-        "biodiversity_index": biodiversity_index,
-        "trajectories": trajectories,
-    }
-    
+            return pool[:limit]
+
+    # If no custom selection or no matches, fall back to sampling
+    if sampling == 'top-by-images':
+        return sorted(species_counts, key=lambda x: x[1], reverse=True)[:limit]
+    shuffled = species_counts[:]
+    rnd.shuffle(shuffled)
+    return shuffled[:limit]
+
+
+async def _set_progress(sim_id: int, phase: str, progress: int) -> bool:
+    """Record and broadcast progress; False once the simulation is no longer running."""
+    if not await _store.update_progress(sim_id, phase, progress):
+        return False
+    try:
+        await emit_sim_progress(sim_id, phase, progress)
+    except Exception as e:
+        print(f"Error emitting progress: {e}")
+    return True
+
+
+async def run_phases(sim_id: int, intervention: dict | None = None):
+    """
+    Run the population-dynamics engine (app.services.population) for a simulation
+
+    Species and their starting populations come from the dataset's
+    per-species image counts; the projection runs in the shared process
+    pool and progress is emitted after every integration chunk. The same
+    seed (in the intervention config, or the one reported in the results)
+    reproduces the run.
+    """
+    sim = await _store.get_simulation(sim_id)
+    if sim is None:
+        return
+    config = sim["intervention_config"] if isinstance(sim.get("intervention_config"), dict) else {}
+    try:
+        opts = _engine_options(config)
+    except (TypeError, ValueError) as e:
+        await _store.finish_simulation(sim_id, "failed", error=str(e))
+        return
+
+    if not await _set_progress(sim_id, "loading data", 5):
+        return
+    # Fallback if no real dataset present anywhere
+    species_counts = await asyncio.to_thread(_species_counts) or DEFAULT_SPECIES
+    picked = _pick_species(species_counts, config, opts["species_limit"], opts["sampling"], random.Random(opts["seed"]))
+
+    # Another worker may stop the run; its status is checked with every progress write
+    running = [True]
+
+    async def on_chunk(done: int, total: int):
+        running[0] = await _set_progress(sim_id, "simulating dynamics", 5 + 90 * done // total)
+
+    try:
+        results = await simulate_population(
+            [n for _, n in picked], opts["action"], opts["intensity"], opts["years"], opts["replicas"], opts["seed"],
+            on_progress=on_chunk, cancelled=lambda: not running[0],
+        )
+    except Exception as e:
+        print(f"Simulation {sim_id} failed: {e}")
+        await _store.finish_simulation(sim_id, "failed", error=str(e))
+        return
+    if results is None:
+        return
+
+    final = results.pop("final")
+    results["trajectories"] = [
+        {"species": name, "before": before, "after": int(round(after)), "baseline": int(round(base))}
+        for (name, before), after, base in zip(picked, final["intervention"], final["baseline"])
+    ]
+    results.update(action=opts["action"], intensity=opts["intensity"])
+
+    # Finalize
+    if not await _store.finish_simulation(sim_id, "completed", results=results):
+        return
+
     # Broadcast completion
     try:
-        await emit_sim_completed(sim_id, sim["results"])
+        await emit_sim_completed(sim_id, results)
     except Exception as e:
         print(f"Error emitting completion: {e}")
 
 @router.post("/run")
 async def run_simulation(background_tasks: BackgroundTasks, simulation_id: int = 1, intervention: dict | None = Body(default=None)):
-    sim = _SIM_STATE["store"].get(simulation_id)
-    if not sim:
-        return {
-            "success": False, 
-            "error": {
-                "code": "SIM_NOT_FOUND", 
-                "message": "Simulation not found"
-            }, 
-            "timestamp": datetime.utcnow().isoformat()
-        }
-    
-    sim["status"] = "running"
-    sim["progress"] = 0
-    sim["phase"] = "initializing"
-    
     if intervention:
-        sim["intervention_config"] = intervention
+        try:
+            _engine_options(intervention)
+        except (TypeError, ValueError) as e:
+            return _error("INVALID_INTERVENTION", str(e))
+
+    if not await _store.start_simulation(simulation_id, intervention or None):
+        return _error("SIM_NOT_FOUND", "Simulation not found")
 
     # Start simulation in background
     background_tasks.add_task(run_phases, simulation_id, intervention)
@@ -233,33 +188,26 @@ async def run_simulation(background_tasks: BackgroundTasks, simulation_id: int =
     }
 
 @router.get("/scenarios")
-async def list_scenarios():
-    # Most recent first
-    items = sorted(_SCENARIOS, key=lambda x: x.get("saved_at",""), reverse=True)
-    return {"success": True, "data": items, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
+async def list_scenarios(limit: int = Query(DEFAULT_PAGE, ge=1, le=MAX_PAGE), cursor: str | None = None):
+    # Most recent first; pass next_cursor back as cursor for the following page
+    try:
+        items, next_cursor = await _store.list_scenarios(limit, cursor)
+    except ValueError as e:
+        return _error("INVALID_CURSOR", str(e))
+    return {"success": True, "data": items, "next_cursor": next_cursor, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
 
 
 @router.post("/scenarios")
 async def save_scenario(name: str = "Scenario", simulation_id: int = 1):
-    sim = _SIM_STATE["store"].get(simulation_id)
-    if not sim or not sim.get("results"):
-        return {"success": False, "error": {"code": "NO_RESULTS", "message": "No completed results to save"}, "timestamp": datetime.utcnow().isoformat()}
-    entry = {
-        "id": len(_SCENARIOS) + 1,
-        "name": name,
-        "simulation_id": simulation_id,
-        "saved_at": datetime.utcnow().isoformat(),
-        "ecosystem_config": sim.get("ecosystem_config"),
-        "intervention_config": sim.get("intervention_config"),
-        "results": sim.get("results"),
-    }
-    _SCENARIOS.append(entry)
+    entry = await _store.save_scenario(name, simulation_id)
+    if entry is None:
+        return _error("NO_RESULTS", "No completed results to save")
     return {"success": True, "data": entry, "message": "Saved", "timestamp": datetime.utcnow().isoformat()}
 
 
 @router.get("/{simulation_id}")
 async def get_simulation(simulation_id: int):
-    sim = _SIM_STATE["store"].get(simulation_id)
+    sim = await _store.get_simulation(simulation_id)
     if not sim:
-        return {"success": False, "error": {"code": "SIM_NOT_FOUND", "message": "Simulation not found"}, "timestamp": datetime.utcnow().isoformat()}
+        return _error("SIM_NOT_FOUND", "Simulation not found")
     return {"success": True, "data": sim, "message": "OK", "timestamp": datetime.utcnow().isoformat()}
@@ -1,8 +1,9 @@
 from fastapi import APIRouter, UploadFile, File, Request, Query, BackgroundTasks
 from typing import List
 from datetime import datetime
-from pathlib import Path
-import random
+import asyncio
+
+from services.catalog import CatalogDelta, CatalogImage, get_catalog, subscribe
 
 router = APIRouter()
 
@@ -54,231 +55,157 @@ async def upload_images(files: List[UploadFile] = File(...)):
         "timestamp": datetime.utcnow().isoformat()
     }
 
-# Simple in-memory cache for clusters to avoid rescanning on every request
+# In-memory cache for clusters, built once and then patched per species from
+# dataset catalog deltas (see _apply_catalog_delta) rather than expiring
 _CLUSTERS_CACHE: List[dict] = []
 _CACHE_BUILT_AT: datetime | None = None
-_CACHE_TTL_SECONDS = 300
-
-def _scan_dataset(request: Request) -> List[dict]:
-    # Scan both the primary butterflies dataset and any upserted images
-    # Prioritize upserted species so they appear first in the
-    # clusters list (and therefore on the first page in the UI).
-    roots = [
-        Path("/app/data/temp_extract/train"),
-        Path("/app/data/butterflies/train"),
-    ]
-    existing_roots = [r for r in roots if r.exists() and r.is_dir()]
-    if not existing_roots:
-        print("No dataset directories found; returning empty scan")
-        return []
+_CACHE_BASE_URL: str | None = None
+# Catalog version the cache reflects (see DatasetCatalog.last_version)
+_CACHE_VERSION: int | None = None
 
-    results: List[dict] = []
-
-    # Define allowed image extensions (case-insensitive)
-    ALLOWED_EXTENSIONS = {".jpg", ".jpeg", ".png"}
-    base_url = str(request.base_url).rstrip('/')
+def _cluster_id(species_name: str) -> int:
+    return abs(hash(species_name)) % 10_000_000
 
-    # Map species name -> list of image Paths aggregated across roots
-    from collections import defaultdict
-    species_images: dict[str, list[Path]] = defaultdict(list)
-
-    # Debug: Print current working directory and path info
-    print(f"Current working directory: {Path.cwd()}")
-    for root in existing_roots:
-        print(f"Scanning root: {root}")
-        try:
-            dirs = [d for d in root.iterdir() if d.is_dir()]
-            print(f"  Found {len(dirs)} species directories under {root}")
-            for d in dirs[:5]:
-                print(f"    - {d.name}")
-        except Exception as e:
-            print(f"Error listing species directories in {root}: {e}")
-            continue
 
-        for species_dir in dirs:
-            try:
-                imgs: list[Path] = []
-                try:
-                    all_files = list(species_dir.iterdir())
-                    imgs = [
-                        f for f in all_files
-                        if f.is_file() and f.suffix.lower() in ALLOWED_EXTENSIONS
-                    ]
-                except Exception as e:
-                    print(f"  Error listing images in {species_dir}: {e}")
-                    continue
+def _cluster(species_name: str, size: int, images: List[CatalogImage], base_url: str) -> dict:
+    # Images under temp_extract are served from /uploads, the base dataset from /static
+    image_urls = [f"{base_url}/{img.url_path}" for img in images]
+    # Calculate cohesion score based on number of images
+    cohesion = 0.7 + 0.3 * min(1.0, size / 200.0)
+    return {
+        "id": _cluster_id(species_name),
+        "name": species_name.replace("_", " "),
+        "cohesion_score": round(cohesion, 2),
+        "size": size,
+        "is_anomaly": size < 10,
+        "images": image_urls,
+    }
 
-                if not imgs:
-                    continue
 
-                species_images[species_dir.name].extend(imgs)
+def _species_by_priority(catalog) -> List[tuple]:
+    # Prioritize upserted species so they appear first in the clusters list
+    # (and therefore on the first page in the UI).
+    counts = catalog.species_counts()
+    uploaded = {sp for sp, _n in catalog.species_counts(root="uploads")}
+    return [sc for sc in counts if sc[0] in uploaded] + [sc for sc in counts if sc[0] not in uploaded]
 
-            except Exception as e:
-                print(f"  Error processing {species_dir.name} in {root}: {e}")
-                import traceback
-                traceback.print_exc()
-                continue
 
-    if not species_images:
-        print("No images found in any dataset roots")
+def _scan_dataset(request: Request) -> List[dict]:
+    # Clusters over both the primary butterflies dataset and any upserted
+    # images, read from the shared dataset catalog instead of walking the tree.
+    catalog = get_catalog()
+    if not catalog.existing_roots():
+        print("No dataset directories found; returning empty scan")
         return []
 
-    print(f"Aggregated {len(species_images)} species across all roots")
-
-    # Process each aggregated species
-    for species_name, imgs in species_images.items():
+    base_url = str(request.base_url).rstrip('/')
+    results: List[dict] = []
+    for species_name, size in _species_by_priority(catalog):
         try:
-            print(f"\nProcessing species: {species_name} with {len(imgs)} images")
-
             # Take up to 5 random images for the cluster
-            sample_size = min(5, len(imgs))
-            sample_imgs = random.sample(imgs, sample_size) if imgs else []
-            
-            # Create image URLs
-            image_urls = []
-            for img in sample_imgs:
-                # Decide which static mount to use based on the image path
-                img_path_str = str(img)
-                if "/app/data/temp_extract/train" in img_path_str:
-                    base_path = "uploads"
-                else:
-                    base_path = "static"
-
-                img_url = f"{base_url}/{base_path}/{species_name}/{img.name}"
-                # Debug log
-                print(f"  Image URL: {img_url}")
-                image_urls.append(img_url)
-                
-                # Debug: Print the first image URL for verification
-                if len(image_urls) == 1:
-                    print(f"  First image URL: {img_url}")
-                
-            # Calculate cohesion score based on number of images
-            size = len(imgs)
-            cohesion = 0.7 + 0.3 * min(1.0, size / 200.0)
-            is_anomaly = size < 10
-            
-            results.append({
-                "id": abs(hash(species_name)) % 10_000_000,
-                "name": species_name.replace("_", " "),
-                "cohesion_score": round(cohesion, 2),
-                "size": size,
-                "is_anomaly": is_anomaly,
-                "images": image_urls,  # Use the image_urls list we created
-            })
-            
+            sample_imgs = catalog.sample_images(species_name, 5)
+            results.append(_cluster(species_name, size, sample_imgs, base_url))
         except Exception as e:
-            print(f"  Error processing {species_dir.name}: {e}")
-            import traceback
-            traceback.print_exc()
+            print(f"  Error processing {species_name}: {e}")
             continue
+
+    if not results:
+        print("No images found in any dataset roots")
+    else:
+        print(f"Aggregated {len(results)} species across all roots")
     return results
 
 def _get_clusters_cached(request: Request) -> List[dict]:
-    global _CLUSTERS_CACHE, _CACHE_BUILT_AT
-
-    fresh = False
-    if _CACHE_BUILT_AT is not None:
-        age = (datetime.utcnow() - _CACHE_BUILT_AT).total_seconds()
-        fresh = age < _CACHE_TTL_SECONDS
+    global _CLUSTERS_CACHE, _CACHE_BUILT_AT, _CACHE_BASE_URL
 
-    if not _CLUSTERS_CACHE or not fresh:
+    if not _CLUSTERS_CACHE:
         print("\n=== Starting full dataset scan ===")
-        print(f"Current time: {datetime.utcnow().isoformat()}")
         print(f"Request URL: {request.url}")
-
         try:
-            scanned = _scan_dataset(request)
-            print(f"SUCCESS: Found {len(scanned)} clusters in dataset")
-            _CLUSTERS_CACHE = scanned
-
-            # Print first cluster as sample
-            if _CLUSTERS_CACHE:
-                print("\nSample cluster:")
-                import json
-                print(json.dumps(_CLUSTERS_CACHE[0], indent=2, default=str))
-
+            _CLUSTERS_CACHE = _scan_dataset(request)
+            print(f"SUCCESS: Found {len(_CLUSTERS_CACHE)} clusters in dataset")
         except Exception as e:
             print(f"ERROR in _get_clusters_cached: {e}")
             import traceback
             traceback.print_exc()
             _CLUSTERS_CACHE = []
-
         _CACHE_BUILT_AT = datetime.utcnow()
+        _CACHE_BASE_URL = str(request.base_url).rstrip('/')
         print(f"=== Dataset scan completed at {_CACHE_BUILT_AT} ===\n")
     else:
         print(f"Using {len(_CLUSTERS_CACHE)} cached clusters built at {_CACHE_BUILT_AT}")
 
     return _CLUSTERS_CACHE
 
+
+def _apply_catalog_delta(delta: CatalogDelta):
+    """Rebuild only the clusters of species whose images were added or removed."""
+    global _CLUSTERS_CACHE, _CACHE_VERSION
+    if not _CLUSTERS_CACHE or _CACHE_BASE_URL is None or _CACHE_VERSION != delta.base:
+        return  # nothing built yet, or already stale and rebuilt on the next request
+    touched = delta.species()
+    catalog = get_catalog()
+    current = {c["id"]: c for c in _CLUSTERS_CACHE}
+    clusters: List[dict] = []
+    for species_name, size in _species_by_priority(catalog):
+        cached = current.get(_cluster_id(species_name))
+        if species_name in touched or cached is None:
+            cached = _cluster(species_name, size, catalog.sample_images(species_name, 5), _CACHE_BASE_URL)
+        clusters.append(cached)
+    # Swap in a new list so concurrent readers never see a partial update
+    _CLUSTERS_CACHE = clusters
+    _CACHE_VERSION = delta.version
+    print(f"Updated clusters for {len(touched)} changed species")
+
+
+subscribe(_apply_catalog_delta)
+
 def _quick_scan(request: Request, max_species: int) -> List[dict]:
-    # Use the mounted butterflies dataset inside the container
-    train_dir = Path("/app/data/butterflies/train")
-    results: List[dict] = []
-    if not train_dir.exists():
-        return []
-    exts = ("*.jpg", "*.jpeg", "*.png", "*.JPG", "*.JPEG", "*.PNG")
+    # First page of clusters with the first few images per species, without
+    # random sampling
+    catalog = get_catalog()
     base_url = str(request.base_url).rstrip('/')
-    count = 0
-    for species_dir in sorted([p for p in train_dir.iterdir() if p.is_dir()]):
-        imgs: List[Path] = []
-        for ext in exts:
-            imgs.extend(species_dir.glob(ext))
-        if not imgs:
-            for sub in [p for p in species_dir.iterdir() if p.is_dir()]:
-                for ext in exts:
-                    imgs.extend(sub.glob(ext))
-                if imgs:
-                    break
-        if not imgs:
-            continue
-        thumbs = imgs[:3]
-        size = len(imgs)
-        cohesion = 0.7 + 0.3 * min(1.0, size / 200.0)
-        is_anomaly = size < 10
-        images = [f"{base_url}/static/{thumb.parent.name}/{thumb.name}" if thumb.parent == species_dir else f"{base_url}/static/{species_dir.name}/{thumb.name}" for thumb in thumbs]
-        results.append({
-            "id": abs(hash(species_dir.name)) % 10_000_000,
-            "name": species_dir.name.replace("_", " "),
-            "cohesion_score": round(cohesion, 2),
-            "size": size,
-            "is_anomaly": is_anomaly,
-            "images": images,
-        })
-        count += 1
-        if count >= max_species:
-            break
+    results: List[dict] = []
+    for species_name, size in _species_by_priority(catalog)[:max_species]:
+        thumbs = catalog.images(species=species_name, limit=3)
+        results.append(_cluster(species_name, size, thumbs, base_url))
     return results
 
 def _build_cache_background(request: Request):
-    global _CLUSTERS_CACHE, _CACHE_BUILT_AT
+    global _CLUSTERS_CACHE, _CACHE_BUILT_AT, _CACHE_BASE_URL, _CACHE_VERSION
+    catalog = get_catalog()
+    catalog.ensure_fresh()
+    version = catalog.last_version
     _CLUSTERS_CACHE = _scan_dataset(request)
+    _CACHE_VERSION = version
     _CACHE_BUILT_AT = datetime.utcnow()
+    _CACHE_BASE_URL = str(request.base_url).rstrip('/')
+
+def _refresh_clusters(request: Request):
+    catalog = get_catalog()
+    catalog.ensure_fresh()
+    if _CACHE_VERSION != catalog.last_version:
+        # changed by another worker, whose deltas never reach this process
+        _build_cache_background(request)
 
 @router.get("/clusters")
 async def get_clusters(request: Request, background_tasks: BackgroundTasks, page: int = Query(1, ge=1), limit: int = Query(24, ge=1, le=200)):
-    global _CLUSTERS_CACHE, _CACHE_BUILT_AT
     # Decide data source without blocking
     data: List[dict] = []
-    fresh = False
-    if _CACHE_BUILT_AT is not None:
-        age = (datetime.utcnow() - _CACHE_BUILT_AT).total_seconds()
-        fresh = age < _CACHE_TTL_SECONDS
 
     if _CLUSTERS_CACHE:
-        # Use whatever is cached immediately
+        # The dataset watcher keeps the cache current; without it this picks up
+        # changes (applied as deltas) at most every few seconds; a reconcile and
+        # its subscribers touch SQLite and the filesystem, so not on the loop
+        await asyncio.to_thread(_refresh_clusters, request)
         data = _CLUSTERS_CACHE
-        # If stale, kick off background refresh but don't block
-        if not fresh:
-            print("Cache is stale; scheduling background refresh...")
-            background_tasks.add_task(_build_cache_background, request)
     else:
         # No cache yet: return a quick, shallow scan immediately
         print("No cache available; serving quick scan and scheduling full build...")
         # Use quick_scan results only; do not fall back to MOCK_CLUSTERS so the
         # UI always reflects real dataset state (possibly empty) instead of
-        # demo data.
-        data = _quick_scan(request, max_species=limit * max(2, page))
+        # demo data. It reads the catalog (SQLite), so not on the loop.
+        data = await asyncio.to_thread(_quick_scan, request, limit * max(2, page))
         background_tasks.add_task(_build_cache_background, request)
 
     # Paginate
@@ -1,103 +1,68 @@
-from fastapi import APIRouter
-from pydantic import BaseModel
-from typing import Dict, Any, List, Optional
-from datetime import datetime
-import random
+from fastapi import APIRouter, Query, Response
+from pydantic import BaseModel, Field
+from typing import List, Literal, Optional, Union
+import asyncio
+
+import numpy as np
+
+from app.services.compute_pool import shutdown_pool
+from app.services.twin_checkpoint import Checkpoint, CheckpointNotFound, get_checkpoint_store
+from app.services.twin_codec import MEDIA_TYPE, encode_frame, quantize
+from app.services.twin_ensemble import DEFAULT_QUANTILES, run_ensemble
+from app.services.twin_registry import TwinBusy, TwinNotFound, get_twin_registry
+from app.services.twin_runs import FRAME_AGENTS, MAX_FPS, RunLimitReached, RunNotFound, TwinRunManager, new_run_id
+from app.services.twin_sweep import AXES, SweepLimitReached, SweepManager, SweepNotFound
+from app.services.twin_world import MAX_AGENTS, N_A, N_B, W, H, World
+from websocket.handlers import emit_twin_frame, emit_twin_run_status, emit_twin_sweep_progress
 
 router = APIRouter()
 
-# --- Minimal ABM world (prototype, in-memory) ---
-# Grid size kept small for demo
-W, H = 40, 24
-
-class World:
-    def __init__(self):
-        self.id = random.randint(1000, 9999)
-        self.step = 0
-        self.temp = 0.0
-        self.rain = 0.0
-        self.poaching = 0.0
-        # resources per cell 0..1
-        self.res = [[0.6 for _ in range(W)] for _ in range(H)]
-        # agents: list of dicts {x,y,species:'A'|'B',energy:float}
-        self.agents: List[Dict[str, Any]] = []
-        for _ in range(60):
-            self.agents.append({"x": random.randrange(W), "y": random.randrange(H), "species": "A", "energy": 0.8})
-        for _ in range(40):
-            self.agents.append({"x": random.randrange(W), "y": random.randrange(H), "species": "B", "energy": 0.8})
-        self.snapshots: List[Dict[str, Any]] = []
-
-    def metrics(self) -> Dict[str, Any]:
-        a = sum(1 for ag in self.agents if ag["species"] == "A")
-        b = sum(1 for ag in self.agents if ag["species"] == "B")
-        biodiv = 0.0
-        tot = a + b
-        if tot:
-            p = a / tot
-            # Simpson-like evenness proxy
-            biodiv = round(1 - (p**2 + (1 - p)**2), 3)
-        risk = max(0.0, min(1.0, 0.3 + 0.2*self.temp + 0.2*(1-self.rain) + 0.3*self.poaching - 0.2*biodiv))
-        return {"count_A": a, "count_B": b, "biodiversity": biodiv, "risk": round(risk, 3)}
-
-    def apply_env(self, temp: float, rain: float, poaching: float):
-        self.temp = max(-1.0, min(1.0, temp))
-        self.rain = max(0.0, min(1.0, rain))
-        self.poaching = max(0.0, min(1.0, poaching))
-
-    def step_once(self, steps: int = 1):
-        for _ in range(steps):
-            self.step += 1
-            # resource regen/decay
-            for y in range(H):
-                for x in range(W):
-                    regen = 0.02 + 0.02*self.rain
-                    decay = 0.01 + 0.02*max(0.0, self.temp)
-                    self.res[y][x] = max(0.0, min(1.0, self.res[y][x] + regen - decay))
-            # move agents randomly, eat, reproduce, die
-            new_agents: List[Dict[str, Any]] = []
-            for ag in self.agents:
-                # random move
-                ag["x"] = (ag["x"] + random.choice([-1, 0, 1])) % W
-                ag["y"] = (ag["y"] + random.choice([-1, 0, 1])) % H
-                # eat resource
-                food = min(0.1, self.res[ag["y"]][ag["x"]])
-                self.res[ag["y"]][ag["x"]] -= food
-                ag["energy"] = max(0.0, min(1.5, ag["energy"] + food - 0.03))
-                # poaching mortality affects both, higher on B
-                mort = 0.01 + 0.09*self.poaching*(1.2 if ag["species"] == "B" else 1.0)
-                # temperature stress: hurts A at high temp, B at low temp
-                if self.temp > 0.4 and ag["species"] == "A":
-                    mort += 0.02
-                if self.temp < -0.4 and ag["species"] == "B":
-                    mort += 0.02
-                # starvation
-                if ag["energy"] < 0.2:
-                    mort += 0.05
-                if random.random() < mort:
-                    continue  # dead
-                # reproduce if high energy and resources
-                if ag["energy"] > 1.2 and random.random() < 0.1:
-                    new_agents.append({"x": ag["x"], "y": ag["y"], "species": ag["species"], "energy": 0.8})
-                    ag["energy"] *= 0.7
-                new_agents.append(ag)
-            self.agents = new_agents[:200]  # cap population
-
-    def snapshot(self, name: str):
-        snap = {
-            "id": len(self.snapshots) + 1,
-            "name": name,
-            "saved_at": datetime.utcnow().isoformat(),
-            "step": self.step,
-            "env": {"temp": self.temp, "rain": self.rain, "poaching": self.poaching},
-            "metrics": self.metrics(),
-        }
-        self.snapshots.append(snap)
-        return snap
-
-_WORLD: Optional[World] = None
+# --- ABM worlds (in-memory, one per twin_id); the engine lives in app.services.twin_world ---
+_twins = get_twin_registry()
+# Full-state checkpoints behind snapshots, shared by all twins so branches can
+# start from any of them
+_checkpoints = get_checkpoint_store()
+
+
+# --- Background runs: worker processes streaming frames over Socket.IO ---
+async def _on_frame(run, frame):
+    await emit_twin_frame(run.run_id, frame)
+
+async def _on_status(run, info):
+    await emit_twin_run_status(run.run_id, info)
+
+def _on_finish(run, world):
+    # completed and cancelled runs keep their progress; failed runs leave the twin as it was
+    # (called in a worker thread: release() waits for the twin's lock)
+    _twins.release(run.twin_id, run.run_id, world)
+
+_runs = TwinRunManager(_on_frame, _on_status, _on_finish)
+
+
+# --- Parameter sweeps: memoized cells computed in the ensemble process pool ---
+async def _on_sweep_progress(sweep, info):
+    await emit_twin_sweep_progress(sweep.sweep_id, info)
+
+_sweeps = SweepManager(_on_sweep_progress)
+
+
+def stop_twin_workers():
+    _runs.shutdown()
+    shutdown_pool()
 
 # --- Schemas ---
-class CreateBody(BaseModel):
+class WorldBody(BaseModel):
+    seed: Optional[int] = None
+    width: int = Field(W, ge=4, le=2000)
+    height: int = Field(H, ge=4, le=2000)
+    agents_a: int = Field(N_A, ge=0, le=500_000)
+    agents_b: int = Field(N_B, ge=0, le=500_000)
+    max_agents: int = Field(MAX_AGENTS, ge=1, le=1_000_000)
+
+    def config(self):
+        return {"w": self.width, "h": self.height, "n_a": self.agents_a, "n_b": self.agents_b, "max_agents": self.max_agents}
+
+class CreateBody(WorldBody):
     temp: float = 0.0
     rain: float = 0.5
     poaching: float = 0.0
@@ -113,55 +78,409 @@ class StepBody(BaseModel):
 class SnapshotBody(BaseModel):
     name: str = "Snapshot"
 
+class RestoreBody(BaseModel):
+    snapshot_id: int
+
+class BranchBody(BaseModel):
+    # snapshot to branch from; omit to branch from the current state
+    snapshot_id: Optional[int] = None
+    # what-if environment for the branch; defaults to the snapshot's
+    temp: Optional[float] = None
+    rain: Optional[float] = None
+    poaching: Optional[float] = None
+    # reseed the branch; without it the branch continues the parent's random stream
+    seed: Optional[int] = None
+
+# Upper bound on replicas * steps for one ensemble request, and on its quantiles
+ENSEMBLE_MAX_WORK = 2_000_000
+ENSEMBLE_MAX_QUANTILES = 11
+
+class EnsembleOptions(BaseModel):
+    replicas: int = Field(64, ge=2, le=4096)
+    steps: int = Field(200, ge=1, le=20_000)
+    seed: Optional[int] = None
+    # record metrics every `every` steps (the last step is always recorded)
+    every: int = Field(1, ge=1, le=10_000)
+    quantiles: List[float] = list(DEFAULT_QUANTILES)
+
+class EnsembleBody(CreateBody, EnsembleOptions):
+    pass
+
+class TwinEnsembleBody(EnsembleOptions):
+    # what-if environment; defaults to the twin's current one
+    temp: Optional[float] = None
+    rain: Optional[float] = None
+    poaching: Optional[float] = None
+
+# Upper bound on cells * replicas * steps for one sweep, and on its cells
+SWEEP_MAX_WORK = 4_000_000
+SWEEP_MAX_CELLS = 4096
+
+class SweepRange(BaseModel):
+    start: float
+    stop: float
+    num: int = Field(5, ge=1, le=64)
+
+    def values(self) -> List[float]:
+        return [round(float(v), 6) for v in np.linspace(self.start, self.stop, self.num)]
+
+# an axis is a fixed value, a list of values or an evenly spaced range
+Axis = Union[float, List[float], SweepRange]
+
+class SweepBody(WorldBody):
+    temp: Axis = SweepRange(start=-1.0, stop=1.0, num=5)
+    rain: Axis = SweepRange(start=0.0, stop=1.0, num=5)
+    poaching: Axis = 0.0
+    steps: int = Field(200, ge=1, le=20_000)
+    replicas: int = Field(8, ge=1, le=256)
+    # fixed by default so repeated and overlapping sweeps reuse memoized cells
+    seed: int = 0
+
+    def axes(self):
+        out = {}
+        for name in AXES:
+            axis = getattr(self, name)
+            out[name] = axis.values() if isinstance(axis, SweepRange) else [float(v) for v in (axis if isinstance(axis, list) else [axis])]
+        return out
+
+class RunBody(BaseModel):
+    steps: int = Field(1000, ge=1, le=1_000_000)
+    # steps per second; omit to run as fast as possible
+    rate: Optional[float] = Field(None, gt=0, le=10_000)
+    fps: float = Field(10.0, gt=0, le=MAX_FPS)
+    agents: int = Field(FRAME_AGENTS, ge=0, le=1_000_000)
+
+
+def _no_twin(twin_id: str):
+    return {"success": False, "error": {"code": "NO_TWIN", "message": f"Twin {twin_id} not found or expired; create a new one"}}
+
+
+def _twin_running(twin_id: str, run_id: str):
+    return {"success": False, "error": {"code": "TWIN_RUNNING", "message": f"Twin {twin_id} is busy with run {run_id}", "run_id": run_id}}
+
+
+def _no_snapshot(twin_id: str, snapshot_id: int):
+    return {"success": False, "error": {"code": "NO_SNAPSHOT", "message": f"Twin {twin_id} has no snapshot {snapshot_id}"}}
+
+
+def _no_checkpoint(snapshot_id: int):
+    return {"success": False, "error": {"code": "NO_CHECKPOINT", "message": f"The saved state of snapshot {snapshot_id} has expired"}}
+
+
+def _no_run(run_id: str):
+    return {"success": False, "error": {"code": "NO_RUN", "message": f"Run {run_id} not found"}}
+
+
+# Payload formats: "json" (default, agents capped at 200, no grid) or "binary"
+# (app.services.twin_codec frame with typed agent arrays and the quantized grid)
+Format = Literal["json", "binary"]
+_BINARY_AGENTS = Query(200, ge=0, le=1_000_000, description="Agents included in binary frames")
+
+
+def _binary(data: bytes) -> Response:
+    return Response(content=data, media_type=MEDIA_TYPE)
+
+
+def state_payload(world: World):
+    return {
+        "twin_id": world.id,
+        "step": world.step,
+        "env": {"temp": world.temp, "rain": world.rain, "poaching": world.poaching},
+        "metrics": world.metrics(),
+        # compress agents for UI
+        "agents": world.agents(limit=200),
+        "grid": {"w": world.w, "h": world.h},
+        "run_id": _twins.running(world.id),
+    }
+
 # --- Endpoints ---
 @router.post("/create")
 def create_world(body: CreateBody):
-    global _WORLD
-    _WORLD = World()
-    _WORLD.apply_env(body.temp, body.rain, body.poaching)
-    return {"success": True, "data": {"twin_id": _WORLD.id, "state": state_payload()} }
+    world = World(body.width, body.height, body.agents_a, body.agents_b, body.max_agents, seed=body.seed)
+    world.apply_env(body.temp, body.rain, body.poaching)
+    twin_id = _twins.create(world)
+    return {"success": True, "data": {"twin_id": twin_id, "state": state_payload(world)}}
 
+@router.get("")
+def list_twins():
+    return {"success": True, "data": _twins.list(), "stats": _twins.stats()}
 
-def state_payload():
-    if not _WORLD:
-        return None
-    # compress agents for UI
-    agents = _WORLD.agents[:200]
-    return {
-        "step": _WORLD.step,
-        "env": {"temp": _WORLD.temp, "rain": _WORLD.rain, "poaching": _WORLD.poaching},
-        "metrics": _WORLD.metrics(),
-        "agents": [{"x": a["x"], "y": a["y"], "s": a["species"]} for a in agents],
-        "grid": {"w": W, "h": H},
-    }
+@router.get("/{twin_id}/state")
+def get_state(twin_id: str, format: Format = "json", agents: int = _BINARY_AGENTS):
+    try:
+        with _twins.use(twin_id) as world:
+            if format == "binary":
+                return _binary(encode_frame(world, agents))
+            return {"success": True, "data": state_payload(world)}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+@router.post("/{twin_id}/apply")
+def apply_env(twin_id: str, body: ApplyBody):
+    try:
+        with _twins.use(twin_id) as world:
+            if _twins.running(twin_id):
+                return _twin_running(twin_id, _twins.running(twin_id))
+            world.apply_env(body.temp, body.rain, body.poaching)
+            return {"success": True, "data": state_payload(world)}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+@router.post("/{twin_id}/step")
+def step_world(twin_id: str, body: StepBody, format: Format = "json", agents: int = _BINARY_AGENTS):
+    """
+    Advance the twin up to 20 steps
+
+    With format=binary the response is a delta frame against the state before
+    this call (its base_step); clients holding that step apply it, others
+    fetch a keyframe from /state?format=binary.
+    """
+    try:
+        with _twins.use(twin_id) as world:
+            if _twins.running(twin_id):
+                return _twin_running(twin_id, _twins.running(twin_id))
+            base, base_step = (quantize(world.res), world.step) if format == "binary" else (None, 0)
+            world.step_once(max(1, min(20, int(body.steps))))
+            if format == "binary":
+                return _binary(encode_frame(world, agents, base, base_step))
+            return {"success": True, "data": state_payload(world)}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+@router.post("/{twin_id}/snapshot")
+def save_snapshot(twin_id: str, body: SnapshotBody):
+    """Save the twin's metrics and its full state (restorable and branchable)"""
+    try:
+        with _twins.use(twin_id) as world:
+            # while a run owns the twin this world is stale and is replaced when the run ends
+            if _twins.running(twin_id):
+                return _twin_running(twin_id, _twins.running(twin_id))
+            checkpoint_id = _checkpoints.put(world)
+            snap = world.snapshot(body.name or "Snapshot")
+            snap["checkpoint_id"] = checkpoint_id
+            return {"success": True, "data": snap}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+def _checkpoint_ids(world: World) -> List[str]:
+    return [s["checkpoint_id"] for s in world.snapshots if "checkpoint_id" in s]
+
+def _snapshot_checkpoint(world: World, snapshot_id: int) -> Checkpoint:
+    snap = next((s for s in world.snapshots if s["id"] == snapshot_id), None)
+    if snap is None or "checkpoint_id" not in snap:
+        raise LookupError(snapshot_id)
+    return _checkpoints.get(snap["checkpoint_id"])
+
+@router.post("/{twin_id}/restore")
+def restore_snapshot(twin_id: str, body: RestoreBody):
+    """Reset the twin to a snapshot's state (later snapshots are kept)"""
+    try:
+        with _twins.use(twin_id) as world:
+            if _twins.running(twin_id):
+                return _twin_running(twin_id, _twins.running(twin_id))
+            try:
+                _snapshot_checkpoint(world, body.snapshot_id).restore(world)
+            except CheckpointNotFound:
+                return _no_checkpoint(body.snapshot_id)
+            except LookupError:
+                return _no_snapshot(twin_id, body.snapshot_id)
+            return {"success": True, "data": state_payload(world)}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+@router.post("/{twin_id}/branch")
+def branch_twin(twin_id: str, body: BranchBody):
+    """
+    Fork a new twin from a snapshot (or the current state)
+
+    The branch starts as an exact copy, random generator state included, so
+    with the same environment it replays what the parent did; change the
+    environment or pass a seed to explore a what-if. The parent is not
+    changed, and the branch inherits its snapshot list.
+    """
+    try:
+        with _twins.use(twin_id) as world:
+            try:
+                if body.snapshot_id is None:
+                    branch = Checkpoint.capture(world).to_world()
+                else:
+                    branch = _snapshot_checkpoint(world, body.snapshot_id).to_world()
+            except CheckpointNotFound:
+                return _no_checkpoint(body.snapshot_id)
+            except LookupError:
+                return _no_snapshot(twin_id, body.snapshot_id)
+            branch.snapshots = [dict(s) for s in world.snapshots]
+    except TwinNotFound:
+        return _no_twin(twin_id)
+    _checkpoints.retain(_checkpoint_ids(branch))
+    branch.apply_env(
+        branch.temp if body.temp is None else body.temp,
+        branch.rain if body.rain is None else body.rain,
+        branch.poaching if body.poaching is None else body.poaching,
+    )
+    if body.seed is not None:
+        branch.seed = body.seed
+        branch.rng = np.random.default_rng(body.seed)
+    branch_id = _twins.create(branch)
+    return {"success": True, "data": {
+        "twin_id": branch_id,
+        "parent": {"twin_id": twin_id, "snapshot_id": body.snapshot_id},
+        "state": state_payload(branch),
+    }}
+
+@router.get("/{twin_id}/snapshots")
+def list_snapshots(twin_id: str):
+    try:
+        with _twins.use(twin_id) as world:
+            return {"success": True, "data": list(reversed(world.snapshots))}
+    except TwinNotFound:
+        return _no_twin(twin_id)
+
+@router.post("/{twin_id}/runs")
+async def start_run(twin_id: str, body: RunBody):
+    """
+    Run the twin for many steps in a worker process
+
+    Frames (binary, see app.services.twin_codec: a keyframe every 30 frames and
+    deltas against the previous frame in between, at most `fps` per second)
+    and status changes are emitted over Socket.IO as "twin_frame" / "twin_run_status" to
+    clients that sent "twin_run_subscribe" with the returned run_id. The twin
+    is read-only until the run completes or is cancelled, then holds the
+    final state.
+    """
+    def launch():
+        # blocking: waits for the twin's lock and sends the world to the new process
+        run_id = new_run_id()
+        try:
+            with _twins.use(twin_id) as world:
+                if _twins.running(twin_id):
+                    return _twin_running(twin_id, _twins.running(twin_id))
+                # claimed before the process exists, so a failed claim never orphans one
+                _twins.claim(twin_id, run_id)
+                return _runs.spawn(twin_id, world, body.steps, body.rate, body.fps, body.agents, run_id=run_id)
+        except RunLimitReached as e:
+            _twins.release(twin_id, run_id)
+            return {"success": False, "error": {"code": "TOO_MANY_RUNS", "message": str(e)}}
+        except Exception:
+            # release() needs the twin's lock, so only once use() has let go of it
+            _twins.release(twin_id, run_id)
+            raise
+
+    try:
+        run = await asyncio.to_thread(launch)
+    except TwinNotFound:
+        return _no_twin(twin_id)
+    except TwinBusy as e:
+        return _twin_running(twin_id, e.run_id)
+    if isinstance(run, dict):
+        return run
+    _runs.attach(run)
+    return {"success": True, "data": run.info()}
+
+async def _ensemble(spec, opts: EnsembleOptions):
+    if opts.replicas * opts.steps > ENSEMBLE_MAX_WORK:
+        return {"success": False, "error": {"code": "ENSEMBLE_TOO_LARGE", "message": f"replicas * steps must be at most {ENSEMBLE_MAX_WORK}"}}
+    # checked here rather than in the schema: pydantic 1 and 2 spell list length constraints differently
+    if not 1 <= len(opts.quantiles) <= ENSEMBLE_MAX_QUANTILES or not all(0.0 <= q <= 1.0 for q in opts.quantiles):
+        return {"success": False, "error": {"code": "BAD_QUANTILES", "message": f"1 to {ENSEMBLE_MAX_QUANTILES} quantiles within [0, 1]"}}
+    data = await run_ensemble(spec, opts.replicas, opts.steps, opts.seed, opts.every, sorted(opts.quantiles))
+    return {"success": True, "data": data}
+
+@router.post("/ensemble")
+async def ensemble(body: EnsembleBody):
+    """
+    Monte Carlo ensemble of freshly created twins
+
+    Runs `replicas` seeded copies of the configuration for `steps` steps
+    (batched array simulations spread over a process pool) and returns the
+    per-step mean, std and quantile bands of count_A, count_B, biodiversity
+    and risk. The response includes the seed to reproduce it.
+    """
+    spec = {"temp": body.temp, "rain": body.rain, "poaching": body.poaching, **body.config()}
+    return await _ensemble(spec, body)
+
+@router.post("/{twin_id}/ensemble")
+async def twin_ensemble(twin_id: str, body: TwinEnsembleBody):
+    """Monte Carlo ensemble starting from the twin's current state (the twin itself is not changed)"""
+    def capture():
+        # copy the state under the twin's lock (blocking, so in a thread); the lock is not held while the ensemble runs
+        with _twins.use(twin_id) as world:
+            return {
+                "checkpoint": Checkpoint.capture(world),
+                "temp": world.temp if body.temp is None else body.temp,
+                "rain": world.rain if body.rain is None else body.rain,
+                "poaching": world.poaching if body.poaching is None else body.poaching,
+            }
+
+    try:
+        spec = await asyncio.to_thread(capture)
+    except TwinNotFound:
+        return _no_twin(twin_id)
+    return await _ensemble(spec, body)
+
+def _no_sweep(sweep_id: str):
+    return {"success": False, "error": {"code": "NO_SWEEP", "message": f"Sweep {sweep_id} not found"}}
+
+@router.post("/sweep")
+async def start_sweep(body: SweepBody):
+    """
+    Sweep temp x rain x poaching over fresh twins
+
+    Every cell of the grid runs `replicas` seeded twins for `steps` steps in
+    the shared process pool. Cells already computed for the same world
+    configuration, seed, steps and replicas (by any earlier or concurrent
+    sweep) are reused. Progress is emitted over Socket.IO as
+    "twin_sweep_progress" to clients that sent "twin_sweep_subscribe" with the
+    returned sweep_id; the risk / biodiversity surface is then available from
+    GET /sweeps/{sweep_id}.
+    """
+    axes = body.axes()
+    cells = len(axes["temp"]) * len(axes["rain"]) * len(axes["poaching"])
+    if cells > SWEEP_MAX_CELLS or cells * body.replicas * body.steps > SWEEP_MAX_WORK:
+        return {"success": False, "error": {"code": "SWEEP_TOO_LARGE", "message": f"At most {SWEEP_MAX_CELLS} cells and cells * replicas * steps <= {SWEEP_MAX_WORK}"}}
+    try:
+        sweep = _sweeps.start(body.config(), axes, body.steps, body.replicas, body.seed)
+    except SweepLimitReached as e:
+        return {"success": False, "error": {"code": "TOO_MANY_SWEEPS", "message": str(e)}}
+    return {"success": True, "data": sweep.info()}
+
+@router.get("/sweeps/{sweep_id}")
+async def get_sweep(sweep_id: str):
+    """Sweep progress; once completed also the surface: each metric as a [temp][rain][poaching] nested list"""
+    try:
+        sweep = _sweeps.get(sweep_id)
+    except SweepNotFound:
+        return _no_sweep(sweep_id)
+    return {"success": True, "data": {**sweep.info(), "result": sweep.result}}
+
+@router.get("/runs/{run_id}")
+async def get_run(run_id: str):
+    try:
+        return {"success": True, "data": _runs.get(run_id).info()}
+    except RunNotFound:
+        return _no_run(run_id)
+
+@router.post("/runs/{run_id}/{action}")
+async def control_run(run_id: str, action: Literal["pause", "resume", "cancel"]):
+    """Pause, resume or cancel a run; the new state is confirmed by a "twin_run_status" event."""
+    try:
+        run = getattr(_runs, action)(run_id)
+    except RunNotFound:
+        return _no_run(run_id)
+    return {"success": True, "data": run.info()}
 
-@router.get("/state")
-def get_state():
-    return {"success": True, "data": state_payload()}
-
-@router.post("/apply")
-def apply_env(body: ApplyBody):
-    if not _WORLD:
-        return {"success": False, "error": {"code": "NO_TWIN", "message": "Create twin first"}}
-    _WORLD.apply_env(body.temp, body.rain, body.poaching)
-    return {"success": True, "data": state_payload()}
-
-@router.post("/step")
-def step_world(body: StepBody):
-    if not _WORLD:
-        return {"success": False, "error": {"code": "NO_TWIN", "message": "Create twin first"}}
-    _WORLD.step_once(max(1, min(20, int(body.steps))))
-    return {"success": True, "data": state_payload()}
-
-@router.post("/snapshot")
-def save_snapshot(body: SnapshotBody):
-    if not _WORLD:
-        return {"success": False, "error": {"code": "NO_TWIN", "message": "Create twin first"}}
-    snap = _WORLD.snapshot(body.name or "Snapshot")
-    return {"success": True, "data": snap}
-
-@router.get("/snapshots")
-def list_snapshots():
-    if not _WORLD:
-        return {"success": True, "data": []}
-    return {"success": True, "data": list(reversed(_WORLD.snapshots))}
+@router.delete("/{twin_id}")
+def delete_twin(twin_id: str):
+    run_id = _twins.running(twin_id)
+    if run_id:
+        _runs.cancel(run_id)
+    try:
+        with _twins.use(twin_id) as world:
+            checkpoint_ids = _checkpoint_ids(world)
+    except TwinNotFound:
+        return _no_twin(twin_id)
+    if not _twins.delete(twin_id):
+        return _no_twin(twin_id)
+    # the twin's snapshots go with it, unless a branch inherited them
+    _checkpoints.release(checkpoint_ids)
+    return {"success": True, "data": {"twin_id": twin_id}}
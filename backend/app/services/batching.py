@@ -0,0 +1,120 @@
+import asyncio
+import os
+import queue
+import threading
+import time
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+# Defaults for the classifier's batching queue; tune per deployment. A larger
+# batch raises throughput under load, a longer wait trades latency for fuller
+# batches when traffic is light.
+MAX_BATCH_SIZE = int(os.getenv("BUTTERFLY_MAX_BATCH_SIZE", "16"))
+MAX_WAIT_MS = float(os.getenv("BUTTERFLY_MAX_WAIT_MS", "5"))
+
+_STOP = object()
+
+
+class MicroBatcher:
+    """Coalesces concurrent single-image requests into batched forward passes.
+
+    Callers ``await submit(x)`` with one preprocessed input. A dedicated worker
+    thread takes the first queued item, keeps collecting until it has
+    ``max_batch_size`` items or ``max_wait_ms`` has elapsed, runs
+    ``forward(np.stack(items))`` once and resolves each caller's future with
+    its row of the output. The event loop never runs the model itself.
+    """
+
+    def __init__(
+        self,
+        forward: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_wait_ms: float = MAX_WAIT_MS,
+        name: str = "micro-batcher",
+    ):
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be >= 1")
+        self.forward = forward
+        self.max_batch_size = max_batch_size
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        # Counters for monitoring / the benchmark
+        self.batches = 0
+        self.items = 0
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout=timeout)
+
+    @property
+    def mean_batch_size(self) -> float:
+        return self.items / self.batches if self.batches else 0.0
+
+    async def submit(self, x: np.ndarray) -> np.ndarray:
+        """Queue one input (without batch axis) and wait for its output row."""
+        self.start()
+        loop = asyncio.get_running_loop()
+        fut = loop.create_future()
+        self._queue.put((x, fut, loop))
+        return await fut
+
+    def _collect(self, first) -> List[Tuple[np.ndarray, asyncio.Future, asyncio.AbstractEventLoop]]:
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.put(_STOP)  # finish this batch, then exit
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                return
+            batch = self._collect(first)
+            # Skip callers that gave up (e.g. client disconnected)
+            batch = [b for b in batch if not b[1].cancelled()]
+            if not batch:
+                continue
+            try:
+                out = self.forward(np.stack([b[0] for b in batch]))
+                if len(out) != len(batch):
+                    raise RuntimeError(f"forward returned {len(out)} rows for a batch of {len(batch)}")
+            except Exception as e:
+                for _x, fut, loop in batch:
+                    loop.call_soon_threadsafe(_set_exception, fut, e)
+                continue
+            self.batches += 1
+            self.items += len(batch)
+            for i, (_x, fut, loop) in enumerate(batch):
+                loop.call_soon_threadsafe(_set_result, fut, out[i])
+
+
+def _set_result(fut: asyncio.Future, value):
+    if not fut.done():
+        fut.set_result(value)
+
+
+def _set_exception(fut: asyncio.Future, exc: BaseException):
+    if not fut.done():
+        fut.set_exception(exc)
@@ -0,0 +1,172 @@
+import hashlib
+import mmap
+import os
+import secrets
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+# Content-addressed store for image payloads handed to Celery workers. The
+# default lives in /dev/shm (shared memory) when the API and the workers share
+# a host; across containers point GAIA_BLOB_DIR at a volume both mount.
+_DEFAULT_DIR = "/dev/shm/gaia-blobs" if os.path.isdir("/dev/shm") else os.path.join(tempfile.gettempdir(), "gaia-blobs")
+BLOB_DIR = Path(os.getenv("GAIA_BLOB_DIR", _DEFAULT_DIR))
+# Blobs not written or reused for this long are swept
+BLOB_TTL_SECONDS = float(os.getenv("GAIA_BLOB_TTL_SECONDS", "3600"))
+# Size cap; beyond it the least recently used blobs are swept first
+BLOB_MAX_BYTES = int(os.getenv("GAIA_BLOB_MAX_BYTES", str(256 * 1024 * 1024)))
+_SWEEP_INTERVAL = 60.0
+_HEX = frozenset("0123456789abcdef")
+
+REF_PREFIX = "blob:"
+
+
+def is_ref(value) -> bool:
+    return isinstance(value, str) and value.startswith(REF_PREFIX)
+
+
+class BlobStore:
+    """Write-once files named by the SHA-256 of their content.
+
+    put() returns a short "blob:<sha256>.<lease>" reference that is cheap to
+    send through the broker. Identical payloads are stored once: every put
+    adds a hard link (the lease) to the same file, and delete() drops one
+    lease, removing the content with the last. Readers map the file instead
+    of copying it (see open()), so a worker decodes straight out of the page
+    cache, or out of shared memory under /dev/shm.
+    """
+
+    def __init__(self, root: Path = BLOB_DIR, ttl: float = BLOB_TTL_SECONDS, max_bytes: int = BLOB_MAX_BYTES):
+        self.root = Path(root)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._last_sweep = 0.0
+        # bytes on disk as of the last sweep plus those written since (by this process)
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> Path:
+        digest, dot, lease = name.partition(".")
+        if len(digest) != 64 or not _HEX.issuperset(digest) or (dot and (len(lease) != 16 or not _HEX.issuperset(lease))):
+            raise ValueError(f"Invalid blob digest: {name!r}")
+        return self.root / digest[:2] / name
+
+    def path_for(self, ref: str) -> Path:
+        if not is_ref(ref):
+            raise ValueError(f"Not a blob reference: {ref!r}")
+        return self._path(ref[len(REF_PREFIX):])
+
+    def put(self, data: bytes) -> str:
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        lease = path.with_name(f"{digest}.{secrets.token_hex(8)}")
+        while True:
+            if not path.exists():
+                self._write(path, data)
+            try:
+                os.link(path, lease)
+                break
+            except FileNotFoundError:
+                continue  # the content was deleted or swept in between: write it again
+        os.utime(lease)  # in use: push back its expiry (shared by every name of the blob)
+        self._maybe_sweep()
+        return REF_PREFIX + lease.name
+
+    def _write(self, path: Path, data: bytes):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+        with self._lock:
+            self._bytes += len(data)
+
+    @contextmanager
+    def open(self, ref: str) -> Iterator[mmap.mmap]:
+        """Read-only memory map of the blob; usable anywhere a binary file is."""
+        with open(self.path_for(ref), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            yield mm
+        finally:
+            mm.close()
+
+    def read(self, ref: str) -> bytes:
+        return self.path_for(ref).read_bytes()
+
+    def delete(self, ref: str):
+        """Drop a reference; the content goes with its last lease."""
+        path = self.path_for(ref)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        content = path.with_name(path.name.partition(".")[0])
+        try:
+            # a put racing this links before we unlink, and its lease keeps the data
+            if content != path and os.stat(content).st_nlink == 1:
+                content.unlink()
+        except FileNotFoundError:
+            pass
+
+    def _maybe_sweep(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last_sweep < _SWEEP_INTERVAL and self._bytes <= self.max_bytes:
+                return
+            self._last_sweep = now
+        self.sweep()
+
+    def sweep(self, max_age: Optional[float] = None) -> int:
+        """Delete blobs older than max_age seconds (default: the TTL), then the
+        least recently used ones while over max_bytes; returns how many."""
+        cutoff = time.time() - (self.ttl if max_age is None else max_age)
+        if not self.root.is_dir():
+            return 0
+        # every name (content file and leases) of each stored blob
+        blobs: dict = {}
+        for shard in os.scandir(self.root):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                try:
+                    st = entry.stat()
+                except FileNotFoundError:
+                    continue
+                if entry.name.startswith(".tmp-") and st.st_mtime >= cutoff:
+                    continue  # a put still writing
+                blobs.setdefault(st.st_ino, (st.st_mtime, st.st_size, []))[2].append(entry.path)
+        by_age = sorted(blobs.values())
+        total = sum(size for _mtime, size, _paths in by_age)
+        removed = 0
+        for mtime, size, paths in by_age:
+            if mtime >= cutoff and total <= self.max_bytes:
+                break
+            for p in paths:
+                try:
+                    os.unlink(p)
+                except FileNotFoundError:
+                    pass
+            total -= size
+            removed += 1
+        with self._lock:
+            self._bytes = total
+        return removed
+
+
+_STORE: Optional[BlobStore] = None
+
+
+def get_blob_store() -> BlobStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = BlobStore()
+    return _STORE
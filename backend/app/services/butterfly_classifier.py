@@ -1,13 +1,31 @@
+import asyncio
 import os
 import tensorflow as tf
 from tensorflow.keras.models import load_model
 from tensorflow.keras import backend as K
 import numpy as np
-from PIL import Image
 from fastapi import HTTPException
 from typing import List, Dict, Any, Optional, Union, Tuple
 import json
 
+from .batching import MicroBatcher
+from .imaging import ImageSource, to_model_input
+from .inference_backends import BACKEND, InferenceBackend, KerasBackend, load_backend, resolve_backend, to_probabilities
+
+# Model file locations, first match wins
+MODEL_PATHS = [
+    '/app/data/butterflies/efficientnetb0_butterfly_model.h5',  # Docker container path
+    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'butterflies', 'efficientnetb0_butterfly_model.h5'),  # Local dev path
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'butterflies', 'efficientnetb0_butterfly_model.h5')
+]
+
+# Training directories whose sub-folders are the class names
+TRAIN_DIRS = [
+    '/app/data/butterflies/train',  # Docker container path
+    os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'butterflies', 'train'),  # Local dev path
+    os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'butterflies', 'train')
+]
+
 # Create a custom DepthwiseConv2D class to handle the 'groups' parameter
 class FixedDepthwiseConv2D(tf.keras.layers.DepthwiseConv2D):
     def __init__(self, *args, **kwargs):
@@ -29,8 +47,13 @@ class ButterflyClassifier:
                 print(e)
         
         self.model = None
+        self.backend: Optional[InferenceBackend] = None
+        # Identifies the weights and backend in prediction cache keys
+        self.model_version = "unloaded"
         self.class_names = []
         self.load_model()
+        # Concurrent predict_async calls share batched forward passes
+        self.batcher = MicroBatcher(self.predict_proba, name="butterfly-batcher")
     
     def load_model(self):
         try:
@@ -39,33 +62,26 @@ class ButterflyClassifier:
                 'FixedDepthwiseConv2D': FixedDepthwiseConv2D
             }
             
-            # Try multiple possible model paths
-            possible_paths = [
-                '/app/data/butterflies/efficientnetb0_butterfly_model.h5',  # Docker container path
-                os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'butterflies', 'efficientnetb0_butterfly_model.h5'),  # Local dev path
-                os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'butterflies', 'efficientnetb0_butterfly_model.h5')
-            ]
-            
             model_loaded = False
-            for model_path in possible_paths:
+            for model_path in MODEL_PATHS:
                 if os.path.exists(model_path):
                     print(f"Attempting to load model from: {model_path}")
                     try:
                         # Try to load the model with the custom objects
-                        self.model = load_model(
-                            model_path, 
-                            custom_objects=custom_objects,
-                            compile=False
-                        )
-                        # Verify the model was loaded correctly
-                        if self.model is not None:
-                            print(f"Successfully loaded model from: {model_path}")
-                            print(f"Model input shape: {self.model.input_shape}")
-                            print(f"Model output shape: {self.model.output_shape}")
-                            model_loaded = True
-                            break
-                        else:
-                            print(f"Warning: Model loaded but is None for path: {model_path}")
+                        def load_keras(model_path=model_path):
+                            return load_model(
+                                model_path,
+                                custom_objects=custom_objects,
+                                compile=False
+                            )
+                        self.backend = self._load_backend(model_path, load_keras)
+                        self.model = getattr(self.backend, "model", None)
+                        st = os.stat(model_path)
+                        self.model_version = f"{self.backend.name}:{os.path.basename(model_path)}:{st.st_size}:{st.st_mtime_ns}"
+                        print(f"Successfully loaded model from: {model_path} ({self.backend.name} backend)")
+                        print(f"Model output classes: {self.backend.num_classes}")
+                        model_loaded = True
+                        break
                     except Exception as load_error:
                         print(f"Error loading model from {model_path}: {str(load_error)}")
                         import traceback
@@ -81,13 +97,7 @@ class ButterflyClassifier:
                     print(f"Loaded {len(self.class_names)} class names from model")
                 else:
                     # If not in model, try to load from the training directory
-                    possible_train_dirs = [
-                        '/app/data/butterflies/train',  # Docker container path
-                        os.path.join(os.path.dirname(__file__), '..', '..', '..', 'data', 'butterflies', 'train'),  # Local dev path
-                        os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(__file__)))), 'data', 'butterflies', 'train')
-                    ]
-                    
-                    for data_dir in possible_train_dirs:
+                    for data_dir in TRAIN_DIRS:
                         if os.path.exists(data_dir) and os.path.isdir(data_dir):
                             self.class_names = sorted([d for d in os.listdir(data_dir) 
                                                      if os.path.isdir(os.path.join(data_dir, d))])
@@ -95,8 +105,8 @@ class ButterflyClassifier:
                             break
                     
                     # If still no class names, use the ones from the model's output layer
-                    if not self.class_names and hasattr(self.model, 'output') and hasattr(self.model.output, 'shape'):
-                        num_classes = self.model.output.shape[-1]
+                    if not self.class_names and self.backend.num_classes:
+                        num_classes = self.backend.num_classes
                         self.class_names = [f'class_{i}' for i in range(num_classes)]
                         print(f"Using {num_classes} generic class names")
                     
@@ -111,8 +121,20 @@ class ButterflyClassifier:
             print(f"Error loading model: {str(e)}")
             # Load a placeholder model if the main one fails
             self.model = self._create_placeholder_model()
+            self.backend = KerasBackend(self.model)
+            self.model_version = "placeholder"
             self.class_names = ['Placeholder Class']
 
+    def _load_backend(self, model_path: str, load_keras) -> InferenceBackend:
+        """Serve the model with the BUTTERFLY_BACKEND backend, falling back to Keras."""
+        if resolve_backend(BACKEND) != "keras":
+            try:
+                train_dir = next((d for d in TRAIN_DIRS if os.path.isdir(d)), None)
+                return load_backend(BACKEND, model_path, load_keras, calibration_dir=train_dir)
+            except Exception as e:
+                print(f"Warning: {BACKEND} backend unavailable ({e}); falling back to Keras")
+        return KerasBackend(load_keras())
+
     def _create_placeholder_model(self):
         """Create a minimal model for development purposes"""
         model = tf.keras.Sequential([
@@ -120,166 +142,153 @@ class ButterflyClassifier:
         ])
         return model
 
-    def preprocess_image(self, img_path: str):
+    def preprocess_image(self, image: ImageSource):
         """
         Preprocess the image for prediction
-        
+
         Args:
-            img_path: Path to the image file
-            
+            image: Encoded image bytes, a binary file object, a PIL image or a path.
+                In-memory inputs are decoded without any temporary files.
+
         Returns:
             Preprocessed image array ready for model input
         """
         try:
-            # Open and convert to RGB (in case image is RGBA or grayscale)
-            img = Image.open(img_path).convert('RGB')
-            
-            # Resize to expected input shape
-            target_size = (224, 224)
-            if img.size != target_size:
-                img = img.resize(target_size, Image.Resampling.LANCZOS)
-            
-            # Convert to numpy array and normalize
-            img_array = np.array(img, dtype=np.float32) / 255.0
-            
+            # Decode (downscaled for JPEGs), convert to RGB and resize to the model input
+            img_array = to_model_input(image)
+
             # Add batch dimension
             img_array = np.expand_dims(img_array, axis=0)
-            
+
             # Verify the shape is correct
             if img_array.shape != (1, 224, 224, 3):
                 print(f"Warning: Unexpected image shape after preprocessing: {img_array.shape}")
-                
+
             return img_array
-            
+
         except Exception as e:
             error_msg = f"Error processing image: {str(e)}"
             print(error_msg)
             raise HTTPException(status_code=400, detail=error_msg)
-    
-    def predict(self, img_path: str, top_k: int = 5) -> List[Dict[str, Any]]:
+
+    def predict_proba(self, batch: np.ndarray) -> np.ndarray:
+        """Run the model on a (N, 224, 224, 3) batch and return (N, classes) probabilities."""
+        return to_probabilities(self.backend.predict(batch))
+
+    def _top_k(self, predictions: np.ndarray, top_k: int) -> List[Dict[str, Any]]:
+        """Format one row of class probabilities as the top_k result dicts."""
+        try:
+            predictions = np.asarray(predictions, dtype=np.float32).ravel()
+
+            # Get indices of top k predictions
+            top_k = min(top_k, len(predictions))
+
+            # Get top k indices with highest confidence
+            top_k_indices = np.argpartition(predictions, -top_k)[-top_k:]
+
+            # Sort by confidence in descending order
+            top_k_indices = top_k_indices[np.argsort(predictions[top_k_indices])][::-1]
+
+            # Prepare results
+            results = []
+            total_confidence = float(np.sum(predictions[top_k_indices]))
+
+            for i, idx in enumerate(top_k_indices):
+                idx = int(idx)
+                raw_confidence = float(predictions[idx])
+
+                # Normalize confidence to sum to 1.0 for top-k
+                normalized_confidence = raw_confidence / total_confidence if total_confidence > 0 else 0.0
+
+                # Get class name with fallback
+                species = f"class_{idx}"
+                if (isinstance(self.class_names, (list, np.ndarray)) and
+                    0 <= idx < len(self.class_names)):
+                    species = str(self.class_names[idx])
+
+                # Format confidence as percentage with 2 decimal places
+                confidence_pct = round(normalized_confidence * 100, 2)
+
+                results.append({
+                    "species": species,
+                    "confidence": confidence_pct / 100.0,  # Store as float between 0-1
+                    "confidence_pct": confidence_pct,      # Store as percentage for display
+                    "class_id": idx
+                })
+
+            return results
+
+        except Exception as e:
+            error_msg = f"Error processing top-k predictions: {str(e)}"
+            print(error_msg)
+            import traceback
+            print(traceback.format_exc())
+            return [{"species": "processing_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
+
+    def predict(self, image: ImageSource, top_k: int = 5) -> List[Dict[str, Any]]:
         """
-        Make predictions on an image
-        
+        Make predictions on an image (synchronous, batch of one)
+
         Args:
-            img_path: Path to the image file
+            image: Encoded image bytes, a binary file object, a PIL image or a path
             top_k: Number of top predictions to return
-            
+
         Returns:
             List of prediction dictionaries with species, confidence, and class_id
         """
-        print(f"Starting prediction for {img_path}...")
-        
         # Check if model is loaded
-        if self.model is None:
+        if self.backend is None:
             error_msg = "Error: Model is not loaded. Cannot make predictions."
             print(error_msg)
             return [{"species": "model_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
-        
-        try:
-            # Preprocess the image
-            print("Preprocessing image...")
-            processed_img = self.preprocess_image(img_path)
-            
-            if processed_img is None:
-                error_msg = "Error: Failed to preprocess image"
-                print(error_msg)
-                return [{"species": "preprocess_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
-
-            # Print input shape for debugging
-            print(f"Model input shape: {processed_img.shape}, dtype: {processed_img.dtype}")
-            print(f"Input range - min: {np.min(processed_img):.4f}, max: {np.max(processed_img):.4f}")
 
-            # Make prediction
-            print("Running model prediction...")
-            predictions = self.model.predict(processed_img, verbose=1)  # Set verbose=1 to see prediction progress
-            print(f"Raw predictions shape: {predictions.shape}")
-            
-            # Ensure we have valid predictions
-            if predictions is None or predictions.size == 0:
+        try:
+            processed_img = self.preprocess_image(image)
+            predictions = self.predict_proba(processed_img)
+            if predictions.size == 0:
                 error_msg = "Received empty predictions from model"
                 print(error_msg)
                 return [{"species": "prediction_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
-            
-            # Convert predictions to 1D array and apply softmax if needed
-            try:
-                predictions = np.squeeze(predictions)
-                
-                # If model doesn't have softmax activation, apply it manually
-                if not np.allclose(np.sum(predictions), 1.0, rtol=1e-3):
-                    print("Applying softmax to predictions")
-                    predictions = np.exp(predictions) / np.sum(np.exp(predictions))
-                
-                # Ensure we have a 1D array
-                if predictions.ndim > 1:
-                    predictions = predictions[0]  # Take first sample if batch prediction
-                
-                predictions = np.asarray(predictions, dtype=np.float32)
-                
-                # Print prediction stats for debugging
-                print(f"Predictions - min: {np.min(predictions):.6f}, "
-                      f"max: {np.max(predictions):.6f}, "
-                      f"sum: {np.sum(predictions):.6f}")
-                
-            except Exception as e:
-                error_msg = f"Error processing predictions: {str(e)}"
-                print(error_msg)
-                return [{"species": "processing_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
-            
-            # Get top K predictions
-            try:
-                # Get indices of top k predictions
-                top_k = min(top_k, len(predictions))
-                
-                # Get top k indices with highest confidence
-                top_k_indices = np.argpartition(predictions, -top_k)[-top_k:]
-                
-                # Sort by confidence in descending order
-                top_k_indices = top_k_indices[np.argsort(predictions[top_k_indices])][::-1]
-                
-                # Prepare results
-                results = []
-                total_confidence = np.sum(predictions[top_k_indices])
-                
-                for i, idx in enumerate(top_k_indices):
-                    idx = int(idx)
-                    raw_confidence = float(predictions[idx])
-                    
-                    # Normalize confidence to sum to 1.0 for top-k
-                    normalized_confidence = raw_confidence / total_confidence if total_confidence > 0 else 0.0
-                    
-                    # Get class name with fallback
-                    species = f"class_{idx}"
-                    if (isinstance(self.class_names, (list, np.ndarray)) and 
-                        0 <= idx < len(self.class_names)):
-                        species = str(self.class_names[idx])
-                    
-                    # Format confidence as percentage with 2 decimal places
-                    confidence_pct = round(normalized_confidence * 100, 2)
-                    
-                    results.append({
-                        "species": species,
-                        "confidence": confidence_pct / 100.0,  # Store as float between 0-1
-                        "confidence_pct": confidence_pct,      # Store as percentage for display
-                        "class_id": idx
-                    })
-                
-                print(f"Successfully generated {len(results)} predictions")
-                print("Top predictions:", [
-                    f"{r['species']}: {r['confidence_pct']:.2f}%" 
-                    for r in results
-                ])
-                
-                return results
-                
-            except Exception as e:
-                error_msg = f"Error processing top-k predictions: {str(e)}"
-                print(error_msg)
-                import traceback
-                print(traceback.format_exc())
-                return [{"species": "processing_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
-            
+            return self._top_k(predictions[0], top_k)
+        except HTTPException:
+            raise
         except Exception as e:
             raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
 
-# Singleton instance
-butterfly_classifier = ButterflyClassifier()
+    async def predict_async(self, image: ImageSource, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Make predictions through the micro-batching queue
+
+        Preprocessing runs in a worker thread and the forward pass is shared
+        with any other requests that arrive within the batching window, so the
+        event loop never blocks on the model.
+        """
+        if self.backend is None:
+            error_msg = "Error: Model is not loaded. Cannot make predictions."
+            print(error_msg)
+            return [{"species": "model_error", "confidence": 0.0, "class_id": -1, "error": error_msg}]
+
+        processed_img = await asyncio.to_thread(self.preprocess_image, image)
+        try:
+            predictions = await self.batcher.submit(processed_img[0])
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"Prediction failed: {str(e)}")
+        return self._top_k(predictions, top_k)
+
+    def predict_batch(self, images: np.ndarray, top_k: int = 5) -> List[List[Dict[str, Any]]]:
+        """
+        One forward pass over already preprocessed images
+
+        Args:
+            images: (N, 224, 224, 3) float32 array, e.g. stacked to_model_input() outputs
+            top_k: Number of top predictions to return per image
+
+        Returns:
+            Per-image prediction lists, in input order
+        """
+        if self.backend is None:
+            error_msg = "Error: Model is not loaded. Cannot make predictions."
+            return [[{"species": "model_error", "confidence": 0.0, "class_id": -1, "error": error_msg}] for _ in images]
+        return [self._top_k(row, top_k) for row in self.predict_proba(images)]
+
+# The shared instance is built in the background by model_loader.butterfly_model
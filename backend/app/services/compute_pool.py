@@ -0,0 +1,25 @@
+import multiprocessing as mp
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+# Worker processes shared by the CPU-bound simulations (twin ensembles and
+# sweeps, population dynamics); "spawn" keeps them clear of the API's threads
+COMPUTE_WORKERS = int(os.getenv("GAIA_COMPUTE_WORKERS", str(os.cpu_count() or 1)))
+
+_POOL: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """The shared process pool (at most COMPUTE_WORKERS processes), created on first use."""
+    global _POOL
+    if _POOL is None:
+        _POOL = ProcessPoolExecutor(max_workers=COMPUTE_WORKERS, mp_context=mp.get_context("spawn"))
+    return _POOL
+
+
+def shutdown_pool():
+    global _POOL
+    if _POOL is not None:
+        _POOL.shutdown(wait=False, cancel_futures=True)
+        _POOL = None
@@ -2,13 +2,41 @@ import os
 import google.generativeai as genai
 from fastapi import HTTPException
 from typing import List, Dict, Any
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import base64
-from PIL import Image
-import io
+import copy
+import functools
+import hashlib
 import logging
 
+from .imaging import prepare_upload
+
+# Upstream calls allowed in flight at once; further requests wait their turn
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "4"))
+GEMINI_TIMEOUT_SECONDS = float(os.getenv("GEMINI_TIMEOUT_SECONDS", "60"))
+# "auto" uses the SDK's native async API when the model has one, "thread" always
+# runs the blocking call in a bounded thread pool
+GEMINI_ASYNC_MODE = os.getenv("GEMINI_ASYNC_MODE", "auto").lower()
+
 class GeminiClassifier:
-    def __init__(self, api_key: str = None):
+    def __init__(self, api_key: str = None, model=None, max_concurrency: int = GEMINI_MAX_CONCURRENCY):
+        # Bounded concurrency towards Gemini, and one upstream call per distinct
+        # image among concurrent requests (see classify_image)
+        self.max_concurrency = max(1, max_concurrency)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="gemini")
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.upstream_calls = 0
+        self.coalesced = 0
+
+        if model is not None:
+            # Pre-built model (tests, alternative clients); no API configuration
+            self.api_key = api_key
+            self.model = model
+            self.model_name = getattr(model, "model_name", type(model).__name__)
+            return
+
         # Accept GOOGLE_API_KEY or fallback to GEMINI_API_KEY for flexibility
         self.api_key = api_key or os.getenv("GOOGLE_API_KEY") or os.getenv("GEMINI_API_KEY")
         if not self.api_key:
@@ -19,6 +47,7 @@ class GeminiClassifier:
         # Use a widely available model name for images
         # Note: Some keys/projects only allow certain models; we try a small set deterministically
         self.model = None
+        self.model_name = None
         last_err = None
         # Allow explicit model override via env (e.g., models/gemini-2.5-flash)
         model_env = os.getenv('GEMINI_MODEL')
@@ -39,6 +68,7 @@ class GeminiClassifier:
                 continue
             try:
                 self.model = genai.GenerativeModel(name)
+                self.model_name = name
                 break
             except Exception as e:
                 last_err = e
@@ -47,9 +77,50 @@ class GeminiClassifier:
             raise ValueError(f"Failed to initialize Gemini model: {last_err}")
     
     async def classify_image(self, image_bytes: bytes) -> List[Dict[str, Any]]:
+        """Classify an image, sharing one upstream call among identical concurrent requests.
+
+        The shared call is shielded so a caller that disconnects doesn't cancel
+        it for the others; each caller gets its own copy of the predictions.
+        """
+        key = hashlib.sha256(image_bytes).hexdigest()
+        fut = self._inflight.get(key)
+        if fut is None or fut.get_loop() is not asyncio.get_running_loop():
+            fut = asyncio.ensure_future(self._classify(image_bytes))
+            self._inflight[key] = fut
+            fut.add_done_callback(functools.partial(self._forget, key))
+        else:
+            self.coalesced += 1
+        return copy.deepcopy(await asyncio.shield(fut))
+
+    def _forget(self, key: str, fut: asyncio.Future):
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+
+    async def _generate(self, parts):
+        """One generate_content call without blocking the event loop."""
+        async with self._semaphore:
+            self.upstream_calls += 1
+            native = getattr(self.model, "generate_content_async", None)
+            if native is not None and GEMINI_ASYNC_MODE != "thread":
+                call = native(parts)
+            else:
+                loop = asyncio.get_running_loop()
+                call = loop.run_in_executor(self._executor, self.model.generate_content, parts)
+            return await asyncio.wait_for(call, timeout=GEMINI_TIMEOUT_SECONDS)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "model": self.model_name,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": len(self._inflight),
+            "upstream_calls": self.upstream_calls,
+            "coalesced": self.coalesced,
+        }
+
+    async def _classify(self, image_bytes: bytes) -> List[Dict[str, Any]]:
         try:
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_bytes))
+            # Downscale / re-encode for upload, off the event loop; invalid images fail here
+            upload_bytes, mime_type = await asyncio.to_thread(prepare_upload, image_bytes)
             
             # Prepare the prompt with more specific instructions
             prompt = """
@@ -92,15 +163,15 @@ class GeminiClassifier:
             """
             
             # Prepare content parts: prompt + inline image (base64)
-            img_b64 = base64.b64encode(image_bytes).decode('utf-8')
+            img_b64 = base64.b64encode(upload_bytes).decode('utf-8')
             parts = [
                 {"text": prompt},
-                {"inline_data": {"mime_type": "image/jpeg", "data": img_b64}}
+                {"inline_data": {"mime_type": mime_type, "data": img_b64}}
             ]
 
-            # Generate content (synchronous call; SDK returns a GenerateContentResponse)
+            # Generate content off the event loop (SDK returns a GenerateContentResponse)
             try:
-                response = self.model.generate_content(parts)
+                response = await self._generate(parts)
             except Exception as model_err:
                 # Log the real error for debugging, but return a safe fallback
                 logging.error(f"Gemini generate_content failed: {model_err}")
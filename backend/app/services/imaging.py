@@ -0,0 +1,87 @@
+import io
+import os
+from typing import BinaryIO, Tuple, Union
+
+import numpy as np
+from PIL import Image, ImageOps
+
+# Anything the classifiers accept as an image: a path, the raw encoded bytes,
+# a binary file object, or an already opened PIL image.
+ImageSource = Union[str, os.PathLike, bytes, bytearray, memoryview, BinaryIO, Image.Image]
+
+MODEL_INPUT_SIZE = (224, 224)
+
+# Uploads to remote vision models: longest side, JPEG quality, and the size under
+# which an already web-friendly file is sent untouched
+UPLOAD_MAX_SIDE = int(os.getenv("GEMINI_UPLOAD_MAX_SIDE", "1024"))
+UPLOAD_JPEG_QUALITY = int(os.getenv("GEMINI_UPLOAD_JPEG_QUALITY", "85"))
+UPLOAD_PASSTHROUGH_BYTES = 512 * 1024
+_PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+
+def open_image(source: ImageSource) -> Image.Image:
+    """Open an image from any ImageSource without touching the filesystem for in-memory data."""
+    if isinstance(source, Image.Image):
+        return source
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        source = io.BytesIO(source)
+    return Image.open(source)
+
+
+def load_rgb(source: ImageSource, target_size: Tuple[int, int] = MODEL_INPUT_SIZE) -> Image.Image:
+    """Decode to an RGB image of exactly target_size.
+
+    For JPEGs, Image.draft lets libjpeg decode at 1/2, 1/4 or 1/8 scale (never
+    below target_size), so a 12 MP photo is decoded as ~0.2 MP instead of being
+    fully decoded and then thrown away by the resize.
+    """
+    img = open_image(source)
+    if img.format == "JPEG":
+        img.draft("RGB", target_size)
+    img = img.convert("RGB")
+    if img.size != target_size:
+        img = img.resize(target_size, Image.Resampling.LANCZOS)
+    return img
+
+
+def to_model_input(source: ImageSource, target_size: Tuple[int, int] = MODEL_INPUT_SIZE) -> np.ndarray:
+    """(H, W, 3) float32 array scaled to [0, 1], without the batch axis."""
+    return np.asarray(load_rgb(source, target_size), dtype=np.float32) / 255.0
+
+
+def prepare_upload(
+    data: bytes,
+    max_side: int = UPLOAD_MAX_SIDE,
+    quality: int = UPLOAD_JPEG_QUALITY,
+) -> Tuple[bytes, str]:
+    """Shrink an image for upload and return (bytes, MIME type).
+
+    Small JPEG/PNG/WebP files within max_side are sent as-is with their real
+    MIME type. Everything else gets EXIF rotation applied, alpha flattened
+    onto white, a downscale to max_side (draft-decoded for JPEGs) and a JPEG
+    re-encode. The re-encode is skipped if it would come out larger.
+    """
+    img = open_image(data)
+    fmt = img.format
+    if (
+        fmt in _PASSTHROUGH_FORMATS
+        and len(data) <= UPLOAD_PASSTHROUGH_BYTES
+        and max(img.size) <= max_side
+    ):
+        return bytes(data), Image.MIME[fmt]
+    if fmt == "JPEG":
+        img.draft("RGB", (max_side, max_side))
+    img = ImageOps.exif_transpose(img)
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        img = Image.new("RGB", rgba.size, (255, 255, 255))
+        img.paste(rgba, mask=rgba.getchannel("A"))
+    else:
+        img = img.convert("RGB")
+    img.thumbnail((max_side, max_side), Image.Resampling.LANCZOS)
+    buf = io.BytesIO()
+    img.save(buf, format="JPEG", quality=quality, optimize=True)
+    out = buf.getvalue()
+    if fmt in _PASSTHROUGH_FORMATS and len(out) >= len(data):
+        return bytes(data), Image.MIME[fmt]
+    return out, "image/jpeg"
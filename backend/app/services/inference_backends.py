@@ -0,0 +1,356 @@
+"""Pluggable CPU inference backends for the butterfly classifier.
+
+BUTTERFLY_BACKEND selects how the EfficientNet model is served:
+
+- ``keras`` (default): the original ``.h5`` model through TensorFlow.
+- ``tflite-fp16``: float16 weights, about half the size; runs in float32 on CPU.
+- ``tflite-int8``: full-integer quantization calibrated on training images
+  (int8 weights, activations, input and output), about a quarter of the
+  size and the fastest option on CPU.
+- ``onnx``: ONNX Runtime. Needs ``onnxruntime``, plus ``tf2onnx`` for the
+  one-time conversion.
+
+Converted models are cached in BUTTERFLY_MODEL_CACHE_DIR. The cache key is
+the source model's path, size and mtime, so later starts load only the small
+artifact and never build the Keras graph. To check a backend's accuracy
+against Keras, run:
+
+    python -m app.services.inference_backends --backend tflite-int8 --images /app/data/butterflies/test
+"""
+import argparse
+import hashlib
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from .imaging import to_model_input
+
+BACKEND = os.getenv("BUTTERFLY_BACKEND", "keras").lower()
+MODEL_CACHE_DIR = Path(os.getenv("BUTTERFLY_MODEL_CACHE_DIR", "/app/data/temp_extract/model_cache"))
+NUM_THREADS = int(os.getenv("BUTTERFLY_NUM_THREADS", str(os.cpu_count() or 1)))
+# Images used to calibrate int8 activation ranges
+CALIBRATION_IMAGES = int(os.getenv("BUTTERFLY_CALIBRATION_IMAGES", "200"))
+
+BACKENDS = ("keras", "tflite-fp16", "tflite-int8", "onnx")
+_ALIASES = {"tflite": "tflite-fp16", "int8": "tflite-int8", "fp16": "tflite-fp16", "onnxruntime": "onnx"}
+
+_IMG_EXTS = {".jpg", ".jpeg", ".png"}
+
+
+def resolve_backend(name: str) -> str:
+    name = _ALIASES.get(name.lower(), name.lower())
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{name}', expected one of {', '.join(BACKENDS)}")
+    return name
+
+
+class InferenceBackend:
+    """Maps a float32 (N, 224, 224, 3) batch in [0, 1] to (N, classes) scores."""
+
+    name = "base"
+    num_classes = 0
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    name = "keras"
+
+    def __init__(self, model):
+        self.model = model
+        self.num_classes = int(model.output_shape[-1])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model.predict_on_batch(batch))
+
+
+class TFLiteBackend(InferenceBackend):
+    def __init__(self, path: Path, num_threads: int = NUM_THREADS, name: str = "tflite"):
+        try:
+            from ai_edge_litert.interpreter import Interpreter
+        except ImportError:
+            try:
+                from tflite_runtime.interpreter import Interpreter
+            except ImportError:
+                import tensorflow as tf
+                Interpreter = tf.lite.Interpreter
+        self.name = name
+        self.path = Path(path)
+        self._interp = Interpreter(model_path=str(path), num_threads=num_threads)
+        self._interp.allocate_tensors()
+        self._input = self._interp.get_input_details()[0]
+        self._output = self._interp.get_output_details()[0]
+        self._batch = int(self._input["shape"][0])
+        self.num_classes = int(self._output["shape"][-1])
+        # One interpreter, one set of tensors: calls must not overlap
+        self._lock = threading.Lock()
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        with self._lock:
+            n = len(batch)
+            if n != self._batch:
+                self._interp.resize_tensor_input(self._input["index"], [n, *self._input["shape"][1:]])
+                self._interp.allocate_tensors()
+                self._input = self._interp.get_input_details()[0]
+                self._output = self._interp.get_output_details()[0]
+                self._batch = n
+            x = batch
+            dtype = self._input["dtype"]
+            if dtype != np.float32:
+                scale, zero = self._input["quantization"]
+                x = np.round(batch / scale + zero)
+                info = np.iinfo(dtype)
+                x = np.clip(x, info.min, info.max)
+            self._interp.set_tensor(self._input["index"], x.astype(dtype))
+            self._interp.invoke()
+            out = self._interp.get_tensor(self._output["index"])
+            if self._output["dtype"] != np.float32:
+                scale, zero = self._output["quantization"]
+                out = (out.astype(np.float32) - zero) * scale
+            return np.array(out, dtype=np.float32)
+
+
+class OnnxBackend(InferenceBackend):
+    name = "onnx"
+
+    def __init__(self, path: Path, num_threads: int = NUM_THREADS):
+        import onnxruntime as ort
+
+        opts = ort.SessionOptions()
+        opts.intra_op_num_threads = num_threads
+        opts.inter_op_num_threads = 1
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.path = Path(path)
+        self._session = ort.InferenceSession(str(path), sess_options=opts, providers=["CPUExecutionProvider"])
+        self._input_name = self._session.get_inputs()[0].name
+        self.num_classes = int(self._session.get_outputs()[0].shape[-1])
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return self._session.run(None, {self._input_name: batch.astype(np.float32, copy=False)})[0]
+
+
+# --- conversion and cache ---
+
+def _cache_dir() -> Path:
+    try:
+        MODEL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+        if os.access(MODEL_CACHE_DIR, os.W_OK):
+            return MODEL_CACHE_DIR
+    except OSError:
+        pass
+    fallback = Path(tempfile.gettempdir()) / "butterfly_model_cache"
+    fallback.mkdir(parents=True, exist_ok=True)
+    return fallback
+
+
+# Bump when a conversion changes, so artifacts cached by older versions are not reused
+ARTIFACT_VERSION = 2
+
+
+def artifact_path(model_path: str, backend: str, cache_dir: Optional[Path] = None) -> Path:
+    """Cache location of model_path converted for backend; changes whenever the source model does."""
+    st = os.stat(model_path)
+    key = hashlib.sha1(f"{os.path.abspath(model_path)}:{st.st_size}:{st.st_mtime_ns}:v{ARTIFACT_VERSION}".encode()).hexdigest()[:12]
+    ext = ".onnx" if backend == "onnx" else ".tflite"
+    return (cache_dir or _cache_dir()) / f"{Path(model_path).stem}.{key}.{backend}{ext}"
+
+
+def calibration_images(data_dir: Optional[str], n: int = CALIBRATION_IMAGES) -> List[np.ndarray]:
+    """Up to n preprocessed images, round-robin across the class directories."""
+    if not data_dir or not os.path.isdir(data_dir):
+        return []
+    per_class = []
+    for d in sorted(os.listdir(data_dir)):
+        full = os.path.join(data_dir, d)
+        if os.path.isdir(full):
+            files = sorted(f for f in os.listdir(full) if os.path.splitext(f)[1].lower() in _IMG_EXTS)
+            per_class.append([os.path.join(full, f) for f in files])
+    paths: List[str] = []
+    for i in range(max((len(f) for f in per_class), default=0)):
+        paths.extend(files[i] for files in per_class if i < len(files))
+        if len(paths) >= n:
+            break
+    out = []
+    for p in paths[:n]:
+        try:
+            out.append(to_model_input(p))
+        except Exception as e:
+            print(f"Skipping calibration image {p}: {e}")
+    return out
+
+
+def _write_atomic(path: Path, data: bytes):
+    tmp = path.with_suffix(path.suffix + f".{os.getpid()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+
+
+def convert_tflite(keras_model, out_path: Path, quantization: str, calibration: Optional[List[np.ndarray]] = None):
+    import tensorflow as tf
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(keras_model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if quantization == "fp16":
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantization == "int8":
+        if not calibration:
+            raise ValueError("int8 quantization needs calibration images")
+
+        def representative():
+            for x in calibration:
+                yield [x[None].astype(np.float32)]
+
+        # Integer kernels only (conversion fails rather than falling back to
+        # float ops) and int8 input/output; TFLiteBackend quantizes the float
+        # batch and dequantizes the scores, so callers don't change
+        converter.representative_dataset = representative
+        converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS_INT8]
+        converter.inference_input_type = tf.int8
+        converter.inference_output_type = tf.int8
+    else:
+        raise ValueError(f"Unknown TFLite quantization '{quantization}'")
+    _write_atomic(out_path, converter.convert())
+
+
+def convert_onnx(keras_model, out_path: Path, opset: int = 13):
+    import tensorflow as tf
+    import tf2onnx
+
+    spec = (tf.TensorSpec((None, *keras_model.input_shape[1:]), tf.float32, name="input"),)
+    model_proto, _ = tf2onnx.convert.from_keras(keras_model, input_signature=spec, opset=opset)
+    _write_atomic(out_path, model_proto.SerializeToString())
+
+
+def open_artifact(backend: str, path: Path) -> InferenceBackend:
+    if backend == "onnx":
+        return OnnxBackend(path)
+    return TFLiteBackend(path, name=backend)
+
+
+def load_backend(
+    backend: str,
+    model_path: str,
+    load_keras: Callable[[], object],
+    calibration_dir: Optional[str] = None,
+    cache_dir: Optional[Path] = None,
+) -> InferenceBackend:
+    """Serve model_path with the given backend, converting and caching it on first use.
+
+    load_keras is only called for the Keras backend or when no cached
+    conversion exists yet. The Keras model is released as soon as it has been
+    converted.
+    """
+    backend = resolve_backend(backend)
+    if backend == "keras":
+        return KerasBackend(load_keras())
+    path = artifact_path(model_path, backend, cache_dir)
+    if not path.exists():
+        t0 = time.perf_counter()
+        keras_model = load_keras()
+        if backend == "onnx":
+            convert_onnx(keras_model, path)
+        else:
+            convert_tflite(keras_model, path, backend.split("-", 1)[1], calibration_images(calibration_dir))
+        del keras_model
+        try:
+            import tensorflow as tf
+            tf.keras.backend.clear_session()
+        except ImportError:
+            pass
+        print(f"Converted {model_path} to {backend} in {time.perf_counter() - t0:.1f}s: {path}")
+    else:
+        print(f"Using cached {backend} model: {path}")
+    return open_artifact(backend, path)
+
+
+# --- accuracy parity ---
+
+def to_probabilities(scores: np.ndarray) -> np.ndarray:
+    """(N, classes) model scores as probabilities.
+
+    Rows with no negative score are softmax outputs and are renormalised by
+    their sum: dequantized int8 probabilities sum to 1 only within a few
+    quantization steps, and a second softmax would flatten them. Other rows
+    are logits and get a softmax.
+    """
+    scores = np.array(scores, dtype=np.float32).reshape(len(scores), -1)
+    sums = scores.sum(axis=1)
+    probs = (scores >= 0).all(axis=1) & (sums > 0)
+    scores[probs] /= sums[probs, None]
+    logits = scores[~probs]
+    if len(logits):
+        e = np.exp(logits - logits.max(axis=1, keepdims=True))
+        scores[~probs] = e / e.sum(axis=1, keepdims=True)
+    return scores
+
+
+def _run(backend: InferenceBackend, images: np.ndarray, batch_size: int):
+    out, t0 = [], time.perf_counter()
+    for i in range(0, len(images), batch_size):
+        out.append(backend.predict(images[i:i + batch_size]))
+    return to_probabilities(np.concatenate(out)), (time.perf_counter() - t0) / max(1, len(images))
+
+
+def check_parity(reference: InferenceBackend, candidate: InferenceBackend, images: np.ndarray, batch_size: int = 16) -> Dict[str, float]:
+    """Compare candidate against reference on the same preprocessed images.
+
+    Reports the fraction of images with the same top-1 class, the fraction
+    whose reference top-1 class is in the candidate's top-5, the probability
+    error, and the per-image latency of each backend.
+    """
+    ref, ref_s = _run(reference, images, batch_size)
+    got, got_s = _run(candidate, images, batch_size)
+    ref_top1 = ref.argmax(axis=1)
+    top5 = np.argsort(-got, axis=1)[:, :5]
+    diff = np.abs(ref - got)
+    return {
+        "images": float(len(images)),
+        "top1_agreement": float(np.mean(got.argmax(axis=1) == ref_top1)),
+        "top5_agreement": float(np.mean((top5 == ref_top1[:, None]).any(axis=1))),
+        "max_abs_diff": float(diff.max()) if diff.size else 0.0,
+        "mean_abs_diff": float(diff.mean()) if diff.size else 0.0,
+        "reference_ms": ref_s * 1000,
+        "candidate_ms": got_s * 1000,
+    }
+
+
+def main(argv=None) -> int:
+    from .butterfly_classifier import FixedDepthwiseConv2D, MODEL_PATHS, TRAIN_DIRS
+
+    parser = argparse.ArgumentParser(description="Check a converted backend against the Keras model")
+    parser.add_argument("--backend", default=BACKEND if BACKEND != "keras" else "tflite-int8")
+    parser.add_argument("--model", default=next((p for p in MODEL_PATHS if os.path.exists(p)), None))
+    parser.add_argument("--images", default=None, help="Directory of class folders (default: training set)")
+    parser.add_argument("--n", type=int, default=200)
+    parser.add_argument("--min-top1", type=float, default=0.98)
+    args = parser.parse_args(argv)
+    if not args.model:
+        parser.error("no model file found; pass --model")
+    train_dir = next((d for d in TRAIN_DIRS if os.path.isdir(d)), None)
+
+    from tensorflow.keras.models import load_model
+    keras_model = load_model(args.model, custom_objects={"FixedDepthwiseConv2D": FixedDepthwiseConv2D}, compile=False)
+    candidate = load_backend(args.backend, args.model, lambda: keras_model, calibration_dir=train_dir)
+    images = calibration_images(args.images or train_dir, args.n)
+    if not images:
+        parser.error("no evaluation images found; pass --images")
+    report = check_parity(KerasBackend(keras_model), candidate, np.stack(images))
+    if hasattr(candidate, "path"):
+        report["model_mb"] = os.path.getsize(args.model) / 1e6
+        report["artifact_mb"] = os.path.getsize(candidate.path) / 1e6
+    for k, v in report.items():
+        print(f"{k:>15}: {v:.4f}")
+    ok = report["top1_agreement"] >= args.min_top1
+    print("PASS" if ok else f"FAIL: top-1 agreement below {args.min_top1}")
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Start loading models in the background as soon as the app starts; with 0 the
+# first classification request triggers the load instead.
+PRELOAD_MODELS = os.getenv("GAIA_PRELOAD_MODELS", "1").lower() not in ("0", "false", "no")
+# Seconds before a failed load is retried by the next request
+RETRY_FAILED_SECONDS = float(os.getenv("GAIA_MODEL_RETRY_SECONDS", "30"))
+
+IDLE, LOADING, READY, FAILED = "idle", "loading", "ready", "failed"
+
+
+class ModelNotReady(Exception):
+    def __init__(self, name: str, state: str, error: Optional[str] = None):
+        self.name = name
+        self.state = state
+        self.error = error
+        super().__init__(f"Model '{name}' is {state}" + (f": {error}" if error else ""))
+
+
+class LazyModel(Generic[T]):
+    """Builds a heavy model in a background thread and tracks its readiness.
+
+    Importing this module is cheap: the factory (and with it TensorFlow) only
+    runs once start() is called, either at app startup or by the first
+    request. Until then get() raises ModelNotReady so routes can answer 503
+    immediately instead of blocking the event loop.
+    """
+
+    def __init__(self, name: str, factory: Callable[[], T], retry_seconds: float = RETRY_FAILED_SECONDS):
+        self.name = name
+        self._factory = factory
+        self.retry_seconds = retry_seconds
+        self._lock = threading.Lock()
+        self._ready = threading.Event()
+        self._instance: Optional[T] = None
+        self.state = IDLE
+        self.error: Optional[str] = None
+        self.started_at: Optional[float] = None
+        self.load_seconds: Optional[float] = None
+        self._failed_at = 0.0
+
+    def start(self) -> bool:
+        """Begin loading in the background; returns False if already loading or loaded."""
+        with self._lock:
+            if self.state in (LOADING, READY):
+                return False
+            if self.state == FAILED and time.monotonic() - self._failed_at < self.retry_seconds:
+                return False
+            self.state = LOADING
+            self.error = None
+            self.started_at = time.time()
+        threading.Thread(target=self._load, name=f"{self.name}-loader", daemon=True).start()
+        return True
+
+    def _load(self):
+        t0 = time.perf_counter()
+        try:
+            instance = self._factory()
+        except Exception as e:
+            with self._lock:
+                self.state = FAILED
+                self.error = str(e)
+                self._failed_at = time.monotonic()
+            print(f"Failed to load model '{self.name}': {e}")
+            return
+        with self._lock:
+            self._instance = instance
+            self.load_seconds = time.perf_counter() - t0
+            self.state = READY
+        self._ready.set()
+        print(f"Model '{self.name}' ready in {self.load_seconds:.1f}s")
+
+    def set(self, instance: T):
+        """Install an already built instance (preloaded workers, tests)."""
+        with self._lock:
+            self._instance = instance
+            self.load_seconds = 0.0 if self.load_seconds is None else self.load_seconds
+            self.state = READY
+        self._ready.set()
+
+    @property
+    def ready(self) -> bool:
+        return self._ready.is_set()
+
+    def get(self) -> T:
+        """The loaded model, or ModelNotReady (after kicking off loading if needed)."""
+        if self._ready.is_set():
+            return self._instance
+        self.start()
+        raise ModelNotReady(self.name, self.state, self.error)
+
+    def wait(self, timeout: Optional[float] = None) -> T:
+        """Block until loaded; for workers and scripts, never for request handlers."""
+        self.start()
+        if not self._ready.wait(timeout):
+            raise ModelNotReady(self.name, self.state, self.error)
+        return self._instance
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": round(self.load_seconds, 2) if self.load_seconds is not None else None,
+            "loading_for_seconds": round(time.time() - self.started_at, 1) if self.state == LOADING and self.started_at else None,
+        }
+
+
+def _load_butterfly_classifier():
+    from .butterfly_classifier import ButterflyClassifier
+    return ButterflyClassifier()
+
+
+butterfly_model: "LazyModel" = LazyModel("butterfly", _load_butterfly_classifier)
+
+MODELS = [butterfly_model]
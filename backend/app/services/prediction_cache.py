@@ -0,0 +1,218 @@
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+# In-memory entries per cache and how long a prediction stays valid
+PREDICTION_CACHE_SIZE = int(os.getenv("GAIA_PREDICTION_CACHE_SIZE", "2048"))
+PREDICTION_CACHE_TTL = float(os.getenv("GAIA_PREDICTION_CACHE_TTL", str(7 * 24 * 3600)))
+# Optional SQLite tier shared by all caches and uvicorn workers; empty disables it
+PREDICTION_CACHE_PATH = os.getenv("GAIA_PREDICTION_CACHE_PATH", "")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    key TEXT PRIMARY KEY,
+    cache TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS predictions_expires ON predictions(expires);
+"""
+
+
+def content_hash(data: bytes) -> str:
+    """SHA-256 of the encoded image bytes."""
+    return hashlib.sha256(data).hexdigest()
+
+
+class _DiskTier:
+    def __init__(self, path: Path):
+        try:
+            path.parent.mkdir(parents=True, exist_ok=True)
+        except OSError:
+            pass
+        if not os.access(path.parent, os.W_OK):
+            fallback = Path(tempfile.gettempdir()) / path.name
+            print(f"Prediction cache path {path} not writable; using {fallback}")
+            path = fallback
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self.prune()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM predictions WHERE key = ? AND expires > ?", (key, time.time())
+            ).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, cache: str, value: str, expires: float):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO predictions(key, cache, value, expires) VALUES (?, ?, ?, ?)",
+                (key, cache, value, expires),
+            )
+
+    def prune(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM predictions WHERE expires <= ?", (time.time(),))
+
+    def clear(self, cache: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM predictions WHERE cache = ?", (cache,))
+
+
+class PredictionCache:
+    """LRU + TTL cache of predictions keyed by image content hash and model version.
+
+    Values must be JSON-serializable; they are stored encoded so every hit
+    returns a fresh copy the caller may mutate. With a disk tier, misses in
+    memory fall through to SQLite and hits are promoted back into memory.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_entries: int = PREDICTION_CACHE_SIZE,
+        ttl: float = PREDICTION_CACHE_TTL,
+        disk_path: Optional[str] = PREDICTION_CACHE_PATH,
+    ):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._mem: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk = _disk_tier(disk_path) if disk_path else None
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expired = 0
+
+    def key(self, digest: str, model_version: str, **params) -> str:
+        extra = "&".join(f"{k}={params[k]}" for k in sorted(params))
+        return f"{self.name}:{model_version}:{digest}:{extra}"
+
+    def get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._mem.move_to_end(key)
+                    self.hits += 1
+                    return json.loads(entry[1])
+                del self._mem[key]
+                self.expired += 1
+        if self._disk is not None:
+            encoded = self._disk.get(key)
+            if encoded is not None:
+                with self._lock:
+                    self._remember(key, now + self.ttl, encoded)
+                    self.hits += 1
+                    self.disk_hits += 1
+                return json.loads(encoded)
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key: str, value: Any):
+        encoded, expires = self._put_memory(key, value)
+        if self._disk is not None:
+            self._disk.put(key, self.name, encoded, expires)
+
+    async def aput(self, key: str, value: Any):
+        """put() for the event loop: the memory tier is updated before the first
+        await, the SQLite write runs in a thread."""
+        encoded, expires = self._put_memory(key, value)
+        if self._disk is not None:
+            await asyncio.to_thread(self._disk.put, key, self.name, encoded, expires)
+
+    def _put_memory(self, key: str, value: Any) -> Tuple[str, float]:
+        encoded = json.dumps(value)
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires, encoded)
+        return encoded, expires
+
+    def _remember(self, key: str, expires: float, encoded: str):
+        self._mem[key] = (expires, encoded)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(
+        self,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        cacheable: Callable[[Any], bool] = lambda value: True,
+    ) -> Tuple[Any, bool]:
+        """Return (value, hit). Computed values are stored only if cacheable(value)."""
+        if self._disk is not None:
+            value = await asyncio.to_thread(self.get, key)
+        else:
+            value = self.get(key)
+        if value is not None:
+            return value, True
+        value = await compute()
+        if cacheable(value):
+            await self.aput(key, value)
+        return value, False
+
+    def clear(self):
+        with self._lock:
+            self._mem.clear()
+        if self._disk is not None:
+            self._disk.clear(self.name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "entries": len(self._mem),
+                "max_entries": self.max_entries,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expired": self.expired,
+                "disk_path": str(self._disk.path) if self._disk is not None else None,
+            }
+
+
+_DISK_TIERS: Dict[str, _DiskTier] = {}
+_DISK_LOCK = threading.Lock()
+
+
+def _disk_tier(path: str) -> _DiskTier:
+    # One connection per file, shared by every cache that uses it
+    with _DISK_LOCK:
+        tier = _DISK_TIERS.get(path)
+        if tier is None:
+            tier = _DISK_TIERS[path] = _DiskTier(Path(path))
+        return tier
+
+
+_CACHES: Dict[str, PredictionCache] = {}
+
+
+def get_prediction_cache(name: str) -> PredictionCache:
+    cache = _CACHES.get(name)
+    if cache is None:
+        cache = _CACHES[name] = PredictionCache(name)
+    return cache
@@ -0,0 +1,296 @@
+import asyncio
+import base64
+import os
+import tempfile
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON, Column, DateTime, ForeignKey, Index, Integer, MetaData, String, Table, Text,
+    insert, select, text, tuple_, update,
+)
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.schema import CreateIndex, CreateTable
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+
+# Simulations and saved scenarios, shared by every API worker. DATABASE_URL is
+# the docker-compose Postgres (driven through asyncpg); without it a local
+# SQLite file is used through aiosqlite.
+_DEFAULT_URL = "sqlite:///" + os.path.join(tempfile.gettempdir(), "gaia-simulations.db")
+DATABASE_URL = os.getenv("DATABASE_URL", _DEFAULT_URL)
+# Connections kept open per worker, and extra ones allowed under bursts
+DB_POOL_SIZE = int(os.getenv("GAIA_DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("GAIA_DB_MAX_OVERFLOW", "10"))
+
+DEFAULT_PAGE = 100
+MAX_PAGE = 1000
+
+# Postgres advisory lock key serializing schema setup across API workers
+_SCHEMA_LOCK = 0x6761696173696D  # "gaiasim"
+# The simulation the routes fall back to (simulation_id=1)
+DEMO_ID = 1
+
+_json = JSON().with_variant(JSONB(), "postgresql")
+metadata = MetaData()
+
+simulations = Table(
+    "simulations", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(200), nullable=False),
+    Column("status", String(20), nullable=False, default="idle"),
+    Column("phase", String(50), nullable=False, default="idle"),
+    Column("progress", Integer, nullable=False, default=0),
+    Column("ecosystem_config", _json, nullable=False, default=dict),
+    Column("intervention_config", _json, nullable=False, default=dict),
+    Column("results", _json, nullable=True),
+    Column("error", Text, nullable=True),
+    Column("created_at", DateTime, nullable=False, default=datetime.utcnow),
+    Column("updated_at", DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow),
+    Column("completed_at", DateTime, nullable=True),
+    # listing by status, newest first
+    Index("ix_simulations_status_id", "status", "id"),
+)
+
+scenarios = Table(
+    "scenarios", metadata,
+    Column("id", Integer, primary_key=True, autoincrement=True),
+    Column("name", String(200), nullable=False),
+    Column("simulation_id", Integer, ForeignKey("simulations.id", ondelete="SET NULL"), nullable=True, index=True),
+    Column("saved_at", DateTime, nullable=False, default=datetime.utcnow),
+    Column("ecosystem_config", _json, nullable=True),
+    Column("intervention_config", _json, nullable=True),
+    Column("results", _json, nullable=True),
+    # keyset pagination: newest first, ties broken by id
+    Index("ix_scenarios_saved_at_id", "saved_at", "id"),
+)
+
+RUNNING = "running"
+
+
+def _create_schema(conn):
+    """Create missing tables and indexes (no-op when present)."""
+    for table in metadata.sorted_tables:
+        conn.execute(CreateTable(table, if_not_exists=True))
+        for index in sorted(table.indexes, key=lambda i: i.name):
+            conn.execute(CreateIndex(index, if_not_exists=True))
+
+
+def async_url(url: str) -> str:
+    """The same database through its asyncio driver (asyncpg / aiosqlite)."""
+    for prefix, driver in (("postgres://", "postgresql+asyncpg://"), ("postgresql://", "postgresql+asyncpg://"), ("sqlite://", "sqlite+aiosqlite://")):
+        if url.startswith(prefix):
+            return driver + url[len(prefix):]
+    return url
+
+
+def encode_cursor(*key) -> str:
+    """Opaque cursor for the row a page ended on."""
+    raw = "|".join(k.isoformat() if isinstance(k, datetime) else str(k) for k in key)
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def _decode_cursor(cursor: str) -> List[str]:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode().split("|")
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+
+def _iso(value: Optional[datetime]) -> Optional[str]:
+    return value.isoformat() if value is not None else None
+
+
+def _simulation(row) -> Dict[str, Any]:
+    sim = dict(row._mapping)
+    for key in ("created_at", "updated_at", "completed_at"):
+        sim[key] = _iso(sim[key])
+    return sim
+
+
+def _scenario(row) -> Dict[str, Any]:
+    entry = dict(row._mapping)
+    entry["saved_at"] = _iso(entry["saved_at"])
+    return entry
+
+
+class SimulationStore:
+    """Repository for simulations and scenarios on an async connection pool.
+
+    Every method is one short transaction, so all API workers see the same
+    state. Lists are newest first and paginated by keyset: a page returns
+    the cursor of its last row and the next page starts strictly after it,
+    which the (saved_at, id) and (status, id) indexes answer directly
+    however deep the page is.
+    """
+
+    def __init__(self, url: str = DATABASE_URL, engine: Optional[AsyncEngine] = None):
+        if engine is None:
+            url = async_url(url)
+            pool = {} if url.startswith("sqlite") else {
+                "pool_size": DB_POOL_SIZE, "max_overflow": DB_MAX_OVERFLOW, "pool_pre_ping": True,
+            }
+            engine = create_async_engine(url, **pool)
+        self.engine = engine
+        self._ready = False
+        self._init_lock = asyncio.Lock()
+
+    async def init(self):
+        """Create missing tables and the demo simulation (id 1).
+
+        Safe to run from every worker at once: on Postgres the setup holds a
+        transaction-scoped advisory lock, the DDL is IF NOT EXISTS and the demo
+        row is inserted with ON CONFLICT DO NOTHING.
+        """
+        if self._ready:
+            return
+        async with self._init_lock:
+            if self._ready:
+                return
+            postgres = self.engine.dialect.name == "postgresql"
+            dialect_insert = postgresql.insert if postgres else sqlite.insert
+            async with self.engine.begin() as conn:
+                if postgres:
+                    await conn.execute(text("SELECT pg_advisory_xact_lock(:key)"), {"key": _SCHEMA_LOCK})
+                await conn.run_sync(_create_schema)
+                seeded = await conn.execute(
+                    dialect_insert(simulations)
+                    .values(id=DEMO_ID, name="Demo Ecosystem", ecosystem_config={"species": 12, "areas": 5})
+                    .on_conflict_do_nothing(index_elements=[simulations.c.id])
+                )
+                if postgres and seeded.rowcount:
+                    # an explicit id does not advance the serial sequence
+                    await conn.execute(text(
+                        "SELECT setval(pg_get_serial_sequence('simulations', 'id'), "
+                        "GREATEST((SELECT MAX(id) FROM simulations), 1))"
+                    ))
+            self._ready = True
+
+    async def close(self):
+        await self.engine.dispose()
+
+    # --- simulations ---
+    async def create_simulation(self, ecosystem_config: Dict[str, Any], name: Optional[str] = None) -> Dict[str, Any]:
+        await self.init()
+        async with self.engine.begin() as conn:
+            sim_id = (await conn.execute(
+                insert(simulations).values(name=name or "Simulation", ecosystem_config=ecosystem_config).returning(simulations.c.id)
+            )).scalar_one()
+            if name is None:
+                await conn.execute(update(simulations).where(simulations.c.id == sim_id).values(name=f"Simulation {sim_id}"))
+            row = (await conn.execute(select(simulations).where(simulations.c.id == sim_id))).one()
+        return _simulation(row)
+
+    async def get_simulation(self, sim_id: int) -> Optional[Dict[str, Any]]:
+        await self.init()
+        async with self.engine.connect() as conn:
+            row = (await conn.execute(select(simulations).where(simulations.c.id == sim_id))).first()
+        return _simulation(row) if row is not None else None
+
+    async def list_simulations(
+        self, status: Optional[str] = None, limit: int = DEFAULT_PAGE, cursor: Optional[str] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Newest first, optionally only one status; returns (page, next cursor or None)."""
+        await self.init()
+        query = select(simulations)
+        if status is not None:
+            query = query.where(simulations.c.status == status)
+        if cursor is not None:
+            (last_id,) = _decode_cursor(cursor)
+            query = query.where(simulations.c.id < int(last_id))
+        limit = max(1, min(MAX_PAGE, limit))
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(query.order_by(simulations.c.id.desc()).limit(limit + 1))).all()
+        page = [_simulation(r) for r in rows[:limit]]
+        return page, encode_cursor(page[-1]["id"]) if len(rows) > limit else None
+
+    async def start_simulation(self, sim_id: int, intervention_config: Optional[Dict[str, Any]] = None) -> bool:
+        """Mark a simulation running (replacing its intervention config if given); False if it does not exist."""
+        await self.init()
+        values = {"status": RUNNING, "phase": "initializing", "progress": 0, "error": None, "completed_at": None}
+        if intervention_config is not None:
+            values["intervention_config"] = intervention_config
+        async with self.engine.begin() as conn:
+            result = await conn.execute(update(simulations).where(simulations.c.id == sim_id).values(**values))
+        return result.rowcount > 0
+
+    async def update_progress(self, sim_id: int, phase: str, progress: int) -> bool:
+        """Record progress of a running simulation; False once it is no longer running (e.g. cancelled)."""
+        await self.init()
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(simulations)
+                .where(simulations.c.id == sim_id, simulations.c.status == RUNNING)
+                .values(phase=phase, progress=progress)
+            )
+        return result.rowcount > 0
+
+    async def finish_simulation(
+        self, sim_id: int, status: str, results: Optional[Dict[str, Any]] = None, error: Optional[str] = None,
+    ) -> bool:
+        """Move a running simulation to its final status; False if it was no longer running."""
+        await self.init()
+        values = {"status": status, "phase": status, "error": error, "completed_at": datetime.utcnow()}
+        if results is not None:
+            values.update(results=results, progress=100)
+        async with self.engine.begin() as conn:
+            result = await conn.execute(
+                update(simulations).where(simulations.c.id == sim_id, simulations.c.status == RUNNING).values(**values)
+            )
+        return result.rowcount > 0
+
+    # --- scenarios ---
+    async def save_scenario(self, name: str, sim_id: int) -> Optional[Dict[str, Any]]:
+        """Snapshot a simulation's configs and results as a scenario; None if it has no results."""
+        await self.init()
+        async with self.engine.begin() as conn:
+            sim = (await conn.execute(select(simulations).where(simulations.c.id == sim_id))).first()
+            if sim is None or not sim.results:
+                return None
+            row = (await conn.execute(
+                insert(scenarios).values(
+                    name=name,
+                    simulation_id=sim_id,
+                    ecosystem_config=sim.ecosystem_config,
+                    intervention_config=sim.intervention_config,
+                    results=sim.results,
+                ).returning(*scenarios.c)
+            )).one()
+        return _scenario(row)
+
+    async def list_scenarios(self, limit: int = DEFAULT_PAGE, cursor: Optional[str] = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Most recently saved first; returns (page, next cursor or None)."""
+        await self.init()
+        query = select(scenarios)
+        if cursor is not None:
+            saved_at, last_id = _decode_cursor(cursor)
+            query = query.where(
+                tuple_(scenarios.c.saved_at, scenarios.c.id) < tuple_(datetime.fromisoformat(saved_at), int(last_id))
+            )
+        limit = max(1, min(MAX_PAGE, limit))
+        async with self.engine.connect() as conn:
+            rows = (await conn.execute(
+                query.order_by(scenarios.c.saved_at.desc(), scenarios.c.id.desc()).limit(limit + 1)
+            )).all()
+        page = [_scenario(r) for r in rows[:limit]]
+        if len(rows) <= limit:
+            return page, None
+        last = rows[limit - 1]
+        return page, encode_cursor(last.saved_at, last.id)
+
+
+_STORE: Optional[SimulationStore] = None
+
+
+def get_simulation_store() -> SimulationStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = SimulationStore()
+    return _STORE
+
+
+async def close_simulation_store():
+    global _STORE
+    if _STORE is not None:
+        await _STORE.close()
+        _STORE = None
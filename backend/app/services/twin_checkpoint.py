@@ -0,0 +1,302 @@
+import json
+import mmap
+import os
+import secrets
+import struct
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional
+
+import numpy as np
+
+from .blob_store import BlobStore
+from .twin_world import World
+
+# Full-state twin checkpoints. Layout (little endian):
+#
+#   16-byte header (see _HEADER): magic, version, metadata length
+#   metadata  UTF-8 JSON: step, grid, env, population cap, seed, the
+#             Generator's bit generator state and, for every array, its
+#             dtype, shape and byte offset
+#   arrays    raw bytes of res, x, y, species, energy, each 64-byte aligned
+#
+# Arrays are stored uncompressed so a checkpoint on disk can be memory mapped
+# and read in place; restoring is then a single copy per array.
+MAGIC = b"GTWC"
+VERSION = 1
+_HEADER = struct.Struct("<4sBBHQ")
+_ALIGN = 64
+ARRAYS = ("res", "x", "y", "species", "energy")
+
+# Checkpoint bytes kept in memory; beyond it the least recently used ones are
+# spilled to CHECKPOINT_DIR and memory mapped back on use
+CHECKPOINT_MEMORY_BUDGET = int(float(os.getenv("GAIA_TWIN_CHECKPOINT_MEMORY_MB", "256")) * 1024 * 1024)
+CHECKPOINT_DIR = os.getenv("GAIA_TWIN_CHECKPOINT_DIR", os.path.join(tempfile.gettempdir(), "gaia-twin-checkpoints"))
+# Spilled checkpoint files not used for this long are swept
+CHECKPOINT_TTL_SECONDS = float(os.getenv("GAIA_TWIN_CHECKPOINT_TTL_SECONDS", str(24 * 3600)))
+# Hard cap on checkpoints tracked, in memory or spilled
+MAX_CHECKPOINTS = int(os.getenv("GAIA_TWIN_MAX_CHECKPOINTS", "4096"))
+
+
+class CheckpointNotFound(KeyError):
+    pass
+
+
+def _aligned(n: int) -> int:
+    return -(-n // _ALIGN) * _ALIGN
+
+
+class Checkpoint:
+    """Complete state of a World at one step: arrays, environment and RNG state.
+
+    Arrays are private copies while the checkpoint is in memory, or read-only
+    views of a memory-mapped file once spilled. Either way a checkpoint never
+    changes, so any number of twins can restore or branch from it.
+    """
+
+    def __init__(self, meta: Dict[str, Any], arrays: Dict[str, np.ndarray], ref: Optional[str] = None):
+        self.meta = meta
+        self.arrays = arrays
+        # blob reference of the spilled file, None while only in memory
+        self.ref = ref
+
+    @classmethod
+    def capture(cls, world: World) -> "Checkpoint":
+        meta = {
+            "step": world.step,
+            "w": world.w,
+            "h": world.h,
+            "max_agents": world.max_agents,
+            "seed": world.seed,
+            "env": {"temp": world.temp, "rain": world.rain, "poaching": world.poaching},
+            "rng": world.rng.bit_generator.state,
+        }
+        return cls(meta, {name: getattr(world, name).copy() for name in ARRAYS})
+
+    @property
+    def step(self) -> int:
+        return self.meta["step"]
+
+    @property
+    def nbytes(self) -> int:
+        return sum(a.nbytes for a in self.arrays.values())
+
+    @property
+    def spilled(self) -> bool:
+        return self.ref is not None
+
+    def restore(self, world: World):
+        """Overwrite world's state with this checkpoint (its id and snapshot list are kept)."""
+        m = self.meta
+        res = self.arrays["res"]
+        if world.res.shape == res.shape:
+            np.copyto(world.res, res)
+        else:
+            world.res = res.copy()
+        world.x, world.y, world.species, world.energy = (self.arrays[name].copy() for name in ARRAYS[1:])
+        world.w, world.h = m["w"], m["h"]
+        world.max_agents = m["max_agents"]
+        world.seed = m["seed"]
+        world.step = m["step"]
+        world.temp, world.rain, world.poaching = m["env"]["temp"], m["env"]["rain"], m["env"]["poaching"]
+        rng_state = m["rng"]
+        world.rng = np.random.Generator(getattr(np.random, rng_state["bit_generator"])())
+        world.rng.bit_generator.state = rng_state
+
+    def to_world(self) -> World:
+        """A new World in this checkpoint's state."""
+        m = self.meta
+        world = World(m["w"], m["h"], 0, 0, m["max_agents"], seed=m["seed"])
+        self.restore(world)
+        return world
+
+    def to_bytes(self) -> bytes:
+        layout, offset = [], 0
+        for name in ARRAYS:
+            a = self.arrays[name]
+            layout.append({"name": name, "dtype": a.dtype.str, "shape": list(a.shape), "offset": offset})
+            offset = _aligned(offset + a.nbytes)
+        meta = json.dumps({**self.meta, "arrays": layout}).encode()
+        start = _aligned(_HEADER.size + len(meta))
+        buf = bytearray(start + offset)
+        buf[:_HEADER.size] = _HEADER.pack(MAGIC, VERSION, 0, 0, len(meta))
+        buf[_HEADER.size:_HEADER.size + len(meta)] = meta
+        for entry in layout:
+            a = np.ascontiguousarray(self.arrays[entry["name"]])
+            pos = start + entry["offset"]
+            buf[pos:pos + a.nbytes] = a.tobytes()
+        return bytes(buf)
+
+    @classmethod
+    def from_buffer(cls, buf, ref: Optional[str] = None) -> "Checkpoint":
+        """Checkpoint whose arrays are views into buf (bytes or a memory map); nothing is copied."""
+        magic, version, _r1, _r2, meta_len = _HEADER.unpack_from(buf)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a twin checkpoint")
+        meta = json.loads(bytes(buf[_HEADER.size:_HEADER.size + meta_len]))
+        start = _aligned(_HEADER.size + meta_len)
+        arrays = {}
+        for entry in meta.pop("arrays"):
+            dtype = np.dtype(entry["dtype"])
+            count = int(np.prod(entry["shape"], dtype=np.int64))
+            arrays[entry["name"]] = np.frombuffer(buf, dtype, count, start + entry["offset"]).reshape(entry["shape"])
+        return cls(meta, arrays, ref)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "step": self.step,
+            "grid": {"w": self.meta["w"], "h": self.meta["h"]},
+            "agents": len(self.arrays["x"]),
+            "env": self.meta["env"],
+            "bytes": self.nbytes,
+            "spilled": self.spilled,
+        }
+
+
+def load_checkpoint(path: str, ref: Optional[str] = None) -> Checkpoint:
+    """Memory map a checkpoint file; its arrays are paged in only when read."""
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    # the array views keep the map alive
+    return Checkpoint.from_buffer(mm, ref)
+
+
+class CheckpointStore:
+    """Checkpoints keyed by checkpoint_id, shared by every twin.
+
+    Checkpoints are held in memory up to memory_budget bytes; beyond that the
+    least recently used are written to a content-addressed BlobStore and
+    replaced by memory-mapped views of their file, so many branches can start
+    from the same warm state without it occupying RAM. A spilled file is
+    removed with its checkpoint (views already handed out stay readable).
+
+    Each checkpoint counts the twins whose snapshots point at it: put() gives
+    it one, retain() adds the branches that inherit the snapshot and
+    release() drops it once the last of them is deleted.
+    """
+
+    def __init__(
+        self,
+        memory_budget: int = CHECKPOINT_MEMORY_BUDGET,
+        spill: Optional[BlobStore] = None,
+        max_checkpoints: int = MAX_CHECKPOINTS,
+    ):
+        self.memory_budget = memory_budget
+        # spilled files live as long as their checkpoint, which max_checkpoints bounds
+        self.spill_store = spill or BlobStore(CHECKPOINT_DIR, ttl=CHECKPOINT_TTL_SECONDS, max_bytes=sys.maxsize)
+        self.max_checkpoints = max_checkpoints
+        self._items: "OrderedDict[str, Checkpoint]" = OrderedDict()
+        self._refs: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self.spills = 0
+
+    def put(self, world: World) -> str:
+        checkpoint = Checkpoint.capture(world)
+        checkpoint_id = secrets.token_hex(6)
+        evicted = []
+        with self._lock:
+            self._items[checkpoint_id] = checkpoint
+            self._refs[checkpoint_id] = 1
+            while len(self._items) > self.max_checkpoints:
+                oldest, dropped = self._items.popitem(last=False)
+                self._refs.pop(oldest, None)
+                evicted.append(dropped)
+            victims = self._over_budget(keep=checkpoint_id)
+        for dropped in evicted:
+            self._discard(dropped)
+        for victim_id, victim in victims:
+            self._spill(victim_id, victim)
+        return checkpoint_id
+
+    def get(self, checkpoint_id: str) -> Checkpoint:
+        with self._lock:
+            checkpoint = self._items.get(checkpoint_id)
+            if checkpoint is None:
+                raise CheckpointNotFound(checkpoint_id)
+            self._items.move_to_end(checkpoint_id)
+        if checkpoint.spilled:
+            try:
+                os.utime(self.spill_store.path_for(checkpoint.ref))  # still in use: push back its expiry
+            except FileNotFoundError:
+                pass  # swept; the mapping stays valid while we hold it
+        return checkpoint
+
+    def delete(self, checkpoint_id: str) -> bool:
+        with self._lock:
+            checkpoint = self._items.pop(checkpoint_id, None)
+            self._refs.pop(checkpoint_id, None)
+        if checkpoint is None:
+            return False
+        self._discard(checkpoint)
+        return True
+
+    def retain(self, checkpoint_ids: Iterable[str]):
+        """Count another twin (a branch) holding snapshots of these checkpoints."""
+        with self._lock:
+            for checkpoint_id in checkpoint_ids:
+                if checkpoint_id in self._refs:
+                    self._refs[checkpoint_id] += 1
+
+    def release(self, checkpoint_ids: Iterable[str]):
+        """A twin holding these checkpoints is gone; delete those no other twin holds."""
+        unused = []
+        with self._lock:
+            for checkpoint_id in checkpoint_ids:
+                if checkpoint_id not in self._refs:
+                    continue
+                self._refs[checkpoint_id] -= 1
+                if self._refs[checkpoint_id] <= 0:
+                    unused.append(checkpoint_id)
+        for checkpoint_id in unused:
+            self.delete(checkpoint_id)
+
+    def _discard(self, checkpoint: Checkpoint):
+        if checkpoint.spilled:
+            self.spill_store.delete(checkpoint.ref)
+
+    def _over_budget(self, keep: str):
+        """In-memory checkpoints to spill, least recently used first; call with self._lock held."""
+        resident = sum(c.nbytes for c in self._items.values() if not c.spilled)
+        victims = []
+        for checkpoint_id, checkpoint in self._items.items():
+            if resident <= self.memory_budget:
+                break
+            if checkpoint_id == keep or checkpoint.spilled:
+                continue
+            victims.append((checkpoint_id, checkpoint))
+            resident -= checkpoint.nbytes
+        return victims
+
+    def _spill(self, checkpoint_id: str, checkpoint: Checkpoint):
+        ref = self.spill_store.put(checkpoint.to_bytes())
+        mapped = load_checkpoint(str(self.spill_store.path_for(ref)), ref)
+        with self._lock:
+            kept = checkpoint_id in self._items
+            if kept:
+                self._items[checkpoint_id] = mapped
+                self.spills += 1
+        if not kept:
+            self.spill_store.delete(ref)  # deleted while it was being written
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            items = list(self._items.values())
+        return {
+            "checkpoints": len(items),
+            "resident_bytes": sum(c.nbytes for c in items if not c.spilled),
+            "spilled": sum(c.spilled for c in items),
+            "memory_budget": self.memory_budget,
+            "spills": self.spills,
+        }
+
+
+_STORE: Optional[CheckpointStore] = None
+
+
+def get_checkpoint_store() -> CheckpointStore:
+    global _STORE
+    if _STORE is None:
+        _STORE = CheckpointStore()
+    return _STORE
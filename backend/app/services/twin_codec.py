@@ -0,0 +1,121 @@
+import struct
+import zlib
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+from .twin_world import World
+
+# Binary twin frames. Layout (little endian), mirrored by
+# frontend/app/lib/twinFrame.ts:
+#
+#   64-byte header (see _HEADER)
+#   x        uint16[n_sent]   agent columns
+#   y        uint16[n_sent]   agent rows
+#   species  uint8[n_sent]    0 = A, 1 = B
+#   grid     zlib(uint8[h * w])
+#
+# The grid is the resource layer quantized to 0..255. In a keyframe it is the
+# grid itself; in a delta frame it is (grid - grid at base_step) mod 256,
+# which is mostly zeros and compresses to almost nothing. Agents are always
+# sent in full: they are re-indexed every step (births and deaths), and the
+# UI only ever gets a bounded number of them.
+MAGIC = b"GTWF"
+VERSION = 1
+KEYFRAME, DELTA = 0, 1
+MEDIA_TYPE = "application/vnd.gaia.twin-frame"
+
+_HEADER = struct.Struct("<4sBBH8I5fI")
+assert _HEADER.size == 64
+
+# A streaming encoder sends a full keyframe at least this often so late
+# subscribers can join
+KEYFRAME_EVERY = 30
+ZLIB_LEVEL = 1
+
+
+def quantize(res: np.ndarray) -> np.ndarray:
+    """Resource grid (0..1 floats) as uint8 levels 0..255."""
+    return np.rint(res * 255.0).astype(np.uint8)
+
+
+def encode_frame(
+    world: World,
+    agent_limit: Optional[int] = None,
+    base: Optional[np.ndarray] = None,
+    base_step: int = 0,
+    grid: Optional[np.ndarray] = None,
+) -> bytes:
+    """Encode the world as a keyframe, or as a delta against base (quantized grid at base_step)."""
+    if max(world.w, world.h) > 0xFFFF:
+        raise ValueError("Grid too large for uint16 coordinates")
+    n = world.n_agents if agent_limit is None else min(agent_limit, world.n_agents)
+    q = quantize(world.res) if grid is None else grid
+    kind = KEYFRAME if base is None else DELTA
+    payload = q if base is None else q - base  # uint8 arithmetic wraps mod 256
+    packed = zlib.compress(payload.tobytes(), ZLIB_LEVEL)
+    m = world.metrics()
+    header = _HEADER.pack(
+        MAGIC, VERSION, kind, 0,
+        world.step, base_step if base is not None else world.step, world.w, world.h,
+        world.n_agents, n, m["count_A"], m["count_B"],
+        m["biodiversity"], m["risk"], world.temp, world.rain, world.poaching,
+        len(packed),
+    )
+    return b"".join((
+        header,
+        world.x[:n].astype(np.uint16).tobytes(),
+        world.y[:n].astype(np.uint16).tobytes(),
+        world.species[:n].tobytes(),
+        packed,
+    ))
+
+
+def decode_frame(data: bytes, base: Optional[np.ndarray] = None) -> Dict[str, Any]:
+    """Inverse of encode_frame; delta frames need the quantized grid at their base_step."""
+    (magic, version, kind, _reserved, step, base_step, w, h, n_total, n, count_a, count_b,
+     biodiversity, risk, temp, rain, poaching, grid_bytes) = _HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a twin frame")
+    off = _HEADER.size
+    x = np.frombuffer(data, np.uint16, n, off)
+    y = np.frombuffer(data, np.uint16, n, off + 2 * n)
+    s = np.frombuffer(data, np.uint8, n, off + 4 * n)
+    off += 5 * n
+    grid = np.frombuffer(zlib.decompress(data[off:off + grid_bytes]), np.uint8).reshape(h, w)
+    if kind == DELTA:
+        if base is None:
+            raise ValueError(f"Delta frame needs the grid at step {base_step}")
+        grid = base + grid
+    return {
+        "keyframe": kind == KEYFRAME,
+        "step": step,
+        "base_step": base_step,
+        "grid": {"w": w, "h": h},
+        "env": {"temp": temp, "rain": rain, "poaching": poaching},
+        "metrics": {"count_A": count_a, "count_B": count_b, "biodiversity": round(biodiversity, 3), "risk": round(risk, 3)},
+        "n_agents": n_total,
+        "x": x, "y": y, "s": s,
+        "res": grid,
+    }
+
+
+class FrameEncoder:
+    """Stateful encoder for one stream: a keyframe first and every keyframe_every frames, deltas in between."""
+
+    def __init__(self, agent_limit: Optional[int] = None, keyframe_every: int = KEYFRAME_EVERY):
+        self.agent_limit = agent_limit
+        self.keyframe_every = keyframe_every
+        self._base: Optional[np.ndarray] = None
+        self._base_step = 0
+        self._since_key = 0
+        self.keyframe = False  # whether the last encoded frame was a keyframe
+
+    def encode(self, world: World) -> bytes:
+        q = quantize(world.res)
+        key = self._base is None or self._since_key >= self.keyframe_every - 1
+        data = encode_frame(world, self.agent_limit, None if key else self._base, self._base_step, grid=q)
+        self.keyframe = key
+        self._since_key = 0 if key else self._since_key + 1
+        self._base, self._base_step = q, world.step
+        return data
@@ -0,0 +1,220 @@
+import asyncio
+import os
+import secrets
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from .compute_pool import get_pool
+from .twin_world import (
+    BIRTH_ENERGY, BIRTH_P, MAX_ENERGY, METABOLISM, PARENT_KEEPS, START_ENERGY,
+    A, B, World, clamp_env, eat, metrics_from_counts, mortality, resource_delta,
+)
+
+# Replicas simulated together as one batched array simulation; the unit of
+# work handed to the process pool. Fixed so results depend only on the seed,
+# not on how many workers happen to run them.
+ENSEMBLE_CHUNK = int(os.getenv("GAIA_ENSEMBLE_CHUNK", "64"))
+# Memory one chunk may use while stepping; chunks of large grids or
+# populations hold fewer replicas (see chunk_size)
+ENSEMBLE_CHUNK_BYTES = int(os.getenv("GAIA_ENSEMBLE_CHUNK_BYTES", str(256 * 1024 * 1024)))
+# Peak bytes per grid cell and per agent during a batched step: the float32
+# grid plus the per-cell int64 / float64 temporaries of eat(), and the agent
+# arrays plus their temporaries
+_CELL_BYTES = 24
+_AGENT_BYTES = 64
+DEFAULT_QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+METRICS = ("count_A", "count_B", "biodiversity", "risk")
+
+
+class BatchedWorld:
+    """K independent replicas of a World stepped together.
+
+    All replicas' grids live in one (K, h, w) array and all agents in flat
+    arrays tagged with their replica, kept grouped by replica in the same list
+    order World uses. Cell indices are offset per replica, so the World rules
+    (eat, mortality, reproduction, the per-replica population cap) apply to
+    the whole batch in a single pass.
+    """
+
+    def __init__(self, res, rep, x, y, species, energy, max_agents: int, env, rng: np.random.Generator):
+        self.res = res
+        self.k, self.h, self.w = res.shape
+        self.rep, self.x, self.y, self.species, self.energy = rep, x, y, species, energy
+        self.max_agents = max_agents
+        self.temp, self.rain, self.poaching = env
+        self.rng = rng
+        self.step = 0
+
+    @classmethod
+    def from_world(cls, world: World, k: int, rng: np.random.Generator) -> "BatchedWorld":
+        """K copies of world's current state that diverge from here on."""
+        n = world.n_agents
+        return cls(
+            np.repeat(world.res[None], k, axis=0),
+            np.repeat(np.arange(k, dtype=np.int32), n),
+            np.tile(world.x, k), np.tile(world.y, k), np.tile(world.species, k), np.tile(world.energy, k),
+            world.max_agents, (world.temp, world.rain, world.poaching), rng,
+        )
+
+    @classmethod
+    def fresh(cls, k: int, w: int, h: int, n_a: int, n_b: int, max_agents: int, env, rng: np.random.Generator) -> "BatchedWorld":
+        """K newly created worlds, each with its own random starting positions."""
+        n = n_a + n_b
+        species = np.repeat(np.array([A, B], dtype=np.uint8), [n_a, n_b])
+        return cls(
+            np.full((k, h, w), 0.6, dtype=np.float32),
+            np.repeat(np.arange(k, dtype=np.int32), n),
+            rng.integers(0, w, k * n, dtype=np.int32), rng.integers(0, h, k * n, dtype=np.int32),
+            np.tile(species, k), np.full(k * n, START_ENERGY, dtype=np.float32),
+            max_agents, env, rng,
+        )
+
+    def metrics(self) -> Dict[str, np.ndarray]:
+        """Per-replica metrics, each an array of length K."""
+        b = np.bincount(self.rep[self.species == B], minlength=self.k)
+        a = np.bincount(self.rep, minlength=self.k) - b
+        biodiv, risk = metrics_from_counts(a, b, self.temp, self.rain, self.poaching)
+        return {"count_A": a, "count_B": b, "biodiversity": biodiv, "risk": risk}
+
+    def step_once(self):
+        rng = self.rng
+        self.step += 1
+        self.res += np.float32(resource_delta(self.temp, self.rain))
+        np.clip(self.res, 0.0, 1.0, out=self.res)
+        n = len(self.x)
+        if n == 0:
+            return
+        self.x = (self.x + rng.integers(-1, 2, n, dtype=np.int32)) % self.w
+        self.y = (self.y + rng.integers(-1, 2, n, dtype=np.int32)) % self.h
+        cell = (self.rep.astype(np.int64) * self.h + self.y) * self.w + self.x
+        food = eat(self.res.reshape(-1), cell)
+        self.energy = np.clip(self.energy + food - METABOLISM, 0.0, MAX_ENERGY).astype(np.float32)
+        alive = rng.random(n) >= mortality(self.species, self.energy, self.temp, self.poaching)
+        births = alive & (self.energy > BIRTH_ENERGY) & (rng.random(n) < BIRTH_P)
+        self.energy[births] *= PARENT_KEEPS
+        self._rebuild(alive, births)
+
+    def _rebuild(self, alive: np.ndarray, births: np.ndarray):
+        # Same as World._rebuild (newborn just before its parent), with the
+        # population cap applied to each replica separately
+        parents = np.flatnonzero(alive)
+        per_parent = 1 + births[parents].astype(np.int64)
+        end = np.cumsum(per_parent)
+        src = np.repeat(parents, per_parent)
+        is_child = np.zeros(len(src), dtype=bool)
+        is_child[(end - 2)[per_parent == 2]] = True
+        rep = self.rep[src]
+        counts = np.bincount(rep, minlength=self.k)
+        rank = np.arange(len(src)) - (np.cumsum(counts) - counts)[rep]
+        keep = rank < self.max_agents
+        src, is_child = src[keep], is_child[keep]
+        self.rep = rep[keep]
+        self.x = self.x[src]
+        self.y = self.y[src]
+        self.species = self.species[src]
+        energy = self.energy[src]
+        energy[is_child] = START_ENERGY
+        self.energy = energy
+
+
+def replica_bytes(spec: Dict[str, Any]) -> int:
+    """Peak memory of one replica of spec while it is stepped."""
+    checkpoint = spec.get("checkpoint")
+    if checkpoint is not None:
+        m = checkpoint.meta
+        w, h, agents = m["w"], m["h"], max(len(checkpoint.arrays["x"]), m["max_agents"])
+    else:
+        w, h, agents = spec["w"], spec["h"], max(spec["n_a"] + spec["n_b"], spec["max_agents"])
+    return _CELL_BYTES * w * h + _AGENT_BYTES * agents
+
+
+def chunk_size(spec: Dict[str, Any], chunk: int = ENSEMBLE_CHUNK) -> int:
+    """Replicas per chunk: at most `chunk`, fewer when they would not fit ENSEMBLE_CHUNK_BYTES."""
+    return max(1, min(chunk, ENSEMBLE_CHUNK_BYTES // replica_bytes(spec)))
+
+
+def simulate_chunk(spec: Dict[str, Any], k: int, steps: int, every: int, seed: np.random.SeedSequence) -> Dict[str, np.ndarray]:
+    """Run k replicas; returns each metric as an (n_records, k) array (process pool entry point)."""
+    rng = np.random.default_rng(seed)
+    env = clamp_env(spec["temp"], spec["rain"], spec["poaching"])
+    if spec.get("checkpoint") is not None:
+        world = spec["checkpoint"].to_world()
+        world.apply_env(*env)
+        batch = BatchedWorld.from_world(world, k, rng)
+    else:
+        batch = BatchedWorld.fresh(k, spec["w"], spec["h"], spec["n_a"], spec["n_b"], spec["max_agents"], env, rng)
+    records = {m: [] for m in METRICS}
+
+    def record():
+        for name, values in batch.metrics().items():
+            records[name].append(values)
+
+    record()
+    for i in range(1, steps + 1):
+        batch.step_once()
+        if i % every == 0 or i == steps:
+            record()
+    return {name: np.stack(rows) for name, rows in records.items()}
+
+
+def summarize(
+    series: Dict[str, np.ndarray],
+    steps_recorded: Sequence[int],
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+) -> Dict[str, Any]:
+    """Per-step mean, std and quantile bands of (n_records, K) metric arrays."""
+    out: Dict[str, Any] = {"steps": list(steps_recorded), "quantiles": list(quantiles), "metrics": {}}
+    for name, values in series.items():
+        values = values.astype(np.float64)
+        qs = np.quantile(values, quantiles, axis=1)
+        out["metrics"][name] = {
+            "mean": np.round(values.mean(axis=1), 4).tolist(),
+            "std": np.round(values.std(axis=1), 4).tolist(),
+            "bands": {f"q{q * 100:g}": np.round(row, 4).tolist() for q, row in zip(quantiles, qs)},
+            "final": {
+                "mean": round(float(values[-1].mean()), 4),
+                "min": round(float(values[-1].min()), 4),
+                "max": round(float(values[-1].max()), 4),
+            },
+        }
+    return out
+
+
+async def run_ensemble(
+    spec: Dict[str, Any],
+    replicas: int,
+    steps: int,
+    seed: Optional[int] = None,
+    every: int = 1,
+    quantiles: Sequence[float] = DEFAULT_QUANTILES,
+    chunk: int = ENSEMBLE_CHUNK,
+) -> Dict[str, Any]:
+    """Simulate `replicas` seeded runs of spec across the process pool and summarize them.
+
+    spec holds temp / rain / poaching plus either "checkpoint" (start every
+    replica from that twin_checkpoint.Checkpoint) or w / h / n_a / n_b /
+    max_agents for fresh worlds. The same seed gives the same result regardless of pool size.
+    Large worlds are split into smaller chunks (chunk_size) so each worker's
+    batch stays within ENSEMBLE_CHUNK_BYTES.
+    """
+    if seed is None:
+        seed = secrets.randbits(32)  # reported back so the run can be repeated
+    root = np.random.SeedSequence(seed)
+    chunk = chunk_size(spec, chunk)
+    sizes = [min(chunk, replicas - i) for i in range(0, replicas, chunk)]
+    seeds = root.spawn(len(sizes))
+    loop = asyncio.get_running_loop()
+    pool = get_pool()
+    parts: List[Dict[str, np.ndarray]] = await asyncio.gather(*(
+        loop.run_in_executor(pool, simulate_chunk, spec, k, steps, every, s) for k, s in zip(sizes, seeds)
+    ))
+    series = {name: np.concatenate([p[name] for p in parts], axis=1) for name in METRICS}
+    recorded = [0] + [i for i in range(1, steps + 1) if i % every == 0 or i == steps]
+    result = summarize(series, recorded, quantiles)
+    result.update({
+        "replicas": replicas,
+        "seed": seed,
+        "env": dict(zip(("temp", "rain", "poaching"), clamp_env(spec["temp"], spec["rain"], spec["poaching"]))),
+    })
+    return result
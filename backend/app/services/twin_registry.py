@@ -0,0 +1,183 @@
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from .twin_world import World
+
+# Memory all live twins may hold together; least recently used idle twins are
+# evicted beyond it
+TWIN_MEMORY_BUDGET = int(float(os.getenv("GAIA_TWIN_MEMORY_MB", "512")) * 1024 * 1024)
+# Hard cap on the number of twins regardless of their size
+MAX_TWINS = int(os.getenv("GAIA_MAX_TWINS", "256"))
+
+
+class TwinNotFound(KeyError):
+    def __init__(self, twin_id: str):
+        self.twin_id = twin_id
+        super().__init__(twin_id)
+
+
+class TwinBusy(RuntimeError):
+    def __init__(self, twin_id: str, run_id: str):
+        self.twin_id = twin_id
+        self.run_id = run_id
+        super().__init__(f"Twin {twin_id} is owned by run {run_id}")
+
+
+class _Entry:
+    __slots__ = ("world", "lock", "created_at", "last_used", "nbytes", "evicted", "run_id")
+
+    def __init__(self, world: World):
+        self.world = world
+        self.lock = threading.Lock()
+        self.created_at = self.last_used = time.time()
+        self.nbytes = world.nbytes
+        self.evicted = False
+        # Background run currently owning this twin, if any
+        self.run_id: Optional[str] = None
+
+
+class TwinRegistry:
+    """Independent twins keyed by twin_id, each behind its own lock.
+
+    The registry lock only guards the dictionary, so twins of different users
+    step in parallel; requests for the same twin are serialized. Twins are
+    kept in LRU order and, once their total size exceeds memory_budget (or
+    their number max_twins), the least recently used ones that are not in use
+    are dropped.
+    """
+
+    def __init__(self, memory_budget: int = TWIN_MEMORY_BUDGET, max_twins: int = MAX_TWINS):
+        self.memory_budget = memory_budget
+        self.max_twins = max_twins
+        self._twins: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def create(self, world: World) -> str:
+        twin_id = secrets.token_hex(6)
+        world.id = twin_id
+        with self._lock:
+            self._twins[twin_id] = _Entry(world)
+            self._evict(keep=twin_id)
+        return twin_id
+
+    @contextmanager
+    def use(self, twin_id: str) -> Iterator[World]:
+        """Exclusive access to a twin; raises TwinNotFound for unknown or evicted ids."""
+        with self._lock:
+            entry = self._twins.get(twin_id)
+            if entry is None:
+                raise TwinNotFound(twin_id)
+            self._twins.move_to_end(twin_id)
+        with entry.lock:
+            if entry.evicted:
+                raise TwinNotFound(twin_id)
+            try:
+                yield entry.world
+            finally:
+                entry.last_used = time.time()
+                entry.nbytes = entry.world.nbytes
+        with self._lock:
+            self._evict(keep=twin_id)
+
+    def running(self, twin_id: str) -> Optional[str]:
+        """Id of the background run that owns the twin, if any."""
+        entry = self._twins.get(twin_id)
+        return entry.run_id if entry else None
+
+    def claim(self, twin_id: str, run_id: str):
+        """Hand the twin to a background run; it is neither stepped inline nor evicted until released."""
+        with self._lock:
+            entry = self._twins.get(twin_id)
+            if entry is None:
+                raise TwinNotFound(twin_id)
+            if entry.run_id is not None:
+                raise TwinBusy(twin_id, entry.run_id)
+            entry.run_id = run_id
+
+    def release(self, twin_id: str, run_id: str, world: Optional[World] = None):
+        """End a run's ownership, installing the world it produced if given."""
+        with self._lock:
+            entry = self._twins.get(twin_id)
+            if entry is None or entry.run_id != run_id:
+                return
+        with entry.lock:
+            if world is not None:
+                world.id = twin_id
+                entry.world = world
+                entry.nbytes = world.nbytes
+            entry.run_id = None
+            entry.last_used = time.time()
+        with self._lock:
+            self._evict()
+
+    def delete(self, twin_id: str) -> bool:
+        with self._lock:
+            entry = self._twins.pop(twin_id, None)
+        if entry is None:
+            return False
+        entry.evicted = True
+        return True
+
+    def __contains__(self, twin_id: str) -> bool:
+        return twin_id in self._twins
+
+    def __len__(self) -> int:
+        return len(self._twins)
+
+    def _evict(self, keep: Optional[str] = None):
+        """Drop idle LRU twins until within budget; call with self._lock held."""
+        total = sum(e.nbytes for e in self._twins.values())
+        for twin_id in list(self._twins):
+            if total <= self.memory_budget and len(self._twins) <= self.max_twins:
+                break
+            entry = self._twins[twin_id]
+            if twin_id == keep or entry.lock.locked() or entry.run_id is not None:
+                continue
+            del self._twins[twin_id]
+            entry.evicted = True
+            total -= entry.nbytes
+            self.evictions += 1
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = list(self._twins.items())
+        return [
+            {
+                "twin_id": twin_id,
+                "step": e.world.step,
+                "grid": {"w": e.world.w, "h": e.world.h},
+                "agents": e.world.n_agents,
+                "run_id": e.run_id,
+                "bytes": e.nbytes,
+                "created_at": e.created_at,
+                "last_used": e.last_used,
+            }
+            for twin_id, e in reversed(entries)
+        ]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            used = sum(e.nbytes for e in self._twins.values())
+            return {
+                "twins": len(self._twins),
+                "bytes": used,
+                "memory_budget": self.memory_budget,
+                "max_twins": self.max_twins,
+                "evictions": self.evictions,
+            }
+
+
+_REGISTRY: Optional[TwinRegistry] = None
+
+
+def get_twin_registry() -> TwinRegistry:
+    global _REGISTRY
+    if _REGISTRY is None:
+        _REGISTRY = TwinRegistry()
+    return _REGISTRY
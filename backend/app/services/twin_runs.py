@@ -0,0 +1,339 @@
+import asyncio
+import multiprocessing as mp
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .twin_codec import FrameEncoder
+from .twin_world import World
+
+# "spawn" keeps worker processes clear of the API's threads and sockets
+RUN_START_METHOD = os.getenv("GAIA_TWIN_RUN_START_METHOD", "spawn")
+# Runs executing at the same time (one process each)
+MAX_RUNS = int(os.getenv("GAIA_TWIN_MAX_RUNS", str(os.cpu_count() or 1)))
+# Upper bound on frames per second streamed to clients, whatever the step rate
+MAX_FPS = float(os.getenv("GAIA_TWIN_MAX_FPS", "20"))
+# Agents included in each frame
+FRAME_AGENTS = 200
+# Finished runs kept around for GET /runs/{run_id}
+_HISTORY = 100
+
+PENDING, RUNNING, PAUSED, CANCELLED, COMPLETED, FAILED = (
+    "pending", "running", "paused", "cancelled", "completed", "failed"
+)
+_FINAL = (CANCELLED, COMPLETED, FAILED)
+
+
+class RunLimitReached(RuntimeError):
+    pass
+
+
+class RunNotFound(KeyError):
+    pass
+
+
+def _handle_commands(ctrl, out, timeout: float, done: int):
+    """Apply pause / resume / cancel commands, waiting at most timeout unless paused.
+
+    Returns (cancelled, seconds spent paused). A closed control pipe (the API
+    process went away) counts as cancel.
+    """
+    paused_at = None
+    paused_for = 0.0
+    deadline = time.perf_counter() + timeout
+    while True:
+        wait = None if paused_at is not None else max(0.0, deadline - time.perf_counter())
+        try:
+            if not ctrl.poll(wait):
+                return False, paused_for
+            cmd = ctrl.recv()
+        except (EOFError, OSError):
+            return True, paused_for
+        now = time.perf_counter()
+        if cmd == "cancel":
+            return True, paused_for
+        if cmd == "pause" and paused_at is None:
+            paused_at = now
+            out.send(("status", PAUSED, done))
+        elif cmd == "resume" and paused_at is not None:
+            paused_for += now - paused_at
+            deadline += now - paused_at
+            paused_at = None
+            out.send(("status", RUNNING, done))
+
+
+def _run_worker(world: World, steps: int, rate: Optional[float], fps: float, agent_limit: int, out, ctrl):
+    """Worker process body: step the world, emit frames at <= fps, pace to rate steps/s.
+
+    Frames are encoded here (binary, delta against the previous frame with
+    periodic keyframes), so the API process only forwards bytes.
+    """
+    encoder = FrameEncoder(agent_limit)
+
+    def frame():
+        data = encoder.encode(world)
+        return ("frame", {"step": world.step, "keyframe": encoder.keyframe, "data": data})
+
+    try:
+        step_gap = 1.0 / rate if rate else 0.0
+        frame_gap = 1.0 / fps
+        start = time.perf_counter()
+        last_frame = float("-inf")
+        done = 0
+        out.send(("status", RUNNING, done))
+        out.send(frame())
+        while done < steps:
+            world.step_once()
+            done += 1
+            now = time.perf_counter()
+            if now - last_frame >= frame_gap or done == steps:
+                out.send(frame())
+                last_frame = now
+            delay = start + done * step_gap - time.perf_counter()
+            cancelled, paused_for = _handle_commands(ctrl, out, max(0.0, delay), done)
+            start += paused_for
+            if cancelled:
+                out.send(("done", CANCELLED, done, world))
+                return
+        out.send(("done", COMPLETED, done, world))
+    except Exception as e:
+        out.send(("error", FAILED, repr(e)))
+
+
+def new_run_id() -> str:
+    return secrets.token_hex(6)
+
+
+class TwinRun:
+    def __init__(self, twin_id: str, start_step: int, steps: int, rate: Optional[float], fps: float, run_id: Optional[str] = None):
+        self.run_id = run_id or new_run_id()
+        self.twin_id = twin_id
+        self.start_step = start_step
+        self.steps = steps
+        self.rate = rate
+        self.fps = fps
+        self.state = PENDING
+        self.done = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.frames = 0
+        self.process = None
+        self.conn = None
+        self.ctrl = None
+        self.outbox: "asyncio.Queue" = asyncio.Queue()
+        self.pump: Optional[asyncio.Task] = None
+
+    @property
+    def active(self) -> bool:
+        return self.state not in _FINAL
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "run_id": self.run_id,
+            "twin_id": self.twin_id,
+            "state": self.state,
+            "start_step": self.start_step,
+            "steps": self.steps,
+            "done": self.done,
+            "rate": self.rate,
+            "fps": self.fps,
+            "frames": self.frames,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class TwinRunManager:
+    """Long twin runs in worker processes, with frames pushed back to the event loop.
+
+    Each run gets its own process, a result pipe and a control pipe. The loop
+    watches the result pipe with add_reader, so streaming costs no API thread
+    while the simulation runs. Frames and status changes (run.info() at the
+    time of the change) go to the async on_frame / on_status callbacks in
+    order; on_finish(run, world) receives the final world of completed and
+    cancelled runs, None for failed ones. It is called in a worker thread,
+    before the final status is delivered.
+    """
+
+    def __init__(
+        self,
+        on_frame: Callable[[TwinRun, Dict[str, Any]], Awaitable[None]],
+        on_status: Callable[[TwinRun, Dict[str, Any]], Awaitable[None]],
+        on_finish: Callable[[TwinRun, Optional[World]], None],
+        max_runs: int = MAX_RUNS,
+        start_method: str = RUN_START_METHOD,
+    ):
+        self.on_frame = on_frame
+        self.on_status = on_status
+        self.on_finish = on_finish
+        self.max_runs = max_runs
+        self._ctx = mp.get_context(start_method)
+        self._runs: "OrderedDict[str, TwinRun]" = OrderedDict()
+        # guards the run limit and self._runs for spawn() called from threads
+        self._lock = threading.Lock()
+
+    def active_runs(self):
+        return [r for r in list(self._runs.values()) if r.active]
+
+    def start(
+        self,
+        twin_id: str,
+        world: World,
+        steps: int,
+        rate: Optional[float] = None,
+        fps: float = MAX_FPS,
+        agent_limit: int = FRAME_AGENTS,
+    ) -> TwinRun:
+        """Launch a run on a copy of world; call from the event loop."""
+        return self.attach(self.spawn(twin_id, world, steps, rate, fps, agent_limit))
+
+    def spawn(
+        self,
+        twin_id: str,
+        world: World,
+        steps: int,
+        rate: Optional[float] = None,
+        fps: float = MAX_FPS,
+        agent_limit: int = FRAME_AGENTS,
+        run_id: Optional[str] = None,
+    ) -> TwinRun:
+        """Start the worker process on a copy of world; blocking, safe to call from a thread.
+
+        Sending a large world to the new process blocks until it has read it,
+        so the API calls this off the event loop and then attach()es the run.
+        run_id lets the caller claim the twin under the run's id beforehand.
+        """
+        with self._lock:
+            if len(self.active_runs()) >= self.max_runs:
+                raise RunLimitReached(f"{self.max_runs} twin runs already in progress")
+            run = TwinRun(twin_id, world.step, steps, rate, min(fps, MAX_FPS), run_id)
+            self._runs[run.run_id] = run
+            self._trim_history()
+        conn, child_out = self._ctx.Pipe(duplex=False)
+        child_ctrl, ctrl = self._ctx.Pipe(duplex=False)
+        run.process = self._ctx.Process(
+            target=_run_worker,
+            args=(world, steps, rate, run.fps, agent_limit, child_out, child_ctrl),
+            name=f"twin-run-{run.run_id}",
+            daemon=True,
+        )
+        try:
+            run.process.start()
+        except BaseException as e:
+            run.state, run.error = FAILED, repr(e)
+            raise
+        finally:
+            child_out.close()
+            child_ctrl.close()
+        run.conn, run.ctrl = conn, ctrl
+        return run
+
+    def attach(self, run: TwinRun) -> TwinRun:
+        """Stream a spawned run's frames and status changes; call from the event loop."""
+        loop = asyncio.get_running_loop()
+        loop.add_reader(run.conn.fileno(), self._on_readable, run)
+        run.pump = loop.create_task(self._pump(run))
+        return run
+
+    def get(self, run_id: str) -> TwinRun:
+        run = self._runs.get(run_id)
+        if run is None:
+            raise RunNotFound(run_id)
+        return run
+
+    def _send(self, run_id: str, cmd: str) -> TwinRun:
+        run = self.get(run_id)
+        if run.active:
+            try:
+                run.ctrl.send(cmd)
+            except (BrokenPipeError, OSError):
+                pass
+        return run
+
+    def pause(self, run_id: str) -> TwinRun:
+        return self._send(run_id, "pause")
+
+    def resume(self, run_id: str) -> TwinRun:
+        return self._send(run_id, "resume")
+
+    def cancel(self, run_id: str) -> TwinRun:
+        return self._send(run_id, "cancel")
+
+    def _on_readable(self, run: TwinRun):
+        try:
+            while run.conn.poll():
+                msg = run.conn.recv()
+                kind = msg[0]
+                if kind == "frame":
+                    run.frames += 1
+                    run.done = msg[1]["step"] - run.start_step
+                    run.outbox.put_nowait(msg)
+                elif kind == "status":
+                    run.state, run.done = msg[1], msg[2]
+                    run.outbox.put_nowait(("status", run.info()))
+                elif kind == "done":
+                    _kind, state, run.done, world = msg
+                    self._finish(run, state, world=world)
+                    return
+                elif kind == "error":
+                    self._finish(run, FAILED, error=msg[2])
+                    return
+        except (EOFError, OSError):
+            code = run.process.exitcode if run.process else None
+            self._finish(run, FAILED, error=f"Run process exited unexpectedly (exit code {code})")
+
+    def _finish(self, run: TwinRun, state: str, world: Optional[World] = None, error: Optional[str] = None):
+        asyncio.get_running_loop().remove_reader(run.conn.fileno())
+        run.conn.close()
+        run.ctrl.close()
+        run.process.join(0)
+        # the run turns final once on_finish has run, after its last frames
+        run.outbox.put_nowait(("finish", state, world, error))
+
+    async def _complete(self, run: TwinRun, state: str, world: Optional[World], error: Optional[str]):
+        # on_finish may block (the twin's lock), so it runs in a thread
+        try:
+            await asyncio.to_thread(self.on_finish, run, world)
+        except Exception as e:
+            print(f"Twin run {run.run_id}: finish callback failed: {e}")
+        run.state = state
+        run.error = error
+        run.finished_at = time.time()
+        try:
+            await self.on_status(run, run.info())
+        except Exception as e:
+            print(f"Twin run {run.run_id}: delivery failed: {e}")
+
+    async def _pump(self, run: TwinRun):
+        """Deliver a run's frames and status changes in order, then finish it."""
+        while True:
+            msg = await run.outbox.get()
+            if msg[0] == "finish":
+                await self._complete(run, *msg[1:])
+                return
+            try:
+                if msg[0] == "frame":
+                    await self.on_frame(run, msg[1])
+                else:
+                    await self.on_status(run, msg[1])
+            except Exception as e:
+                print(f"Twin run {run.run_id}: delivery failed: {e}")
+
+    def _trim_history(self):
+        """Drop the oldest finished runs; call with self._lock held."""
+        while len(self._runs) > _HISTORY:
+            oldest = next((k for k, r in self._runs.items() if not r.active), None)
+            if oldest is None:
+                return
+            del self._runs[oldest]
+
+    def shutdown(self):
+        """Stop every worker process (app shutdown)."""
+        for run in self.active_runs():
+            if run.process is not None and run.process.is_alive():
+                run.process.terminate()
@@ -0,0 +1,260 @@
+import asyncio
+import itertools
+import math
+import os
+import secrets
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .compute_pool import COMPUTE_WORKERS, get_pool
+from .prediction_cache import PredictionCache
+from .twin_ensemble import METRICS, chunk_size, simulate_chunk
+from .twin_world import clamp_env
+
+# Part of every memoized cell's key: bump it when the twin rules change
+ENGINE_VERSION = "twin-1"
+# Memoized cells kept in memory (the optional SQLite tier of
+# GAIA_PREDICTION_CACHE_PATH is shared with the prediction caches)
+SWEEP_CACHE_SIZE = int(os.getenv("GAIA_TWIN_SWEEP_CACHE_SIZE", "50000"))
+# Sweeps computing at the same time; they share the compute process pool
+MAX_SWEEPS = int(os.getenv("GAIA_TWIN_MAX_SWEEPS", "2"))
+# Least time between two progress events of one sweep
+PROGRESS_INTERVAL = 0.25
+# Finished sweeps kept around for GET /sweeps/{sweep_id}
+_HISTORY = 50
+
+AXES = ("temp", "rain", "poaching")
+CELL_METRICS = ("risk", "risk_std", "biodiversity", "count_A", "count_B")
+
+RUNNING, COMPLETED, FAILED = "running", "completed", "failed"
+
+
+class SweepLimitReached(RuntimeError):
+    pass
+
+
+class SweepNotFound(KeyError):
+    pass
+
+
+Cell = Tuple[float, float, float]
+
+
+def simulate_cells(config: Dict[str, Any], cells: Sequence[Cell], steps: int, replicas: int, seed: int) -> List[Dict[str, float]]:
+    """Final metrics of each (temp, rain, poaching) cell, averaged over replicas (process pool entry point).
+
+    Every cell starts from the same seed (common random numbers): differences
+    across the surface come from the parameters rather than sampling noise,
+    and a cell's result does not depend on which sweep computed it.
+    """
+    out = []
+    for temp, rain, poaching in cells:
+        spec = {**config, "temp": temp, "rain": rain, "poaching": poaching}
+        # replicas of large worlds run in several smaller batches to bound memory
+        k = chunk_size(spec, replicas)
+        root = np.random.SeedSequence(seed)
+        seeds = [root] if k >= replicas else root.spawn(-(-replicas // k))
+        parts = [simulate_chunk(spec, min(k, replicas - i * k), steps, steps, s) for i, s in enumerate(seeds)]
+        final = {name: np.concatenate([p[name][-1] for p in parts]) for name in METRICS}
+        out.append({
+            "risk": round(float(final["risk"].mean()), 4),
+            "risk_std": round(float(final["risk"].std()), 4),
+            "biodiversity": round(float(final["biodiversity"].mean()), 4),
+            "count_A": round(float(final["count_A"].mean()), 2),
+            "count_B": round(float(final["count_B"].mean()), 2),
+        })
+    return out
+
+
+def grid_cells(axes: Dict[str, Sequence[float]]) -> List[Cell]:
+    """Cartesian product of the axes in temp, rain, poaching order (poaching varies fastest)."""
+    return [clamp_env(*cell) for cell in itertools.product(*(axes[a] for a in AXES))]
+
+
+class Sweep:
+    def __init__(self, axes: Dict[str, List[float]], steps: int, replicas: int, seed: int, total: int):
+        self.sweep_id = secrets.token_hex(6)
+        self.axes = axes
+        self.steps = steps
+        self.replicas = replicas
+        self.seed = seed
+        self.total = total
+        self.state = RUNNING
+        self.done = 0
+        self.cached = 0
+        self.error: Optional[str] = None
+        self.started_at = time.time()
+        self.finished_at: Optional[float] = None
+        self.result: Optional[Dict[str, Any]] = None
+        self.task: Optional[asyncio.Task] = None
+        self._last_progress = 0.0
+
+    @property
+    def active(self) -> bool:
+        return self.state == RUNNING
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "sweep_id": self.sweep_id,
+            "state": self.state,
+            "total": self.total,
+            "done": self.done,
+            "cached": self.cached,
+            "steps": self.steps,
+            "replicas": self.replicas,
+            "seed": self.seed,
+            "error": self.error,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class SweepManager:
+    """Parameter sweeps over temp x rain x poaching with memoized cells.
+
+    Each cell (world configuration, environment, seed, steps, replicas) is
+    computed once: finished cells come from the cache and cells another
+    running sweep is already computing are awaited rather than recomputed.
+    The rest are handed to the shared process pool in small groups, and
+    on_progress(sweep, info) is awaited as they finish (at most every
+    PROGRESS_INTERVAL seconds, and always at the end).
+    """
+
+    def __init__(
+        self,
+        on_progress: Callable[["Sweep", Dict[str, Any]], Awaitable[None]],
+        cache: Optional[PredictionCache] = None,
+        max_sweeps: int = MAX_SWEEPS,
+    ):
+        self.on_progress = on_progress
+        self.cache = cache or PredictionCache("twin_sweep", max_entries=SWEEP_CACHE_SIZE)
+        self.max_sweeps = max_sweeps
+        self._sweeps: "OrderedDict[str, Sweep]" = OrderedDict()
+        # cell key -> future of a cell being computed by some sweep
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    def start(self, config: Dict[str, Any], axes: Dict[str, List[float]], steps: int, replicas: int, seed: int) -> Sweep:
+        """Start a sweep; call from the event loop. config holds w / h / n_a / n_b / max_agents."""
+        if sum(s.active for s in self._sweeps.values()) >= self.max_sweeps:
+            raise SweepLimitReached(f"{self.max_sweeps} sweeps already in progress")
+        cells = grid_cells(axes)
+        sweep = Sweep(axes, steps, replicas, seed, len(cells))
+        self._sweeps[sweep.sweep_id] = sweep
+        self._trim_history()
+        sweep.task = asyncio.get_running_loop().create_task(self._run(sweep, config, cells))
+        return sweep
+
+    def get(self, sweep_id: str) -> Sweep:
+        sweep = self._sweeps.get(sweep_id)
+        if sweep is None:
+            raise SweepNotFound(sweep_id)
+        return sweep
+
+    def cell_key(self, config: Dict[str, Any], cell: Cell, steps: int, replicas: int, seed: int) -> str:
+        env = ",".join(f"{v:.6g}" for v in cell)
+        return self.cache.key(env, ENGINE_VERSION, steps=steps, replicas=replicas, seed=seed, **config)
+
+    async def _progress(self, sweep: Sweep, force: bool = False):
+        now = time.monotonic()
+        if not force and now - sweep._last_progress < PROGRESS_INTERVAL:
+            return
+        sweep._last_progress = now
+        try:
+            await self.on_progress(sweep, sweep.info())
+        except Exception as e:
+            print(f"Twin sweep {sweep.sweep_id}: progress delivery failed: {e}")
+
+    async def _run(self, sweep: Sweep, config: Dict[str, Any], cells: List[Cell]):
+        loop = asyncio.get_running_loop()
+        keys = [self.cell_key(config, cell, sweep.steps, sweep.replicas, sweep.seed) for cell in cells]
+        results: List[Optional[Dict[str, float]]] = [None] * len(keys)
+
+        # Claim every cell no other sweep is working on before the first
+        # await, so a concurrent sweep either waits on the claim or later
+        # finds the value in the cache, never computes the cell again
+        claimed: List[int] = []
+        waits: List[Tuple[int, asyncio.Future]] = []
+        for i, key in enumerate(keys):
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = loop.create_future()
+                claimed.append(i)
+            waits.append((i, future))
+
+        def fail(indices: List[int], e: BaseException):
+            for i in indices:
+                future = self._inflight.pop(keys[i], None)
+                if future is None or future.done():
+                    continue
+                if isinstance(e, Exception):
+                    future.set_exception(e)
+                else:
+                    # this sweep was cancelled; other sweeps waiting on the cell fail too
+                    future.set_exception(RuntimeError("Sweep cancelled before the cell finished"))
+                    future.exception()  # no warning if nobody was waiting
+
+        try:
+            hits = await asyncio.to_thread(lambda: [self.cache.get(keys[i]) for i in claimed])
+        except BaseException as e:
+            fail(claimed, e)
+            raise
+        todo: List[int] = []
+        for i, value in zip(claimed, hits):
+            if value is None:
+                todo.append(i)
+            else:
+                results[i] = value
+                self._inflight.pop(keys[i]).set_result(value)
+        waits = [(i, f) for i, f in waits if results[i] is None]
+        sweep.cached = sweep.done = len(claimed) - len(todo)
+        await self._progress(sweep, force=True)
+
+        async def compute(group: List[int]):
+            try:
+                values = await loop.run_in_executor(
+                    get_pool(), simulate_cells, config, [cells[i] for i in group], sweep.steps, sweep.replicas, sweep.seed,
+                )
+            except BaseException as e:
+                fail(group, e)
+                raise
+            for i, value in zip(group, values):
+                self._inflight.pop(keys[i]).set_result(value)
+                # aput() fills the memory tier before it yields, so the cell is never
+                # in neither place; the disk write is off the loop
+                await self.cache.aput(keys[i], value)
+
+        async def collect(i: int, future: asyncio.Future):
+            results[i] = await asyncio.shield(future)
+            sweep.done += 1
+            await self._progress(sweep)
+
+        # enough groups to keep every worker busy, small enough for steady progress
+        size = max(1, min(16, math.ceil(len(todo) / (4 * COMPUTE_WORKERS))))
+        groups = [todo[i:i + size] for i in range(0, len(todo), size)]
+        try:
+            await asyncio.gather(*(compute(g) for g in groups), *(collect(i, f) for i, f in waits))
+            shape = [len(sweep.axes[a]) for a in AXES]
+            sweep.result = {
+                "axes": sweep.axes,
+                "shape": shape,
+                "steps": sweep.steps,
+                "replicas": sweep.replicas,
+                "seed": sweep.seed,
+                "metrics": {m: np.array([r[m] for r in results]).reshape(shape).tolist() for m in CELL_METRICS},
+            }
+            sweep.state = COMPLETED
+        except Exception as e:
+            sweep.state = FAILED
+            sweep.error = repr(e)
+        sweep.finished_at = time.time()
+        await self._progress(sweep, force=True)
+
+    def _trim_history(self):
+        while len(self._sweeps) > _HISTORY:
+            oldest = next((k for k, s in self._sweeps.items() if not s.active), None)
+            if oldest is None:
+                return
+            del self._sweeps[oldest]
@@ -0,0 +1,232 @@
+import random
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+# Default demo world: grid size, starting populations and population cap
+W, H = 40, 24
+N_A, N_B = 60, 40
+MAX_AGENTS = 200
+
+SPECIES = ("A", "B")
+A, B = 0, 1
+
+# Per-step rules
+BITE = 0.1             # most resource one agent eats per step
+METABOLISM = 0.03      # energy burnt per step
+MAX_ENERGY = 1.5
+START_ENERGY = 0.8
+STARVING = 0.2         # below this energy starvation mortality applies
+BIRTH_ENERGY = 1.2     # above this energy an agent may reproduce
+BIRTH_P = 0.1
+PARENT_KEEPS = 0.7     # fraction of energy a parent keeps after giving birth
+
+
+def clamp_env(temp: float, rain: float, poaching: float) -> Tuple[float, float, float]:
+    """Environment drivers limited to their valid ranges (temp -1..1, rain and poaching 0..1)."""
+    return max(-1.0, min(1.0, temp)), max(0.0, min(1.0, rain)), max(0.0, min(1.0, poaching))
+
+
+def resource_delta(temp: float, rain: float) -> float:
+    """Per-step change of every cell's resources: rain-driven regen minus heat-driven decay."""
+    regen = 0.02 + 0.02*rain
+    decay = 0.01 + 0.02*max(0.0, temp)
+    return regen - decay
+
+
+def mortality(species: np.ndarray, energy: np.ndarray, temp: float, poaching: float) -> np.ndarray:
+    """Per-agent death probability for this step."""
+    is_b = species == B
+    # poaching mortality affects both, higher on B
+    mort = np.where(is_b, 0.01 + 0.09*poaching*1.2, 0.01 + 0.09*poaching).astype(np.float32)
+    # temperature stress: hurts A at high temp, B at low temp
+    if temp > 0.4:
+        mort[~is_b] += 0.02
+    if temp < -0.4:
+        mort[is_b] += 0.02
+    # starvation
+    mort[energy < STARVING] += 0.05
+    return mort
+
+
+def metrics_from_counts(a, b, temp: float, rain: float, poaching: float):
+    """Biodiversity (Simpson-like evenness proxy) and risk; works on scalars and arrays of counts."""
+    a = np.asarray(a, dtype=np.float64)
+    tot = a + np.asarray(b, dtype=np.float64)
+    p = np.divide(a, tot, out=np.zeros_like(tot), where=tot > 0)
+    biodiv = np.where(tot > 0, np.round(1 - (p**2 + (1 - p)**2), 3), 0.0)
+    risk = np.clip(0.3 + 0.2*temp + 0.2*(1-rain) + 0.3*poaching - 0.2*biodiv, 0.0, 1.0)
+    return biodiv, np.round(risk, 3)
+
+
+# Crowding beyond which eat() ranks the remaining agents by sorting
+_RANK_ROUNDS = 16
+
+
+def _rank_in_cell(cell: np.ndarray, n_cells: int) -> np.ndarray:
+    """How many earlier agents (in list order) share each agent's cell.
+
+    Works in rounds: each round the first remaining agent of every cell gets
+    the current rank. Cells rarely hold more than a few agents, so this beats
+    a full stable sort; crowded leftovers are ranked by sorting instead.
+    """
+    n = len(cell)
+    rank = np.zeros(n, dtype=np.int64)
+    first = np.full(n_cells, n, dtype=np.int64)
+    remaining = np.arange(n)
+    r = 0
+    while len(remaining) and r < _RANK_ROUNDS:
+        c = cell[remaining]
+        np.minimum.at(first, c, remaining)
+        won = first[c] == remaining
+        rank[remaining[won]] = r
+        first[c] = n
+        remaining = remaining[~won]
+        r += 1
+    if len(remaining):
+        c = cell[remaining]
+        order = np.argsort(c, kind="stable")
+        sc = c[order]
+        idx = np.arange(len(order))
+        start = np.empty(len(order), dtype=bool)
+        start[0] = True
+        np.not_equal(sc[1:], sc[:-1], out=start[1:])
+        rank[remaining[order]] = r + idx - np.maximum.accumulate(np.where(start, idx, 0))
+    return rank
+
+
+def eat(res: np.ndarray, cell: np.ndarray, bite: float = BITE) -> np.ndarray:
+    """Let agents on flat cell indices eat from res (flattened, in place); returns what each ate.
+
+    Agents sharing a cell eat in list order, each taking min(bite, what is
+    left), exactly like a sequential loop would: the j-th agent on a cell with
+    r resources gets clip(r - j * bite, 0, bite).
+    """
+    if len(cell) == 0:
+        return np.zeros(0, dtype=res.dtype)
+    rank = _rank_in_cell(cell, res.size).astype(res.dtype)
+    food = np.clip(res[cell] - rank * bite, 0.0, bite)
+    res -= np.bincount(cell, weights=food, minlength=res.size).astype(res.dtype)
+    np.maximum(res, 0.0, out=res)
+    return food
+
+
+class World:
+    """Agent-based ecosystem twin stored as structure-of-arrays.
+
+    The resource grid is a (h, w) float32 array and agents are parallel
+    x / y / species / energy arrays, so every rule of a step (regeneration,
+    movement, eating, mortality, reproduction) is a handful of NumPy
+    operations over all cells or all agents. Randomness comes from a seeded
+    Generator: the same seed and inputs give the same run.
+    """
+
+    def __init__(
+        self,
+        w: int = W,
+        h: int = H,
+        n_a: int = N_A,
+        n_b: int = N_B,
+        max_agents: int = MAX_AGENTS,
+        seed: Optional[int] = None,
+    ):
+        self.id = random.randint(1000, 9999)
+        self.w, self.h = w, h
+        self.max_agents = max_agents
+        self.seed = seed
+        self.rng = np.random.default_rng(seed)
+        self.step = 0
+        self.temp = 0.0
+        self.rain = 0.0
+        self.poaching = 0.0
+        # resources per cell 0..1
+        self.res = np.full((h, w), 0.6, dtype=np.float32)
+        n = n_a + n_b
+        self.x = self.rng.integers(0, w, n, dtype=np.int32)
+        self.y = self.rng.integers(0, h, n, dtype=np.int32)
+        self.species = np.repeat(np.array([A, B], dtype=np.uint8), [n_a, n_b])
+        self.energy = np.full(n, START_ENERGY, dtype=np.float32)
+        self.snapshots: List[Dict[str, Any]] = []
+
+    @property
+    def n_agents(self) -> int:
+        return len(self.x)
+
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the grid and agent arrays."""
+        return self.res.nbytes + self.x.nbytes + self.y.nbytes + self.species.nbytes + self.energy.nbytes
+
+    def counts(self) -> Tuple[int, int]:
+        b = int(np.count_nonzero(self.species))
+        return self.n_agents - b, b
+
+    def metrics(self) -> Dict[str, Any]:
+        a, b = self.counts()
+        biodiv, risk = metrics_from_counts(a, b, self.temp, self.rain, self.poaching)
+        return {"count_A": a, "count_B": b, "biodiversity": float(biodiv), "risk": float(risk)}
+
+    def apply_env(self, temp: float, rain: float, poaching: float):
+        self.temp, self.rain, self.poaching = clamp_env(temp, rain, poaching)
+
+    def step_once(self, steps: int = 1):
+        rng = self.rng
+        for _ in range(steps):
+            self.step += 1
+            # resource regen/decay
+            self.res += np.float32(resource_delta(self.temp, self.rain))
+            np.clip(self.res, 0.0, 1.0, out=self.res)
+            n = self.n_agents
+            if n == 0:
+                continue
+            # move agents randomly, eat, reproduce, die
+            self.x = (self.x + rng.integers(-1, 2, n, dtype=np.int32)) % self.w
+            self.y = (self.y + rng.integers(-1, 2, n, dtype=np.int32)) % self.h
+            food = eat(self.res.reshape(-1), self.y * self.w + self.x)
+            self.energy = np.clip(self.energy + food - METABOLISM, 0.0, MAX_ENERGY).astype(np.float32)
+            alive = rng.random(n) >= mortality(self.species, self.energy, self.temp, self.poaching)
+            births = alive & (self.energy > BIRTH_ENERGY) & (rng.random(n) < BIRTH_P)
+            self.energy[births] *= PARENT_KEEPS
+            self._rebuild(alive, births)
+
+    def _rebuild(self, alive: np.ndarray, births: np.ndarray):
+        """Drop the dead and insert each newborn just before its parent, then cap.
+
+        Keeps the list order of the sequential rules, which decides who is
+        cut when the population cap is hit.
+        """
+        parents = np.flatnonzero(alive)
+        per_parent = 1 + births[parents].astype(np.int64)
+        end = np.cumsum(per_parent)
+        total = min(int(end[-1]) if len(end) else 0, self.max_agents)
+        src = np.repeat(parents, per_parent)[:total]
+        is_child = np.zeros(len(src), dtype=bool)
+        child_at = (end - 2)[per_parent == 2]
+        is_child[child_at[child_at < total]] = True
+        self.x = self.x[src]
+        self.y = self.y[src]
+        self.species = self.species[src]
+        energy = self.energy[src]
+        energy[is_child] = START_ENERGY
+        self.energy = energy
+
+    def agents(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Agents as {"x", "y", "s"} dicts for the UI."""
+        n = self.n_agents if limit is None else min(limit, self.n_agents)
+        return [
+            {"x": int(x), "y": int(y), "s": SPECIES[s]}
+            for x, y, s in zip(self.x[:n].tolist(), self.y[:n].tolist(), self.species[:n].tolist())
+        ]
+
+    def snapshot(self, name: str):
+        snap = {
+            "id": len(self.snapshots) + 1,
+            "name": name,
+            "saved_at": datetime.utcnow().isoformat(),
+            "step": self.step,
+            "env": {"temp": self.temp, "rain": self.rain, "poaching": self.poaching},
+            "metrics": self.metrics(),
+        }
+        self.snapshots.append(snap)
+        return snap
@@ -15,4 +15,8 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # ML tasks are long and uneven: hand each worker process one message at a
+    # time so a bulk backfill spreads evenly and scales with the process count
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
 )
@@ -1,68 +1,189 @@
 from .celery_config import celery_app
+from celery import group
+from celery.signals import worker_process_init
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Union
+import base64
 import os
+
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.preprocessing import image
-from PIL import Image
-import io
 
-# Import the custom DepthwiseConv2D class
-from ..services.butterfly_classifier import DepthwiseConv2D
+from ..services.blob_store import get_blob_store, is_ref
+from ..services.imaging import to_model_input
+from ..services.model_loader import butterfly_model
+
+# Images per classify_batch task (one forward pass each)
+TASK_BATCH_SIZE = int(os.getenv("CELERY_CLASSIFY_BATCH_SIZE", "32"))
+# Seconds a task waits for its worker's model to finish loading
+MODEL_WAIT_SECONDS = float(os.getenv("CELERY_MODEL_WAIT_SECONDS", "600"))
+# Threads per worker process for TensorFlow / TFLite. Prefork workers scale by
+# processes, so one thread each keeps them from fighting over the same cores.
+WORKER_MODEL_THREADS = os.getenv("CELERY_MODEL_THREADS", "1")
+# Path references must resolve inside one of these directories
+IMAGE_ROOTS = [os.path.realpath(p) for p in os.getenv("GAIA_TASK_IMAGE_ROOTS", "/app/data").split(os.pathsep) if p]
+
+# An image reference: "blob:<sha256>" from the blob store (what the API
+# enqueues), a path under IMAGE_ROOTS, or {"b64": "<base64 bytes>"}
+ImageRef = Union[str, Dict[str, str]]
+
+_decode_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix="task-decode")
+
+
+@worker_process_init.connect
+def _preload_model(**_kwargs):
+    """Warm the model in every worker process right after fork.
+
+    TensorFlow must not be initialised before the fork, so the parent never
+    loads it. Loading runs in the background because this signal has to return
+    within a few seconds; tasks wait for it via butterfly_model.wait().
+    """
+    for var in ("TF_NUM_INTRAOP_THREADS", "TF_NUM_INTEROP_THREADS", "OMP_NUM_THREADS", "BUTTERFLY_NUM_THREADS"):
+        os.environ.setdefault(var, WORKER_MODEL_THREADS)
+    butterfly_model.start()
+
+
+def _classifier():
+    return butterfly_model.wait(timeout=MODEL_WAIT_SECONDS)
+
+
+def _read_ref(ref: ImageRef) -> bytes:
+    if is_ref(ref):
+        return get_blob_store().read(ref)
+    if isinstance(ref, dict):
+        if "b64" in ref:
+            return base64.b64decode(ref["b64"])
+        raise ValueError(f"Unsupported image reference: {sorted(ref)}")
+    path = os.path.realpath(ref)
+    if not any(path == root or path.startswith(root + os.sep) for root in IMAGE_ROOTS):
+        raise ValueError(f"Image path outside allowed roots: {ref}")
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _release(refs: List[ImageRef]):
+    # Blobs are staged for one task (see enqueue_images); the result is final
+    # either way, since these tasks are not retried
+    store = get_blob_store()
+    for ref in refs:
+        if is_ref(ref):
+            try:
+                store.delete(ref)
+            except ValueError:
+                pass
+
+
+def _describe(ref: ImageRef) -> Any:
+    return ref if isinstance(ref, str) else {k: v for k, v in ref.items() if k != "b64"}
+
+
+def _load(ref: ImageRef):
+    try:
+        if is_ref(ref):
+            # Decode straight from the mapped blob, no copy into the task
+            with get_blob_store().open(ref) as mm:
+                return to_model_input(mm), None
+        return to_model_input(_read_ref(ref)), None
+    except Exception as e:
+        return None, f"Error processing image: {e}"
+
+
+@celery_app.task(bind=True)
+def classify_batch(self, refs: List[ImageRef], top_k: int = 5) -> List[Dict[str, Any]]:
+    """
+    Classify a list of images with a single forward pass
+
+    Args:
+        refs: Image references (blob refs, paths under GAIA_TASK_IMAGE_ROOTS or {"b64": ...})
+        top_k: Number of top predictions per image
+
+    Returns:
+        list: One result per reference, in order, with the same prediction
+        format as /api/butterfly/classify
+    """
+    try:
+        classifier = _classifier()
+        loaded = list(_decode_pool.map(_load, refs))
+    finally:
+        _release(refs)
+    ok = [i for i, (x, _err) in enumerate(loaded) if x is not None]
+    predictions = classifier.predict_batch(np.stack([loaded[i][0] for i in ok]), top_k) if ok else []
+    by_index = dict(zip(ok, predictions))
+    results = []
+    for i, ref in enumerate(refs):
+        if i in by_index:
+            results.append({'status': 'success', 'ref': _describe(ref), 'predictions': by_index[i]})
+        else:
+            results.append({'status': 'error', 'ref': _describe(ref), 'message': loaded[i][1]})
+    return results
+
+
+def enqueue_images(images: List[bytes], top_k: int = 5, batch_size: int = TASK_BATCH_SIZE):
+    """Store payloads in the blob store and enqueue classification by reference.
+
+    Only blob reference strings go through the broker; workers on the same
+    host (or sharing GAIA_BLOB_DIR) map the blobs directly and delete them
+    once the batch is classified.
+    """
+    store = get_blob_store()
+    refs = [store.put(data) for data in images]
+    return bulk_classify(refs, batch_size=batch_size, top_k=top_k).apply_async()
+
+
+def bulk_classify(refs: List[ImageRef], batch_size: int = TASK_BATCH_SIZE, top_k: int = 5, batches_per_task: int = 1):
+    """
+    Signature classifying many images as a group of classify_batch tasks
+
+    With batches_per_task > 1 several batches travel in one message (Celery
+    chunks), which cuts broker round-trips for very large backfills. Call
+    .apply_async() on the result; .get() returns per-batch result lists.
+    """
+    batches = [(refs[i:i + batch_size], top_k) for i in range(0, len(refs), batch_size)]
+    if batches_per_task > 1:
+        return classify_batch.chunks(batches, batches_per_task).group()
+    return group(classify_batch.s(*args) for args in batches)
 
-# Initialize the model (will be loaded when the worker starts)
-model = None
 
 @celery_app.task(bind=True)
 def classify_butterfly_image(self, image_data):
     """
     Classify a butterfly image using the pre-trained model
-    
+
     Args:
-        image_data: Binary image data
-        
+        image_data: A blob store reference (released once classified), or
+            base64-encoded image data (the JSON serializer cannot carry bytes)
+
     Returns:
         dict: Classification results
     """
-    global model
-    
-    # Lazy load the model
-    if model is None:
-        try:
-            from ..services.butterfly_classifier import ButterflyClassifier
-            classifier = ButterflyClassifier()
-            model = classifier.model
-        except Exception as e:
-            return {
-                'status': 'error',
-                'message': f'Failed to load model: {str(e)}'
-            }
-    
+    ref = image_data
+    try:
+        classifier = _classifier()
+    except Exception as e:
+        _release([ref])
+        return {
+            'status': 'error',
+            'message': f'Failed to load model: {str(e)}'
+        }
+
     try:
-        # Convert binary data to image
-        img = Image.open(io.BytesIO(image_data))
-        
-        # Preprocess the image
-        img = img.resize((224, 224))  # Adjust size according to your model's expected input
-        img_array = image.img_to_array(img)
-        img_array = np.expand_dims(img_array, axis=0) / 255.0
-        
-        # Make prediction
-        predictions = model.predict(img_array)
-        predicted_class = np.argmax(predictions[0])
-        confidence = float(predictions[0][predicted_class])
-        
-        # Get class labels (you'll need to replace this with your actual class labels)
-        class_labels = ['class1', 'class2', 'class3']  # Replace with your actual class labels
-        
+        if is_ref(image_data):
+            image_data = get_blob_store().read(image_data)
+        elif isinstance(image_data, str):
+            image_data = base64.b64decode(image_data)
+        probabilities = classifier.predict_proba(to_model_input(image_data)[None])[0]
+        predicted_class = int(np.argmax(probabilities))
+        names = classifier.class_names
         return {
             'status': 'success',
-            'predicted_class': class_labels[predicted_class],
-            'confidence': confidence,
-            'all_predictions': predictions[0].tolist()
+            'predicted_class': str(names[predicted_class]) if predicted_class < len(names) else f'class_{predicted_class}',
+            'confidence': float(probabilities[predicted_class]),
+            'all_predictions': probabilities.tolist()
         }
-        
+
     except Exception as e:
         return {
             'status': 'error',
             'message': f'Error processing image: {str(e)}'
         }
+    finally:
+        _release([ref])
@@ -4,16 +4,19 @@ from pathlib import Path
 from fastapi.middleware.cors import CORSMiddleware
 from datetime import datetime
 from websocket.handlers import socket_app
+from services.watcher import start_watcher, stop_watcher
+from app.services.model_loader import PRELOAD_MODELS, MODELS
 
 from api.species_routes import router as species_router
 from api.edge_routes import router as edge_router
 from api.prediction_routes import router as prediction_router
 from api.simulation_routes import router as simulation_router
+from app.services.simulation_store import close_simulation_store
 from api.butterfly_routes import router as butterfly_router
 from api.gemini_routes import router as gemini_router
 from api.health import router as health_router
 from api.alerts_routes import router as alerts_router
-from api.twin_routes import router as twin_router
+from api.twin_routes import router as twin_router, stop_twin_workers
 from api.map_routes import router as map_router
 from api.contact_routes import router as contact_router
 
@@ -47,6 +50,37 @@ app.include_router(twin_router, prefix="/api/twin", tags=["twin"])
 app.include_router(map_router, prefix="/api/map", tags=["map"])
 app.include_router(contact_router, prefix="/api", tags=["contact"])
 
+
+@app.on_event("startup")
+def _warm_up_models():
+    # Load in the background so /health and non-ML routes serve immediately
+    if PRELOAD_MODELS:
+        for model in MODELS:
+            model.start()
+
+
+@app.on_event("startup")
+def _start_dataset_watcher():
+    # Pushes dataset changes into the catalog-backed caches as they happen
+    watcher = start_watcher()
+    print(f"Dataset watcher: {watcher.backend}")
+
+
+@app.on_event("shutdown")
+def _stop_dataset_watcher():
+    stop_watcher()
+
+
+@app.on_event("shutdown")
+def _stop_twin_workers():
+    stop_twin_workers()
+
+
+@app.on_event("shutdown")
+async def _close_simulation_store():
+    # Closes the pooled database connections of this worker
+    await close_simulation_store()
+
 # Define the base directories for static files
 STATIC_DIR = Path("/app/data/butterflies/train")
 UPLOADS_DIR = Path("/app/data/temp_extract/train")
@@ -0,0 +1,341 @@
+from __future__ import annotations
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+# Dataset roots in priority order, with the static mount each one is served
+# under (see main.py): upserted images first, then the read-only base dataset.
+DATASET_ROOTS: List[Tuple[Path, str]] = [
+    (Path("/app/data/temp_extract/train"), "uploads"),
+    (Path("/app/data/butterflies/train"), "static"),
+]
+
+IMG_EXTS = {".jpg", ".jpeg", ".png"}
+
+# The base dataset is mounted read-only, so the index lives next to the uploads
+CATALOG_PATH = Path(os.getenv("GAIA_CATALOG_PATH", "/app/data/temp_extract/catalog.sqlite3"))
+
+# Minimum seconds between two reconciles triggered by queries
+RECONCILE_INTERVAL = float(os.getenv("GAIA_CATALOG_RECONCILE_SECONDS", "5"))
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    parent TEXT,
+    root TEXT NOT NULL,
+    species TEXT,
+    mtime_ns INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS dirs_parent ON dirs(parent);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    dir TEXT NOT NULL,
+    root TEXT NOT NULL,
+    species TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS images_species ON images(species);
+CREATE INDEX IF NOT EXISTS images_dir ON images(dir);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+class CatalogImage(NamedTuple):
+    species: str
+    path: str
+    size: int
+    mtime: float
+    root: str  # static mount name: "uploads" or "static"
+
+    @property
+    def url_path(self) -> str:
+        """Path under the static mount, e.g. uploads/MONARCH/001.jpg."""
+        for root, mount in DATASET_ROOTS:
+            if mount == self.root:
+                try:
+                    return f"{mount}/{Path(self.path).relative_to(root).as_posix()}"
+                except ValueError:
+                    break
+        return f"{self.root}/{self.species}/{Path(self.path).name}"
+
+
+class CatalogDelta(NamedTuple):
+    """Images added to / removed from the index by one reconcile.
+
+    A rename shows up as a removal plus an addition; a file whose size or mtime
+    changed is reported as removed (old row) and added (new row). base and
+    version are the index versions before and after: only a cache built at
+    base can be patched with it.
+    """
+    added: List[CatalogImage]
+    removed: List[CatalogImage]
+    base: int = 0
+    version: int = 0
+
+    def species(self) -> set:
+        return {img.species for img in self.added} | {img.species for img in self.removed}
+
+
+def _is_image(name: str) -> bool:
+    return os.path.splitext(name)[1].lower() in IMG_EXTS
+
+
+class DatasetCatalog:
+    """SQLite index of every image under the dataset roots.
+
+    Reconciling stats each known directory and only lists the ones whose mtime
+    changed since the last pass, reusing the stored child directories for the
+    rest. Adding, removing or renaming a file bumps its directory's mtime, so a
+    warm restart over an unchanged tree costs one stat per directory.
+    """
+
+    def __init__(self, db_path: Path = CATALOG_PATH, roots: Optional[List[Tuple[Path, str]]] = None, subscribers: Optional[List[Callable[[CatalogDelta], None]]] = None):
+        self.roots = list(roots if roots is not None else DATASET_ROOTS)
+        self.subscribers = subscribers if subscribers is not None else []
+        self.db_path = self._writable_db_path(Path(db_path))
+        self._lock = threading.RLock()
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._last_reconcile = 0.0
+        # Index version as of this process's last reconcile (-1 before the
+        # first). Other workers share the index, so caches compare against
+        # this rather than relying on the deltas of their own reconciles.
+        self.last_version = -1
+
+    @staticmethod
+    def _writable_db_path(p: Path) -> Path:
+        try:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            if os.access(p.parent, os.W_OK):
+                return p
+        except OSError:
+            pass
+        fallback = Path(tempfile.gettempdir()) / p.name
+        print(f"Catalog path {p} not writable; using {fallback}")
+        return fallback
+
+    # --- reconciliation ---
+
+    def version(self) -> int:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def _bump_version(self):
+        self._conn.execute(
+            "INSERT INTO meta(key, value) VALUES('version', '1') "
+            "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+
+    def is_fresh(self, max_age: Optional[float] = None) -> bool:
+        """True while the last pass is younger than max_age seconds (ensure_fresh would not reconcile)."""
+        max_age = RECONCILE_INTERVAL if max_age is None else max_age
+        return time.monotonic() - self._last_reconcile < max_age
+
+    def ensure_fresh(self, max_age: Optional[float] = None) -> bool:
+        """Reconcile unless the last pass is younger than max_age seconds."""
+        if self.is_fresh(max_age):
+            return False
+        return self.reconcile()
+
+    def reconcile(self, force_dirs: Optional[Iterable[str]] = None) -> bool:
+        """Bring the index in line with the filesystem. Returns True if anything changed.
+
+        Directories in force_dirs are relisted even if their mtime is unchanged
+        (e.g. a watcher saw a file rewritten in place). Subscribers receive the
+        resulting CatalogDelta after the changes are committed.
+        """
+        force = {str(p) for p in force_dirs} if force_dirs else set()
+        with self._lock:
+            conn = self._conn
+            base = self.version()
+            known = {p: (m, par) for p, m, par in conn.execute("SELECT path, mtime_ns, parent FROM dirs")}
+            children: Dict[str, List[str]] = {}
+            for p, (_m, par) in known.items():
+                if par is not None:
+                    children.setdefault(par, []).append(p)
+
+            seen: set = set()
+            delta = CatalogDelta([], [])
+            with conn:
+                for root, mount in self.roots:
+                    if not root.is_dir():
+                        continue
+                    stack: List[Tuple[str, Optional[str], Optional[str]]] = [(str(root), None, None)]
+                    while stack:
+                        d, parent, species = stack.pop()
+                        try:
+                            st = os.stat(d)
+                        except OSError:
+                            continue
+                        seen.add(d)
+                        prev = known.get(d)
+                        if prev is not None and prev[0] == st.st_mtime_ns and d not in force:
+                            for child in children.get(d, []):
+                                stack.append((child, d, species or os.path.basename(child)))
+                            continue
+                        self._rescan_dir(d, parent, mount, species, st.st_mtime_ns, stack, delta)
+
+                gone = [(p,) for p in known if p not in seen]
+                if gone:
+                    for p in gone:
+                        delta.removed.extend(
+                            CatalogImage(*r) for r in conn.execute(
+                                "SELECT species, path, size, mtime, root FROM images WHERE dir = ?", p
+                            )
+                        )
+                    conn.executemany("DELETE FROM images WHERE dir = ?", gone)
+                    conn.executemany("DELETE FROM dirs WHERE path = ?", gone)
+                changed = bool(gone or delta.added or delta.removed)
+                if changed:
+                    self._bump_version()
+            self._last_reconcile = time.monotonic()
+            self.last_version = self.version()
+            if delta.added or delta.removed:
+                delta = delta._replace(base=base, version=self.last_version)
+                for cb in list(self.subscribers):
+                    try:
+                        cb(delta)
+                    except Exception as e:
+                        print(f"Catalog subscriber {getattr(cb, '__name__', cb)} failed: {e}")
+            return changed
+
+    def _rescan_dir(self, d: str, parent: Optional[str], mount: str, species: Optional[str], mtime_ns: int, stack: list, delta: CatalogDelta):
+        conn = self._conn
+        files: Dict[str, Tuple[int, float]] = {}
+        try:
+            with os.scandir(d) as it:
+                for entry in it:
+                    try:
+                        if entry.is_dir():
+                            stack.append((entry.path, d, species or entry.name))
+                        elif species is not None and entry.is_file() and _is_image(entry.name):
+                            st = entry.stat()
+                            files[entry.path] = (st.st_size, st.st_mtime)
+                    except OSError:
+                        continue
+        except OSError as e:
+            print(f"Catalog: failed to list {d}: {e}")
+            return
+
+        before = {
+            r[1]: CatalogImage(*r)
+            for r in conn.execute("SELECT species, path, size, mtime, root FROM images WHERE dir = ?", (d,))
+        }
+        removed = [img for p, img in before.items() if (img.size, img.mtime) != files.get(p)]
+        added = [
+            CatalogImage(species, p, s, m, mount)
+            for p, (s, m) in files.items()
+            if p not in before or (before[p].size, before[p].mtime) != (s, m)
+        ]
+        if removed:
+            conn.executemany("DELETE FROM images WHERE path = ?", [(img.path,) for img in removed])
+        if added:
+            conn.executemany(
+                "INSERT INTO images(path, dir, root, species, size, mtime) VALUES(?, ?, ?, ?, ?, ?)",
+                [(img.path, d, img.root, img.species, img.size, img.mtime) for img in added],
+            )
+        conn.execute(
+            "INSERT OR REPLACE INTO dirs(path, parent, root, species, mtime_ns) VALUES(?, ?, ?, ?, ?)",
+            (d, parent, mount, species, mtime_ns),
+        )
+        delta.added.extend(added)
+        delta.removed.extend(removed)
+
+    def dirs(self) -> List[str]:
+        """Every indexed directory, roots included (used by the watcher)."""
+        with self._lock:
+            return [r[0] for r in self._conn.execute("SELECT path FROM dirs")]
+
+    # --- queries ---
+
+    def _query(self, sql: str, args: tuple = ()) -> list:
+        self.ensure_fresh()
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+    def species_names(self) -> List[str]:
+        """Every species directory across roots, including empty ones."""
+        rows = self._query("SELECT DISTINCT species FROM dirs WHERE species IS NOT NULL ORDER BY species")
+        return [r[0] for r in rows]
+
+    def species_counts(self, root: Optional[str] = None) -> List[Tuple[str, int]]:
+        """(species, image count) across all roots (or one mount), by species name."""
+        if root is None:
+            rows = self._query("SELECT species, COUNT(*) FROM images GROUP BY species ORDER BY species")
+        else:
+            rows = self._query(
+                "SELECT species, COUNT(*) FROM images WHERE root = ? GROUP BY species ORDER BY species", (root,)
+            )
+        return [(sp, int(n)) for sp, n in rows]
+
+    def images(self, species: Optional[str] = None, root: Optional[str] = None, limit: Optional[int] = None) -> List[CatalogImage]:
+        sql = "SELECT species, path, size, mtime, root FROM images"
+        where, args = [], []
+        if species is not None:
+            where.append("species = ?")
+            args.append(species)
+        if root is not None:
+            where.append("root = ?")
+            args.append(root)
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY path"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(int(limit))
+        return [CatalogImage(*r) for r in self._query(sql, tuple(args))]
+
+    def sample_images(self, species: str, k: int) -> List[CatalogImage]:
+        rows = self._query(
+            "SELECT species, path, size, mtime, root FROM images WHERE species = ? ORDER BY RANDOM() LIMIT ?",
+            (species, k),
+        )
+        return [CatalogImage(*r) for r in rows]
+
+    def daily_counts(self) -> Dict[str, List[Tuple[datetime, int]]]:
+        """Images per species per local calendar day of their file mtime."""
+        rows = self._query(
+            "SELECT species, date(mtime, 'unixepoch', 'localtime') AS day, COUNT(*) "
+            "FROM images GROUP BY species, day ORDER BY species, day"
+        )
+        out: Dict[str, List[Tuple[datetime, int]]] = {}
+        for sp, day, n in rows:
+            out.setdefault(sp, []).append((datetime.strptime(day, "%Y-%m-%d"), int(n)))
+        return out
+
+    def existing_roots(self) -> List[Tuple[Path, str]]:
+        return [(r, m) for r, m in self.roots if r.is_dir()]
+
+
+_CATALOG: Optional[DatasetCatalog] = None
+_CATALOG_LOCK = threading.Lock()
+
+# Callbacks that receive every CatalogDelta of the shared catalog
+_SUBSCRIBERS: List[Callable[[CatalogDelta], None]] = []
+
+
+def subscribe(callback: Callable[[CatalogDelta], None]):
+    """Register a cache to be patched with the shared catalog's deltas."""
+    if callback not in _SUBSCRIBERS:
+        _SUBSCRIBERS.append(callback)
+
+
+def get_catalog() -> DatasetCatalog:
+    global _CATALOG
+    if _CATALOG is None:
+        with _CATALOG_LOCK:
+            if _CATALOG is None:
+                _CATALOG = DatasetCatalog(subscribers=_SUBSCRIBERS)
+    return _CATALOG
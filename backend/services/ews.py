@@ -1,100 +1,190 @@
 from __future__ import annotations
-from typing import List, Dict, Tuple
-from datetime import datetime
+from typing import List, Dict, Tuple, Sequence
+from datetime import datetime, timedelta
+from collections import deque
 import math
 
-# Helper: compute rolling mean for detrending
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
-def rolling_mean(values: List[float], window: int) -> List[float]:
-    if window <= 1:
-        return values[:]
-    out: List[float] = []
-    s = 0.0
-    q: List[float] = []
-    for v in values:
-        q.append(v)
-        s += v
-        if len(q) > window:
-            s -= q.pop(0)
-        out.append(s / len(q))
+# All indicators use the same trailing-window convention: point i sees the last
+# `window` values up to and including i, or the whole prefix while the series is
+# still shorter than the window. A non-positive window means "whole prefix".
+
+RISK_WEIGHTS = (0.5, 0.3, 0.2)  # autocorrelation, variance, trend
+RISK_ALPHA = 0.25
+_EMA_BLOCK = 256
+
+
+def _as_array(values: Sequence[float]) -> np.ndarray:
+    return np.asarray(values, dtype=np.float64)
+
+
+def _effective_window(n: int, window: int) -> int:
+    return n if window <= 0 else min(window, n)
+
+
+def _trailing_windows(x: np.ndarray, window: int):
+    # Yield (start_index, block of equal-length windows along the last axis): one
+    # row per warm-up prefix, then a single sliding-window view covering every
+    # full window. Leading axes (e.g. species) are carried through untouched.
+    n = x.shape[-1]
+    w = _effective_window(n, window)
+    for i in range(w - 1):
+        yield i, x[..., None, : i + 1]
+    yield w - 1, sliding_window_view(x, w, axis=-1)
+
+
+# --- vectorized kernels (windows on the last axis) ---
+
+def _window_variance(block: np.ndarray) -> np.ndarray:
+    m = block.mean(axis=-1, keepdims=True)
+    return ((block - m) ** 2).mean(axis=-1)
+
+
+def _window_autocorr(block: np.ndarray) -> np.ndarray:
+    if block.shape[-1] < 2:
+        return np.zeros(block.shape[:-1])
+    d = block - block.mean(axis=-1, keepdims=True)
+    num = (d[..., 1:] * d[..., :-1]).sum(axis=-1)
+    den = (d * d).sum(axis=-1)
+    safe = np.where(den != 0, den, 1.0)
+    ac = np.where(den != 0, num / safe, 0.0)
+    return np.clip(ac, -1.0, 1.0)
+
+
+def _window_slope(block: np.ndarray) -> np.ndarray:
+    n = block.shape[-1]
+    if n < 2:
+        return np.zeros(block.shape[:-1])
+    xs = np.arange(n, dtype=np.float64) - (n - 1) / 2.0
+    # xs is centred, so sum((xs - xm) * (y - ym)) reduces to y @ xs
+    num = block @ xs
+    den = float((xs * xs).sum())
+    return num / den if den != 0 else np.zeros(block.shape[:-1])
+
+
+def _rolling(x: np.ndarray, window: int, kernel) -> np.ndarray:
+    out = np.empty(x.shape, dtype=np.float64)
+    if x.shape[-1] == 0:
+        return out
+    for start, block in _trailing_windows(x, window):
+        out[..., start : start + block.shape[-2]] = kernel(block)
     return out
 
 
+def _rolling_mean(x: np.ndarray, window: int) -> np.ndarray:
+    if window <= 1:
+        return x.copy()
+    n = x.shape[-1]
+    cs = np.concatenate((np.zeros(x.shape[:-1] + (1,)), np.cumsum(x, axis=-1)), axis=-1)
+    idx = np.arange(1, n + 1)
+    lo = np.maximum(idx - window, 0)
+    return (cs[..., idx] - cs[..., lo]) / (idx - lo)
+
+
+def _zscore(x: np.ndarray, baseline_n: int) -> np.ndarray:
+    n = x.shape[-1]
+    if n == 0:
+        return x.copy()
+    b = x[..., : max(1, min(n, baseline_n))]
+    mu = b.mean(axis=-1, keepdims=True)
+    var = ((b - mu) ** 2).mean(axis=-1, keepdims=True)
+    sd = np.where(var > 0, np.sqrt(np.where(var > 0, var, 1.0)), 1.0)
+    return (x - mu) / sd
+
+
+def _clamp01(z: np.ndarray) -> np.ndarray:
+    return (np.clip(z, -3.0, 3.0) + 3.0) / 6.0
+
+
+def _raw_risk(ac_z: np.ndarray, var_z: np.ndarray, trend_z: np.ndarray) -> np.ndarray:
+    wa, wv, wt = RISK_WEIGHTS
+    return wa * _clamp01(ac_z) + wv * _clamp01(var_z) + wt * _clamp01(trend_z)
+
+
+def _ema(raw: np.ndarray, alpha: float = RISK_ALPHA) -> np.ndarray:
+    # Same recurrence as chaining combine_risk(ema_prev=...), evaluated a block at
+    # a time as a lower-triangular matrix product so long series stay vectorized.
+    n = raw.shape[-1]
+    out = np.empty(raw.shape, dtype=np.float64)
+    if n == 0:
+        return out
+    out[..., 0] = raw[..., 0]
+    if n == 1:
+        return np.clip(out, 0.0, 1.0)
+    decay = 1.0 - alpha
+    b = min(_EMA_BLOCK, n - 1)
+    lags = np.arange(b)[:, None] - np.arange(b)[None, :]
+    kernel = np.where(lags >= 0, alpha * decay ** np.maximum(lags, 0), 0.0)
+    carry_w = decay ** np.arange(1, b + 1)
+    prev = out[..., :1]
+    for start in range(1, n, b):
+        chunk = raw[..., start : start + b]
+        m = chunk.shape[-1]
+        vals = chunk @ kernel[:m, :m].T + carry_w[:m] * prev
+        out[..., start : start + m] = vals
+        prev = vals[..., -1:]
+    return np.clip(out, 0.0, 1.0)
+
+
+def _indicators(vals: np.ndarray, trend_window: int, metric_window: int, baseline: int) -> Dict[str, np.ndarray]:
+    # Core pipeline over the last axis; vals may be 1-D (one series) or 2-D
+    # (species x day).
+
+    # detrend residuals
+    resid = vals - _rolling_mean(vals, trend_window)
+
+    # metrics
+    ac = _rolling(resid, metric_window, _window_autocorr)
+    var = _rolling(resid, metric_window, _window_variance)
+
+    # trend slope of the original values (not residuals)
+    slope = _rolling(vals, metric_window, _window_slope)
+
+    # z-scores vs baseline, combined and smoothed into a [0,1] risk
+    raw = _raw_risk(_zscore(ac, baseline), _zscore(var, baseline), _zscore(slope, baseline))
+    risk = _ema(raw)
+
+    return {
+        "detections": vals,
+        "autocorrelation": ac,
+        "variance": var,
+        "trend": slope,
+        "risk": np.clip(risk * 100.0, 0.0, 100.0),
+    }
+
+
+# --- public list-in/list-out API ---
+
+def rolling_mean(values: List[float], window: int) -> List[float]:
+    return _rolling_mean(_as_array(values), window).tolist()
+
+
 def zscore_vs_baseline(values: List[float], baseline_n: int) -> List[float]:
-    if not values:
-        return []
-    b = values[:max(1, min(len(values), baseline_n))]
-    mu = sum(b) / len(b)
-    var = sum((x - mu) ** 2 for x in b) / max(1, len(b))
-    sd = math.sqrt(var) if var > 0 else 1.0
-    return [(x - mu) / sd for x in values]
+    return _zscore(_as_array(values), baseline_n).tolist()
 
 
 def lag1_autocorr(residuals: List[float], window: int) -> List[float]:
-    if not residuals:
-        return []
-    out: List[float] = []
-    x: List[float] = []
-    for r in residuals:
-        x.append(r)
-        if len(x) < 2:
-            out.append(0.0)
-            continue
-        w = x[-window:] if len(x) >= window else x
-        xm = sum(w) / len(w)
-        num = sum((w[i] - xm) * (w[i-1] - xm) for i in range(1, len(w)))
-        den = sum((w[i] - xm) ** 2 for i in range(len(w)))
-        ac = num / den if den != 0 else 0.0
-        out.append(max(-1.0, min(1.0, ac)))
-    return out
+    return _rolling(_as_array(residuals), window, _window_autocorr).tolist()
 
 
 def rolling_variance(residuals: List[float], window: int) -> List[float]:
-    if not residuals:
-        return []
-    out: List[float] = []
-    x: List[float] = []
-    for r in residuals:
-        x.append(r)
-        w = x[-window:] if len(x) >= window else x
-        m = sum(w) / len(w)
-        var = sum((v - m) ** 2 for v in w) / max(1, len(w))
-        out.append(var)
-    return out
+    return _rolling(_as_array(residuals), window, _window_variance).tolist()
 
 
 def rolling_trend(values: List[float], window: int) -> List[float]:
     # simple linear regression slope over sliding window
-    if not values:
-        return []
-    out: List[float] = []
-    x: List[float] = []
-    for v in values:
-        x.append(v)
-        w = x[-window:] if len(x) >= window else x
-        n = len(w)
-        if n < 2:
-            out.append(0.0)
-            continue
-        xs = list(range(n))
-        xm = (n - 1) / 2.0
-        ym = sum(w) / n
-        num = sum((xs[i] - xm) * (w[i] - ym) for i in range(n))
-        den = sum((xs[i] - xm) ** 2 for i in range(n))
-        slope = num / den if den != 0 else 0.0
-        out.append(slope)
-    return out
+    return _rolling(_as_array(values), window, _window_slope).tolist()
 
 
-def combine_risk(ac_z: float, var_z: float, trend_z: float, ema_prev: float | None = None, alpha: float = 0.25) -> float:
+def combine_risk(ac_z: float, var_z: float, trend_z: float, ema_prev: float | None = None, alpha: float = RISK_ALPHA) -> float:
     # map z in [-3,3] -> [0,1]
     def clamp01(z: float) -> float:
         z = max(-3.0, min(3.0, z))
         return (z + 3.0) / 6.0
-    ac = clamp01(ac_z)
-    va = clamp01(var_z)
-    tr = clamp01(trend_z)
-    raw = 0.5 * ac + 0.3 * va + 0.2 * tr
+    wa, wv, wt = RISK_WEIGHTS
+    raw = wa * clamp01(ac_z) + wv * clamp01(var_z) + wt * clamp01(trend_z)
     score = raw if ema_prev is None else (alpha * raw + (1 - alpha) * ema_prev)
     return max(0.0, min(1.0, score))
 
@@ -104,37 +194,214 @@ def compute_metrics_from_counts(series: List[Tuple[datetime, int]], trend_window
     if not series:
         return {"dates": [], "detections": [], "autocorrelation": [], "variance": [], "trend": [], "risk": []}
     dates = [d for d, _ in series]
-    vals = [float(c) for _d, c in series]
+    vals = np.fromiter((c for _d, c in series), dtype=np.float64, count=len(series))
+    out = _indicators(vals, trend_window, metric_window, baseline)
+    return {"dates": dates, **{k: v.tolist() for k, v in out.items()}}
 
-    # detrend residuals
-    trend = rolling_mean(vals, trend_window)
-    resid = [v - t for v, t in zip(vals, trend)]
 
-    # metrics
-    ac = lag1_autocorr(resid, metric_window)
-    var = rolling_variance(resid, metric_window)
+def compute_metrics_batch(counts: np.ndarray, trend_window: int = 14, metric_window: int = 14, baseline: int = 30) -> Dict[str, np.ndarray]:
+    """Indicators for every row of a species x day counts matrix in one pass.
 
-    # z-scores vs baseline (on metric values)
-    ac_z = zscore_vs_baseline(ac, baseline)
-    var_z = zscore_vs_baseline(var, baseline)
+    Rows must share a common daily date axis (see timeseries.build_counts_matrix).
+    Each row gets what compute_metrics_from_counts returns for that row over
+    the whole axis, zeros included: for a species first seen after the axis
+    starts, the leading zero days enter its windows and its baseline, so its
+    values differ from those of its own, shorter series. Values are returned
+    as 2-D arrays with the same shape.
+    """
+    vals = np.asarray(counts, dtype=np.float64)
+    if vals.ndim != 2:
+        raise ValueError(f"compute_metrics_batch expects a 2-D species x day matrix, got shape {vals.shape}")
+    return _indicators(vals, trend_window, metric_window, baseline)
 
-    # trend slope of the original values (not residuals), normalized
-    slope = rolling_trend(vals, metric_window)
-    slope_z = zscore_vs_baseline(slope, baseline)
 
-    # risk as [0,1], map to [0,100] later
-    risk: List[float] = []
-    ema: float | None = None
-    for i in range(len(vals)):
-        r = combine_risk(ac_z[i], var_z[i], slope_z[i], ema_prev=ema)
-        ema = r
-        risk.append(r)
+# --- Streaming state ---
 
-    return {
-        "dates": dates,
-        "detections": vals,
-        "autocorrelation": ac,
-        "variance": var,
-        "trend": slope,
-        "risk": [min(100.0, max(0.0, x * 100.0)) for x in risk],
-    }
+_RESYNC_EVERY = 4096  # recompute running sums from the window to bound float drift
+
+
+class _Baseline:
+    """Population mean/std of the first `n` values of a metric, then frozen."""
+
+    def __init__(self, n: int):
+        self.n = max(1, n)
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def add(self, x: float):
+        if self.count >= self.n:
+            return
+        self.count += 1
+        d = x - self.mean
+        self.mean += d / self.count
+        self.m2 += d * (x - self.mean)
+
+    def z(self, x: float) -> float:
+        var = self.m2 / self.count if self.count else 0.0
+        sd = math.sqrt(var) if var > 0 else 1.0
+        return (x - self.mean) / sd
+
+
+class _RollingWindow:
+    """Trailing window of floats with O(1) running sums.
+
+    Keeps sum, sum of squares, sum of lag-1 products and sum of index-weighted
+    values (index 0 = oldest) so mean, variance, lag-1 autocorrelation and OLS
+    slope can be read off without rescanning the window.
+    """
+
+    def __init__(self, window: int):
+        self.window = max(1, window)
+        self.q: deque = deque()
+        self.s1 = 0.0
+        self.s2 = 0.0
+        self.lag = 0.0
+        self.sjy = 0.0
+        self.run = 0  # length of the trailing run of identical values
+        self._updates = 0
+
+    def push(self, v: float):
+        q = self.q
+        self.run = self.run + 1 if q and q[-1] == v else 1
+        if len(q) == self.window:
+            old = q.popleft()
+            self.lag -= old * q[0] if q else 0.0
+            self.sjy -= self.s1 - old
+            self.s1 -= old
+            self.s2 -= old * old
+        if q:
+            self.lag += q[-1] * v
+        self.sjy += len(q) * v
+        self.s1 += v
+        self.s2 += v * v
+        q.append(v)
+        self._updates += 1
+        if self._updates % _RESYNC_EVERY == 0 or self.run == len(q):
+            self._resync()
+
+    def _resync(self):
+        a = np.fromiter(self.q, dtype=np.float64, count=len(self.q))
+        self.s1 = float(a.sum())
+        self.s2 = float((a * a).sum())
+        self.lag = float((a[1:] * a[:-1]).sum())
+        self.sjy = float((np.arange(len(a)) * a).sum())
+
+    def constant(self) -> bool:
+        return self.run >= len(self.q)
+
+    def mean(self) -> float:
+        return self.s1 / len(self.q)
+
+    def variance(self) -> float:
+        if self.constant():
+            return 0.0
+        m = self.mean()
+        return max(0.0, self.s2 / len(self.q) - m * m)
+
+    def autocorr(self) -> float:
+        n = len(self.q)
+        if n < 2 or self.constant():
+            return 0.0
+        m = self.mean()
+        num = self.lag - m * (2 * self.s1 - self.q[0] - self.q[-1]) + (n - 1) * m * m
+        den = self.s2 - n * m * m
+        if den <= 0:
+            return 0.0
+        return max(-1.0, min(1.0, num / den))
+
+    def slope(self) -> float:
+        n = len(self.q)
+        if n < 2 or self.constant():
+            return 0.0
+        den = n * (n * n - 1) / 12.0
+        return (self.sjy - (n - 1) / 2.0 * self.s1) / den
+
+
+class EWSState:
+    """Incremental early-warning indicators for one daily count series.
+
+    `update(date, count)` appends one day in O(1) and returns that day's
+    indicators, matching what compute_metrics_from_counts would report for the
+    same point. Dates must be strictly increasing; skipped days are filled with
+    zero counts like build_or_get_timeseries does.
+
+    Baseline statistics are built from the first `baseline` points and then
+    frozen. When streaming from scratch the z-scores during that warm-up use the
+    baseline seen so far, so early risk values differ slightly from the batch
+    result; use `from_series` to seed the state from history instead.
+    """
+
+    def __init__(self, trend_window: int = 14, metric_window: int = 14, baseline: int = 30):
+        if metric_window < 1:
+            raise ValueError("EWSState needs a bounded metric_window >= 1")
+        self.trend_window = trend_window
+        self.metric_window = metric_window
+        self.baseline = baseline
+        self.last_date: datetime | None = None
+        self.n = 0
+        self._vals = _RollingWindow(trend_window if trend_window > 1 else 1)
+        self._resid = _RollingWindow(metric_window)
+        self._slope = _RollingWindow(metric_window)
+        self._base_ac = _Baseline(baseline)
+        self._base_var = _Baseline(baseline)
+        self._base_slope = _Baseline(baseline)
+        self._ema: float | None = None
+
+    @classmethod
+    def from_series(cls, series: List[Tuple[datetime, int]], trend_window: int = 14, metric_window: int = 14, baseline: int = 30) -> "EWSState":
+        """Seed a state from history with one batch pass, then stream from there."""
+        state = cls(trend_window, metric_window, baseline)
+        if not series:
+            return state
+        m = compute_metrics_from_counts(series, trend_window, metric_window, baseline)
+        vals = np.asarray(m["detections"], dtype=np.float64)
+        resid = vals - _rolling_mean(vals, trend_window)
+        tail = max(state._vals.window, metric_window)
+        for v, r in zip(vals[-tail:].tolist(), resid[-tail:].tolist()):
+            state._vals.push(v)
+            state._resid.push(r)
+            state._slope.push(v)
+        k = min(len(vals), max(1, baseline))
+        for b, key in ((state._base_ac, "autocorrelation"), (state._base_var, "variance"), (state._base_slope, "trend")):
+            for x in m[key][:k]:
+                b.add(x)
+        state._ema = m["risk"][-1] / 100.0
+        state.last_date = series[-1][0]
+        state.n = len(series)
+        return state
+
+    def update(self, date: datetime, count: int) -> Dict[str, float]:
+        day = datetime(date.year, date.month, date.day)
+        if self.last_date is not None:
+            if day <= self.last_date:
+                raise ValueError(f"EWSState expects strictly increasing dates; got {day} after {self.last_date}")
+            cur = self.last_date + timedelta(days=1)
+            while cur < day:
+                self._push(0.0)
+                cur += timedelta(days=1)
+        self.last_date = day
+        return {"date": day, **self._push(float(count))}
+
+    def _push(self, v: float) -> Dict[str, float]:
+        self.n += 1
+        self._vals.push(v)
+        mean = v if self.trend_window <= 1 else self._vals.mean()
+        self._resid.push(v - mean)
+        self._slope.push(v)
+
+        ac = self._resid.autocorr()
+        var = self._resid.variance()
+        slope = self._slope.slope()
+
+        self._base_ac.add(ac)
+        self._base_var.add(var)
+        self._base_slope.add(slope)
+        self._ema = combine_risk(self._base_ac.z(ac), self._base_var.z(var), self._base_slope.z(slope), ema_prev=self._ema)
+        return {
+            "detections": v,
+            "autocorrelation": ac,
+            "variance": var,
+            "trend": slope,
+            "risk": min(100.0, max(0.0, self._ema * 100.0)),
+        }
@@ -1,119 +1,171 @@
 from __future__ import annotations
 from datetime import datetime, timedelta
-from pathlib import Path
 from typing import Dict, List, Tuple, Optional
-import os
+import hashlib
 
-# In-memory cache
+import numpy as np
+
+from .catalog import CatalogDelta, get_catalog, subscribe
+
+# In-memory cache, built once from the catalog and then patched with catalog
+# deltas (see apply_catalog_delta) instead of expiring on a timer
 _TS_CACHE: Optional[Dict[str, List[Tuple[datetime, int]]]] = None
 _TS_CACHE_BUILT_AT: Optional[datetime] = None
-_TS_CACHE_TTL_SECONDS = 600  # 10 minutes
-
-# Where to read dataset from (fallback order)
-DATASET_DIR_CANDIDATES = [
-    Path("/app/data/temp_extract/train"),
-    Path("/app/data/butterflies/train"),
-]
-
-IMG_EXTS = (".jpg", ".jpeg", ".png", ".JPG", ".JPEG", ".PNG")
-
-
-def _find_dataset_dir() -> Optional[Path]:
-    for p in DATASET_DIR_CANDIDATES:
-        if p.exists() and p.is_dir():
-            return p
-    return None
-
-
-def _iter_images(base: Path):
-    for species_dir in base.iterdir():
-        if not species_dir.is_dir():
-            continue
-        species = species_dir.name
-        for root, _dirs, files in os.walk(species_dir):
-            for f in files:
-                if any(f.endswith(ext) for ext in IMG_EXTS):
-                    yield species, Path(root) / f
-
-
-def _file_timestamp(p: Path) -> datetime:
-    try:
-        ts = p.stat().st_mtime
-        return datetime.fromtimestamp(ts)
-    except Exception:
-        # Fallback: spread over last 30 days
-        days_back = 30
-        return datetime.utcnow() - timedelta(days=(hash(p.name) % days_back))
-
-
-def _aggregate_daily(points: List[Tuple[datetime, str]]) -> Dict[str, List[Tuple[datetime, int]]]:
-    # points: list of (timestamp, species)
-    buckets: Dict[str, Dict[datetime, int]] = {}
-    for ts, sp in points:
-        day = datetime(ts.year, ts.month, ts.day)
-        buckets.setdefault(sp, {})[day] = buckets.setdefault(sp, {}).get(day, 0) + 1
-    # Sort days
-    out: Dict[str, List[Tuple[datetime, int]]] = {}
-    for sp, by_day in buckets.items():
-        days = sorted(by_day.items(), key=lambda x: x[0])
-        out[sp] = days
-    return out
+# Catalog version _TS_CACHE reflects; changes made by other workers only show
+# up as a newer catalog.last_version and trigger a rebuild
+_TS_VERSION: Optional[int] = None
+
+# Species x day matrix derived from _TS_CACHE (rebuilt when the cache object changes)
+_TS_MATRIX: Optional[Tuple[List[str], List[datetime], np.ndarray]] = None
+_TS_MATRIX_SOURCE: Optional[Dict[str, List[Tuple[datetime, int]]]] = None
+_TS_MATRIX_VERSION: Optional[str] = None
+
+
+def is_fresh() -> bool:
+    """True when the cached series can be served without touching the catalog or the filesystem."""
+    catalog = get_catalog()
+    return _TS_CACHE is not None and catalog.is_fresh() and _TS_VERSION == catalog.last_version
+
+
+def _fill_gaps(days: List[Tuple[datetime, int]]) -> List[Tuple[datetime, int]]:
+    # Ensure continuous days by filling gaps with 0
+    if not days:
+        return []
+    filled: List[Tuple[datetime, int]] = []
+    cur = days[0][0]
+    end = days[-1][0]
+    idx = 0
+    while cur <= end:
+        if idx < len(days) and days[idx][0] == cur:
+            filled.append(days[idx])
+            idx += 1
+        else:
+            filled.append((cur, 0))
+        cur = cur + timedelta(days=1)
+    return filled
 
 
 def build_or_get_timeseries(force_rebuild: bool = False) -> Dict[str, List[Tuple[datetime, int]]]:
-    global _TS_CACHE, _TS_CACHE_BUILT_AT
-
-    fresh = False
-    if _TS_CACHE_BUILT_AT is not None:
-        age = (datetime.utcnow() - _TS_CACHE_BUILT_AT).total_seconds()
-        fresh = age < _TS_CACHE_TTL_SECONDS
-
-    if not force_rebuild and _TS_CACHE is not None and fresh:
-        return _TS_CACHE
-
-    base = _find_dataset_dir()
-    if not base:
-        _TS_CACHE = {}
-        _TS_CACHE_BUILT_AT = datetime.utcnow()
-        return _TS_CACHE
+    global _TS_CACHE, _TS_CACHE_BUILT_AT, _TS_VERSION
 
-    # Collect points
-    pts: List[Tuple[datetime, str]] = []
-    for species, path in _iter_images(base):
-        ts = _file_timestamp(path)
-        pts.append((ts, species))
+    # Cheap when the watcher is running; otherwise picks up filesystem changes
+    # (delivered to apply_catalog_delta) at most every few seconds
+    catalog = get_catalog()
+    catalog.ensure_fresh()
 
-    if not pts:
-        _TS_CACHE = {}
-        _TS_CACHE_BUILT_AT = datetime.utcnow()
+    version = catalog.last_version
+    if not force_rebuild and _TS_CACHE is not None and _TS_VERSION == version:
         return _TS_CACHE
 
-    series = _aggregate_daily(pts)
-
-    # Optional: ensure continuous days by filling gaps with 0 up to a limit
+    # Daily image counts per species across all dataset roots
+    series = catalog.daily_counts()
     for sp, days in list(series.items()):
-        if not days:
-            continue
-        filled: List[Tuple[datetime, int]] = []
-        start = days[0][0]
-        end = days[-1][0]
-        cur = start
-        idx = 0
-        while cur <= end:
-            if idx < len(days) and days[idx][0] == cur:
-                filled.append(days[idx])
-                idx += 1
-            else:
-                filled.append((cur, 0))
-            cur = cur + timedelta(days=1)
-        series[sp] = filled
+        series[sp] = _fill_gaps(days)
 
     _TS_CACHE = series
     _TS_CACHE_BUILT_AT = datetime.utcnow()
+    _TS_VERSION = version
     return _TS_CACHE
 
 
+def _day(mtime: float) -> datetime:
+    ts = datetime.fromtimestamp(mtime)
+    return datetime(ts.year, ts.month, ts.day)
+
+
+def apply_catalog_delta(delta: CatalogDelta):
+    """Patch the cached series with images added/removed since the last build."""
+    global _TS_CACHE, _TS_VERSION
+    if _TS_CACHE is None or _TS_VERSION != delta.base:
+        return  # nothing built yet, or already stale and rebuilt on the next read
+    changes: Dict[str, Dict[datetime, int]] = {}
+    for img in delta.added:
+        by_day = changes.setdefault(img.species, {})
+        by_day[_day(img.mtime)] = by_day.get(_day(img.mtime), 0) + 1
+    for img in delta.removed:
+        by_day = changes.setdefault(img.species, {})
+        by_day[_day(img.mtime)] = by_day.get(_day(img.mtime), 0) - 1
+
+    # Copy-on-write so readers never see a half-applied update
+    series = dict(_TS_CACHE)
+    for sp, by_day in changes.items():
+        counts = {d: c for d, c in series.get(sp, []) if c}
+        for d, c in by_day.items():
+            counts[d] = counts.get(d, 0) + c
+        days = sorted((d, c) for d, c in counts.items() if c > 0)
+        if days:
+            series[sp] = _fill_gaps(days)
+        else:
+            series.pop(sp, None)
+    _TS_CACHE = series
+    _TS_VERSION = delta.version
+
+
+subscribe(apply_catalog_delta)
+
+
+def series_to_matrix(series: Dict[str, List[Tuple[datetime, int]]]) -> Tuple[List[str], List[datetime], np.ndarray]:
+    """Align per-species daily series on one date axis.
+
+    Returns (species, dates, counts) where counts[i, j] is the number of images
+    of species[i] on dates[j]. Days outside a species' own range count as 0,
+    matching how gaps inside a series are filled.
+    """
+    species = sorted(sp for sp, days in series.items() if days)
+    if not species:
+        return [], [], np.zeros((0, 0), dtype=np.int64)
+    start = min(series[sp][0][0] for sp in species)
+    end = max(series[sp][-1][0] for sp in species)
+    n_days = (end - start).days + 1
+    counts = np.zeros((len(species), n_days), dtype=np.int64)
+    for i, sp in enumerate(species):
+        days = series[sp]
+        off = (days[0][0] - start).days
+        counts[i, off : off + len(days)] = [c for _d, c in days]
+    dates = [start + timedelta(days=j) for j in range(n_days)]
+    return species, dates, counts
+
+
+def _fingerprint(species: List[str], dates: List[datetime], counts: np.ndarray) -> str:
+    h = hashlib.sha1()
+    h.update("\n".join(species).encode("utf-8"))
+    h.update(dates[0].isoformat().encode("ascii") if dates else b"")
+    h.update(np.ascontiguousarray(counts).tobytes())
+    return h.hexdigest()[:16]
+
+
+def build_counts_matrix(force_rebuild: bool = False) -> Tuple[List[str], List[datetime], np.ndarray]:
+    global _TS_MATRIX, _TS_MATRIX_SOURCE, _TS_MATRIX_VERSION
+    ser = build_or_get_timeseries(force_rebuild=force_rebuild)
+    if _TS_MATRIX is None or _TS_MATRIX_SOURCE is not ser:
+        _TS_MATRIX = series_to_matrix(ser)
+        _TS_MATRIX_SOURCE = ser
+        _TS_MATRIX_VERSION = _fingerprint(*_TS_MATRIX)
+    return _TS_MATRIX
+
+
+def dataset_version() -> str:
+    """Content fingerprint of the current counts matrix.
+
+    Only changes when the per-species daily counts change, so a periodic
+    rebuild over an unchanged dataset keeps the same version.
+    """
+    build_counts_matrix()
+    return _TS_MATRIX_VERSION or ""
+
+
+def cached_version() -> Optional[str]:
+    """dataset_version() if it is known without any I/O or rebuild, else None."""
+    if not is_fresh() or _TS_MATRIX_SOURCE is not _TS_CACHE:
+        return None
+    return _TS_MATRIX_VERSION
+
+
 def top_species_by_volume(n: int = 5) -> List[str]:
-    ser = build_or_get_timeseries()
-    ranked = sorted(ser.items(), key=lambda kv: sum(v for _d, v in kv[1]), reverse=True)
-    return [sp for sp, _ in ranked[:n]]
+    species, _dates, counts = build_counts_matrix()
+    if not species:
+        return []
+    totals = counts.sum(axis=1)
+    # stable sort on -total keeps name order for ties
+    order = np.argsort(-totals, kind="stable")[:n]
+    return [species[i] for i in order]
@@ -0,0 +1,220 @@
+from __future__ import annotations
+from typing import Dict, Optional, Set
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import threading
+import time
+
+from .catalog import DatasetCatalog, get_catalog
+
+# "auto" uses inotify where available and falls back to polling; "inotify",
+# "poll" force one backend; "off" disables the watcher (queries still reconcile
+# the catalog at most every RECONCILE_INTERVAL seconds).
+WATCHER_MODE = os.getenv("GAIA_DATASET_WATCHER", "auto").lower()
+POLL_SECONDS = float(os.getenv("GAIA_DATASET_POLL_SECONDS", "2"))
+# Coalesce bursts of events (e.g. a bulk copy) into one reconcile
+DEBOUNCE_SECONDS = 0.2
+# Safety-net reconcile in inotify mode, e.g. for roots created after startup
+RESYNC_SECONDS = 60.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+_WATCH_MASK = (
+    IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+    | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR
+)
+_EVENT = struct.Struct("iIII")
+
+
+class _Inotify:
+    """Minimal ctypes binding: one fd, one watch per catalog directory."""
+
+    def __init__(self):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self._add = libc.inotify_add_watch
+        self._add.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._rm = libc.inotify_rm_watch
+        self._rm.argtypes = [ctypes.c_int, ctypes.c_int]
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wd_to_path: Dict[int, str] = {}
+        self.path_to_wd: Dict[str, int] = {}
+        # Watches on the parent of a missing root only care about that root's name
+        self.only_names: Dict[str, str] = {}
+
+    def sync(self, paths: Set[str]):
+        for p in paths - set(self.path_to_wd):
+            wd = self._add(self.fd, os.fsencode(p), _WATCH_MASK)
+            if wd >= 0:
+                self.wd_to_path[wd] = p
+                self.path_to_wd[p] = wd
+        for p in set(self.path_to_wd) - paths:
+            wd = self.path_to_wd.pop(p)
+            self.wd_to_path.pop(wd, None)
+            self._rm(self.fd, wd)
+
+    def read(self, timeout: float):
+        """Return (changed dirs, overflowed) for events within timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set(), False
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return set(), False
+        dirs: Set[str] = set()
+        overflow = False
+        off = 0
+        while off + _EVENT.size <= len(buf):
+            wd, mask, _cookie, length = _EVENT.unpack_from(buf, off)
+            name = buf[off + _EVENT.size : off + _EVENT.size + length].rstrip(b"\0")
+            off += _EVENT.size + length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            path = self.wd_to_path.get(wd)
+            if mask & IN_IGNORED:
+                if path is not None:
+                    self.path_to_wd.pop(path, None)
+                self.wd_to_path.pop(wd, None)
+                continue
+            if path is None:
+                continue
+            wanted = self.only_names.get(path)
+            if wanted is not None and os.fsdecode(name) != wanted:
+                continue
+            dirs.add(path)
+        return dirs, overflow
+
+    def close(self):
+        try:
+            os.close(self.fd)
+        except OSError:
+            pass
+
+
+class DatasetWatcher:
+    """Keeps the dataset catalog, and the caches subscribed to it, hot.
+
+    With inotify every change under the dataset roots triggers a (debounced)
+    incremental reconcile of just the touched directories; the catalog then
+    pushes the add/remove delta to its subscribers. Without inotify the catalog
+    is reconciled every POLL_SECONDS, which only relists directories whose
+    mtime changed.
+    """
+
+    def __init__(self, catalog: Optional[DatasetCatalog] = None, mode: str = WATCHER_MODE, poll_seconds: float = POLL_SECONDS):
+        self.catalog = catalog or get_catalog()
+        self.mode = mode
+        self.poll_seconds = poll_seconds
+        self.backend = "off"
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._inotify: Optional[_Inotify] = None
+
+    def start(self):
+        if self.mode == "off" or self._thread is not None:
+            return
+        if self.mode in ("auto", "inotify"):
+            try:
+                self._inotify = _Inotify()
+                self.backend = "inotify"
+            except Exception as e:
+                if self.mode == "inotify":
+                    raise
+                print(f"inotify unavailable ({e}); polling dataset every {self.poll_seconds}s")
+        if self._inotify is None:
+            self.backend = "poll"
+        target = self._run_inotify if self._inotify is not None else self._run_poll
+        self._thread = threading.Thread(target=target, name="dataset-watcher", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        if self._inotify is not None:
+            self._inotify.close()
+            self._inotify = None
+
+    def _reconcile(self, force_dirs: Optional[Set[str]] = None):
+        try:
+            self.catalog.reconcile(force_dirs=force_dirs)
+        except Exception as e:
+            print(f"Dataset watcher reconcile failed: {e}")
+
+    def _watch_targets(self) -> Set[str]:
+        paths = set(self.catalog.dirs())
+        only_names: Dict[str, str] = {}
+        # Parents of missing roots, so creating a root is noticed too
+        for root, _mount in self.catalog.roots:
+            if root.is_dir():
+                paths.add(str(root))
+            elif root.parent.is_dir():
+                paths.add(str(root.parent))
+                only_names[str(root.parent)] = root.name
+        if self._inotify is not None:
+            self._inotify.only_names = only_names
+        return {p for p in paths if os.path.isdir(p)}
+
+    def _run_poll(self):
+        while not self._stop.wait(self.poll_seconds):
+            self._reconcile()
+
+    def _run_inotify(self):
+        ino = self._inotify
+        self._reconcile()
+        ino.sync(self._watch_targets())
+        last_full = time.monotonic()
+        while not self._stop.is_set():
+            dirs, overflow = ino.read(timeout=1.0)
+            if dirs or overflow:
+                # Let the burst settle, then take everything that queued up
+                deadline = time.monotonic() + DEBOUNCE_SECONDS
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    more, more_overflow = ino.read(timeout=remaining)
+                    dirs |= more
+                    overflow |= more_overflow
+                self._reconcile(force_dirs=None if overflow else dirs)
+                ino.sync(self._watch_targets())
+            elif time.monotonic() - last_full >= RESYNC_SECONDS:
+                self._reconcile()
+                ino.sync(self._watch_targets())
+                last_full = time.monotonic()
+
+
+_WATCHER: Optional[DatasetWatcher] = None
+
+
+def start_watcher() -> DatasetWatcher:
+    global _WATCHER
+    if _WATCHER is None:
+        _WATCHER = DatasetWatcher()
+        _WATCHER.start()
+    return _WATCHER
+
+
+def stop_watcher():
+    global _WATCHER
+    if _WATCHER is not None:
+        _WATCHER.stop()
+        _WATCHER = None
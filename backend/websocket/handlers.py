@@ -51,3 +51,64 @@ async def emit_edge_status(payload: dict):
             "timestamp": datetime.utcnow().isoformat(),
         },
     )
+
+# --- Digital twin runs: clients join "twin_run:<run_id>" to receive its frames ---
+def _twin_run_room(run_id: str) -> str:
+    return f"twin_run:{run_id}"
+
+@sio.event
+async def twin_run_subscribe(sid, data):
+    run_id = (data or {}).get("run_id")
+    if not run_id:
+        return {"success": False, "error": "run_id required"}
+    await sio.enter_room(sid, _twin_run_room(run_id))
+    return {"success": True}
+
+@sio.event
+async def twin_run_unsubscribe(sid, data):
+    run_id = (data or {}).get("run_id")
+    if run_id:
+        await sio.leave_room(sid, _twin_run_room(run_id))
+    return {"success": True}
+
+async def emit_twin_frame(run_id: str, frame: dict):
+    await sio.emit("twin_frame", {"run_id": run_id, **frame}, room=_twin_run_room(run_id))
+
+async def emit_twin_run_status(run_id: str, status: dict):
+    await sio.emit(
+        "twin_run_status",
+        {
+            **status,
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+        room=_twin_run_room(run_id),
+    )
+
+# --- Digital twin parameter sweeps: clients join "twin_sweep:<sweep_id>" for progress ---
+def _twin_sweep_room(sweep_id: str) -> str:
+    return f"twin_sweep:{sweep_id}"
+
+@sio.event
+async def twin_sweep_subscribe(sid, data):
+    sweep_id = (data or {}).get("sweep_id")
+    if not sweep_id:
+        return {"success": False, "error": "sweep_id required"}
+    await sio.enter_room(sid, _twin_sweep_room(sweep_id))
+    return {"success": True}
+
+@sio.event
+async def twin_sweep_unsubscribe(sid, data):
+    sweep_id = (data or {}).get("sweep_id")
+    if sweep_id:
+        await sio.leave_room(sid, _twin_sweep_room(sweep_id))
+    return {"success": True}
+
+async def emit_twin_sweep_progress(sweep_id: str, progress: dict):
+    await sio.emit(
+        "twin_sweep_progress",
+        {
+            **progress,
+            "timestamp": datetime.utcnow().isoformat(),
+        },
+        room=_twin_sweep_room(sweep_id),
+    )
@@ -2,19 +2,23 @@
 import { useEffect, useRef, useState } from 'react'
 import { toast } from 'sonner'
 import { fetchWithRetry } from '../lib/fetcher'
+import { decodeTwinFrame, TWIN_FRAME_MEDIA_TYPE, type TwinFrame } from '../lib/twinFrame'
 import { useRouter } from 'next/navigation'
 
 type Metrics = { count_A:number; count_B:number; biodiversity:number; risk:number }
 
 type TwinState = {
+  twin_id?: string
   step: number
   env: { temp:number; rain:number; poaching:number }
   metrics: Metrics
   agents: { x:number; y:number; s:'A'|'B' }[]
   grid: { w:number; h:number }
+  // quantized resources (0..255, row-major), present once binary frames arrive
+  res?: Uint8Array
 } | null
 
-type Snapshot = { id:number; name:string; saved_at:string; step:number; env:{temp:number;rain:number;poaching:number}; metrics: Metrics }
+type Snapshot = { id:number; name:string; saved_at:string; step:number; env:{temp:number;rain:number;poaching:number}; metrics: Metrics; checkpoint_id?: string }
 
 export default function DigitalTwinPage() {
   const [state, setState] = useState<TwinState>(null)
@@ -27,6 +31,35 @@ export default function DigitalTwinPage() {
   const rafRef = useRef<number | null>(null)
   const lastStepRef = useRef<number>(0)
   const canvasRef = useRef<HTMLCanvasElement | null>(null)
+  // each browser works on its own twin; the id lives in a ref so the animation loop sees it
+  const twinIdRef = useRef<string | null>(null)
+  const twinPath = (p:string) => `/twin/${twinIdRef.current}${p}`
+  // last decoded binary frame: the base that step deltas apply to
+  const frameRef = useRef<TwinFrame | null>(null)
+
+  const frameToState = (f: TwinFrame): TwinState => ({
+    step: f.step,
+    env: f.env,
+    metrics: f.metrics,
+    agents: Array.from(f.x, (x, i) => ({ x, y: f.y[i], s: f.s[i] === 0 ? 'A' as const : 'B' as const })),
+    grid: f.grid,
+    res: f.res,
+  })
+
+  const fetchFrame = async (path:string, init?: RequestInit) => {
+    const r = await fetchWithRetry(path, init, 0, 12000)
+    if (!(r.headers.get('content-type') || '').startsWith(TWIN_FRAME_MEDIA_TYPE)) {
+      const j = await r.json()
+      throw new Error(j?.error?.message || 'Request failed')
+    }
+    return r.arrayBuffer()
+  }
+
+  const loadKeyframe = async () => {
+    const f = await decodeTwinFrame(await fetchFrame(twinPath('/state?format=binary')))
+    frameRef.current = f
+    return f
+  }
   const router = useRouter()
 
   const api = async (path:string, init?: RequestInit) => {
@@ -39,6 +72,8 @@ export default function DigitalTwinPage() {
   const create = async () => {
     try {
       const j = await api('/twin/create', { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ temp: 0, rain: 0.5, poaching: 0 }) })
+      twinIdRef.current = j.data.twin_id
+      frameRef.current = null
       setState(j.data.state)
       setTemp(0); setRain(0.5); setPoach(0)
       toast.success('Twin created')
@@ -47,32 +82,37 @@ export default function DigitalTwinPage() {
   }
 
   const refreshState = async () => {
-    try { const j = await api('/twin/state'); setState(j.data) } catch {}
+    try { const j = await api(twinPath('/state')); setState(j.data) } catch {}
   }
 
   const applyEnv = async (t:number, r:number, p:number) => {
-    try { const j = await api('/twin/apply', { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ temp:t, rain:r, poaching:p }) }); setState(j.data) } catch {}
+    try { const j = await api(twinPath('/apply'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ temp:t, rain:r, poaching:p }) }); setState({ ...j.data, res: frameRef.current?.res }) } catch {}
   }
 
   const step = async (n=1) => {
     try {
-      const j = await api('/twin/step', { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ steps:n }) })
-      setState(j.data)
+      // binary delta against our last frame; resync from a keyframe when we lack its base
+      const base = frameRef.current ?? await loadKeyframe()
+      const buf = await fetchFrame(twinPath('/step?format=binary'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ steps:n }) })
+      let f: TwinFrame
+      try { f = await decodeTwinFrame(buf, base) } catch { f = await loadKeyframe() }
+      frameRef.current = f
+      setState(frameToState(f))
     } catch {}
   }
 
   const saveSnapshot = async () => {
-    try { await api('/twin/snapshot', { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ name: snapName || 'Snapshot' }) }); toast.success('Snapshot saved'); await refreshSnapshots() } catch (e:any) { toast.error('Snapshot failed', { description: String(e) }) }
+    try { await api(twinPath('/snapshot'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ name: snapName || 'Snapshot' }) }); toast.success('Snapshot saved'); await refreshSnapshots() } catch (e:any) { toast.error('Snapshot failed', { description: String(e) }) }
   }
 
   const runInterventionOnThisTwin = async () => {
     try {
-      const r = await fetchWithRetry('/twin/snapshot', { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ name: snapName || 'Snapshot' }) }, 0, 12000)
+      const r = await fetchWithRetry(twinPath('/snapshot'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ name: snapName || 'Snapshot' }) }, 0, 12000)
       const j = await r.json()
       let id: number | null = j?.data?.id ?? null
       if (!id) {
         try {
-          const list = await fetchWithRetry('/twin/snapshots', {}, 0, 12000)
+          const list = await fetchWithRetry(twinPath('/snapshots'), {}, 0, 12000)
           const lj = await list.json()
           const items: Snapshot[] = lj?.data || []
           if (items.length) {
@@ -91,8 +131,33 @@ export default function DigitalTwinPage() {
     }
   }
 
+  const showState = (st: NonNullable<TwinState>) => {
+    frameRef.current = null
+    setState(st)
+    setTemp(st.env.temp); setRain(st.env.rain); setPoach(st.env.poaching)
+  }
+
+  const restoreSnapshot = async (s: Snapshot) => {
+    try {
+      const j = await api(twinPath('/restore'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ snapshot_id: s.id }) })
+      showState(j.data)
+      toast.success(`Restored "${s.name}"`)
+    } catch (e:any) { toast.error('Restore failed', { description: String(e) }) }
+  }
+
+  // fork a new twin from the snapshot with the current slider environment and switch to it
+  const branchSnapshot = async (s: Snapshot) => {
+    try {
+      const j = await api(twinPath('/branch'), { method:'POST', headers:{ 'Content-Type':'application/json' }, body: JSON.stringify({ snapshot_id: s.id, temp, rain, poaching: poach }) })
+      twinIdRef.current = j.data.twin_id
+      showState(j.data.state)
+      toast.success(`Branched from "${s.name}"`)
+      await refreshSnapshots()
+    } catch (e:any) { toast.error('Branch failed', { description: String(e) }) }
+  }
+
   const refreshSnapshots = async () => {
-    try { const j = await api('/twin/snapshots'); setSnapshots(j.data || []) } catch {}
+    try { const j = await api(twinPath('/snapshots')); setSnapshots(j.data || []) } catch {}
   }
 
   // animation loop
@@ -121,6 +186,20 @@ export default function DigitalTwinPage() {
     // grid scale
     const sx = W / (state.grid.w)
     const sy = H / (state.grid.h)
+    // resource layer
+    if (state.res) {
+      const { w, h } = state.grid
+      const img = new ImageData(w, h)
+      for (let i = 0; i < w * h; i++) {
+        const v = state.res[i]
+        img.data[i*4] = 10; img.data[i*4+1] = 40 + (v >> 1); img.data[i*4+2] = 30; img.data[i*4+3] = 255
+      }
+      const off = document.createElement('canvas')
+      off.width = w; off.height = h
+      off.getContext('2d')!.putImageData(img, 0, 0)
+      ctx.imageSmoothingEnabled = false
+      ctx.drawImage(off, 0, 0, W, H)
+    }
     // draw agents
     for (const a of state.agents) {
       ctx.fillStyle = a.s === 'A' ? '#34d399' : '#60a5fa'
@@ -190,6 +269,12 @@ export default function DigitalTwinPage() {
               <div className="text-xs text-slate-400">{new Date(s.saved_at).toLocaleString()}</div>
               <div className="mt-1">Step {s.step} • Bio {s.metrics.biodiversity.toFixed(2)} • Risk {s.metrics.risk.toFixed(2)}</div>
               <div className="text-xs text-slate-400 mt-1">Env • Temp {s.env.temp.toFixed(2)} • Rain {s.env.rain.toFixed(2)} • Poach {s.env.poaching.toFixed(2)}</div>
+              {s.checkpoint_id && (
+                <div className="mt-2 flex gap-2">
+                  <button className="px-2 py-1 glass text-xs" onClick={()=>restoreSnapshot(s)}>Restore</button>
+                  <button className="px-2 py-1 glass text-xs" title="New twin from this snapshot with the current environment" onClick={()=>branchSnapshot(s)}>Branch</button>
+                </div>
+              )}
             </div>
           ))}
         </div>
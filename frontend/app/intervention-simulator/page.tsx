@@ -10,7 +10,10 @@ type Results = {
   population_change_percent: number
   risk_change_percent: number
   biodiversity_index: number
-  trajectories: { species:string; before:number; after:number }[]
+  // after: projected population with the intervention; baseline: without it
+  trajectories: { species:string; before:number; after:number; baseline?:number }[]
+  seed?: number
+  years?: number
 } | null
 
 export default function InterventionSimulatorPage() {
@@ -292,10 +295,10 @@ function ComparePanel({ a, b }: { a: any; b: any }) {
             <div className="glass p-3"><div className="text-slate-400 text-xs">Biodiversity index</div><div className="font-bold">{results!.biodiversity_index}</div></div>
           </div>
           <div className="mt-4">
-            <h4 className="font-medium">Trajectories <span className="text-xs text-slate-400">{results!.trajectories.length} species</span></h4>
+            <h4 className="font-medium">Trajectories <span className="text-xs text-slate-400">{results!.trajectories.length} species{results!.years ? ` • ${results!.years} years` : ''}{results!.seed !== undefined ? ` • seed ${results!.seed}` : ''}</span></h4>
             <ul className="mt-2 text-sm space-y-1">
               {results!.trajectories.map((t,i)=> (
-                <li key={i} className="flex justify-between"><span>{t.species}</span><span>{t.before} → {t.after}</span></li>
+                <li key={i} className="flex justify-between"><span>{t.species}</span><span>{t.before} → {t.after}{t.baseline !== undefined && <span className="text-xs text-slate-400 ml-2">(no action {t.baseline})</span>}</span></li>
               ))}
             </ul>
           </div>
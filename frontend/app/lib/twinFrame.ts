@@ -0,0 +1,63 @@
+// Decoder for binary digital twin frames (backend/app/services/twin_codec.py).
+// Layout, little endian: 64-byte header, x uint16[n], y uint16[n], species
+// uint8[n], zlib-compressed uint8 resource grid (a delta mod 256 against the
+// frame at base_step unless the frame is a keyframe).
+
+export const TWIN_FRAME_MEDIA_TYPE = 'application/vnd.gaia.twin-frame'
+
+const HEADER_BYTES = 64
+const KEYFRAME = 0
+
+export type TwinFrame = {
+  keyframe: boolean
+  step: number
+  baseStep: number
+  grid: { w: number; h: number }
+  env: { temp: number; rain: number; poaching: number }
+  metrics: { count_A: number; count_B: number; biodiversity: number; risk: number }
+  nAgents: number
+  x: Uint16Array
+  y: Uint16Array
+  s: Uint8Array
+  // quantized resources 0..255, row-major h*w
+  res: Uint8Array
+}
+
+async function inflate(bytes: Uint8Array): Promise<Uint8Array> {
+  const stream = new Blob([bytes]).stream().pipeThrough(new DecompressionStream('deflate'))
+  return new Uint8Array(await new Response(stream).arrayBuffer())
+}
+
+/**
+ * Decode a frame. Delta frames need `base`, the decoded frame at their base
+ * step; they throw if it is missing or at another step (fetch a keyframe then).
+ */
+export async function decodeTwinFrame(buf: ArrayBuffer, base?: TwinFrame | null): Promise<TwinFrame> {
+  const v = new DataView(buf)
+  const magic = String.fromCharCode(v.getUint8(0), v.getUint8(1), v.getUint8(2), v.getUint8(3))
+  if (magic !== 'GTWF' || v.getUint8(4) !== 1) throw new Error('Not a twin frame')
+  const kind = v.getUint8(5)
+  const u32 = (i: number) => v.getUint32(8 + 4 * i, true)
+  const f32 = (i: number) => v.getFloat32(40 + 4 * i, true)
+  const [step, baseStep, w, h, nAgents, n, countA, countB] = [0, 1, 2, 3, 4, 5, 6, 7].map(u32)
+  const gridBytes = v.getUint32(60, true)
+  let off = HEADER_BYTES
+  const x = new Uint16Array(buf.slice(off, off + 2 * n)); off += 2 * n
+  const y = new Uint16Array(buf.slice(off, off + 2 * n)); off += 2 * n
+  const s = new Uint8Array(buf, off, n); off += n
+  const res = await inflate(new Uint8Array(buf, off, gridBytes))
+  if (kind !== KEYFRAME) {
+    if (!base || base.step !== baseStep) throw new Error(`Delta frame needs the frame at step ${baseStep}`)
+    for (let i = 0; i < res.length; i++) res[i] = (res[i] + base.res[i]) & 0xff
+  }
+  return {
+    keyframe: kind === KEYFRAME,
+    step, baseStep,
+    grid: { w, h },
+    env: { temp: f32(2), rain: f32(3), poaching: f32(4) },
+    metrics: { count_A: countA, count_B: countB, biodiversity: f32(0), risk: f32(1) },
+    nAgents,
+    x, y, s,
+    res,
+  }
+}
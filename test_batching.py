@@ -0,0 +1,141 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.batching import MicroBatcher  # noqa: E402
+
+
+class FakeModel:
+    """Stands in for the classifier: fixed per-call cost plus a per-image cost."""
+
+    def __init__(self, overhead=0.0, per_item=0.0):
+        self.overhead = overhead
+        self.per_item = per_item
+        self.batch_sizes = []
+        self.threads = set()
+
+    def __call__(self, batch):
+        self.batch_sizes.append(len(batch))
+        self.threads.add(threading.get_ident())
+        if self.overhead or self.per_item:
+            time.sleep(self.overhead + self.per_item * len(batch))
+        # Row i identifies its input so fan-out can be checked
+        return batch.reshape(len(batch), -1)[:, :1] * 2.0
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def test_results_fan_out_to_callers():
+    model = FakeModel(overhead=0.01)
+    batcher = MicroBatcher(model, max_batch_size=8, max_wait_ms=20)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(np.full((2, 2), i, np.float32)) for i in range(20)))
+
+    try:
+        out = run(main())
+    finally:
+        batcher.stop()
+    assert [float(r[0]) for r in out] == [2.0 * i for i in range(20)]
+    assert sum(model.batch_sizes) == 20
+    assert max(model.batch_sizes) <= 8
+    assert len(model.batch_sizes) < 20  # requests were actually coalesced
+    assert threading.get_ident() not in model.threads
+
+
+def test_single_request_waits_at_most_max_wait():
+    batcher = MicroBatcher(FakeModel(), max_batch_size=64, max_wait_ms=10)
+
+    async def main():
+        t0 = time.perf_counter()
+        await batcher.submit(np.zeros(3, np.float32))
+        return time.perf_counter() - t0
+
+    try:
+        elapsed = run(main())
+    finally:
+        batcher.stop()
+    assert elapsed < 0.5
+
+
+def test_forward_errors_reach_every_caller():
+    def broken(batch):
+        raise ValueError("boom")
+
+    batcher = MicroBatcher(broken, max_batch_size=4, max_wait_ms=5)
+
+    async def main():
+        return await asyncio.gather(*(batcher.submit(np.zeros(1)) for _ in range(4)), return_exceptions=True)
+
+    try:
+        out = run(main())
+    finally:
+        batcher.stop()
+    assert all(isinstance(e, ValueError) for e in out)
+
+
+def test_event_loop_stays_responsive():
+    batcher = MicroBatcher(FakeModel(overhead=0.05), max_batch_size=4, max_wait_ms=1)
+
+    async def main():
+        jobs = [asyncio.ensure_future(batcher.submit(np.zeros(1))) for _ in range(8)]
+        ticks = 0
+        while not all(j.done() for j in jobs):
+            await asyncio.sleep(0.005)
+            ticks += 1
+        return ticks
+
+    try:
+        ticks = run(main())
+    finally:
+        batcher.stop()
+    assert ticks >= 10  # the loop kept running while the model was busy
+
+
+if __name__ == "__main__":
+    # Benchmark: throughput vs latency for concurrent clients, model cost
+    # roughly shaped like EfficientNetB0 on 2 CPUs (fixed call overhead plus
+    # per-image work). Pass --model to use the real classifier instead.
+    if "--model" in sys.argv:
+        from app.services.model_loader import butterfly_model
+        model = butterfly_model.wait().predict_proba
+        shape = (224, 224, 3)
+    else:
+        model = FakeModel(overhead=0.030, per_item=0.004)
+        shape = (4,)
+    requests, clients = 256, 32
+
+    async def bench(max_batch, max_wait_ms):
+        batcher = MicroBatcher(model, max_batch_size=max_batch, max_wait_ms=max_wait_ms)
+        latencies = []
+        x = np.random.rand(*shape).astype(np.float32)
+
+        async def client(n):
+            for _ in range(n):
+                t0 = time.perf_counter()
+                await batcher.submit(x)
+                latencies.append(time.perf_counter() - t0)
+
+        await batcher.submit(x)  # warm-up
+        t0 = time.perf_counter()
+        await asyncio.gather(*(client(requests // clients) for _ in range(clients)))
+        total = time.perf_counter() - t0
+        batcher.stop()
+        lat = np.array(latencies) * 1000
+        print(
+            f"batch<={max_batch:>3} wait={max_wait_ms:>4.1f}ms: {requests / total:7.1f} img/s | "
+            f"p50 {np.percentile(lat, 50):7.1f} ms | p95 {np.percentile(lat, 95):7.1f} ms | "
+            f"mean batch {batcher.mean_batch_size:5.1f}"
+        )
+
+    print(f"{requests} requests from {clients} concurrent clients")
+    for max_batch, max_wait in ((1, 0), (4, 2), (8, 5), (16, 5), (32, 10), (64, 20)):
+        asyncio.run(bench(max_batch, max_wait))
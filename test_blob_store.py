@@ -0,0 +1,153 @@
+import base64
+import hashlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.blob_store import BlobStore, is_ref  # noqa: E402
+from app.services.imaging import to_model_input  # noqa: E402
+
+
+def jpeg(color, size=(64, 64)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def store():
+    with tempfile.TemporaryDirectory() as d:
+        yield BlobStore(d, ttl=3600)
+
+
+def test_put_is_content_addressed(store):
+    data = jpeg((200, 10, 10))
+    ref = store.put(data)
+    assert is_ref(ref) and ref.startswith("blob:" + hashlib.sha256(data).hexdigest() + ".")
+    again = store.put(data)
+    assert again != ref and os.path.samefile(store.path_for(again), store.path_for(ref))
+    other = store.put(jpeg((10, 200, 10)))
+    assert store.read(ref) == data
+    # stored once: each payload is one file, with a link per reference
+    assert len({os.stat(p).st_ino for p in store.root.rglob("*") if p.is_file()}) == 2
+    # the content stays until its last reference is released
+    store.delete(ref)
+    assert store.read(again) == data
+    store.delete(again)
+    store.delete(other)
+    assert [p for p in store.root.rglob("*") if p.is_file()] == []
+
+
+def test_mmap_decodes_like_bytes(store):
+    data = jpeg((30, 60, 200), size=(300, 200))
+    ref = store.put(data)
+    with store.open(ref) as mm:
+        x = to_model_input(mm)
+    np.testing.assert_array_equal(x, to_model_input(data))
+
+
+def test_invalid_refs_rejected(store):
+    for bad in ("blob:../../etc/passwd", "blob:" + "G" * 64, "/etc/passwd"):
+        with pytest.raises(ValueError):
+            store.path_for(bad)
+    with pytest.raises(FileNotFoundError):
+        store.read("blob:" + "0" * 64)
+
+
+def test_sweep_removes_expired_blobs(store):
+    old = store.put(jpeg((1, 2, 3)))
+    fresh = store.put(jpeg((4, 5, 6)))
+    past = time.time() - 7200
+    os.utime(store.path_for(old), (past, past))
+    assert store.sweep() == 1
+    assert not store.path_for(old).exists()
+    assert store.path_for(fresh).exists()
+    store.delete(fresh)
+    store.delete(fresh)
+    assert not store.path_for(fresh).exists()
+
+
+def test_size_cap_sweeps_least_recently_used(store):
+    store.max_bytes = 3 * 1000
+    refs = []
+    for i in range(5):
+        refs.append(store.put(bytes([i]) * 1000))
+        past = time.time() - 100 + i
+        os.utime(store.path_for(refs[-1]), (past, past))
+    # writes past the cap sweep without waiting for the sweep interval
+    assert [store.path_for(r).exists() for r in refs] == [False, False, True, True, True]
+    assert store.sweep() == 0
+
+
+def test_celery_task_reads_blob_refs(store, monkeypatch):
+    pytest.importorskip("celery")
+    from app.services.model_loader import butterfly_model
+    from app.tasks import ml_tasks
+    from test_ml_tasks import FakeClassifier
+
+    clf = FakeClassifier()
+    butterfly_model.set(clf)
+    monkeypatch.setattr(ml_tasks, "get_blob_store", lambda: store)
+    refs = [store.put(jpeg(c)) for c in [(0, 0, 200), (200, 0, 0)]] + ["blob:" + "f" * 64]
+    out = ml_tasks.classify_batch.run(refs, top_k=1)
+    assert [r["status"] for r in out] == ["success", "success", "error"]
+    assert [r["predictions"][0]["species"] for r in out[:2]] == ["BLUE", "RED"]
+    assert out[0]["ref"] == refs[0]
+    assert clf.batches == [2]
+    # classified blobs are released
+    assert not any(store.path_for(r).exists() for r in refs)
+    ref = store.put(jpeg((200, 0, 0)))
+    single = ml_tasks.classify_butterfly_image.run(ref)
+    assert single["predicted_class"] == "RED"
+    assert not store.path_for(ref).exists()
+
+
+if __name__ == "__main__":
+    # Benchmark: broker message for a 32-image batch with inline base64 payloads
+    # versus blob references, and decoding from a mapped blob versus bytes.
+    rng = np.random.default_rng(0)
+    photos = []
+    for i in range(32):
+        arr = rng.integers(0, 255, (1200, 1600, 3), dtype=np.uint8)
+        buf = io.BytesIO()
+        Image.fromarray(arr).save(buf, format="JPEG", quality=90)
+        photos.append(buf.getvalue())
+    with tempfile.TemporaryDirectory(dir="/dev/shm" if os.path.isdir("/dev/shm") else None) as d:
+        store = BlobStore(d)
+        reps = 20
+
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            inline = json.dumps([[{"b64": base64.b64encode(p).decode()} for p in photos], 5])
+            json.loads(inline)
+        t_inline = (time.perf_counter() - t0) / reps
+
+        t0 = time.perf_counter()
+        for _ in range(reps):
+            refs = [store.put(p) for p in photos]
+            by_ref = json.dumps([refs, 5])
+            json.loads(by_ref)
+        t_ref = (time.perf_counter() - t0) / reps
+
+        print(f"message: inline {len(inline) / 1e6:6.2f} MB, {t_inline * 1000:6.1f} ms to encode+decode")
+        print(f"message: refs   {len(by_ref) / 1e3:6.2f} kB, {t_ref * 1000:6.1f} ms incl. store.put")
+
+        t0 = time.perf_counter()
+        for p in photos:
+            to_model_input(base64.b64decode(base64.b64encode(p)))
+        t_bytes = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        for r in refs:
+            with store.open(r) as mm:
+                to_model_input(mm)
+        t_mmap = time.perf_counter() - t0
+        print(f"decode 32 images: from b64 {t_bytes * 1000:6.1f} ms | from mmap {t_mmap * 1000:6.1f} ms")
@@ -0,0 +1,186 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services.catalog import DatasetCatalog  # noqa: E402
+from services.watcher import DatasetWatcher  # noqa: E402
+
+
+def make_tree(base: Path, species: dict) -> Path:
+    for sp, n in species.items():
+        d = base / sp
+        d.mkdir(parents=True, exist_ok=True)
+        for i in range(n):
+            (d / f"{i:04d}.jpg").write_bytes(b"\xff\xd8" + bytes(i % 7))
+    return base
+
+
+def make_catalog(tmp: Path):
+    uploads = tmp / "temp_extract" / "train"
+    static = tmp / "butterflies" / "train"
+    make_tree(static, {"MONARCH": 5, "ADONIS": 3})
+    make_tree(uploads, {"MONARCH": 1, "NEW_SPECIES": 2})
+    (static / "ADONIS" / "notes.txt").write_text("not an image")
+    (static / "ADONIS" / "nested").mkdir()
+    (static / "ADONIS" / "nested" / "x.PNG").write_bytes(b"png")
+    (static / "EMPTY").mkdir()
+    roots = [(uploads, "uploads"), (static, "static")]
+    return DatasetCatalog(db_path=tmp / "catalog.sqlite3", roots=roots), uploads, static
+
+
+def test_initial_index():
+    with tempfile.TemporaryDirectory() as d:
+        cat, _uploads, _static = make_catalog(Path(d))
+        assert cat.reconcile() is True
+        assert cat.species_counts() == [("ADONIS", 4), ("MONARCH", 6), ("NEW_SPECIES", 2)]
+        assert cat.species_counts(root="uploads") == [("MONARCH", 1), ("NEW_SPECIES", 2)]
+        assert cat.species_names() == ["ADONIS", "EMPTY", "MONARCH", "NEW_SPECIES"]
+        nested = [img for img in cat.images(species="ADONIS") if img.path.endswith("x.PNG")]
+        assert nested and nested[0].root == "static"
+        assert sum(n for _d, n in cat.daily_counts()["MONARCH"]) == 6
+        # Unchanged tree: nothing to do
+        assert cat.reconcile() is False
+
+
+def test_incremental_add_remove_rename():
+    with tempfile.TemporaryDirectory() as d:
+        cat, uploads, static = make_catalog(Path(d))
+        cat.reconcile()
+        v0 = cat.version()
+        time.sleep(0.01)
+        (uploads / "MONARCH" / "upload_1.jpg").write_bytes(b"new")
+        (static / "ADONIS" / "0000.jpg").unlink()
+        os.rename(uploads / "NEW_SPECIES", uploads / "RENAMED")
+        assert cat.reconcile() is True
+        assert cat.version() > v0
+        assert cat.species_counts() == [("ADONIS", 3), ("MONARCH", 7), ("RENAMED", 2)]
+        assert "NEW_SPECIES" not in cat.species_names()
+
+
+def test_warm_restart_reuses_index():
+    with tempfile.TemporaryDirectory() as d:
+        cat, _uploads, _static = make_catalog(Path(d))
+        cat.reconcile()
+        # A new process opening the same database sees no changes to apply
+        again = DatasetCatalog(db_path=cat.db_path, roots=cat.roots)
+        assert again.reconcile() is False
+        assert again.species_counts() == cat.species_counts()
+
+
+def test_cached_ews_snapshot_is_served_without_io(monkeypatch):
+    from fastapi import BackgroundTasks
+    from api import prediction_routes
+    from services import timeseries
+
+    with tempfile.TemporaryDirectory() as d:
+        cat, _uploads, _static = make_catalog(Path(d))
+        monkeypatch.setattr(timeseries, "get_catalog", lambda: cat)
+        for name in ("_TS_CACHE", "_TS_VERSION", "_TS_MATRIX", "_TS_MATRIX_SOURCE", "_TS_MATRIX_VERSION"):
+            monkeypatch.setattr(timeseries, name, None)
+        monkeypatch.setattr(prediction_routes, "_EWS_CACHE", type(prediction_routes._EWS_CACHE)())
+        monkeypatch.setattr(prediction_routes, "_LATEST", {})
+        assert not timeseries.is_fresh() and timeseries.cached_version() is None
+
+        snap = asyncio.run(prediction_routes._get_snapshot(BackgroundTasks(), 7, 10))
+        assert timeseries.is_fresh() and timeseries.cached_version() == snap["version"]
+        # a dict hit neither reconciles nor computes
+        monkeypatch.setattr(cat, "reconcile", lambda *a, **k: pytest.fail("reconciled on the event loop"))
+        assert asyncio.run(prediction_routes._get_snapshot(BackgroundTasks(), 7, 10)) is snap
+        # once a reconcile is due, the newest snapshot is served and rebuilt in the background
+        cat._last_reconcile = 0.0
+        assert not cat.is_fresh() and timeseries.cached_version() is None
+        tasks = BackgroundTasks()
+        assert asyncio.run(prediction_routes._get_snapshot(tasks, 7, 10)) is snap
+        assert [t.func for t in tasks.tasks] == [prediction_routes._refresh_snapshot]
+
+
+def test_caches_follow_changes_indexed_by_another_worker(monkeypatch):
+    from services import timeseries
+
+    with tempfile.TemporaryDirectory() as d:
+        ours, uploads, _static = make_catalog(Path(d))
+        # a second worker process sharing the same index
+        theirs = DatasetCatalog(db_path=ours.db_path, roots=ours.roots)
+        monkeypatch.setattr(timeseries, "get_catalog", lambda: ours)
+        for name in ("_TS_CACHE", "_TS_VERSION"):
+            monkeypatch.setattr(timeseries, name, None)
+        assert sum(n for _d, n in timeseries.build_or_get_timeseries()["MONARCH"]) == 6
+        time.sleep(0.01)
+        (uploads / "MONARCH" / "upload_1.jpg").write_bytes(b"new")
+        assert theirs.reconcile() is True
+        # our next reconcile finds the index already current (no delta), but a newer version
+        ours._last_reconcile = 0.0
+        assert ours.reconcile() is False
+        assert not timeseries.is_fresh()
+        assert sum(n for _d, n in timeseries.build_or_get_timeseries()["MONARCH"]) == 7
+        assert timeseries.is_fresh()
+        # our own changes still arrive as a delta and patch the cache in place
+        time.sleep(0.01)
+        (uploads / "MONARCH" / "upload_2.jpg").write_bytes(b"newer")
+        ours.subscribers.append(timeseries.apply_catalog_delta)
+        ours.reconcile()
+        assert timeseries.is_fresh()
+        assert sum(n for _d, n in timeseries._TS_CACHE["MONARCH"]) == 8
+
+
+def test_subscribers_receive_deltas():
+    with tempfile.TemporaryDirectory() as d:
+        cat, uploads, _static = make_catalog(Path(d))
+        cat.reconcile()
+        deltas = []
+        cat.subscribers.append(deltas.append)
+        time.sleep(0.01)
+        (uploads / "MONARCH" / "upload_1.jpg").write_bytes(b"new")
+        (uploads / "NEW_SPECIES" / "0000.jpg").unlink()
+        cat.reconcile()
+        assert len(deltas) == 1
+        assert [img.path for img in deltas[0].added] == [str(uploads / "MONARCH" / "upload_1.jpg")]
+        assert [img.path for img in deltas[0].removed] == [str(uploads / "NEW_SPECIES" / "0000.jpg")]
+        assert deltas[0].species() == {"MONARCH", "NEW_SPECIES"}
+
+
+def wait_for(pred, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if pred():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def test_watcher_picks_up_changes():
+    for mode in ("auto", "poll"):
+        with tempfile.TemporaryDirectory() as d:
+            cat, uploads, _static = make_catalog(Path(d))
+            cat.reconcile()
+            watcher = DatasetWatcher(cat, mode=mode, poll_seconds=0.05)
+            watcher.start()
+            try:
+                time.sleep(0.1)  # let the watches be installed
+                (uploads / "BRAND_NEW").mkdir()
+                (uploads / "BRAND_NEW" / "a.jpg").write_bytes(b"x")
+                # Read the index directly so queries don't reconcile on their own
+                indexed = lambda: cat._conn.execute("SELECT 1 FROM images WHERE species = 'BRAND_NEW'").fetchone()
+                assert wait_for(lambda: indexed() is not None), watcher.backend
+            finally:
+                watcher.stop()
+
+
+if __name__ == "__main__":
+    # Benchmark: cold index vs warm restart over a synthetic tree
+    with tempfile.TemporaryDirectory() as d:
+        root = make_tree(Path(d) / "train", {f"SPECIES_{i:03d}": 1000 for i in range(100)})
+        t0 = time.perf_counter()
+        cat = DatasetCatalog(db_path=Path(d) / "catalog.sqlite3", roots=[(root, "static")])
+        cat.reconcile()
+        print(f"cold index of 100k images: {time.perf_counter() - t0:.2f} s")
+        t0 = time.perf_counter()
+        DatasetCatalog(db_path=cat.db_path, roots=cat.roots).reconcile()
+        print(f"warm restart: {(time.perf_counter() - t0) * 1000:.1f} ms")
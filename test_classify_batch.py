@@ -0,0 +1,122 @@
+import io
+import json
+import os
+import sys
+import time
+import zipfile
+
+import numpy as np
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from api import butterfly_routes  # noqa: E402
+from app.services.model_loader import butterfly_model  # noqa: E402
+
+
+class FakeClassifier:
+    """Predicts the dominant colour channel; records batch sizes."""
+
+    model_version = "fake-1"
+    class_names = ["RED", "GREEN", "BLUE"]
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    def predict_batch(self, images, top_k=5):
+        self.batches.append(len(images))
+        time.sleep(self.delay)
+        means = images.mean(axis=(1, 2))
+        return [[{"species": self.class_names[int(np.argmax(m))], "confidence": 1.0, "class_id": int(np.argmax(m))}] for m in means]
+
+
+def jpeg(color, size=(64, 48)):
+    buf = io.BytesIO()
+    Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+def make_client(fake):
+    butterfly_model.set(fake)
+    butterfly_routes._cache.clear()
+    app = FastAPI()
+    app.include_router(butterfly_routes.router, prefix="/api/butterfly")
+    return TestClient(app)
+
+
+def read_lines(resp):
+    return [json.loads(line) for line in resp.iter_lines() if line]
+
+
+def test_files_and_zip_stream_in_order():
+    fake = FakeClassifier()
+    client = make_client(fake)
+    zbuf = io.BytesIO()
+    with zipfile.ZipFile(zbuf, "w") as zf:
+        zf.writestr("a/green.jpg", jpeg((0, 200, 0)))
+        zf.writestr("notes.txt", "skipped")
+        zf.writestr("__MACOSX/._green.jpg", b"junk")
+        zf.writestr("blue.png", jpeg((0, 0, 200)))
+    files = [
+        ("files", ("red.jpg", jpeg((200, 0, 0)), "image/jpeg")),
+        ("files", ("broken.jpg", b"not an image", "image/jpeg")),
+        ("files", ("batch.zip", zbuf.getvalue(), "application/zip")),
+    ]
+    with client.stream("POST", "/api/butterfly/classify-batch", files=files) as resp:
+        assert resp.status_code == 200
+        assert resp.headers["content-type"].startswith("application/x-ndjson")
+        lines = read_lines(resp)
+    *items, summary = lines
+    assert [it["filename"] for it in items] == ["red.jpg", "broken.jpg", "batch.zip/a/green.jpg", "batch.zip/blue.png"]
+    assert [it["index"] for it in items] == [0, 1, 2, 3]
+    assert [it["predictions"][0]["species"] for it in items if it["success"]] == ["RED", "GREEN", "BLUE"]
+    assert not items[1]["success"] and "error" in items[1]
+    assert summary["done"] and summary["count"] == 4 and summary["errors"] == 1
+
+
+def test_large_upload_is_batched_and_cached():
+    fake = FakeClassifier()
+    client = make_client(fake)
+    n = butterfly_routes.BULK_BATCH_SIZE * 2 + 5
+    files = [("files", (f"{i}.jpg", jpeg((i % 250, 10, 10), size=(40 + i, 30)), "image/jpeg")) for i in range(n)]
+    lines = read_lines(client.post("/api/butterfly/classify-batch", files=files))
+    assert lines[-1]["count"] == n and lines[-1]["errors"] == 0
+    assert fake.batches == [butterfly_routes.BULK_BATCH_SIZE] * 2 + [5]
+    # Same images again: served from the prediction cache, no forward passes
+    lines = read_lines(client.post("/api/butterfly/classify-batch", files=files[:10]))
+    assert lines[-1]["cached"] == 10 and len(fake.batches) == 3
+
+
+def test_503_while_model_loading():
+    client = make_client(FakeClassifier())
+    butterfly_model._ready.clear()
+    butterfly_model.state = "loading"
+    try:
+        resp = client.post("/api/butterfly/classify-batch", files=[("files", ("a.jpg", jpeg((1, 2, 3)), "image/jpeg"))])
+        assert resp.status_code == 503 and "Retry-After" in resp.headers
+    finally:
+        butterfly_model.set(FakeClassifier())
+
+
+if __name__ == "__main__":
+    # Benchmark: 500-image upload, time to first streamed result vs all of them,
+    # with a model that takes 150 ms per forward pass
+    import asyncio
+
+    fake = FakeClassifier(delay=0.15)
+    uploads = [(f"{i}.jpg", "image/jpeg", io.BytesIO(jpeg((i % 250, 80 + i // 250, 120), size=(1200, 900)))) for i in range(500)]
+
+    async def run():
+        t0 = time.perf_counter()
+        first = None
+        stream = butterfly_routes._classify_stream(fake, butterfly_routes._iter_sources(uploads), 5, [])
+        async for _line in stream:
+            if first is None:
+                first = time.perf_counter() - t0
+        return first, time.perf_counter() - t0
+
+    first, total = asyncio.run(run())
+    print(f"500 images: first result after {first:.2f}s, all after {total:.2f}s, {len(fake.batches)} forward passes")
@@ -0,0 +1,255 @@
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from services import ews  # noqa: E402
+from services.timeseries import series_to_matrix  # noqa: E402
+
+
+# --- Pure-Python reference implementation (the original ews.py loops) ---
+
+def ref_rolling_mean(values, window):
+    if window <= 1:
+        return values[:]
+    out, s, q = [], 0.0, []
+    for v in values:
+        q.append(v)
+        s += v
+        if len(q) > window:
+            s -= q.pop(0)
+        out.append(s / len(q))
+    return out
+
+
+def ref_zscore(values, baseline_n):
+    if not values:
+        return []
+    b = values[:max(1, min(len(values), baseline_n))]
+    mu = sum(b) / len(b)
+    var = sum((x - mu) ** 2 for x in b) / max(1, len(b))
+    sd = math.sqrt(var) if var > 0 else 1.0
+    return [(x - mu) / sd for x in values]
+
+
+def ref_lag1_autocorr(residuals, window):
+    out, x = [], []
+    for r in residuals:
+        x.append(r)
+        if len(x) < 2:
+            out.append(0.0)
+            continue
+        w = x[-window:] if len(x) >= window else x
+        xm = sum(w) / len(w)
+        num = sum((w[i] - xm) * (w[i-1] - xm) for i in range(1, len(w)))
+        den = sum((w[i] - xm) ** 2 for i in range(len(w)))
+        ac = num / den if den != 0 else 0.0
+        out.append(max(-1.0, min(1.0, ac)))
+    return out
+
+
+def ref_rolling_variance(residuals, window):
+    out, x = [], []
+    for r in residuals:
+        x.append(r)
+        w = x[-window:] if len(x) >= window else x
+        m = sum(w) / len(w)
+        out.append(sum((v - m) ** 2 for v in w) / max(1, len(w)))
+    return out
+
+
+def ref_rolling_trend(values, window):
+    out, x = [], []
+    for v in values:
+        x.append(v)
+        w = x[-window:] if len(x) >= window else x
+        n = len(w)
+        if n < 2:
+            out.append(0.0)
+            continue
+        xm = (n - 1) / 2.0
+        ym = sum(w) / n
+        num = sum((i - xm) * (w[i] - ym) for i in range(n))
+        den = sum((i - xm) ** 2 for i in range(n))
+        out.append(num / den if den != 0 else 0.0)
+    return out
+
+
+def ref_compute_metrics(series, trend_window=14, metric_window=14, baseline=30):
+    vals = [float(c) for _d, c in series]
+    trend = ref_rolling_mean(vals, trend_window)
+    resid = [v - t for v, t in zip(vals, trend)]
+    ac = ref_lag1_autocorr(resid, metric_window)
+    var = ref_rolling_variance(resid, metric_window)
+    slope = ref_rolling_trend(vals, metric_window)
+    ac_z, var_z, slope_z = ref_zscore(ac, baseline), ref_zscore(var, baseline), ref_zscore(slope, baseline)
+    risk, ema = [], None
+    for i in range(len(vals)):
+        ema = ews.combine_risk(ac_z[i], var_z[i], slope_z[i], ema_prev=ema)
+        risk.append(min(100.0, max(0.0, ema * 100.0)))
+    return {"detections": vals, "autocorrelation": ac, "variance": var, "trend": slope, "risk": risk}
+
+
+# --- Fixtures ---
+
+def make_series(n, seed=0):
+    rnd = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    out = []
+    for i in range(n):
+        # Poisson-ish counts with zero runs (gap filling produces long 0 streaks)
+        c = 0 if (i // 40) % 3 == 2 else int(rnd.expovariate(0.2))
+        out.append((start + timedelta(days=i), c))
+    return out
+
+
+def assert_close(a, b):
+    assert len(a) == len(b)
+    np.testing.assert_allclose(np.asarray(a), np.asarray(b), rtol=1e-9, atol=1e-9)
+
+
+# --- Parity tests ---
+
+def test_indicator_parity():
+    vals = [float(c) for _d, c in make_series(500, seed=1)]
+    for window in (0, 1, 2, 3, 14, 30, 600):
+        assert_close(ews.rolling_mean(vals, window), ref_rolling_mean(vals, window))
+        assert_close(ews.lag1_autocorr(vals, window), ref_lag1_autocorr(vals, window))
+        assert_close(ews.rolling_variance(vals, window), ref_rolling_variance(vals, window))
+        assert_close(ews.rolling_trend(vals, window), ref_rolling_trend(vals, window))
+    for baseline in (0, 1, 30, 1000):
+        assert_close(ews.zscore_vs_baseline(vals, baseline), ref_zscore(vals, baseline))
+
+
+def test_compute_metrics_parity():
+    for n, seed in ((1, 0), (2, 1), (15, 2), (365, 3), (2000, 4)):
+        series = make_series(n, seed)
+        got = ews.compute_metrics_from_counts(series)
+        want = ref_compute_metrics(series)
+        assert got["dates"] == [d for d, _ in series]
+        for key, ref in want.items():
+            assert_close(got[key], ref)
+
+
+def test_compute_metrics_custom_windows():
+    series = make_series(400, seed=7)
+    got = ews.compute_metrics_from_counts(series, trend_window=7, metric_window=21, baseline=60)
+    want = ref_compute_metrics(series, trend_window=7, metric_window=21, baseline=60)
+    for key, ref in want.items():
+        assert_close(got[key], ref)
+
+
+def test_empty_inputs():
+    assert ews.compute_metrics_from_counts([])["risk"] == []
+    assert ews.lag1_autocorr([], 14) == []
+    assert ews.rolling_variance([], 14) == []
+    assert ews.rolling_trend([], 14) == []
+    assert ews.zscore_vs_baseline([], 30) == []
+
+
+# --- Streaming state ---
+
+def test_stream_indicators_match_batch():
+    series = make_series(5000, seed=3)
+    batch = ews.compute_metrics_from_counts(series)
+    state = ews.EWSState()
+    rows = [state.update(d, c) for d, c in series]
+    for key in ("detections", "autocorrelation", "variance", "trend"):
+        np.testing.assert_allclose([r[key] for r in rows], batch[key], rtol=1e-7, atol=1e-7)
+    # Risk converges once the baseline is frozen and the EMA forgets warm-up
+    np.testing.assert_allclose([r["risk"] for r in rows][200:], batch["risk"][200:], atol=1e-6)
+
+
+def test_stream_from_series_continues_batch():
+    series = make_series(1200, seed=4)
+    batch = ews.compute_metrics_from_counts(series)
+    state = ews.EWSState.from_series(series[:400])
+    rows = [state.update(d, c) for d, c in series[400:]]
+    for key in ("autocorrelation", "variance", "trend", "risk"):
+        np.testing.assert_allclose([r[key] for r in rows], batch[key][400:], rtol=1e-7, atol=1e-7)
+
+
+def test_stream_fills_gaps_and_rejects_out_of_order():
+    state = ews.EWSState(metric_window=5, baseline=5)
+    state.update(datetime(2024, 1, 1), 3)
+    row = state.update(datetime(2024, 1, 4), 2)
+    assert state.n == 4
+    assert row["date"] == datetime(2024, 1, 4)
+    try:
+        state.update(datetime(2024, 1, 4), 1)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("expected ValueError for a repeated date")
+
+
+# --- Batch (species x day) ---
+
+def make_species_series(n_species, n_days, seed=0):
+    rnd = random.Random(seed)
+    out = {}
+    for i in range(n_species):
+        start = rnd.randint(0, 60)
+        length = rnd.randint(1, n_days)
+        out[f"SPECIES_{i:03d}"] = make_series(start + length, seed=seed + i)[start:]
+    return out
+
+
+def test_batch_matches_per_species():
+    ser = make_species_series(25, 300, seed=11)
+    species, dates, counts = series_to_matrix(ser)
+    assert counts.shape == (len(ser), len(dates))
+    batch = ews.compute_metrics_batch(counts)
+    for i, sp in enumerate(species):
+        # Per-species reference on the same zero-extended date axis
+        aligned = list(zip(dates, counts[i].tolist()))
+        want = ews.compute_metrics_from_counts(aligned)
+        for key in ("detections", "autocorrelation", "variance", "trend", "risk"):
+            assert_close(batch[key][i], want[key])
+
+
+def test_series_to_matrix_alignment():
+    d0 = datetime(2024, 1, 1)
+    ser = {"B": [(d0 + timedelta(days=2), 4), (d0 + timedelta(days=3), 1)], "A": [(d0, 2)], "C": []}
+    species, dates, counts = series_to_matrix(ser)
+    assert species == ["A", "B"]
+    assert dates == [d0 + timedelta(days=i) for i in range(4)]
+    assert counts.tolist() == [[2, 0, 0, 0], [0, 0, 4, 1]]
+
+
+if __name__ == "__main__":
+    # Benchmark: vectorized engine vs. the pure-Python reference
+    for n in (1_000, 10_000, 50_000):
+        series = make_series(n)
+        t0 = time.perf_counter()
+        ref_compute_metrics(series)
+        t_ref = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        ews.compute_metrics_from_counts(series)
+        t_np = time.perf_counter() - t0
+        print(f"n={n:>6}: python {t_ref*1000:8.1f} ms | numpy {t_np*1000:7.1f} ms | {t_ref/t_np:5.1f}x")
+
+    ser = make_species_series(100, 730)
+    _species, _dates, counts = series_to_matrix(ser)
+    t0 = time.perf_counter()
+    for row in counts:
+        ews.compute_metrics_from_counts(list(zip(_dates, row.tolist())))
+    t_loop = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    ews.compute_metrics_batch(counts)
+    t_batch = time.perf_counter() - t0
+    print(f"{counts.shape[0]} species x {counts.shape[1]} days: per-species loop {t_loop*1000:.1f} ms | batch {t_batch*1000:.1f} ms")
+
+    state = ews.EWSState.from_series(make_series(10_000))
+    day = state.last_date
+    t0 = time.perf_counter()
+    for i in range(10_000):
+        day += timedelta(days=1)
+        state.update(day, i % 17)
+    print(f"EWSState.update: {(time.perf_counter() - t0) / 10_000 * 1e6:.1f} us per observation")
@@ -0,0 +1,159 @@
+import asyncio
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+pytest.importorskip("google.generativeai")
+
+from app.services.gemini_classifier import GeminiClassifier  # noqa: E402
+
+REPLY = {"predictions": [
+    {"species": "Danaus plexippus", "common_name": "Monarch", "confidence": 0.93, "description": "orange"},
+    {"species": "Limenitis archippus", "common_name": "Viceroy", "confidence": 0.81, "description": "mimic"},
+]}
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGemini:
+    """Local stand-in for GenerativeModel: fixed latency, counts concurrency.
+
+    Without an async method the classifier must push the blocking call to its
+    thread pool; with one it awaits it directly.
+    """
+
+    model_name = "models/fake-gemini"
+
+    def __init__(self, latency=0.2, reply=REPLY):
+        self.latency = latency
+        self.reply = reply
+        self.calls = 0
+        self.active = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        with self._lock:
+            self.calls += 1
+            self.active += 1
+            self.peak = max(self.peak, self.active)
+
+    def _exit(self):
+        with self._lock:
+            self.active -= 1
+
+    def generate_content(self, parts):
+        self._enter()
+        try:
+            time.sleep(self.latency)  # blocks whatever thread calls it
+            return FakeResponse("```json\n" + json.dumps(self.reply) + "\n```")
+        finally:
+            self._exit()
+
+
+class AsyncFakeGemini(FakeGemini):
+    async def generate_content_async(self, parts):
+        self._enter()
+        try:
+            await asyncio.sleep(self.latency)
+            return FakeResponse(json.dumps(self.reply))
+        finally:
+            self._exit()
+
+
+def image(i=0):
+    # Distinct colours give distinct payloads, i.e. distinct images
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), (i * 29 % 256, 80, 160)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+async def measure_loop_lag(coro):
+    """Run coro while a ticker measures the worst event-loop stall."""
+    worst = 0.0
+    done = False
+
+    async def ticker():
+        nonlocal worst
+        while not done:
+            t0 = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst = max(worst, time.perf_counter() - t0 - 0.01)
+
+    tick = asyncio.ensure_future(ticker())
+    try:
+        result = await coro
+    finally:
+        done = True
+        await tick
+    return result, worst
+
+
+@pytest.mark.parametrize("fake_cls", [FakeGemini, AsyncFakeGemini])
+def test_event_loop_stays_responsive_under_load(fake_cls):
+    fake = fake_cls(latency=0.2)
+    clf = GeminiClassifier(model=fake, max_concurrency=4)
+
+    async def main():
+        return await measure_loop_lag(asyncio.gather(*(clf.classify_image(image(i)) for i in range(8))))
+
+    t0 = time.perf_counter()
+    results, worst_lag = asyncio.run(main())
+    elapsed = time.perf_counter() - t0
+    assert all(r[0]["species"] == "Danaus plexippus" for r in results)
+    assert worst_lag < 0.1, f"event loop stalled for {worst_lag:.3f}s"
+    assert fake.peak <= 4
+    assert fake.calls == 8
+    assert elapsed < 8 * 0.2  # ran concurrently, two waves of four
+
+
+def test_identical_requests_are_coalesced():
+    fake = AsyncFakeGemini(latency=0.1)
+    clf = GeminiClassifier(model=fake, max_concurrency=4)
+
+    async def main():
+        return await asyncio.gather(*(clf.classify_image(image(1)) for _ in range(10)), clf.classify_image(image(2)))
+
+    results = asyncio.run(main())
+    assert fake.calls == 2
+    assert clf.coalesced == 9
+    # Every caller owns its result
+    results[0][0]["species"] = "changed"
+    assert results[1][0]["species"] == "Danaus plexippus"
+    assert clf.stats()["in_flight"] == 0
+
+
+def test_cancelled_caller_does_not_cancel_shared_call():
+    fake = AsyncFakeGemini(latency=0.1)
+    clf = GeminiClassifier(model=fake)
+
+    async def main():
+        first = asyncio.ensure_future(clf.classify_image(image(3)))
+        second = asyncio.ensure_future(clf.classify_image(image(3)))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main())[0]["common_name"] == "Monarch"
+    assert fake.calls == 1
+
+
+def test_upstream_errors_fall_back_to_unknown():
+    class Broken(AsyncFakeGemini):
+        async def generate_content_async(self, parts):
+            raise RuntimeError("quota exceeded")
+
+    clf = GeminiClassifier(model=Broken())
+    out = asyncio.run(clf.classify_image(image()))
+    assert out[0]["species"] == "Unknown" and out[0]["confidence"] == 0.0
@@ -0,0 +1,110 @@
+import io
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.imaging import load_rgb, prepare_upload, to_model_input  # noqa: E402
+
+
+def encode(size=(1600, 1200), fmt="JPEG", mode="RGB"):
+    rng = np.random.default_rng(0)
+    # Smooth gradient plus noise so resampling differences stay small
+    yy, xx = np.mgrid[0:size[1], 0:size[0]]
+    base = np.stack([xx * 255 // size[0], yy * 255 // size[1], (xx + yy) * 127 // sum(size)], axis=-1)
+    arr = np.clip(base + rng.integers(-8, 8, base.shape), 0, 255).astype(np.uint8)
+    img = Image.fromarray(arr, "RGB").convert(mode)
+    buf = io.BytesIO()
+    img.save(buf, format=fmt, quality=90)
+    return buf.getvalue()
+
+
+def test_bytes_buffer_pil_and_path_agree():
+    data = encode(fmt="PNG")
+    from_bytes = to_model_input(data)
+    assert from_bytes.shape == (224, 224, 3) and from_bytes.dtype == np.float32
+    np.testing.assert_array_equal(to_model_input(io.BytesIO(data)), from_bytes)
+    np.testing.assert_array_equal(to_model_input(Image.open(io.BytesIO(data))), from_bytes)
+    with tempfile.NamedTemporaryFile(suffix=".png") as f:
+        f.write(data)
+        f.flush()
+        np.testing.assert_array_equal(to_model_input(f.name), from_bytes)
+
+
+def test_jpeg_draft_decode_close_to_full_decode():
+    data = encode()
+    full = Image.open(io.BytesIO(data)).convert("RGB").resize((224, 224), Image.Resampling.LANCZOS)
+    fast = load_rgb(data)
+    assert fast.size == (224, 224)
+    diff = np.abs(np.asarray(fast, np.int16) - np.asarray(full, np.int16))
+    assert diff.mean() < 3.0
+
+
+def test_non_rgb_inputs():
+    for mode, fmt in (("RGBA", "PNG"), ("L", "JPEG"), ("P", "PNG")):
+        assert to_model_input(encode(size=(300, 200), fmt=fmt, mode=mode)).shape == (224, 224, 3)
+
+
+def test_prepare_upload_downscales_large_photos():
+    data = encode(size=(4000, 3000))
+    out, mime = prepare_upload(data, max_side=1024)
+    assert mime == "image/jpeg"
+    img = Image.open(io.BytesIO(out))
+    assert img.format == "JPEG" and max(img.size) == 1024 and img.size[0] > img.size[1]
+    assert len(out) < len(data) / 4
+
+
+def test_prepare_upload_keeps_small_files_with_real_mime():
+    png = encode(size=(300, 200), fmt="PNG")
+    assert prepare_upload(png) == (png, "image/png")
+    webp = encode(size=(300, 200), fmt="WEBP")
+    assert prepare_upload(webp) == (webp, "image/webp")
+
+
+def test_prepare_upload_flattens_alpha_and_applies_exif_rotation():
+    out, mime = prepare_upload(encode(size=(2000, 1000), fmt="PNG", mode="RGBA"), max_side=512)
+    assert mime == "image/jpeg" and Image.open(io.BytesIO(out)).mode == "RGB"
+    rotated = Image.new("RGB", (2000, 1000), "red")
+    exif = rotated.getexif()
+    exif[0x0112] = 6  # orientation: rotate 90 degrees
+    buf = io.BytesIO()
+    rotated.save(buf, format="JPEG", exif=exif)
+    out, _mime = prepare_upload(buf.getvalue(), max_side=512)
+    assert Image.open(io.BytesIO(out)).size == (256, 512)
+
+
+if __name__ == "__main__":
+    # Benchmark: the old temp-file path (write, reopen, full decode, unlink)
+    # vs in-memory draft decode, for a 12 MP camera JPEG
+    data = encode(size=(4000, 3000))
+    tmp_dir = tempfile.mkdtemp()
+    n = 20
+    t0 = time.perf_counter()
+    for _ in range(n):
+        path = os.path.join(tmp_dir, f"{uuid.uuid4()}.jpg")
+        with open(path, "wb") as f:
+            f.write(data)
+        img = Image.open(path).convert("RGB").resize((224, 224), Image.Resampling.LANCZOS)
+        np.asarray(img, dtype=np.float32) / 255.0
+        os.remove(path)
+    t_old = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n):
+        to_model_input(data)
+    t_new = (time.perf_counter() - t0) / n
+    print(f"{len(data) / 1e6:.1f} MB JPEG: temp file + full decode {t_old * 1000:.1f} ms | in-memory draft {t_new * 1000:.1f} ms | {t_old / t_new:.1f}x")
+
+    # Benchmark: Gemini upload payload (base64 inline data) before and after
+    import base64
+    for label, raw in (("12 MP JPEG", data), ("2000x1500 PNG", encode(size=(2000, 1500), fmt="PNG"))):
+        t0 = time.perf_counter()
+        out, mime = prepare_upload(raw)
+        t_prep = time.perf_counter() - t0
+        before, after = len(base64.b64encode(raw)), len(base64.b64encode(out))
+        print(f"{label}: upload {before / 1e6:.2f} MB -> {after / 1e6:.2f} MB {mime} ({before / after:.1f}x smaller, {t_prep * 1000:.0f} ms)")
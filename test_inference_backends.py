@@ -0,0 +1,94 @@
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services import inference_backends as ib  # noqa: E402
+
+
+def test_resolve_backend_aliases():
+    assert ib.resolve_backend("TFLite") == "tflite-fp16"
+    assert ib.resolve_backend("int8") == "tflite-int8"
+    assert ib.resolve_backend("keras") == "keras"
+    with pytest.raises(ValueError):
+        ib.resolve_backend("tensorrt")
+
+
+def test_to_probabilities():
+    probs = np.array([[0.2, 0.3, 0.5], [0.25, 0.25, 0.5078]])
+    assert np.allclose(ib.to_probabilities(probs), probs / probs.sum(axis=1, keepdims=True))
+    logits = np.array([[1.0, -1.0, 0.0]])
+    e = np.exp(logits)
+    assert np.allclose(ib.to_probabilities(logits), e / e.sum())
+
+
+def test_artifact_path_tracks_source_model():
+    with tempfile.TemporaryDirectory() as d:
+        model = Path(d) / "model.h5"
+        model.write_bytes(b"v1")
+        a = ib.artifact_path(str(model), "tflite-int8", cache_dir=Path(d))
+        assert a.suffix == ".tflite" and a.parent == Path(d)
+        assert ib.artifact_path(str(model), "onnx", cache_dir=Path(d)).suffix == ".onnx"
+        assert ib.artifact_path(str(model), "tflite-fp16", cache_dir=Path(d)) != a
+        time.sleep(0.01)
+        model.write_bytes(b"v2 changed")
+        assert ib.artifact_path(str(model), "tflite-int8", cache_dir=Path(d)) != a
+
+
+class CountingLoader:
+    def __init__(self, model):
+        self.model = model
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.model
+
+
+def tiny_classifier(tf, classes=5):
+    tf.keras.utils.set_random_seed(0)
+    return tf.keras.Sequential([
+        tf.keras.layers.Conv2D(8, 3, strides=4, activation="relu", input_shape=(224, 224, 3)),
+        tf.keras.layers.DepthwiseConv2D(3, strides=2, activation="relu"),
+        tf.keras.layers.GlobalAveragePooling2D(),
+        tf.keras.layers.Dense(classes, activation="softmax"),
+    ])
+
+
+def test_tflite_backends_match_keras_and_are_cached():
+    tf = pytest.importorskip("tensorflow")
+    model = tiny_classifier(tf)
+    images = np.random.default_rng(0).random((24, 224, 224, 3), dtype=np.float32)
+    with tempfile.TemporaryDirectory() as d:
+        src = Path(d) / "tiny.h5"
+        src.write_bytes(b"stand-in for the .h5 file, only stat()ed for the cache key")
+        calib = Path(d) / "train" / "A"
+        calib.mkdir(parents=True)
+        from PIL import Image
+        for i in range(8):
+            Image.fromarray((images[i] * 255).astype(np.uint8)).save(calib / f"{i}.png")
+        for backend in ("tflite-fp16", "tflite-int8"):
+            loader = CountingLoader(model)
+            served = ib.load_backend(backend, str(src), loader, calibration_dir=str(calib.parent), cache_dir=Path(d))
+            assert loader.calls == 1 and served.num_classes == 5
+            if backend == "tflite-int8":
+                # full-integer model: int8 tensors at both ends
+                assert served._input["dtype"] == np.int8 and served._output["dtype"] == np.int8
+                # dequantized softmax rows are off 1 by a few steps and are renormalised, not softmaxed again
+                raw = served.predict(images[:8])
+                assert not np.allclose(raw.sum(axis=1), 1.0, rtol=1e-3)
+                probs = ib.to_probabilities(raw)
+                assert np.allclose(probs.sum(axis=1), 1.0, atol=1e-5)
+                assert np.abs(probs - model.predict_on_batch(images[:8])).max() < 0.05
+            report = ib.check_parity(ib.KerasBackend(model), served, images, batch_size=7)
+            assert report["top1_agreement"] >= 0.9, report
+            # Second start: served from the cached artifact, Keras never loaded
+            again = CountingLoader(model)
+            ib.load_backend(backend, str(src), again, cache_dir=Path(d))
+            assert again.calls == 0
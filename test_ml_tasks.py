@@ -0,0 +1,92 @@
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pytest
+from PIL import Image
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+pytest.importorskip("celery")
+
+from app.services.model_loader import butterfly_model  # noqa: E402
+from app.tasks import ml_tasks  # noqa: E402
+
+
+class FakeClassifier:
+    """Dominant colour channel classifier with the real predict_batch contract."""
+
+    class_names = ["RED", "GREEN", "BLUE"]
+
+    def __init__(self):
+        self.batches = []
+
+    def predict_proba(self, images):
+        self.batches.append(len(images))
+        m = images.mean(axis=(1, 2))
+        return m / m.sum(axis=1, keepdims=True)
+
+    def predict_batch(self, images, top_k=5):
+        return [[{"species": self.class_names[int(np.argmax(p))], "class_id": int(np.argmax(p))}] for p in self.predict_proba(images)]
+
+
+def jpeg(color):
+    buf = io.BytesIO()
+    Image.new("RGB", (32, 32), color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+@pytest.fixture
+def fake(monkeypatch):
+    clf = FakeClassifier()
+    butterfly_model.set(clf)
+    with tempfile.TemporaryDirectory() as d:
+        monkeypatch.setattr(ml_tasks, "IMAGE_ROOTS", [os.path.realpath(d)])
+        clf.root = d
+        yield clf
+
+
+def test_classify_batch_single_forward_pass(fake):
+    paths = []
+    for i, color in enumerate([(200, 0, 0), (0, 0, 200), (0, 200, 0)]):
+        p = os.path.join(fake.root, f"{i}.jpg")
+        with open(p, "wb") as f:
+            f.write(jpeg(color))
+        paths.append(p)
+    refs = paths + [{"b64": base64.b64encode(jpeg((0, 190, 10))).decode()}, os.path.join(fake.root, "missing.jpg"), "/etc/passwd"]
+    out = ml_tasks.classify_batch.apply(args=(refs,)).get()
+    assert fake.batches == [4]
+    assert [r["status"] for r in out] == ["success"] * 4 + ["error"] * 2
+    assert [r["predictions"][0]["species"] for r in out[:4]] == ["RED", "BLUE", "GREEN", "GREEN"]
+    assert out[3]["ref"] == {}  # inline payloads are not echoed back
+    assert "outside allowed roots" in out[5]["message"]
+
+
+def test_legacy_task_uses_real_class_names(fake):
+    out = ml_tasks.classify_butterfly_image.apply(args=(base64.b64encode(jpeg((0, 0, 220))).decode(),)).get()
+    assert out["status"] == "success" and out["predicted_class"] == "BLUE"
+    assert len(out["all_predictions"]) == 3
+
+
+def test_bulk_classify_splits_into_batches():
+    refs = [f"/app/data/{i}.jpg" for i in range(70)]
+    sig = ml_tasks.bulk_classify(refs, batch_size=32)
+    assert [len(t.args[0]) for t in sig.tasks] == [32, 32, 6]
+    chunked = ml_tasks.bulk_classify(refs, batch_size=10, batches_per_task=3)
+    assert len(chunked.tasks) == 3  # 7 batches in messages of up to 3
+
+
+if __name__ == "__main__":
+    # Benchmark against a running broker and worker, e.g.
+    #   celery -A app.tasks.ml_tasks worker -c 1   (then -c 2, -c 4)
+    # and compare images/s across process counts.
+    train = sys.argv[1] if len(sys.argv) > 1 else "/app/data/butterflies/train"
+    refs = [os.path.join(dp, f) for dp, _d, fs in os.walk(train) for f in fs if f.lower().endswith((".jpg", ".jpeg", ".png"))][:2048]
+    t0 = time.perf_counter()
+    results = ml_tasks.bulk_classify(refs).apply_async().get()
+    elapsed = time.perf_counter() - t0
+    print(f"{sum(len(r) for r in results)} images in {elapsed:.1f}s: {len(refs) / elapsed:.1f} img/s")
@@ -0,0 +1,134 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services import compute_pool, population  # noqa: E402
+from app.services.population import ACTIONS, integrate_chunk, simulate_population  # noqa: E402
+
+COUNTS = [1000, 800, 600, 550, 120, 60]
+
+
+@pytest.fixture(autouse=True)
+def _stop_pool():
+    yield
+    compute_pool.shutdown_pool()
+
+
+def _run(*args, **kwargs):
+    return asyncio.run(simulate_population(*args, **kwargs))
+
+
+def test_single_species_follows_the_logistic_solution(monkeypatch):
+    monkeypatch.setattr(population, "NOISE", 0.0)
+    r, u0, steps = 0.5, 0.1, 500
+    u = np.full((2, 1, 1), u0)
+    u, low = integrate_chunk(u, u.copy(), np.full((1, 1), r), np.ones((1, 1, 1)), np.ones((2, 1, 1)), np.zeros((2, 1, 1)), steps, np.random.SeedSequence(0))
+    t = steps * population.DT
+    exact = 1.0 / (1.0 + (1.0 / u0 - 1.0) * np.exp(-r * t))
+    assert u[0, 0, 0] == pytest.approx(exact, rel=1e-6)
+    assert low[0, 0, 0] == pytest.approx(u0)
+
+
+def test_reproducible_and_zero_intensity_has_no_effect():
+    a = _run(COUNTS, "anti-poaching", 0.6, years=4, replicas=20, seed=11)
+    assert a == _run(COUNTS, "anti-poaching", 0.6, years=4, replicas=20, seed=11)
+    assert a != _run(COUNTS, "anti-poaching", 0.6, years=4, replicas=20, seed=12)
+    none = _run(COUNTS, "anti-poaching", 0.0, years=4, replicas=20, seed=11)
+    assert none["population_change_percent"] == 0.0 and none["risk_change_percent"] == 0.0
+    assert none["final"]["baseline"] == none["final"]["intervention"]
+    # the baseline does not depend on the intervention
+    assert none["series"]["baseline_total"] == a["series"]["baseline_total"]
+
+
+@pytest.mark.parametrize("action", ACTIONS)
+def test_interventions_help_and_scale_with_intensity(action):
+    low = _run(COUNTS, action, 0.3, years=8, replicas=32, seed=3)
+    high = _run(COUNTS, action, 1.0, years=8, replicas=32, seed=3)
+    assert 0 < low["population_change_percent"] < high["population_change_percent"]
+    assert high["risk_change_percent"] <= 0
+    assert 0 <= high["biodiversity_index"] <= 1
+    assert len(high["final"]["intervention"]) == len(COUNTS)
+
+
+def test_progress_per_chunk_and_cancel():
+    events = []
+
+    async def on_progress(done, total):
+        events.append((done, total))
+
+    out = _run(COUNTS, "habitat-restoration", 0.5, years=5, replicas=8, seed=0, on_progress=on_progress)
+    chunks = int(np.ceil(5 / population.DT / population.CHUNK_STEPS))
+    assert events == [(i, chunks) for i in range(1, chunks + 1)]
+    assert len(out["series"]["years"]) == chunks + 1 and out["series"]["years"][-1] == 5.0
+    assert _run(COUNTS, "habitat-restoration", 0.5, years=5, replicas=8, seed=0, cancelled=lambda: True) is None
+    with pytest.raises(ValueError):
+        _run(COUNTS, "rewilding", 0.5, years=1, replicas=2, seed=0)
+
+
+def test_run_endpoint(monkeypatch, tmp_path):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import simulation_routes
+    from app.services.simulation_store import SimulationStore
+
+    monkeypatch.setattr(simulation_routes, "_store", SimulationStore(f"sqlite:///{tmp_path / 'sims.db'}"))
+    monkeypatch.setattr(simulation_routes, "_species_counts", lambda: [("Monarch", 900), ("Blue Morpho", 500), ("Swallowtail", 300)])
+    app = FastAPI()
+    app.include_router(simulation_routes.router, prefix="/api/simulation")
+    with TestClient(app) as client:
+        sim_id = client.post("/api/simulation/create").json()["data"]["simulation_id"]
+        body = {"action": "invasive-control", "intensity": 0.8, "sampling": "top-by-images", "seed": 5, "years": 5}
+        assert client.post(f"/api/simulation/run?simulation_id={sim_id}", json=body).json()["success"]
+        deadline = time.time() + 60
+        while True:
+            data = client.get(f"/api/simulation/{sim_id}").json()["data"]
+            if data["status"] != "running" or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        assert data["status"] == "completed" and data["progress"] == 100
+        results = data["results"]
+        assert results["seed"] == 5 and results["action"] == "invasive-control"
+        assert [t["species"] for t in results["trajectories"]] == ["Monarch", "Blue Morpho", "Swallowtail"]
+        assert results["trajectories"][0]["before"] == 900
+        bad = client.post(f"/api/simulation/run?simulation_id={sim_id}", json={"action": "rewilding"}).json()
+        assert bad["error"]["code"] == "INVALID_INTERVENTION"
+    asyncio.run(simulation_routes._store.close())
+
+
+if __name__ == "__main__":
+    # Benchmark: a 20-year projection of 50 species x 256 replicas through the
+    # process pool: wall time, progress cadence, and how late a 10 ms timer on
+    # the event loop fires meanwhile (the work stays off the loop).
+    counts = list(np.random.default_rng(0).integers(20, 2000, 50))
+
+    async def bench():
+        await simulate_population(counts[:2], "anti-poaching", 0.5, years=1, replicas=2, seed=0)  # start the pool
+        ticks, lag = [], [0.0]
+
+        async def on_progress(done, total):
+            ticks.append(time.perf_counter())
+
+        async def ticker():
+            while True:
+                t = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lag[0] = max(lag[0], time.perf_counter() - t - 0.01)
+
+        probe = asyncio.create_task(ticker())
+        t0 = time.perf_counter()
+        await simulate_population(counts, "anti-poaching", 0.5, years=20, replicas=256, seed=0, on_progress=on_progress)
+        elapsed = time.perf_counter() - t0
+        probe.cancel()
+        gaps = np.diff([t0] + ticks)
+        print(f"{elapsed:.2f} s, {len(ticks)} progress events (largest gap {gaps.max() * 1e3:.0f} ms), "
+              f"worst event loop lag {lag[0] * 1e3:.1f} ms")
+
+    asyncio.run(bench())
+    compute_pool.shutdown_pool()
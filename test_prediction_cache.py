@@ -0,0 +1,97 @@
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.prediction_cache import PredictionCache, content_hash  # noqa: E402
+
+
+def test_hits_misses_and_copies():
+    cache = PredictionCache("t", max_entries=8, ttl=60, disk_path=None)
+    key = cache.key(content_hash(b"img"), "v1", top_k=5)
+    assert cache.get(key) is None
+    cache.put(key, [{"species": "MONARCH", "confidence": 0.9}])
+    got = cache.get(key)
+    got[0]["species"] = "mutated"
+    assert cache.get(key)[0]["species"] == "MONARCH"
+    s = cache.stats()
+    assert (s["hits"], s["misses"], s["entries"]) == (2, 1, 1)
+
+
+def test_key_includes_model_version_and_params():
+    cache = PredictionCache("t", disk_path=None)
+    d = content_hash(b"img")
+    keys = {cache.key(d, "v1", top_k=5), cache.key(d, "v2", top_k=5), cache.key(d, "v1", top_k=3), cache.key(content_hash(b"other"), "v1", top_k=5)}
+    assert len(keys) == 4
+
+
+def test_lru_eviction_and_ttl():
+    cache = PredictionCache("t", max_entries=2, ttl=0.05, disk_path=None)
+    for k in ("a", "b"):
+        cache.put(k, k)
+    cache.get("a")  # "b" is now least recently used
+    cache.put("c", "c")
+    assert cache.get("b") is None and cache.get("a") == "a"
+    assert cache.stats()["evictions"] == 1
+    time.sleep(0.06)
+    assert cache.get("a") is None
+    assert cache.stats()["expired"] >= 1
+
+
+def test_disk_tier_survives_restart():
+    with tempfile.TemporaryDirectory() as d:
+        path = os.path.join(d, "predictions.sqlite3")
+        PredictionCache("t", disk_path=path).put("k", {"x": 1})
+        # New process: empty memory, same file (fresh tier, not the shared one)
+        from app.services import prediction_cache as pc
+        pc._DISK_TIERS.clear()
+        again = PredictionCache("t", disk_path=path)
+        assert again.get("k") == {"x": 1}
+        assert again.stats()["disk_hits"] == 1
+        assert again.get("k") == {"x": 1} and again.stats()["disk_hits"] == 1  # promoted to memory
+
+
+def test_aput_writes_disk_off_the_loop():
+    import threading
+
+    with tempfile.TemporaryDirectory() as d:
+        from app.services import prediction_cache as pc
+        pc._DISK_TIERS.clear()
+        cache = PredictionCache("t", disk_path=os.path.join(d, "predictions.sqlite3"))
+        writers = []
+        real = cache._disk.put
+        cache._disk.put = lambda *a: writers.append(threading.current_thread()) or real(*a)
+
+        async def main():
+            write = asyncio.ensure_future(cache.aput("k", [1]))
+            await asyncio.sleep(0)
+            assert cache.get("k") == [1]  # memory tier is filled before the disk write
+            await write
+            await cache.get_or_compute("k2", lambda: asyncio.sleep(0, [2]))
+
+        asyncio.run(main())
+        assert len(writers) == 2 and threading.main_thread() not in writers
+        pc._DISK_TIERS.clear()
+        assert PredictionCache("t", disk_path=cache._disk.path).get("k2") == [2]
+
+
+def test_get_or_compute_skips_uncacheable():
+    cache = PredictionCache("t", disk_path=None)
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        return [{"species": "Unknown", "confidence": 0.0}]
+
+    async def main():
+        for _ in range(2):
+            value, hit = await cache.get_or_compute("k", compute, cacheable=lambda v: v[0]["confidence"] > 0)
+            assert not hit
+        cache.put("k2", [1])
+        return await cache.get_or_compute("k2", compute)
+
+    assert asyncio.run(main()) == ([1], True)
+    assert len(calls) == 2
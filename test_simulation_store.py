@@ -0,0 +1,209 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.simulation_store import SimulationStore, async_url, encode_cursor, scenarios, simulations  # noqa: E402
+
+RESULTS = {"population_change_percent": 4.2, "trajectories": []}
+
+
+def _store(tmp_path) -> SimulationStore:
+    return SimulationStore(f"sqlite:///{tmp_path / 'sims.db'}")
+
+
+def _run(coro):
+    return asyncio.run(coro)
+
+
+def test_async_urls():
+    assert async_url("postgresql://u:p@postgres:5432/gaia") == "postgresql+asyncpg://u:p@postgres:5432/gaia"
+    assert async_url("postgres://u:p@db/gaia") == "postgresql+asyncpg://u:p@db/gaia"
+    assert async_url("sqlite:////tmp/x.db") == "sqlite+aiosqlite:////tmp/x.db"
+    assert async_url("postgresql+asyncpg://db/gaia") == "postgresql+asyncpg://db/gaia"
+
+
+def test_simulation_lifecycle_and_cancel(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        demo = await store.get_simulation(1)
+        assert demo["name"] == "Demo Ecosystem" and demo["status"] == "idle"
+        sim = await store.create_simulation({"species": 10})
+        assert sim["name"] == f"Simulation {sim['id']}" and sim["ecosystem_config"] == {"species": 10}
+        assert await store.start_simulation(sim["id"], {"action": "anti-poaching"})
+        assert await store.update_progress(sim["id"], "simulating dynamics", 40)
+        got = await store.get_simulation(sim["id"])
+        assert (got["status"], got["phase"], got["progress"]) == ("running", "simulating dynamics", 40)
+        assert got["intervention_config"] == {"action": "anti-poaching"}
+        assert await store.finish_simulation(sim["id"], "completed", results=RESULTS)
+        got = await store.get_simulation(sim["id"])
+        assert got["status"] == "completed" and got["progress"] == 100 and got["results"] == RESULTS
+        assert got["completed_at"] is not None
+        # a run that is no longer running stops on its next progress write
+        assert await store.start_simulation(sim["id"])
+        assert (await store.get_simulation(sim["id"]))["intervention_config"] == {"action": "anti-poaching"}
+        assert await store.finish_simulation(sim["id"], "cancelled")
+        assert not await store.update_progress(sim["id"], "simulating dynamics", 50)
+        assert not await store.finish_simulation(sim["id"], "completed", results=RESULTS)
+        assert not await store.start_simulation(999)
+        assert await store.get_simulation(999) is None
+        await store.close()
+
+    _run(scenario())
+
+
+def test_two_workers_share_state(tmp_path):
+    async def scenario():
+        a, b = _store(tmp_path), _store(tmp_path)
+        sim = await a.create_simulation({})
+        assert await b.start_simulation(sim["id"])
+        await b.finish_simulation(sim["id"], "completed", results=RESULTS)
+        assert (await a.save_scenario("shared", sim["id"]))["results"] == RESULTS
+        items, _ = await b.list_scenarios()
+        assert [s["name"] for s in items] == ["shared"]
+        assert (await a.get_simulation(1))["name"] == "Demo Ecosystem"
+        assert len((await b.list_simulations())[0]) == 2
+        await a.close()
+        await b.close()
+
+    _run(scenario())
+
+
+def test_workers_initialise_concurrently(tmp_path):
+    # each thread is a worker with its own event loop and pool, all starting at once
+    errors, start = [], threading.Barrier(4)
+
+    def worker():
+        async def boot():
+            store = _store(tmp_path)
+            start.wait()
+            await store.init()
+            await store.close()
+
+        try:
+            asyncio.run(boot())
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+
+    async def check():
+        a, b = _store(tmp_path), _store(tmp_path)
+        await asyncio.gather(a.init(), b.init())
+        async with a.engine.connect() as conn:
+            names = (await conn.execute(simulations.select().order_by(simulations.c.id))).all()
+        assert [(r.id, r.name) for r in names] == [(1, "Demo Ecosystem")]
+        assert (await b.create_simulation({}))["id"] == 2
+        await a.close()
+        await b.close()
+
+    _run(check())
+
+
+def test_keyset_pages_do_not_skip_or_repeat(tmp_path):
+    async def scenario():
+        store = _store(tmp_path)
+        sim = await store.create_simulation({})
+        await store.start_simulation(sim["id"])
+        await store.finish_simulation(sim["id"], "completed", results=RESULTS)
+        assert await store.save_scenario("none", 1) is None
+        for i in range(7):
+            await store.save_scenario(f"s{i}", sim["id"])
+        # several scenarios saved in the same instant
+        async with store.engine.begin() as conn:
+            same = datetime(2030, 1, 1)
+            await conn.execute(scenarios.update().where(scenarios.c.id <= 4).values(saved_at=same))
+        seen, cursor = [], None
+        while True:
+            page, cursor = await store.list_scenarios(limit=3, cursor=cursor)
+            seen += [s["name"] for s in page]
+            if cursor is None:
+                break
+        assert seen == ["s3", "s2", "s1", "s0", "s6", "s5", "s4"]
+        with pytest.raises(ValueError):
+            await store.list_scenarios(cursor="!!")
+
+        for status in ("completed", "failed", "completed"):
+            other = await store.create_simulation({})
+            await store.start_simulation(other["id"])
+            await store.finish_simulation(other["id"], status)
+        page, cursor = await store.list_simulations(status="completed", limit=2)
+        rest, end = await store.list_simulations(status="completed", limit=2, cursor=cursor)
+        assert [s["id"] for s in page + rest] == [5, 3, 2] and end is None
+        assert [s["id"] for s in (await store.list_simulations(status="failed"))[0]] == [4]
+        await store.close()
+
+    _run(scenario())
+
+
+def test_endpoints(monkeypatch, tmp_path):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import simulation_routes
+
+    monkeypatch.setattr(simulation_routes, "_store", _store(tmp_path))
+    app = FastAPI()
+    app.include_router(simulation_routes.router, prefix="/api/simulation")
+    with TestClient(app) as client:
+        sim_id = client.post("/api/simulation/create").json()["data"]["simulation_id"]
+        assert client.get(f"/api/simulation/{sim_id}").json()["data"]["status"] == "idle"
+        assert client.post(f"/api/simulation/scenarios?simulation_id={sim_id}&name=x").json()["error"]["code"] == "NO_RESULTS"
+        assert client.get("/api/simulation/404").json()["error"]["code"] == "SIM_NOT_FOUND"
+        assert client.post("/api/simulation/run?simulation_id=404").json()["error"]["code"] == "SIM_NOT_FOUND"
+        listing = client.get("/api/simulation?limit=1").json()
+        assert [s["id"] for s in listing["data"]] == [sim_id] and listing["next_cursor"]
+        rest = client.get(f"/api/simulation?limit=1&cursor={listing['next_cursor']}").json()
+        assert [s["id"] for s in rest["data"]] == [1] and rest["next_cursor"] is None
+        assert client.get("/api/simulation/scenarios").json()["data"] == []
+        assert client.get("/api/simulation/scenarios?cursor=%21%21").json()["error"]["code"] == "INVALID_CURSOR"
+    asyncio.run(simulation_routes._store.close())
+
+
+if __name__ == "__main__":
+    # Benchmark: the last page of 50 000 saved scenarios, by keyset cursor vs
+    # OFFSET, and the old approach of sorting every scenario in memory.
+    import tempfile
+
+    from sqlalchemy import insert, select
+
+    async def bench():
+        with tempfile.TemporaryDirectory() as tmp:
+            store = SimulationStore(f"sqlite:///{tmp}/bench.db")
+            await store.init()
+            n, page = 50_000, 50
+            rows = [{"name": f"s{i}", "saved_at": datetime(2030, 1, 1, 0, i // 60 % 60, i % 60, i), "results": RESULTS} for i in range(n)]
+            async with store.engine.begin() as conn:
+                await conn.execute(insert(scenarios), rows)
+            newest_first = select(scenarios).order_by(scenarios.c.saved_at.desc(), scenarios.c.id.desc())
+            async with store.engine.connect() as conn:
+                items = [dict(r._mapping) for r in (await conn.execute(newest_first)).all()]
+            # the cursor a client holds after paging through everything but the last page
+            cursor = encode_cursor(items[n - page - 1]["saved_at"], items[n - page - 1]["id"])
+            t0 = time.perf_counter()
+            last, _ = await store.list_scenarios(limit=page, cursor=cursor)
+            keyset = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            async with store.engine.connect() as conn:
+                offset = (await conn.execute(newest_first.offset(n - page).limit(page))).all()
+            offset_time = time.perf_counter() - t0
+            assert [r.id for r in offset] == [s["id"] for s in last]
+            t0 = time.perf_counter()
+            sorted(items, key=lambda x: x["saved_at"], reverse=True)[-page:]
+            in_memory = time.perf_counter() - t0
+            print(f"last page of {n}: keyset {keyset * 1e3:.1f} ms, OFFSET {offset_time * 1e3:.1f} ms, "
+                  f"in-memory sort {in_memory * 1e3:.1f} ms")
+            await store.close()
+
+    asyncio.run(bench())
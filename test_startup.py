@@ -0,0 +1,73 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend")
+sys.path.insert(0, BACKEND)
+
+from app.services.model_loader import FAILED, LOADING, READY, LazyModel, ModelNotReady  # noqa: E402
+
+
+def test_importing_the_app_does_not_load_ml_stacks():
+    code = "import sys, main; print('tensorflow' in sys.modules, 'google.generativeai' in sys.modules)"
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip().splitlines()[-1] == "False False"
+
+
+def test_lazy_model_reports_loading_then_ready():
+    gate = threading.Event()
+    model = LazyModel("slow", lambda: gate.wait(5) and "model")
+    with pytest.raises(ModelNotReady) as err:
+        model.get()  # first request kicks off the load
+    assert err.value.state == LOADING
+    assert model.status()["state"] == LOADING
+    gate.set()
+    assert model.wait(5) == "model"
+    assert model.get() == "model" and model.status()["state"] == READY
+    assert model.start() is False
+
+
+def test_lazy_model_failure_is_retried_after_backoff():
+    calls = []
+
+    def factory():
+        calls.append(1)
+        if len(calls) == 1:
+            raise RuntimeError("no weights")
+        return "model"
+
+    model = LazyModel("flaky", factory, retry_seconds=0.1)
+    model.start()
+    deadline = time.monotonic() + 5
+    while model.state != FAILED and time.monotonic() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(ModelNotReady) as err:
+        model.get()
+    assert err.value.state == FAILED and "no weights" in err.value.error
+    time.sleep(0.15)
+    assert model.wait(5) == "model"
+
+
+if __name__ == "__main__":
+    # Benchmark: time until the app serves /health vs until the model is ready
+    code = """
+import time
+t0 = time.perf_counter()
+import main
+from fastapi.testclient import TestClient
+from app.services.model_loader import butterfly_model
+with TestClient(main.app) as client:
+    assert client.get("/health").status_code == 200
+    t_health = time.perf_counter() - t0
+    status = client.get("/health/ready").status_code
+    butterfly_model.wait()
+    t_ready = time.perf_counter() - t0
+print(f"first /health {t_health:.2f}s (readiness {status}) | butterfly model ready {t_ready:.2f}s")
+"""
+    out = subprocess.run([sys.executable, "-c", code], cwd=BACKEND, capture_output=True, text=True)
+    print(out.stdout.strip().splitlines()[-1] if out.returncode == 0 else out.stderr)
@@ -0,0 +1,197 @@
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.blob_store import BlobStore  # noqa: E402
+from app.services.twin_checkpoint import Checkpoint, CheckpointNotFound, CheckpointStore  # noqa: E402
+from app.services.twin_world import World  # noqa: E402
+
+
+def assert_same_world(a: World, b: World):
+    assert (a.step, a.w, a.h, a.max_agents) == (b.step, b.w, b.h, b.max_agents)
+    assert (a.temp, a.rain, a.poaching) == (b.temp, b.rain, b.poaching)
+    for name in ("res", "x", "y", "species", "energy"):
+        np.testing.assert_array_equal(getattr(a, name), getattr(b, name))
+
+
+def _world(seed=2):
+    world = World(60, 40, 300, 200, 2000, seed=seed)
+    world.apply_env(0.3, 0.4, 0.1)
+    world.step_once(15)
+    return world
+
+
+def test_restore_continues_exactly():
+    world = _world()
+    cp = Checkpoint.capture(world)
+    world.step_once(25)
+    expected = cp.to_world()
+    assert_same_world(expected, Checkpoint.capture(expected).to_world())
+    expected.step_once(25)
+    assert_same_world(world, expected)
+    # restoring in place rewinds the same world
+    cp.restore(world)
+    assert world.step == 15
+    world.step_once(25)
+    assert_same_world(world, expected)
+
+
+def test_checkpoint_is_independent_of_the_world():
+    world = _world()
+    cp = Checkpoint.capture(world)
+    res = cp.arrays["res"].copy()
+    world.step_once(5)
+    np.testing.assert_array_equal(cp.arrays["res"], res)
+    branch = cp.to_world()
+    branch.step_once()
+    np.testing.assert_array_equal(cp.arrays["res"], res)
+
+
+def test_bytes_roundtrip_and_mmap(tmp_path):
+    world = _world()
+    cp = Checkpoint.capture(world)
+    data = cp.to_bytes()
+    assert len(data) < cp.nbytes + 4096
+    assert_same_world(Checkpoint.from_buffer(data).to_world(), world)
+    with pytest.raises(ValueError):
+        Checkpoint.from_buffer(b"JUNK" + bytes(64))
+
+    store = CheckpointStore(memory_budget=0, spill=BlobStore(tmp_path, ttl=3600))
+    first = store.put(world)
+    world.step_once(10)
+    second = store.put(world)
+    # the newest stays in memory, older ones are spilled and memory mapped
+    assert store.get(first).spilled and not store.get(second).spilled
+    assert not store.get(first).arrays["res"].flags.writeable
+    restored = store.get(first).to_world()
+    assert restored.step == 15
+    restored.step_once(10)
+    assert_same_world(restored, store.get(second).to_world())
+    assert store.stats()["spilled"] == 1
+    spilled = store.spill_store.path_for(store.get(first).ref)
+    assert store.delete(first) and not store.delete(first)
+    with pytest.raises(CheckpointNotFound):
+        store.get(first)
+    assert not spilled.exists()
+
+
+def test_evicted_checkpoints_take_their_files(tmp_path):
+    world = _world()
+    store = CheckpointStore(memory_budget=0, spill=BlobStore(tmp_path, ttl=3600), max_checkpoints=2)
+    ids = []
+    for _ in range(3):
+        ids.append(store.put(world))
+        world.step_once(1)
+    assert store.stats()["checkpoints"] == 2
+    assert len([p for p in tmp_path.rglob("*") if p.is_file()]) == 2  # the spilled second checkpoint's content + lease
+    store.delete(ids[1])
+    assert [p for p in tmp_path.rglob("*") if p.is_file()] == []
+
+
+def test_endpoints(monkeypatch, tmp_path):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import twin_routes
+    from app.services.twin_registry import TwinRegistry
+
+    monkeypatch.setattr(twin_routes, "_twins", TwinRegistry())
+    monkeypatch.setattr(twin_routes, "_checkpoints", CheckpointStore(spill=BlobStore(tmp_path)))
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    client = TestClient(app)
+    twin_id = client.post("/api/twin/create", json={"seed": 9, "rain": 0.7}).json()["data"]["twin_id"]
+    client.post(f"/api/twin/{twin_id}/step", json={"steps": 10})
+    snap = client.post(f"/api/twin/{twin_id}/snapshot", json={"name": "warm"}).json()["data"]
+    assert snap["step"] == 10 and snap["checkpoint_id"]
+    after = client.post(f"/api/twin/{twin_id}/step", json={"steps": 20}).json()["data"]
+
+    # a branch with the same environment replays the parent exactly
+    r = client.post(f"/api/twin/{twin_id}/branch", json={"snapshot_id": snap["id"]}).json()
+    branch_id = r["data"]["twin_id"]
+    assert branch_id != twin_id and r["data"]["state"]["step"] == 10
+    replay = client.post(f"/api/twin/{branch_id}/step", json={"steps": 20}).json()["data"]
+    assert (replay["metrics"], replay["agents"]) == (after["metrics"], after["agents"])
+    assert [s["id"] for s in client.get(f"/api/twin/{branch_id}/snapshots").json()["data"]] == [snap["id"]]
+
+    # a what-if branch gets its own environment; the parent is untouched
+    r = client.post(f"/api/twin/{twin_id}/branch", json={"snapshot_id": snap["id"], "poaching": 0.9, "seed": 1}).json()
+    assert r["data"]["state"]["env"]["poaching"] == pytest.approx(0.9)
+    parent = client.get(f"/api/twin/{twin_id}/state").json()["data"]
+    assert parent["step"] == 30 and parent["env"]["poaching"] == 0.0
+
+    # restore rewinds the twin and keeps its snapshot list
+    state = client.post(f"/api/twin/{twin_id}/restore", json={"snapshot_id": snap["id"]}).json()["data"]
+    assert state["step"] == 10 and state["twin_id"] == twin_id
+    again = client.post(f"/api/twin/{twin_id}/step", json={"steps": 20}).json()["data"]
+    assert again["metrics"] == after["metrics"]
+
+    assert client.post(f"/api/twin/{twin_id}/restore", json={"snapshot_id": 99}).json()["error"]["code"] == "NO_SNAPSHOT"
+    twin_routes._checkpoints.delete(snap["checkpoint_id"])
+    assert client.post(f"/api/twin/{twin_id}/branch", json={"snapshot_id": snap["id"]}).json()["error"]["code"] == "NO_CHECKPOINT"
+    current = client.post(f"/api/twin/{twin_id}/branch", json={}).json()["data"]["state"]
+    assert current["step"] == 30
+
+
+def test_deleting_a_twin_drops_its_checkpoints(monkeypatch, tmp_path):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import twin_routes
+    from app.services.twin_registry import TwinRegistry
+
+    store = CheckpointStore(spill=BlobStore(tmp_path))
+    monkeypatch.setattr(twin_routes, "_twins", TwinRegistry())
+    monkeypatch.setattr(twin_routes, "_checkpoints", store)
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    client = TestClient(app)
+    twin_id = client.post("/api/twin/create", json={"seed": 4}).json()["data"]["twin_id"]
+    shared = client.post(f"/api/twin/{twin_id}/snapshot", json={}).json()["data"]
+    branch_id = client.post(f"/api/twin/{twin_id}/branch", json={}).json()["data"]["twin_id"]
+    own = client.post(f"/api/twin/{twin_id}/snapshot", json={}).json()["data"]
+    assert client.delete(f"/api/twin/{twin_id}").json()["success"]
+    # the parent's own snapshot is gone, the one the branch inherited is not
+    with pytest.raises(CheckpointNotFound):
+        store.get(own["checkpoint_id"])
+    assert client.post(f"/api/twin/{branch_id}/restore", json={"snapshot_id": shared["id"]}).json()["success"]
+    assert client.delete(f"/api/twin/{branch_id}").json()["success"]
+    assert store.stats()["checkpoints"] == 0
+    assert client.delete(f"/api/twin/{branch_id}").json()["error"]["code"] == "NO_TWIN"
+
+
+if __name__ == "__main__":
+    # Benchmark: getting back to a warm state of a large twin by replaying it
+    # from step 0 vs restoring an in-memory checkpoint vs a spilled,
+    # memory-mapped one.
+    import tempfile
+
+    w, h, n, warm = 1000, 1000, 100_000, 200
+    world = World(w, h, n * 6 // 10, n * 4 // 10, 2 * n, seed=0)
+    world.apply_env(0.2, 0.5, 0.1)
+    t0 = time.perf_counter()
+    world.step_once(warm)
+    replay = time.perf_counter() - t0
+    with tempfile.TemporaryDirectory() as tmp:
+        store = CheckpointStore(memory_budget=0, spill=BlobStore(tmp))
+        t0 = time.perf_counter()
+        warm_id = store.put(world)
+        capture = time.perf_counter() - t0
+        store.put(world)  # pushes the first one out to disk
+        timings = {}
+        for label, cp in (("in memory", Checkpoint.capture(world)), ("mmap", store.get(warm_id))):
+            reps = 20
+            t0 = time.perf_counter()
+            for _ in range(reps):
+                cp.to_world()
+            timings[label] = (time.perf_counter() - t0) / reps
+        print(f"{w}x{h} grid, {world.n_agents} agents at step {warm}, {Checkpoint.capture(world).nbytes / 1e6:.1f} MB of state")
+        print(f"replay from step 0: {replay * 1e3:9.1f} ms")
+        print(f"checkpoint:         {capture * 1e3:9.1f} ms")
+        for label, t in timings.items():
+            print(f"branch ({label}):{' ' * (10 - len(label))}{t * 1e3:9.1f} ms")
@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services.twin_codec import FrameEncoder, decode_frame, encode_frame, quantize  # noqa: E402
+from app.services.twin_world import World  # noqa: E402
+
+
+def test_keyframe_roundtrip():
+    world = World(seed=3)
+    world.apply_env(0.3, 0.6, 0.2)
+    world.step_once(7)
+    f = decode_frame(encode_frame(world, agent_limit=50))
+    assert f["keyframe"] and f["step"] == 7
+    assert f["metrics"] == world.metrics()
+    assert f["n_agents"] == world.n_agents and len(f["x"]) == 50
+    np.testing.assert_array_equal(f["x"], world.x[:50])
+    np.testing.assert_array_equal(f["y"], world.y[:50])
+    np.testing.assert_array_equal(f["s"], world.species[:50])
+    np.testing.assert_array_equal(f["res"], quantize(world.res))
+    assert np.abs(f["res"] / 255.0 - world.res).max() <= 0.5 / 255 + 1e-6
+    assert f["env"]["rain"] == pytest.approx(0.6)
+
+
+def test_delta_chain_reconstructs_every_frame():
+    world = World(120, 80, 600, 400, 5000, seed=1)
+    world.apply_env(0.8, 0.0, 0.1)
+    enc = FrameEncoder(agent_limit=200, keyframe_every=5)
+    grid, kinds = None, []
+    for _ in range(12):
+        world.step_once(3)
+        data = enc.encode(world)
+        f = decode_frame(data, grid)
+        kinds.append(f["keyframe"])
+        np.testing.assert_array_equal(f["res"], quantize(world.res))
+        grid = f["res"]
+    assert kinds == [True, False, False, False, False] * 2 + [True, False]
+
+
+def test_delta_requires_base():
+    world = World(seed=0)
+    base = quantize(world.res)
+    world.step_once()
+    with pytest.raises(ValueError):
+        decode_frame(encode_frame(world, base=base, base_step=0))
+    with pytest.raises(ValueError):
+        decode_frame(b"JUNK" + bytes(100))
+
+
+def test_binary_endpoints(monkeypatch):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import twin_routes
+    from app.services.twin_registry import TwinRegistry
+
+    monkeypatch.setattr(twin_routes, "_twins", TwinRegistry())
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    client = TestClient(app)
+    twin_id = client.post("/api/twin/create", json={"seed": 4}).json()["data"]["twin_id"]
+    r = client.get(f"/api/twin/{twin_id}/state", params={"format": "binary"})
+    assert r.headers["content-type"] == "application/vnd.gaia.twin-frame"
+    key = decode_frame(r.content)
+    r = client.post(f"/api/twin/{twin_id}/step", params={"format": "binary", "agents": 10}, json={"steps": 3})
+    delta = decode_frame(r.content, key["res"])
+    assert not delta["keyframe"] and (delta["base_step"], delta["step"]) == (0, 3) and len(delta["x"]) == 10
+    full = client.get(f"/api/twin/{twin_id}/state", params={"format": "binary"}).content
+    np.testing.assert_array_equal(delta["res"], decode_frame(full)["res"])
+    assert client.get(f"/api/twin/{twin_id}/state").json()["data"]["step"] == 3
+
+
+if __name__ == "__main__":
+    # Benchmark: bytes and encode time per frame for the full state (agents
+    # plus resource grid) as JSON (dicts, grid rounded to 3 decimals) vs a
+    # binary keyframe vs a binary delta frame.
+    for w, h, n, agents in ((40, 24, 100, 200), (200, 200, 10_000, 2000), (1000, 1000, 100_000, 2000)):
+        world = World(w, h, n * 6 // 10, n * 4 // 10, 2 * n, seed=0)
+        world.apply_env(0.6, 0.3, 0.1)
+        world.step_once(3)
+        enc = FrameEncoder(agent_limit=agents, keyframe_every=10**9)
+        enc.encode(world)
+        reps = 10
+        totals = {"json": [0, 0.0], "keyframe": [0, 0.0], "delta": [0, 0.0]}
+        for _ in range(reps):
+            world.step_once()
+            for kind, fn in (
+                ("json", lambda: json.dumps({
+                    "step": world.step,
+                    "metrics": world.metrics(),
+                    "agents": world.agents(limit=agents),
+                    "res": np.round(world.res, 3).tolist(),
+                }).encode()),
+                ("keyframe", lambda: encode_frame(world, agents)),
+                ("delta", lambda: enc.encode(world)),
+            ):
+                t0 = time.perf_counter()
+                data = fn()
+                totals[kind][1] += time.perf_counter() - t0
+                totals[kind][0] += len(data)
+        print(f"{w}x{h} grid, {agents} agents:", " | ".join(
+            f"{kind} {b / reps / 1e3:8.1f} kB {t / reps * 1e3:7.2f} ms" for kind, (b, t) in totals.items()
+        ))
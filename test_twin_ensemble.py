@@ -0,0 +1,158 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services import compute_pool  # noqa: E402
+from app.services.twin_checkpoint import Checkpoint  # noqa: E402
+from app.services import twin_ensemble  # noqa: E402
+from app.services.twin_ensemble import BatchedWorld, chunk_size, run_ensemble, simulate_chunk, summarize  # noqa: E402
+from app.services.twin_world import World  # noqa: E402
+
+SPEC = {"temp": 0.6, "rain": 0.2, "poaching": 0.5, "w": 40, "h": 24, "n_a": 60, "n_b": 40, "max_agents": 200}
+
+
+@pytest.fixture(autouse=True)
+def _stop_pool():
+    yield
+    compute_pool.shutdown_pool()
+
+
+def test_batched_replicas_match_single_worlds_statistically():
+    steps, k = 40, 200
+    series = simulate_chunk(SPEC, k, steps, steps, np.random.SeedSequence(7))
+    batched = np.stack([series["count_A"][-1], series["count_B"][-1]], axis=1).astype(float)
+    single = []
+    for seed in range(k):
+        w = World(seed=seed)
+        w.apply_env(SPEC["temp"], SPEC["rain"], SPEC["poaching"])
+        w.step_once(steps)
+        single.append(w.counts())
+    single = np.array(single, dtype=float)
+    se = np.sqrt(batched.var(axis=0) / k + single.var(axis=0) / k)
+    z = np.abs(batched.mean(axis=0) - single.mean(axis=0)) / se
+    assert (z < 4.5).all(), (batched.mean(axis=0), single.mean(axis=0))
+
+
+def test_population_cap_applies_per_replica():
+    rng = np.random.default_rng(0)
+    batch = BatchedWorld.fresh(6, 20, 20, 40, 40, 90, (0.0, 1.0, 0.0), rng)
+    for _ in range(80):
+        batch.step_once()
+        counts = np.bincount(batch.rep, minlength=6)
+        assert counts.max() <= 90
+        assert (np.diff(batch.rep) >= 0).all()  # agents stay grouped by replica
+    assert (counts == 90).all()  # rich, rain-fed worlds all hit the cap
+
+
+def test_from_world_starts_every_replica_at_the_twin_state():
+    world = World(seed=3)
+    world.step_once(10)
+    batch = BatchedWorld.from_world(world, 4, np.random.default_rng(0))
+    m = batch.metrics()
+    assert m["count_A"].tolist() == [world.counts()[0]] * 4
+    assert float(m["risk"][0]) == world.metrics()["risk"]
+
+
+def test_checkpoint_spec_starts_at_the_twin_state():
+    world = World(seed=4)
+    world.step_once(8)
+    spec = {"checkpoint": Checkpoint.capture(world), "temp": world.temp, "rain": world.rain, "poaching": world.poaching}
+    out = simulate_chunk(spec, 3, 5, 5, np.random.SeedSequence(0))
+    assert out["count_A"][0].tolist() == [world.counts()[0]] * 3
+    assert world.step == 8  # the twin itself is untouched
+
+
+def test_summary_bands_are_ordered():
+    out = summarize(simulate_chunk(SPEC, 32, 30, 10, np.random.SeedSequence(1)), [0, 10, 20, 30])
+    bands = out["metrics"]["count_B"]["bands"]
+    assert list(bands) == ["q5", "q25", "q50", "q75", "q95"]
+    assert all(len(v) == 4 for v in bands.values())
+    lo, mid, hi = (np.array(bands[k]) for k in ("q5", "q50", "q95"))
+    assert (lo <= mid).all() and (mid <= hi).all()
+
+
+def test_ensemble_is_reproducible_and_chunked(monkeypatch):
+    async def main():
+        a = await run_ensemble(SPEC, 40, 25, seed=11, every=5, chunk=16)
+        b = await run_ensemble(SPEC, 40, 25, seed=11, every=5, chunk=16)
+        return a, b
+
+    a, b = asyncio.run(main())
+    assert a == b and a["seed"] == 11 and a["replicas"] == 40
+    assert a["steps"] == [0, 5, 10, 15, 20, 25]
+    assert a["metrics"]["count_A"]["final"]["max"] <= 200
+
+
+def test_large_worlds_get_smaller_chunks(monkeypatch):
+    big = {**SPEC, "w": 2000, "h": 2000, "max_agents": 1_000_000}
+    assert chunk_size(SPEC) == twin_ensemble.ENSEMBLE_CHUNK
+    assert 1 <= chunk_size(big) < 4
+    assert chunk_size(big) * twin_ensemble.replica_bytes(big) <= twin_ensemble.ENSEMBLE_CHUNK_BYTES
+    assert chunk_size({"checkpoint": Checkpoint.capture(World(2000, 2000, seed=0))}) < 8
+    # a budget of three demo replicas splits 10 replicas into chunks of 3
+    monkeypatch.setattr(twin_ensemble, "ENSEMBLE_CHUNK_BYTES", 3 * twin_ensemble.replica_bytes(SPEC))
+    sizes = []
+    monkeypatch.setattr(twin_ensemble, "get_pool", lambda: None)
+    real = twin_ensemble.simulate_chunk
+    monkeypatch.setattr(twin_ensemble, "simulate_chunk", lambda spec, k, *a: sizes.append(k) or real(spec, k, *a))
+    out = asyncio.run(run_ensemble(SPEC, 10, 5, seed=3))
+    assert sizes == [3, 3, 3, 1] and out["replicas"] == 10
+
+
+def test_ensemble_endpoints(monkeypatch):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import twin_routes
+    from app.services.twin_registry import TwinRegistry
+
+    monkeypatch.setattr(twin_routes, "_twins", TwinRegistry())
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    client = TestClient(app)
+    r = client.post("/api/twin/ensemble", json={"replicas": 16, "steps": 20, "seed": 1, "poaching": 0.4}).json()
+    assert r["success"] and len(r["data"]["steps"]) == 21
+    assert r["data"]["env"]["poaching"] == 0.4
+    twin_id = client.post("/api/twin/create", json={"seed": 2}).json()["data"]["twin_id"]
+    client.post(f"/api/twin/{twin_id}/step", json={"steps": 5})
+    r = client.post(f"/api/twin/{twin_id}/ensemble", json={"replicas": 8, "steps": 10, "temp": 0.9}).json()
+    assert r["success"] and r["data"]["env"]["temp"] == 0.9
+    assert client.get(f"/api/twin/{twin_id}/state").json()["data"]["step"] == 5
+    too_big = client.post("/api/twin/ensemble", json={"replicas": 4096, "steps": 20_000}).json()
+    assert too_big["error"]["code"] == "ENSEMBLE_TOO_LARGE"
+    for quantiles in ([], [0.1] * 12, [1.5]):
+        bad = client.post("/api/twin/ensemble", json={"replicas": 4, "steps": 2, "quantiles": quantiles}).json()
+        assert bad["error"]["code"] == "BAD_QUANTILES"
+
+
+if __name__ == "__main__":
+    # Benchmark: 256 replicas x 1000 steps of the demo world, one World at a
+    # time vs batched replicas across the process pool.
+    spec = {**SPEC, "temp": 0.2, "rain": 0.5, "poaching": 0.2}
+    k, steps = 256, 1000
+    t0 = time.perf_counter()
+    for seed in range(8):
+        w = World(seed=seed)
+        w.apply_env(spec["temp"], spec["rain"], spec["poaching"])
+        w.step_once(steps)
+    per_world = (time.perf_counter() - t0) / 8
+    print(f"sequential Worlds: {per_world * k:6.1f} s (extrapolated from 8 replicas)")
+    for chunk in (32, 64, 128):
+        async def main():
+            await run_ensemble(spec, 8, 5, seed=0, chunk=8)  # start the pool
+            t0 = time.perf_counter()
+            out = await run_ensemble(spec, k, steps, seed=0, chunk=chunk)
+            return time.perf_counter() - t0, out
+
+        elapsed, out = asyncio.run(main())
+        compute_pool.shutdown_pool()
+        print(
+            f"batched, chunk {chunk:>3}, {compute_pool.COMPUTE_WORKERS} workers: {elapsed:6.2f} s "
+            f"(final count_A median {out['metrics']['count_A']['bands']['q50'][-1]})"
+        )
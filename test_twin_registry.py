@@ -0,0 +1,148 @@
+import os
+import sys
+import threading
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from api import twin_routes  # noqa: E402
+from app.services.twin_registry import TwinNotFound, TwinRegistry  # noqa: E402
+from app.services.twin_world import World  # noqa: E402
+
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(twin_routes, "_twins", TwinRegistry())
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    return TestClient(app)
+
+
+def create(client, **body):
+    j = client.post("/api/twin/create", json=body).json()
+    assert j["success"]
+    return j["data"]["twin_id"]
+
+
+def test_twins_are_independent(client):
+    a = create(client, seed=1)
+    b = create(client, seed=1, poaching=0.5)
+    assert a != b
+    client.post(f"/api/twin/{a}/step", json={"steps": 5})
+    client.post(f"/api/twin/{a}/snapshot", json={"name": "mine"})
+    sa = client.get(f"/api/twin/{a}/state").json()["data"]
+    sb = client.get(f"/api/twin/{b}/state").json()["data"]
+    assert (sa["step"], sb["step"]) == (5, 0)
+    assert sb["env"]["poaching"] == 0.5 and sa["env"]["poaching"] == 0.0
+    assert [s["name"] for s in client.get(f"/api/twin/{a}/snapshots").json()["data"]] == ["mine"]
+    assert client.get(f"/api/twin/{b}/snapshots").json()["data"] == []
+    # creating another twin leaves existing ones alone
+    create(client)
+    assert client.get(f"/api/twin/{a}/state").json()["data"]["step"] == 5
+    assert {t["twin_id"] for t in client.get("/api/twin").json()["data"]} >= {a, b}
+
+
+def test_unknown_and_deleted_twins(client):
+    j = client.get("/api/twin/nope/state").json()
+    assert not j["success"] and j["error"]["code"] == "NO_TWIN"
+    a = create(client)
+    assert client.delete(f"/api/twin/{a}").json()["success"]
+    assert client.post(f"/api/twin/{a}/step", json={}).json()["error"]["code"] == "NO_TWIN"
+
+
+def test_custom_world_size(client):
+    a = create(client, width=300, height=200, agents_a=1000, agents_b=500, max_agents=5000, seed=3)
+    state = client.post(f"/api/twin/{a}/step", json={"steps": 2}).json()["data"]
+    assert state["grid"] == {"w": 300, "h": 200}
+    assert len(state["agents"]) == 200  # UI payload stays capped
+    assert client.post("/api/twin/create", json={"width": 100000}).status_code == 422
+
+
+def test_same_twin_requests_are_serialized():
+    reg = TwinRegistry()
+    twin_id = reg.create(World(seed=0))
+
+    def worker():
+        for _ in range(10):
+            with reg.use(twin_id) as w:
+                step = w.step
+                time.sleep(0.0005)
+                w.step = step + 1
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    with reg.use(twin_id) as w:
+        assert w.step == 80
+
+
+def test_lru_eviction_under_memory_budget():
+    size = World().nbytes
+    reg = TwinRegistry(memory_budget=int(size * 3.5))
+    ids = [reg.create(World()) for _ in range(3)]
+    with reg.use(ids[0]):
+        pass  # ids[0] is now the most recently used
+    reg.create(World())
+    assert ids[1] not in reg and ids[0] in reg and ids[2] in reg
+    assert reg.stats()["evictions"] == 1
+    with pytest.raises(TwinNotFound):
+        with reg.use(ids[1]):
+            pass
+
+
+def test_busy_twins_are_not_evicted():
+    size = World().nbytes
+    reg = TwinRegistry(memory_budget=int(size * 1.5))
+    busy = reg.create(World())
+    with reg.use(busy):
+        other = reg.create(World())  # over budget, but the only candidate is in use
+        assert busy in reg and other in reg
+    reg.create(World())  # now busy is idle and least recently used
+    assert busy not in reg
+
+
+if __name__ == "__main__":
+    # Benchmark: latency of a researcher poking a small twin while someone else
+    # runs a 1000x1000 twin, with one global lock (the old single _WORLD
+    # behaviour) vs per-twin locks.
+    import numpy as np
+
+    reg = TwinRegistry()
+    heavy = reg.create(World(1000, 1000, 60000, 40000, 200000, seed=0))
+    light = reg.create(World(seed=1))
+    serial = threading.Lock()
+
+    def bench(global_lock):
+        stop = threading.Event()
+
+        def runner():
+            while not stop.is_set():
+                with (serial if global_lock else threading.Lock()), reg.use(heavy) as w:
+                    w.step_once(5)
+
+        t = threading.Thread(target=runner)
+        t.start()
+        time.sleep(0.2)
+        lat = []
+        for _ in range(30):
+            t0 = time.perf_counter()
+            with (serial if global_lock else threading.Lock()), reg.use(light) as w:
+                w.step_once()
+                w.metrics()
+            lat.append(time.perf_counter() - t0)
+            time.sleep(0.01)
+        stop.set()
+        t.join()
+        lat = np.array(lat) * 1000
+        return np.percentile(lat, 50), np.percentile(lat, 95)
+
+    for label, global_lock in (("one global lock", True), ("per-twin locks", False)):
+        p50, p95 = bench(global_lock)
+        print(f"{label:>16}: small twin step p50 {p50:7.1f} ms | p95 {p95:7.1f} ms")
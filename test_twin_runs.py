@@ -0,0 +1,223 @@
+import asyncio
+import os
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+pytest.importorskip("socketio")
+
+from fastapi import FastAPI  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from api import twin_routes  # noqa: E402
+from app.services.twin_registry import TwinRegistry  # noqa: E402
+from app.services.twin_codec import decode_frame, quantize  # noqa: E402
+from app.services.twin_runs import CANCELLED, COMPLETED, PAUSED, RUNNING, TwinRunManager  # noqa: E402
+from app.services.twin_world import World  # noqa: E402
+
+
+class Recorder:
+    def __init__(self):
+        self.frames = []
+        self.statuses = []
+        self.finished = []
+        self.done = asyncio.Event()
+
+    async def on_frame(self, run, frame):
+        self.frames.append(frame)
+
+    async def on_status(self, run, info):
+        self.statuses.append(info["state"])
+        if not run.active:
+            self.done.set()
+
+    def on_finish(self, run, world):
+        self.finished.append(world)
+
+
+def manager(rec, **kw):
+    return TwinRunManager(rec.on_frame, rec.on_status, rec.on_finish, **kw)
+
+
+async def wait_for(cond, timeout=20.0):
+    t0 = time.monotonic()
+    while not cond():
+        assert time.monotonic() - t0 < timeout
+        await asyncio.sleep(0.01)
+
+
+def test_run_streams_frames_and_returns_final_world():
+    async def main():
+        rec = Recorder()
+        runs = manager(rec)
+        world = World(seed=5)
+        run = runs.start("t1", world, steps=300, fps=1000)
+        await asyncio.wait_for(rec.done.wait(), 30)
+        return rec, run, world
+
+    rec, run, world = asyncio.run(main())
+    assert run.state == COMPLETED and run.done == 300
+    assert rec.statuses[0] == RUNNING and rec.statuses[-1] == COMPLETED
+    steps = [f["step"] for f in rec.frames]
+    assert steps == sorted(steps) and steps[0] == 0 and steps[-1] == 300
+    assert rec.frames[0]["keyframe"]
+    grid = None
+    for f in rec.frames:  # deltas chain onto the previous frame
+        decoded = decode_frame(f["data"], grid)
+        assert decoded["step"] == f["step"]
+        grid = decoded["res"]
+    final = rec.finished[0]
+    assert final.step == 300 and world.step == 0  # the run worked on a copy
+    expected = World(seed=5)
+    expected.step_once(300)
+    assert final.metrics() == expected.metrics()
+    np.testing.assert_array_equal(grid, quantize(expected.res))
+
+
+def test_pause_resume_cancel():
+    async def main():
+        rec = Recorder()
+        runs = manager(rec)
+        run = runs.start("t1", World(seed=1), steps=100_000, rate=200, fps=20)
+        await wait_for(lambda: run.state == RUNNING and run.done > 0)
+        runs.pause(run.run_id)
+        await wait_for(lambda: run.state == PAUSED)
+        paused_at = run.done
+        await asyncio.sleep(0.3)
+        assert run.done == paused_at
+        runs.resume(run.run_id)
+        await wait_for(lambda: run.state == RUNNING and run.done > paused_at + 5)
+        runs.cancel(run.run_id)
+        await asyncio.wait_for(rec.done.wait(), 10)
+        return rec, run
+
+    rec, run = asyncio.run(main())
+    assert run.state == CANCELLED and 0 < run.done < 100_000
+    assert PAUSED in rec.statuses and rec.statuses[-1] == CANCELLED
+    assert rec.finished[0].step == run.done
+    run.process.join(5)
+    assert run.process.exitcode == 0
+
+
+def test_rate_limits_steps_per_second():
+    async def main():
+        rec = Recorder()
+        runs = manager(rec)
+        t0 = time.monotonic()
+        run = runs.start("t1", World(seed=1), steps=40, rate=100)
+        await asyncio.wait_for(rec.done.wait(), 30)
+        return run, time.monotonic() - t0
+
+    run, elapsed = asyncio.run(main())
+    assert run.state == COMPLETED
+    assert elapsed >= 0.35
+
+
+def test_run_endpoints_own_the_twin(monkeypatch):
+    reg = TwinRegistry()
+    monkeypatch.setattr(twin_routes, "_twins", reg)
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    with TestClient(app) as client:
+        twin_id = client.post("/api/twin/create", json={"seed": 2}).json()["data"]["twin_id"]
+        run = client.post(f"/api/twin/{twin_id}/runs", json={"steps": 2000, "rate": 500}).json()["data"]
+        run_id = run["run_id"]
+        err = client.post(f"/api/twin/{twin_id}/step", json={"steps": 1}).json()["error"]
+        assert err["code"] == "TWIN_RUNNING" and err["run_id"] == run_id
+        assert client.post(f"/api/twin/{twin_id}/runs", json={}).json()["error"]["code"] == "TWIN_RUNNING"
+        assert client.post(f"/api/twin/runs/{run_id}/cancel").json()["success"]
+        deadline = time.monotonic() + 20
+        while client.get(f"/api/twin/runs/{run_id}").json()["data"]["state"] != CANCELLED:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        state = client.get(f"/api/twin/{twin_id}/state").json()["data"]
+        assert state["run_id"] is None and state["step"] > 0
+        assert client.post(f"/api/twin/{twin_id}/step", json={"steps": 1}).json()["success"]
+        assert client.get("/api/twin/runs/unknown").json()["error"]["code"] == "NO_RUN"
+
+
+def test_failed_run_start_leaves_the_twin_free(monkeypatch):
+    reg = TwinRegistry()
+    monkeypatch.setattr(twin_routes, "_twins", reg)
+    full = TwinRunManager(twin_routes._on_frame, twin_routes._on_status, twin_routes._on_finish, max_runs=0)
+    monkeypatch.setattr(twin_routes, "_runs", full)
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    with TestClient(app) as client:
+        twin_id = client.post("/api/twin/create", json={"seed": 2}).json()["data"]["twin_id"]
+        assert client.post(f"/api/twin/{twin_id}/runs", json={}).json()["error"]["code"] == "TOO_MANY_RUNS"
+        assert reg.running(twin_id) is None
+        monkeypatch.setattr(full, "spawn", lambda *a, **k: (_ for _ in ()).throw(OSError("no fork")))
+        with pytest.raises(OSError):
+            client.post(f"/api/twin/{twin_id}/runs", json={})
+        assert reg.running(twin_id) is None
+        assert client.post(f"/api/twin/{twin_id}/step", json={"steps": 1}).json()["success"]
+
+
+def test_snapshots_survive_a_run(monkeypatch):
+    reg = TwinRegistry()
+    monkeypatch.setattr(twin_routes, "_twins", reg)
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    with TestClient(app) as client:
+        twin_id = client.post("/api/twin/create", json={"seed": 3}).json()["data"]["twin_id"]
+        before = client.post(f"/api/twin/{twin_id}/snapshot", json={"name": "before"}).json()["data"]
+        run_id = client.post(f"/api/twin/{twin_id}/runs", json={"steps": 200, "rate": 400}).json()["data"]["run_id"]
+        # the twin's world is replaced when the run ends, so no snapshot is taken of it meanwhile
+        err = client.post(f"/api/twin/{twin_id}/snapshot", json={"name": "during"}).json()["error"]
+        assert err["code"] == "TWIN_RUNNING" and err["run_id"] == run_id
+        deadline = time.monotonic() + 20
+        while client.get(f"/api/twin/runs/{run_id}").json()["data"]["state"] != COMPLETED:
+            assert time.monotonic() < deadline
+            time.sleep(0.02)
+        after = client.post(f"/api/twin/{twin_id}/snapshot", json={"name": "after"}).json()["data"]
+        snaps = client.get(f"/api/twin/{twin_id}/snapshots").json()["data"]
+        assert [s["name"] for s in snaps] == ["after", "before"]
+        assert snaps[1]["checkpoint_id"] == before["checkpoint_id"] and after["step"] == 200
+        assert client.post(f"/api/twin/{twin_id}/restore", json={"snapshot_id": before["id"]}).json()["data"]["step"] == 0
+
+
+if __name__ == "__main__":
+    # Benchmark: how responsive the API event loop stays during a 1000x1000
+    # run in a worker process vs the same steps executed on the loop itself.
+    async def lag_during(coro_factory):
+        lags = []
+        stop = asyncio.Event()
+
+        async def probe():
+            while not stop.is_set():
+                t0 = time.perf_counter()
+                await asyncio.sleep(0.01)
+                lags.append(time.perf_counter() - t0 - 0.01)
+
+        p = asyncio.ensure_future(probe())
+        t0 = time.perf_counter()
+        await coro_factory()
+        elapsed = time.perf_counter() - t0
+        stop.set()
+        await p
+        return elapsed, max(lags) * 1000
+
+    def big():
+        return World(1000, 1000, 60000, 40000, 200000, seed=0)
+
+    async def inline():
+        w = big()
+        for _ in range(40):
+            w.step_once()
+            await asyncio.sleep(0)
+
+    async def worker():
+        rec = Recorder()
+        runs = manager(rec)
+        runs.start("bench", big(), steps=40, fps=10)
+        await rec.done.wait()
+        print(f"  ({len(rec.frames)} frames streamed)")
+
+    for label, factory in (("steps on the loop", inline), ("worker process", worker)):
+        elapsed, lag = asyncio.run(lag_during(factory))
+        print(f"{label:>18}: 40 steps in {elapsed:5.2f}s, worst event loop stall {lag:7.1f} ms")
@@ -0,0 +1,160 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services import compute_pool, twin_sweep  # noqa: E402
+from app.services.prediction_cache import PredictionCache  # noqa: E402
+from app.services.twin_sweep import COMPLETED, SweepManager, grid_cells, simulate_cells  # noqa: E402
+
+CONFIG = {"w": 40, "h": 24, "n_a": 60, "n_b": 40, "max_agents": 200}
+
+
+@pytest.fixture(autouse=True)
+def _stop_pool():
+    yield
+    compute_pool.shutdown_pool()
+
+
+@pytest.fixture
+def counted(monkeypatch):
+    """Run cells in threads and count how many each sweep actually simulates."""
+    computed = []
+    lock = threading.Lock()
+
+    def fake_simulate(config, cells, steps, replicas, seed):
+        with lock:
+            computed.extend(cells)
+        return simulate_cells(config, cells, steps, replicas, seed)
+
+    pool = ThreadPoolExecutor(4)
+    monkeypatch.setattr(twin_sweep, "get_pool", lambda: pool)
+    monkeypatch.setattr(twin_sweep, "simulate_cells", fake_simulate)
+    yield computed
+    pool.shutdown()
+
+
+def _manager():
+    events = []
+
+    async def on_progress(sweep, info):
+        events.append(info)
+
+    manager = SweepManager(on_progress, cache=PredictionCache("test_sweep", disk_path=""))
+    return manager, events
+
+
+def test_grid_cells_order_and_clamping():
+    cells = grid_cells({"temp": [-2.0, 0.5], "rain": [0.0, 1.0], "poaching": [0.3]})
+    assert cells == [(-1.0, 0.0, 0.3), (-1.0, 1.0, 0.3), (0.5, 0.0, 0.3), (0.5, 1.0, 0.3)]
+
+
+def test_cells_are_reproducible_and_respond_to_parameters():
+    cells = [(0.0, 0.8, 0.0), (0.0, 0.8, 1.0)]
+    a = simulate_cells(CONFIG, cells, 60, 16, seed=5)
+    assert a == simulate_cells(CONFIG, cells, 60, 16, seed=5)
+    assert a[0] == simulate_cells(CONFIG, cells[:1], 60, 16, seed=5)[0]
+    # heavy poaching thins both species and raises risk
+    assert a[1]["count_A"] + a[1]["count_B"] < a[0]["count_A"] + a[0]["count_B"]
+    assert a[1]["risk"] > a[0]["risk"]
+
+
+def test_overlapping_sweeps_reuse_cells(counted):
+    manager, events = _manager()
+    axes = {"temp": [-0.5, 0.0, 0.5], "rain": [0.2, 0.8], "poaching": [0.0]}
+
+    async def scenario():
+        first = manager.start(CONFIG, axes, 20, 2, 1)
+        await first.task
+        assert (first.state, first.done, first.cached) == (COMPLETED, 6, 0)
+        assert first.result["shape"] == [3, 2, 1]
+        risk = np.array(first.result["metrics"]["risk"])
+        assert risk.shape == (3, 2, 1) and ((risk >= 0) & (risk <= 1)).all()
+        assert len(counted) == 6
+        # widen the temp axis: only the 2 new cells are simulated
+        wider = manager.start(CONFIG, {**axes, "temp": [-0.5, 0.0, 0.5, 1.0]}, 20, 2, 1)
+        await wider.task
+        assert (wider.done, wider.cached) == (8, 6) and len(counted) == 8
+        assert wider.result["metrics"]["risk"][:3] == first.result["metrics"]["risk"]
+        # another seed is another cell
+        other = manager.start(CONFIG, axes, 20, 2, 2)
+        await other.task
+        assert other.cached == 0 and len(counted) == 14
+        # identical concurrent sweeps compute each cell once
+        counted.clear()
+        a = manager.start(CONFIG, {**axes, "poaching": [0.5]}, 20, 2, 1)
+        b = manager.start(CONFIG, {**axes, "poaching": [0.5]}, 20, 2, 1)
+        await asyncio.gather(a.task, b.task)
+        assert len(counted) == 6 and a.result == b.result
+
+    asyncio.run(scenario())
+    final = [e for e in events if e["state"] == COMPLETED]
+    assert len(final) == 5 and all(e["done"] == e["total"] for e in final)
+
+
+def test_sweep_limit(counted):
+    manager, _ = _manager()
+    manager.max_sweeps = 1
+
+    async def scenario():
+        s = manager.start(CONFIG, {"temp": [0.0], "rain": [0.5], "poaching": [0.0]}, 5, 1, 0)
+        with pytest.raises(twin_sweep.SweepLimitReached):
+            manager.start(CONFIG, {"temp": [0.0], "rain": [0.5], "poaching": [0.0]}, 5, 1, 0)
+        await s.task
+
+    asyncio.run(scenario())
+
+
+def test_endpoints(monkeypatch, counted):
+    pytest.importorskip("socketio")
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from api import twin_routes
+
+    manager, _ = _manager()
+    monkeypatch.setattr(twin_routes, "_sweeps", manager)
+    app = FastAPI()
+    app.include_router(twin_routes.router, prefix="/api/twin")
+    with TestClient(app) as client:
+        body = {"temp": {"start": -1, "stop": 1, "num": 3}, "rain": [0.2, 0.9], "poaching": 0.1, "steps": 10, "replicas": 2}
+        info = client.post("/api/twin/sweep", json=body).json()["data"]
+        assert info["total"] == 6 and info["seed"] == 0
+        deadline = time.time() + 30
+        while True:
+            data = client.get(f"/api/twin/sweeps/{info['sweep_id']}").json()["data"]
+            if data["state"] != "running" or time.time() > deadline:
+                break
+            time.sleep(0.05)
+        assert data["state"] == COMPLETED
+        assert data["result"]["axes"] == {"temp": [-1.0, 0.0, 1.0], "rain": [0.2, 0.9], "poaching": [0.1]}
+        assert np.array(data["result"]["metrics"]["biodiversity"]).shape == (3, 2, 1)
+        big = client.post("/api/twin/sweep", json={**body, "temp": {"start": -1, "stop": 1, "num": 64}, "steps": 20_000})
+        assert big.json()["error"]["code"] == "SWEEP_TOO_LARGE"
+        assert client.get("/api/twin/sweeps/nope").json()["error"]["code"] == "NO_SWEEP"
+
+
+if __name__ == "__main__":
+    # Benchmark: a 7 x 7 temp x rain sweep (16 replicas x 200 steps per cell)
+    # computed cold, repeated, then refined to 9 temps (3 of which it already has).
+    async def bench():
+        manager, _ = _manager()
+        axes = {"temp": list(np.linspace(-1, 1, 7)), "rain": list(np.linspace(0, 1, 7)), "poaching": [0.2]}
+        for label, run_axes in (
+            ("cold 7x7", axes),
+            ("repeat 7x7", axes),
+            ("refined 9x7", {**axes, "temp": list(np.linspace(-1, 1, 9))}),
+        ):
+            t0 = time.perf_counter()
+            sweep = manager.start(CONFIG, run_axes, 200, 16, 0)
+            await sweep.task
+            print(f"{label:12s} {sweep.total:3d} cells, {sweep.cached:3d} cached: {time.perf_counter() - t0:6.2f} s")
+        compute_pool.shutdown_pool()
+
+    asyncio.run(bench())
@@ -0,0 +1,140 @@
+import os
+import random
+import sys
+import time
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
+
+from app.services import twin_world  # noqa: E402
+from app.services.twin_world import World, eat  # noqa: E402
+
+
+# --- Pure-Python reference implementation (the original twin_routes.World loops) ---
+
+class RefWorld:
+    def __init__(self, w=40, h=24, rng=random):
+        self.w, self.h, self.rng = w, h, rng
+        self.temp = self.rain = self.poaching = 0.0
+        self.res = [[0.6 for _ in range(w)] for _ in range(h)]
+        self.agents = [{"x": rng.randrange(w), "y": rng.randrange(h), "species": "A", "energy": 0.8} for _ in range(60)]
+        self.agents += [{"x": rng.randrange(w), "y": rng.randrange(h), "species": "B", "energy": 0.8} for _ in range(40)]
+
+    def step_once(self, steps=1):
+        rng, W, H = self.rng, self.w, self.h
+        for _ in range(steps):
+            for y in range(H):
+                for x in range(W):
+                    regen = 0.02 + 0.02*self.rain
+                    decay = 0.01 + 0.02*max(0.0, self.temp)
+                    self.res[y][x] = max(0.0, min(1.0, self.res[y][x] + regen - decay))
+            new_agents = []
+            for ag in self.agents:
+                ag["x"] = (ag["x"] + rng.choice([-1, 0, 1])) % W
+                ag["y"] = (ag["y"] + rng.choice([-1, 0, 1])) % H
+                food = min(0.1, self.res[ag["y"]][ag["x"]])
+                self.res[ag["y"]][ag["x"]] -= food
+                ag["energy"] = max(0.0, min(1.5, ag["energy"] + food - 0.03))
+                mort = 0.01 + 0.09*self.poaching*(1.2 if ag["species"] == "B" else 1.0)
+                if self.temp > 0.4 and ag["species"] == "A":
+                    mort += 0.02
+                if self.temp < -0.4 and ag["species"] == "B":
+                    mort += 0.02
+                if ag["energy"] < 0.2:
+                    mort += 0.05
+                if rng.random() < mort:
+                    continue
+                if ag["energy"] > 1.2 and rng.random() < 0.1:
+                    new_agents.append({"x": ag["x"], "y": ag["y"], "species": ag["species"], "energy": 0.8})
+                    ag["energy"] *= 0.7
+                new_agents.append(ag)
+            self.agents = new_agents[:200]
+
+    def counts(self):
+        a = sum(1 for ag in self.agents if ag["species"] == "A")
+        return a, len(self.agents) - a
+
+
+def test_eat_matches_sequential_loop():
+    rng = np.random.default_rng(1)
+    res = rng.random(50).astype(np.float32) * 0.35
+    cell = rng.integers(0, 50, 400)
+    expected_res = res.astype(np.float64).copy()
+    expected_food = []
+    for c in cell:
+        food = min(0.1, expected_res[c])
+        expected_res[c] -= food
+        expected_food.append(food)
+    food = eat(res, cell)
+    np.testing.assert_allclose(food, expected_food, atol=1e-6)
+    np.testing.assert_allclose(res, expected_res, atol=1e-6)
+    assert (res >= 0).all()
+
+
+def test_rebuild_keeps_sequential_order_and_cap():
+    world = World(n_a=5, n_b=5, max_agents=8, seed=0)
+    world.x = np.arange(10, dtype=np.int32)
+    world.energy = np.linspace(0.5, 1.4, 10).astype(np.float32)
+    alive = np.array([1, 0, 1, 1, 0, 1, 1, 1, 1, 1], dtype=bool)
+    births = np.array([0, 0, 1, 0, 0, 1, 0, 0, 0, 1], dtype=bool)
+    world._rebuild(alive, births)
+    # child (energy 0.8) precedes each parent; the list is cut at 8
+    assert world.x.tolist() == [0, 2, 2, 3, 5, 5, 6, 7]
+    assert world.energy[[1, 4]].tolist() == pytest.approx([0.8, 0.8])
+    assert world.energy[2] == pytest.approx(np.linspace(0.5, 1.4, 10)[2])
+
+
+def test_seeded_runs_are_reproducible():
+    a, b = World(seed=42), World(seed=42)
+    for w in (a, b):
+        w.apply_env(0.5, 0.3, 0.4)
+        w.step_once(30)
+    assert a.metrics() == b.metrics()
+    np.testing.assert_array_equal(a.x, b.x)
+    np.testing.assert_array_equal(a.res, b.res)
+
+
+@pytest.mark.parametrize("env,steps", [
+    ((0.0, 0.5, 0.0), 40),    # growth into the population cap
+    ((0.6, 0.2, 0.6), 40),    # poaching plus heat stress on A
+    ((1.0, 0.0, 0.0), 80),    # resources run out: starvation
+    ((-0.8, 0.4, 0.3), 40),   # cold stress on B
+])
+def test_statistically_equivalent_to_reference(env, steps):
+    runs = 80
+    ours, ref = [], []
+    for seed in range(runs):
+        w = World(seed=seed)
+        w.apply_env(*env)
+        w.step_once(steps)
+        ours.append(w.counts() + (float(w.res.mean()),))
+        r = RefWorld(rng=random.Random(seed))
+        r.temp, r.rain, r.poaching = env
+        r.step_once(steps)
+        ref.append(r.counts() + (float(np.mean(r.res)),))
+    ours, ref = np.array(ours), np.array(ref)
+    se = np.sqrt(ours.var(axis=0) / runs + ref.var(axis=0) / runs) + 1e-6
+    z = np.abs(ours.mean(axis=0) - ref.mean(axis=0)) / se
+    assert (z < 4.5).all(), (ours.mean(axis=0), ref.mean(axis=0), z)
+
+
+if __name__ == "__main__":
+    # Benchmark: the reference loops on the demo world vs the vectorized engine
+    # from the demo size up to a 1000x1000 grid with 100k agents.
+    ref = RefWorld(rng=random.Random(0))
+    ref.rain = 0.5
+    t0 = time.perf_counter()
+    ref.step_once(20)
+    print(f"reference 40x24, {len(ref.agents):>6} agents: {(time.perf_counter() - t0) / 20 * 1000:8.2f} ms/step")
+    for w, h, n in ((40, 24, 100), (200, 200, 10_000), (1000, 1000, 100_000)):
+        world = World(w, h, n_a=n * 6 // 10, n_b=n * 4 // 10, max_agents=2 * n, seed=0)
+        world.apply_env(0.2, 0.5, 0.1)
+        world.step_once(2)  # warm-up
+        steps = 20
+        t0 = time.perf_counter()
+        world.step_once(steps)
+        dt = (time.perf_counter() - t0) / steps
+        print(f"vectorized {w}x{h}, {world.n_agents:>6} agents: {dt * 1000:8.2f} ms/step ({1 / dt:6.1f} steps/s)")
+    print(f"(demo population cap {twin_world.MAX_AGENTS})")